@@ -97,6 +97,11 @@ def create_app(config_name=None):
             start_scheduler()
         except Exception as e:
             print(f"Failed to start scheduler: {e}")
+        try:
+            from app.services.printing_service import get_print_spooler
+            get_print_spooler().recover()
+        except Exception as e:
+            print(f"Failed to recover print spool: {e}")
 
     import time
     from flask import request, g, session
@@ -105,6 +110,9 @@ def create_app(config_name=None):
     def start_timer():
         g.start = time.time()
 
+    from app.services import request_metrics_service
+    request_metrics_service.init_app(app)
+
     @app.before_request
     def external_open_access():
         if not app.config.get('EXTERNAL_OPEN_MODE'):
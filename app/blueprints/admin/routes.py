@@ -32,6 +32,7 @@ from app.services.data_service import (
     secure_save_menu_items,
     load_department_permissions,
     save_department_permissions,
+    get_json_cache_stats,
 )
 from app.services.rh_service import load_reset_requests
 from app.services.backup_service import backup_service
@@ -1114,6 +1115,59 @@ def api_search_logs():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@admin_bp.route('/api/admin/logs/pipeline')
+@login_required
+def api_logs_pipeline():
+    if session.get('role') != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+    return jsonify(LoggerService.pipeline_stats())
+
+@admin_bp.route('/api/admin/perf/metrics')
+@login_required
+def api_perf_metrics():
+    if session.get('role') != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+    from app.services.audit_log_service import audit_log_stats
+    from app.services.cashier_service import CashierService
+    from app.services.integration_http_client import integration_http_stats
+    from app.services.kds_event_service import kds_event_stats
+    from app.services.ledger_journal_service import ledger_journal_stats
+    from app.services.ledger_stream_service import get_ledger_stream_index
+    from app.services.occupancy_cube_service import occupancy_cube_stats
+    from app.services.ota_distribution_engine import ota_distribution_stats
+    from app.services.request_metrics_service import get_request_metrics, get_request_profiler
+    from app.services.sefaz_material_cache import sefaz_cache_stats
+    try:
+        top = int(request.args.get('top') or 0) or None
+    except ValueError:
+        top = None
+    payload = get_request_metrics().snapshot(top=top)
+    payload['json_cache'] = get_json_cache_stats()
+    payload['log_pipeline'] = LoggerService.pipeline_stats()
+    payload['ledger_journals'] = ledger_journal_stats()
+    payload['ledger_stream'] = get_ledger_stream_index().stats()
+    payload['integrations'] = integration_http_stats()
+    payload['sefaz_cache'] = sefaz_cache_stats()
+    payload['cashier_index'] = CashierService.session_index_stats()
+    payload['kds_events'] = kds_event_stats()
+    payload['occupancy_cube'] = occupancy_cube_stats()
+    payload['ota_distribution'] = ota_distribution_stats()
+    payload['audit_logs'] = audit_log_stats()
+    payload['profiler'] = {
+        'every_n': get_request_profiler().every_n(),
+        'recent_profiles': list(get_request_profiler().written),
+    }
+    return jsonify(payload)
+
+@admin_bp.route('/api/admin/perf/metrics/reset', methods=['POST'])
+@login_required
+def api_perf_metrics_reset():
+    if session.get('role') != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+    from app.services.request_metrics_service import get_request_metrics
+    get_request_metrics().reset()
+    return jsonify({'success': True})
+
 # --- Sales Dashboard ---
 @admin_bp.route('/admin/settings/kds_sla', methods=['GET', 'POST'])
 @login_required
@@ -420,14 +420,12 @@ def api_fiscal_pool_list():
         'fiscal_type': request.args.get('type') # nfce, nfse
     }
     
-    # We load raw pool then filter
-    pool = FiscalPoolService.get_pool(filters)
-    
-    # Additional filter for fiscal_type
-    if filters['fiscal_type']:
-        pool = [p for p in pool if p.get('fiscal_type') == filters['fiscal_type']]
-        
-    return jsonify(pool)
+    limit = request.args.get('limit', type=int)
+    offset = request.args.get('offset', default=0, type=int)
+    result = FiscalPoolService.query_pool(filters, offset=offset, limit=limit)
+    response = jsonify(result['entries'])
+    response.headers['X-Total-Count'] = str(result['total'])
+    return response
 
 @finance_bp.route('/api/fiscal/pool/emit', methods=['POST'])
 @login_required
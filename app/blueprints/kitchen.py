@@ -11,7 +11,7 @@ from app.services.data_service import (
     load_products, load_settings, save_settings, load_stock_entries,
     save_stock_entry, save_stock_entries, load_stock_logs, save_stock_logs, STOCK_LOGS_FILE, STOCK_ENTRIES_FILE,
     load_table_orders, save_table_orders, load_menu_items, load_printers, secure_save_products, load_room_occupancy,
-    load_suppliers
+    load_suppliers, table_orders_segments
 )
 from app.services.breakfast_kds_service import (
     BREAKFAST_KDS_STATUSES,
@@ -25,12 +25,13 @@ from app.services.breakfast_kds_service import (
     update_breakfast_status as _svc_update_breakfast_status,
     update_breakfast_restaurant_status as _svc_update_breakfast_restaurant_status,
 )
+from app.services.kds_event_service import wait_for_kds_changes
 from app.services.logger_service import LoggerService
 from app.services.kitchen_checklist_service import KitchenChecklistService
 from app.services.data_service import load_products, load_menu_items, secure_save_menu_items
 from app.services.system_config_manager import get_data_path, PRODUCT_PHOTOS_DIR, PRODUCTS_FILE
 from werkzeug.utils import secure_filename
-from app.services.printing_service import get_default_printer, print_portion_labels
+from app.services.printing_service import print_portion_labels
 from app.services.stock_service import get_product_balances
 from app.services.reservation_service import ReservationService
 from app.utils.lock import file_lock
@@ -98,20 +99,32 @@ def _extract_origin_supplier(entry):
     return ''
 
 
+def _order_prep_durations(order):
+    """(sum, count) of the item preparation times recorded on one order."""
+    total = 0
+    count = 0
+    items = order.get('items') or []
+    for item in items:
+        try:
+            sec = int(item.get('kds_preparing_duration_sec') or 0)
+        except Exception:
+            sec = 0
+        if sec > 0:
+            total += sec
+            count += 1
+    return total, count
+
+
 def _compute_avg_prep_seconds(orders):
-    durations = []
+    total = 0
+    count = 0
     for order in (orders or {}).values():
-        items = order.get('items') or []
-        for item in items:
-            try:
-                sec = int(item.get('kds_preparing_duration_sec') or 0)
-            except Exception:
-                sec = 0
-            if sec > 0:
-                durations.append(sec)
-    if not durations:
+        order_total, order_count = _order_prep_durations(order)
+        total += order_total
+        count += order_count
+    if not count:
         return 20 * 60
-    return int(sum(durations) / len(durations))
+    return int(total / count)
 
 
 def _emit_server_done_sound():
@@ -496,277 +509,287 @@ def _build_breakfast_kds_payload(now=None):
     }
 
 
-def _build_kds_payload(station, now=None):
-    if now is None:
-        now = datetime.now()
-    orders = load_table_orders()
-    menu_items = load_menu_items()
-    menu_map = {str(p.get('id')): p for p in menu_items}
-    
-    # Load SLA Settings
-    settings = load_settings()
-    kds_sla = settings.get('kds_sla', {})
-    
-    printers = load_printers()
-    printers_map = {str(p.get('id')): p for p in printers}
-    default_kitchen = get_default_printer('kitchen')
-    result_orders = []
+def _build_kds_table(table_id, order, station, now, kds_sla, printers_map):
+    """
+    One table's KDS card for ``station`` at ``now``, or None when nothing
+    of it shows there. Returns ``(card, section_pending, prep)``:
+    ``section_pending`` is the ordered ``((section, pending items), ...)``
+    feeding ``sections_summary`` and ``prep`` the table's share of
+    ``avg_prep_seconds``.
+    """
+    prep = _order_prep_durations(order)
+    status = str(order.get('status', '')).lower()
+    if status not in ['open', 'aberta', 'aberto']:
+        return None, (), prep
     sections_counter = {}
-    avg_prep_seconds = _compute_avg_prep_seconds(orders)
-    changed = False
-    for table_id, order in orders.items():
-        status = str(order.get('status', '')).lower()
-        if status not in ['open', 'aberta', 'aberto']:
-            continue
-        items = order.get('items') or []
-        table_items = []
-        opened_raw = order.get('opened_at') or order.get('created_at')
-        try:
-            opened_at = datetime.strptime(opened_raw, '%d/%m/%Y %H:%M') if opened_raw else now
-        except Exception:
-            opened_at = now
-            
-        # Order-level SLA tracking
-        order_max_wait_minutes = 0
-        order_has_late_item = False
+    items = order.get('items') or []
+    table_items = []
+    opened_raw = order.get('opened_at') or order.get('created_at')
+    try:
+        opened_at = datetime.strptime(opened_raw, '%d/%m/%Y %H:%M') if opened_raw else now
+    except Exception:
+        opened_at = now
         
-        for item in items:
-            cat = item.get('category') or ''
-            cat_norm = unicodedata.normalize('NFKD', str(cat)).encode('ASCII', 'ignore').decode('utf-8').strip().lower()
-            is_beverage = cat_norm in [
-                'vinhos',
-                'drinks',
-                'sucos e aguas',
-                'sucos e agua',
-                'refrigerante',
-                'refrigerantes',
-                'cervejas',
-                'cerveja',
-                'frigobar',
-                'doses',
-                'bebidas',
-                'bebida'
-            ]
-            
-            # Filter by station
-            item_printer_id = item.get('printer_id')
-            should_show = False
-            
-            # Determine Section (Printer Name or Category)
-            printer_name = 'Cozinha'
-            if item_printer_id:
-                p_obj = printers_map.get(str(item_printer_id))
-                if p_obj:
-                    printer_name = p_obj.get('name', 'Cozinha')
-            
-            # If item has no printer, fallback logic
-            if not item_printer_id:
-                if is_beverage:
-                    printer_name = 'Bar'
-                else:
-                    printer_name = 'Cozinha'
-
-            section_name = printer_name
-            section_lane = _resolve_kitchen_visual_lane(section_name)
-
-            # Station Filtering Logic
-            if station == 'kitchen':
-                # Show everything NOT bar (unless mixed)
-                if not is_beverage:
-                    should_show = True
-                # If explicit kitchen printer
-                if item_printer_id and 'bar' not in printer_name.lower():
-                    should_show = True
-            elif station == 'bar':
-                if is_beverage or (item_printer_id and 'bar' in printer_name.lower()):
-                    should_show = True
-            elif station == 'all':
-                should_show = True
+    # Order-level SLA tracking
+    order_max_wait_minutes = 0
+    order_has_late_item = False
+    
+    for item in items:
+        cat = item.get('category') or ''
+        cat_norm = unicodedata.normalize('NFKD', str(cat)).encode('ASCII', 'ignore').decode('utf-8').strip().lower()
+        is_beverage = cat_norm in [
+            'vinhos',
+            'drinks',
+            'sucos e aguas',
+            'sucos e agua',
+            'refrigerante',
+            'refrigerantes',
+            'cervejas',
+            'cerveja',
+            'frigobar',
+            'doses',
+            'bebidas',
+            'bebida'
+        ]
+
+        # Filter by station
+        item_printer_id = item.get('printer_id')
+        should_show = False
+
+        # Determine Section (Printer Name or Category)
+        printer_name = 'Cozinha'
+        if item_printer_id:
+            p_obj = printers_map.get(str(item_printer_id))
+            if p_obj:
+                printer_name = p_obj.get('name', 'Cozinha')
+
+        # If item has no printer, fallback logic
+        if not item_printer_id:
+            if is_beverage:
+                printer_name = 'Bar'
             else:
-                # Custom station logic (by printer ID match?)
-                # For simplicity, if station name is in printer name
-                if station.lower() in printer_name.lower():
-                    should_show = True
+                printer_name = 'Cozinha'
 
-            if not should_show:
-                continue
-            
-            kds_status = item.get('kds_status') or 'pending'
-            if kds_status == 'archived':
-                continue
+        section_name = printer_name
+        section_lane = _resolve_kitchen_visual_lane(section_name)
 
-            # Calculate Wait Time
-            # If pending: time since created_at
-            # If preparing: time since kds_start_time + pending time? No, usually total time since order.
-            
-            item_created_at = None
-            try:
-                item_created_at = datetime.strptime(item.get('created_at'), '%d/%m/%Y %H:%M')
-            except:
-                item_created_at = opened_at
-            
-            wait_seconds = (now - item_created_at).total_seconds()
-            wait_minutes = int(wait_seconds / 60)
-            
-            # Check SLA
-            # Default SLA 20 min if not found
-            sla_minutes = kds_sla.get(item.get('category'), 20)
-            is_late = wait_minutes > sla_minutes
-            
-            if is_late:
-                order_has_late_item = True
-            
-            if wait_minutes > order_max_wait_minutes:
-                order_max_wait_minutes = wait_minutes
+        # Station Filtering Logic
+        if station == 'kitchen':
+            # Show everything NOT bar (unless mixed)
+            if not is_beverage:
+                should_show = True
+            # If explicit kitchen printer
+            if item_printer_id and 'bar' not in printer_name.lower():
+                should_show = True
+        elif station == 'bar':
+            if is_beverage or (item_printer_id and 'bar' in printer_name.lower()):
+                should_show = True
+        elif station == 'all':
+            should_show = True
+        else:
+            # Custom station logic (by printer ID match?)
+            # For simplicity, if station name is in printer name
+            if station.lower() in printer_name.lower():
+                should_show = True
 
-            if section_name not in sections_counter:
-                sections_counter[section_name] = 0
-            if kds_status == 'pending':
-                sections_counter[section_name] += 1
-            
-            # Prepare Item Display
-            item['wait_minutes'] = wait_minutes
-            item['sla_minutes'] = sla_minutes
-            item['is_late'] = is_late
-            item['section'] = section_name
-            
-            # Format Notes
-            observations = item.get('observations') or []
-            if isinstance(observations, list):
-                notes_parts = [str(o) for o in observations if o]
-            else:
-                notes_parts = [str(observations)] if observations else []
-            accompaniments = item.get('accompaniments') or []
-            if accompaniments:
-                acc_names = []
-                for a in accompaniments:
-                    if isinstance(a, dict):
-                        a_name = a.get('name')
-                        if a_name:
-                            acc_names.append(str(a_name))
-                    else:
-                        acc_names.append(str(a))
-                acc_str = ', '.join(acc_names)
-                notes_parts.append(acc_str)
-            questions = item.get('questions_answers') or []
-            if isinstance(questions, dict):
-                for q, ans in questions.items():
-                    if ans:
-                        notes_parts.append(str(ans))
-            elif isinstance(questions, list):
-                for qa in questions:
-                    if isinstance(qa, dict):
-                        q_text = qa.get('question')
-                        ans = qa.get('answer')
-                        if ans:
-                            notes_parts.append(str(ans))
-                    else:
-                        notes_parts.append(str(qa))
-            notes = ' / '.join(notes_parts)
-            flavor_text = item.get('flavor') or item.get('flavor_name')
-            if flavor_text:
-                flavor_str = str(flavor_text).strip()
-                if flavor_str:
-                    if notes:
-                        notes = f"Sabor: {flavor_str} / {notes}"
-                    else:
-                        notes = f"Sabor: {flavor_str}"
-            
-            item['display_notes'] = notes
-            
-            start_time = item.get('kds_start_time')
-            done_time = item.get('kds_done_time')
-            
-            table_items.append({
-                'id': item.get('id'),
-                'name': item.get('name'),
-                'qty': item.get('qty', 1),
-                'category': cat,
-                'section': section_name,
-                'print_destination': section_name,
-                'visual_lane': section_lane,
-                'status': kds_status,
-                'order_time': item_created_at.isoformat(),
-                'start_time': start_time,
-                'done_time': done_time,
-                'notes': notes,
-                'is_late': is_late,
-                'wait_minutes': wait_minutes,
-                'sla_minutes': sla_minutes, # Pass SLA to frontend
-                'wait_bucket': _compute_order_wait_bucket(wait_minutes),
-                'is_over_avg': is_late # Override generic avg with SLA logic
-            })
+        if not should_show:
+            continue
 
-        if not table_items:
+        kds_status = item.get('kds_status') or 'pending'
+        if kds_status == 'archived':
             continue
 
-        # Sort items by status priority: pending > preparing > done
-        status_priority = {'pending': 0, 'preparing': 1, 'done': 2}
-        table_items.sort(key=lambda x: (status_priority.get(x.get('status', 'pending'), 0), x.get('name')))
+        # Calculate Wait Time
+        # If pending: time since created_at
+        # If preparing: time since kds_start_time + pending time? No, usually total time since order.
 
-        # Determine overall order status
-        pending_count = sum(1 for i in table_items if i.get('status') == 'pending')
-        preparing_count = sum(1 for i in table_items if i.get('status') == 'preparing')
-        done_count = sum(1 for i in table_items if i.get('status') == 'done')
-        
-        overall_status = 'pending'
-        if done_count == len(table_items):
-            overall_status = 'done'
-        elif preparing_count > 0 or done_count > 0:
-            overall_status = 'preparing'
-        
-        # New "Late" logic for order card
-        order_late = order_has_late_item
-        
-        active_items = [i for i in table_items if i.get('status') != 'done']
-        basis_items = active_items if active_items else table_items
-        
-        order_wait_minutes = order_max_wait_minutes
-        wait_bucket = _compute_order_wait_bucket(order_wait_minutes)
-        is_over_avg = order_late # Use late flag for order highlighting too
-        
-        sections = {}
-        for i in table_items:
-            key = i['section']
-            if key not in sections:
-                sections[key] = []
-            sections[key].append(i)
-        sections_list = []
-        for name, items_list in sections.items():
-            section_lane = _resolve_kitchen_visual_lane(name)
-            sections_list.append({
-                'name': name,
-                'visual_lane': section_lane,
-                'pending': sum(1 for i in items_list if i['status'] == 'pending'),
-                'preparing': sum(1 for i in items_list if i['status'] == 'preparing'),
-                'done': sum(1 for i in items_list if i['status'] == 'done'),
-                'items': items_list
-            })
-        label = order.get('label')
-        if not label:
-            tid_str = str(table_id)
-            staff_name = order.get('staff_name')
-            if 'FUNC_' in tid_str and staff_name:
-                label = staff_name
-            else:
-                label = f"Mesa {table_id}"
-        result_orders.append({
-            'table_id': table_id,
-            'label': label,
-            'waiter': order.get('waiter') or '',
-            'status': overall_status,
-            'is_late': order_late,
-            'opened_at': opened_at.isoformat(),
-            'wait_minutes': order_wait_minutes,
-            'wait_bucket': wait_bucket,
-            'is_over_avg': is_over_avg,
-            'sections': sections_list,
-            'totals': {
-                'pending': pending_count,
-                'preparing': preparing_count,
-                'done': done_count
-            }
+        item_created_at = None
+        try:
+            item_created_at = datetime.strptime(item.get('created_at'), '%d/%m/%Y %H:%M')
+        except:
+            item_created_at = opened_at
+
+        wait_seconds = (now - item_created_at).total_seconds()
+        wait_minutes = int(wait_seconds / 60)
+
+        # Check SLA
+        # Default SLA 20 min if not found
+        sla_minutes = kds_sla.get(item.get('category'), 20)
+        is_late = wait_minutes > sla_minutes
+
+        if is_late:
+            order_has_late_item = True
+
+        if wait_minutes > order_max_wait_minutes:
+            order_max_wait_minutes = wait_minutes
+
+        if section_name not in sections_counter:
+            sections_counter[section_name] = 0
+        if kds_status == 'pending':
+            sections_counter[section_name] += 1
+
+        # Format Notes
+        observations = item.get('observations') or []
+        if isinstance(observations, list):
+            notes_parts = [str(o) for o in observations if o]
+        else:
+            notes_parts = [str(observations)] if observations else []
+        accompaniments = item.get('accompaniments') or []
+        if accompaniments:
+            acc_names = []
+            for a in accompaniments:
+                if isinstance(a, dict):
+                    a_name = a.get('name')
+                    if a_name:
+                        acc_names.append(str(a_name))
+                else:
+                    acc_names.append(str(a))
+            acc_str = ', '.join(acc_names)
+            notes_parts.append(acc_str)
+        questions = item.get('questions_answers') or []
+        if isinstance(questions, dict):
+            for q, ans in questions.items():
+                if ans:
+                    notes_parts.append(str(ans))
+        elif isinstance(questions, list):
+            for qa in questions:
+                if isinstance(qa, dict):
+                    q_text = qa.get('question')
+                    ans = qa.get('answer')
+                    if ans:
+                        notes_parts.append(str(ans))
+                else:
+                    notes_parts.append(str(qa))
+        notes = ' / '.join(notes_parts)
+        flavor_text = item.get('flavor') or item.get('flavor_name')
+        if flavor_text:
+            flavor_str = str(flavor_text).strip()
+            if flavor_str:
+                if notes:
+                    notes = f"Sabor: {flavor_str} / {notes}"
+                else:
+                    notes = f"Sabor: {flavor_str}"
+
+        start_time = item.get('kds_start_time')
+        done_time = item.get('kds_done_time')
+
+        table_items.append({
+            'id': item.get('id'),
+            'name': item.get('name'),
+            'qty': item.get('qty', 1),
+            'category': cat,
+            'section': section_name,
+            'print_destination': section_name,
+            'visual_lane': section_lane,
+            'status': kds_status,
+            'order_time': item_created_at.isoformat(),
+            'start_time': start_time,
+            'done_time': done_time,
+            'notes': notes,
+            'is_late': is_late,
+            'wait_minutes': wait_minutes,
+            'sla_minutes': sla_minutes, # Pass SLA to frontend
+            'wait_bucket': _compute_order_wait_bucket(wait_minutes),
+            'is_over_avg': is_late # Override generic avg with SLA logic
+        })
+
+    section_pending = tuple(sections_counter.items())
+    if not table_items:
+        return None, section_pending, prep
+
+    # Sort items by status priority: pending > preparing > done
+    status_priority = {'pending': 0, 'preparing': 1, 'done': 2}
+    table_items.sort(key=lambda x: (status_priority.get(x.get('status', 'pending'), 0), x.get('name')))
+
+    # Determine overall order status
+    pending_count = sum(1 for i in table_items if i.get('status') == 'pending')
+    preparing_count = sum(1 for i in table_items if i.get('status') == 'preparing')
+    done_count = sum(1 for i in table_items if i.get('status') == 'done')
+
+    overall_status = 'pending'
+    if done_count == len(table_items):
+        overall_status = 'done'
+    elif preparing_count > 0 or done_count > 0:
+        overall_status = 'preparing'
+
+    # New "Late" logic for order card
+    order_late = order_has_late_item
+
+    active_items = [i for i in table_items if i.get('status') != 'done']
+    basis_items = active_items if active_items else table_items
+
+    order_wait_minutes = order_max_wait_minutes
+    wait_bucket = _compute_order_wait_bucket(order_wait_minutes)
+    is_over_avg = order_late # Use late flag for order highlighting too
+
+    sections = {}
+    for i in table_items:
+        key = i['section']
+        if key not in sections:
+            sections[key] = []
+        sections[key].append(i)
+    sections_list = []
+    for name, items_list in sections.items():
+        section_lane = _resolve_kitchen_visual_lane(name)
+        sections_list.append({
+            'name': name,
+            'visual_lane': section_lane,
+            'pending': sum(1 for i in items_list if i['status'] == 'pending'),
+            'preparing': sum(1 for i in items_list if i['status'] == 'preparing'),
+            'done': sum(1 for i in items_list if i['status'] == 'done'),
+            'items': items_list
         })
+    label = order.get('label')
+    if not label:
+        tid_str = str(table_id)
+        staff_name = order.get('staff_name')
+        if 'FUNC_' in tid_str and staff_name:
+            label = staff_name
+        else:
+            label = f"Mesa {table_id}"
+    card = {
+        'table_id': table_id,
+        'label': label,
+        'waiter': order.get('waiter') or '',
+        'status': overall_status,
+        'is_late': order_late,
+        'opened_at': opened_at.isoformat(),
+        'wait_minutes': order_wait_minutes,
+        'wait_bucket': wait_bucket,
+        'is_over_avg': is_over_avg,
+        'sections': sections_list,
+        'totals': {
+            'pending': pending_count,
+            'preparing': preparing_count,
+            'done': done_count
+        }
+    }
+    return card, section_pending, prep
+
+
+def _kds_context():
+    """SLA settings and printers the cards depend on."""
+    settings = load_settings()
+    kds_sla = settings.get('kds_sla', {})
+    printers = load_printers()
+    printers_map = {str(p.get('id')): p for p in printers}
+    return kds_sla, printers_map
+
+
+def _build_kds_payload(station, now=None):
+    if now is None:
+        now = datetime.now()
+    orders = load_table_orders()
+    kds_sla, printers_map = _kds_context()
+    result_orders = []
+    sections_counter = {}
+    avg_prep_seconds = _compute_avg_prep_seconds(orders)
+    for table_id, order in orders.items():
+        card, section_pending, _prep = _build_kds_table(table_id, order, station, now, kds_sla, printers_map)
+        for name, pending in section_pending:
+            sections_counter[name] = sections_counter.get(name, 0) + pending
+        if card is not None:
+            result_orders.append(card)
     sections_summary = []
     for name, count in sections_counter.items():
         sections_summary.append({'name': name, 'pending': count})
@@ -778,8 +801,6 @@ def _build_kds_payload(station, now=None):
         'orders': result_orders,
         'sections_summary': sections_summary
     }
-    if changed:
-        save_table_orders(orders)
     return payload
 
 
@@ -807,7 +828,36 @@ def kitchen_kds_data():
         return jsonify({'success': False, 'error': 'Acesso restrito.'}), 403
     station = _normalize_station(request.args.get('station')) or session.get('kds_station')
     station = _normalize_station(station) or 'kitchen'
-    payload = _build_kds_payload(station)
+    since = request.args.get('since')
+    if since is None:
+        payload = _build_kds_payload(station)
+        return jsonify({'success': True, 'data': payload})
+
+    # Versioned screens: only the tables changed since ``since``, held up to
+    # ``wait`` seconds until there is something to send.
+    try:
+        since = int(since)
+    except ValueError:
+        since = None
+    try:
+        wait_seconds = float(request.args.get('wait') or 0)
+    except ValueError:
+        wait_seconds = 0
+
+    def build_table(table_id, order, now, context):
+        kds_sla, printers_map = context
+        return _build_kds_table(table_id, order, station, now, kds_sla, printers_map)
+
+    payload, modified = wait_for_kds_changes(
+        station,
+        since,
+        request.args.get('epoch'),
+        wait_seconds,
+        load_state=lambda: (table_orders_segments(), _kds_context()),
+        build_table=build_table,
+    )
+    if not modified:
+        return jsonify({'success': True, **payload})
     return jsonify({'success': True, 'data': payload})
 
 
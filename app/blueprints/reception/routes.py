@@ -60,6 +60,7 @@ from app.services.channel_sync_log_service import ChannelSyncLogService
 from app.services.channel_commercial_audit_service import ChannelCommercialAuditService
 from app.services.channel_commission_service import ChannelCommissionService
 from app.services.channel_manager_dashboard_service import ChannelManagerDashboardService
+from app.services.period_selector_service import PeriodSelectorService
 from app.services.governance_auto_deduct_service import apply_auto_deduction
 from app.utils.validators import (
     validate_required, validate_phone, validate_cpf, validate_email, 
@@ -1416,6 +1417,7 @@ def api_reception_ota_booking_send_rates():
             weekdays=payload.get('weekdays') or [],
             user=session.get('user') or 'Sistema',
             mode=str(payload.get('mode') or 'manual').strip().lower(),
+            force=bool(payload.get('force')),
         )
         return jsonify({'success': bool(result.get('success')), 'result': result}), (200 if result.get('success') else 502)
     except ValueError as e:
@@ -1477,6 +1479,7 @@ def api_reception_ota_booking_send_availability():
                 'property_id': payload.get('property_id'),
             },
             user=session.get('user') or 'Sistema',
+            force=bool(payload.get('force')),
         )
         return jsonify({'success': bool(result.get('success')), 'result': result}), (200 if result.get('success') else 502)
     except ValueError as e:
@@ -1866,70 +1869,48 @@ def api_reception_channel_manager_calendar():
     if end_dt < start_dt:
         start_dt, end_dt = end_dt, start_dt
     days = max(1, (end_dt - start_dt).days + 1)
-    sim = RevenueManagementService.simulate_projection(start_date=start_dt.isoformat(), days=days, advanced_mode=True)
-    sim_map = {
-        (str(row.get('date') or ''), str(row.get('category') or '')): float(row.get('current_bar') or row.get('base_bar') or 0.0)
-        for row in (sim.get('rows') or [])
-        if isinstance(row, dict)
-    }
+    weekday_codes = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+    grid_weekdays = [code for code in weekdays if code in weekday_codes]
     rows = []
-    current = start_dt
-    while current <= end_dt:
-        day_iso = current.isoformat()
-        if weekdays:
-            weekday_code = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun'][current.weekday()]
-            if weekday_code not in weekdays:
-                current = current.fromordinal(current.toordinal() + 1)
-                continue
-        next_day = current.fromordinal(current.toordinal() + 1).isoformat()
-        for category in categories:
-            direct = sim_map.get((day_iso, RevenueManagementService._booking_category_bucket(category)), 0.0)
-            tariff_payload = ChannelTariffService.calculate_tariffs(
-                channel_name=channel,
-                category=category,
-                start_date=day_iso,
-                end_date=day_iso,
-                weekdays=[],
-            )
-            tariff_row = (tariff_payload.get('rows') or [{}])[0]
-            inv_payload = ChannelInventoryPlannerService.build_snapshot(
-                category=category,
-                start_date=day_iso,
-                end_date=day_iso,
-                weekdays=[],
-            )
-            inv_day = (inv_payload.get('rows') or [{}])[0]
-            channels = inv_day.get('channels') if isinstance(inv_day, dict) else []
-            channel_row = next((item for item in (channels or []) if str(item.get('channel') or '') == str(channel)), {})
-            day_rules = ChannelRestrictionService.resolve_day_rules(category=category, channel=channel, day=day_iso)
-            engine = ChannelRulePriorityEngineService.evaluate(
-                category=category,
-                channel=channel,
-                checkin=day_iso,
-                checkout=next_day,
-                sale_date=day_iso,
-                package_selected=None,
-                apply_dynamic=True,
-            )
-            labels = day_rules.get('labels') or []
-            if rule_type_filter and rule_type_filter not in [str(item).strip().lower() for item in labels]:
-                if rule_type_filter not in str((engine.get('rules_applied') or [{}])[-1].get('rule') if engine.get('rules_applied') else '').lower():
-                    continue
-            rows.append({
-                'date': day_iso,
-                'category': category,
-                'channel': channel,
-                'tarifa_direta': round(float(tariff_row.get('tarifa_direta') or direct), 2),
-                'tarifa_canal': round(float((engine.get('pricing') or {}).get('tarifa_final_calculada') or tariff_row.get('tarifa_canal') or 0.0), 2),
-                'disponibilidade': int(channel_row.get('available_for_sale') or 0),
-                'status_aberto': bool(engine.get('sellable')),
-                'restricoes_ativas': labels,
-                'promocao_ativa': day_rules.get('promocao_especifica') or '',
-                'pacote_ativo': day_rules.get('pacote_obrigatorio') or '',
-                'motivo_indisponibilidade': engine.get('message') or '',
-                'rules_applied': engine.get('rules_applied') or [],
-            })
-        current = current.fromordinal(current.toordinal() + 1)
+    if grid_weekdays or not weekdays:
+        # One batch per rule source for the whole grid instead of one call per day × category.
+        sim = RevenueManagementService.simulate_projection(start_date=start_dt.isoformat(), days=days, advanced_mode=True)
+        sim_map = {
+            (str(row.get('date') or ''), str(row.get('category') or '')): float(row.get('current_bar') or row.get('base_bar') or 0.0)
+            for row in (sim.get('rows') or [])
+            if isinstance(row, dict)
+        }
+        span = {'start_date': start_dt.isoformat(), 'end_date': end_dt.isoformat(), 'weekdays': grid_weekdays}
+        tariffs = ChannelTariffService.calculate_tariffs_range(channel_name=channel, categories=categories, simulation=sim, **span)
+        inventory = ChannelInventoryPlannerService.build_snapshots(categories=categories, **span)
+        restrictions = ChannelRestrictionService.resolve_rules_range(categories=categories, channel=channel, **span)
+        evaluations = ChannelRulePriorityEngineService.evaluate_range(categories=categories, channel=channel, simulation=sim, **span)
+        for day_iso in PeriodSelectorService.expand_dates(start_dt.isoformat(), end_dt.isoformat(), grid_weekdays):
+            for category in categories:
+                direct = sim_map.get((day_iso, RevenueManagementService._booking_category_bucket(category)), 0.0)
+                tariff_row = tariffs[category].get(day_iso) or {}
+                inv_day = inventory[category].get(day_iso) or {}
+                channel_row = next((item for item in (inv_day.get('channels') or []) if str(item.get('channel') or '') == str(channel)), {})
+                day_rules = restrictions[category][day_iso]
+                engine = evaluations[category][day_iso]
+                labels = day_rules.get('labels') or []
+                if rule_type_filter and rule_type_filter not in [str(item).strip().lower() for item in labels]:
+                    if rule_type_filter not in str((engine.get('rules_applied') or [{}])[-1].get('rule') if engine.get('rules_applied') else '').lower():
+                        continue
+                rows.append({
+                    'date': day_iso,
+                    'category': category,
+                    'channel': channel,
+                    'tarifa_direta': round(float(tariff_row.get('tarifa_direta') or direct), 2),
+                    'tarifa_canal': round(float((engine.get('pricing') or {}).get('tarifa_final_calculada') or tariff_row.get('tarifa_canal') or 0.0), 2),
+                    'disponibilidade': int(channel_row.get('available_for_sale') or 0),
+                    'status_aberto': bool(engine.get('sellable')),
+                    'restricoes_ativas': labels,
+                    'promocao_ativa': day_rules.get('promocao_especifica') or '',
+                    'pacote_ativo': day_rules.get('pacote_obrigatorio') or '',
+                    'motivo_indisponibilidade': engine.get('message') or '',
+                    'rules_applied': engine.get('rules_applied') or [],
+                })
     return jsonify({
         'channel': channel,
         'category': category_filter,
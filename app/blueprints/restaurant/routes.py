@@ -6,7 +6,7 @@ from app.services.data_service import (
     load_restaurant_table_settings, save_restaurant_table_settings,
     load_restaurant_settings, save_restaurant_settings,
     load_menu_items, load_complements, save_complements,
-    load_observations, save_observations, load_table_orders, save_table_orders,
+    load_observations, save_observations, load_table_orders, save_table_orders, table_order_lock_path,
     load_room_occupancy, format_room_number, load_breakfast_history,
     load_payment_methods, save_payment_methods,
     load_sales_history, secure_save_sales_history, secure_save_menu_items,
@@ -20,7 +20,7 @@ from app.services.printing_service import (
     print_cashier_ticket, print_order_items, print_bill, 
     print_cancellation_items, print_fiscal_receipt,
     print_transfer_ticket, print_consolidated_stock_warning,
-    print_cashier_ticket_async
+    print_cashier_ticket_async, get_print_spooler, get_print_job
 )
 from app.services.fiscal_service import load_fiscal_settings, process_pending_emissions
 from app.services.fiscal_pool_service import FiscalPoolService
@@ -30,9 +30,11 @@ from app.services.data_service import load_stock_entries
 from app.utils.logger import log_action
 from app.services.cashier_service import CashierService, file_lock
 from app.services.transfer_service import transfer_table_to_room, TransferError
+from app.services.menu_catalog_service import MenuCatalog, get_menu_catalog
+from app.services.sales_cube_service import get_sales_cube, iter_cells
 from app.services.breakfast_kds_service import auto_set_in_preparo_from_table_open
 from app.services.authz import operational_request_service
-from app.services.system_config_manager import TABLE_ORDERS_FILE, SALES_HISTORY_FILE, STOCK_ENTRIES_FILE
+from app.services.system_config_manager import SALES_HISTORY_FILE, STOCK_ENTRIES_FILE
 from app.utils.validators import (
     validate_required, sanitize_input, validate_room_number
 )
@@ -54,6 +56,57 @@ REVIEW_QR_RESTAURANT_LINK_DEFAULT = 'https://www.tripadvisor.com.br/UserReviewEd
 
 # --- Helpers ---
 
+def _pending_print_jobs_by_item(print_res):
+    """
+    Splits the items left pending by print_order_items into
+    ({item id: spool job id} still printing, {item ids} already printed).
+    Items of jobs that failed in the meantime are in neither.
+    """
+    pending_ids = set(print_res.get('pending_ids') or [])
+    mapping = {}
+    printed = set()
+    if not pending_ids:
+        return mapping, printed
+    for job_id in (print_res.get('jobs') or {}).values():
+        job = get_print_job(job_id) or {}
+        item_ids = [item_id for item_id in job.get('item_ids') or [] if item_id in pending_ids]
+        status = job.get('status')
+        if status == 'done':
+            # Finished between the wait and now: the listener has already run.
+            printed.update(item_ids)
+        elif status in ('queued', 'printing'):
+            for item_id in item_ids:
+                mapping[item_id] = job_id
+    return mapping, printed
+
+def _settle_spooled_order_print(job):
+    """Spooler listener: applies the outcome of a late kitchen ticket to the table's items."""
+    context = job.get('context') or {}
+    if context.get('print_type') != 'kitchen_order' or not job.get('item_ids'):
+        return
+    if job.get('status') not in ('done', 'failed', 'expired'):
+        return
+    table_id = str(context.get('table_id'))
+    with file_lock(table_order_lock_path(table_id)):
+        orders = load_table_orders()
+        order = orders.get(table_id)
+        if not isinstance(order, dict):
+            return
+        item_ids = set(job['item_ids'])
+        changed = False
+        for item in order.get('items', []):
+            if item.get('id') in item_ids and item.get('print_job_id') == job['id'] and item.get('print_status') == 'queued':
+                if job['status'] == 'done':
+                    item['printed'] = True
+                    item['print_status'] = 'printed'
+                else:
+                    item['print_status'] = 'error'
+                changed = True
+        if changed:
+            save_table_orders(orders)
+
+get_print_spooler().add_listener(_settle_spooled_order_print)
+
 def _normalize_str(value):
     if value is None:
         return ''
@@ -344,6 +397,9 @@ def get_current_cashier(user=None, cashier_type=None):
     return None
 
 def resolve_stock_product_for_order_item(order_item, menu_items_db, products_db):
+    if isinstance(menu_items_db, MenuCatalog):
+        return menu_items_db.stock_product_for(order_item)
+
     menu_item = None
     raw_product_id = order_item.get('product_id')
     if raw_product_id is not None:
@@ -1501,15 +1557,11 @@ def restaurant_table_order(table_id):
                     return redirect(url_for('restaurant.restaurant_table_order', table_id=table_id))
 
                 try:
-                    menu_items = load_menu_items()
-                    products_insumos = load_products()
+                    catalog = get_menu_catalog(load_menu_items, load_products)
                 except Exception as e:
                     current_app.logger.error(f"Error loading data for restaurant cancellation stock: {e}")
-                    menu_items = []
-                    products_insumos = []
+                    catalog = MenuCatalog([], [])
 
-                insumo_map = {str(i.get('id')): i for i in products_insumos if i.get('id') is not None}
-                
                 removed_count = 0
                 last_removed_name = ""
                 
@@ -1518,12 +1570,7 @@ def restaurant_table_order(table_id):
                     if not target_item:
                         continue
 
-                    product_def = None
-                    prod_id = target_item.get('product_id')
-                    if prod_id:
-                        product_def = next((p for p in menu_items if str(p.get('id')) == str(prod_id)), None)
-                    if not product_def:
-                        product_def = next((p for p in menu_items if p.get('name') == target_item.get('name')), None)
+                    product_def = catalog.menu_item(target_item.get('product_id') or None, target_item.get('name'))
 
                     if product_def and product_def.get('recipe'):
                         try:
@@ -1532,29 +1579,11 @@ def restaurant_table_order(table_id):
                             except (TypeError, ValueError):
                                 qty_removed = 1.0
 
-                            for ingred in product_def['recipe']:
-                                raw_ing_id = ingred.get('ingredient_id')
-                                insumo_data = None
-                                ing_key = None
-
-                                if raw_ing_id is not None:
-                                    ing_key = str(raw_ing_id)
-                                    insumo_data = insumo_map.get(ing_key)
-                                else:
-                                    ing_name = ingred.get('ingredient')
-                                    if ing_name:
-                                        insumo_data = next((i for i in products_insumos if i.get('name') == ing_name), None)
-                                        if insumo_data and insumo_data.get('id') is not None:
-                                            ing_key = str(insumo_data.get('id'))
-                                        else:
-                                            ing_key = ing_name
-
-                                if not insumo_data:
-                                    continue
-
-                                try:
-                                    ing_qty = float(ingred.get('qty', 0))
-                                except (TypeError, ValueError):
+                            for line in catalog.recipe_lines(product_def):
+                                insumo_data = line.insumo
+                                ing_key = line.key
+                                ing_qty = line.qty
+                                if ing_qty is None:
                                     continue
 
                                 total_refund = ing_qty * qty_removed
@@ -1700,11 +1729,9 @@ def restaurant_table_order(table_id):
                         return redirect(url_for('restaurant.restaurant_table_order', table_id=table_id))
                     PROCESSED_BATCHES[batch_id] = now
 
-                menu_items = load_menu_items()
-                products_map = {str(p['id']): p for p in menu_items}
-
-                products_insumos = load_products()
-                insumo_map = {str(i['id']): i for i in products_insumos if i.get('id') is not None}
+                catalog = get_menu_catalog(load_menu_items, load_products)
+                products_map = catalog.by_id
+                insumo_map = catalog.products_by_id
                 flavor_groups = load_flavor_groups()
                 flavor_group_map = {str(g.get('id')): g for g in flavor_groups if g.get('id') is not None}
                 
@@ -1722,7 +1749,7 @@ def restaurant_table_order(table_id):
                     
                     if not product:
                         # Fallback: Try finding by Name (handling legacy calls passing name instead of ID)
-                        product = next((p for p in menu_items if p['name'] == prod_id), None)
+                        product = catalog.by_name.get(prod_id)
                         if product:
                              prod_id = str(product['id']) # Correct the ID for consistency
 
@@ -1831,29 +1858,11 @@ def restaurant_table_order(table_id):
 
                     if product.get('recipe'):
                         try:
-                            for ingred in product['recipe']:
-                                raw_ing_id = ingred.get('ingredient_id')
-                                insumo_data = None
-                                ing_key = None
-
-                                if raw_ing_id is not None:
-                                    ing_key = str(raw_ing_id)
-                                    insumo_data = insumo_map.get(ing_key)
-                                else:
-                                    ing_name = ingred.get('ingredient')
-                                    if ing_name:
-                                        insumo_data = next((i for i in products_insumos if i.get('name') == ing_name), None)
-                                        if insumo_data and insumo_data.get('id') is not None:
-                                            ing_key = str(insumo_data.get('id'))
-                                        else:
-                                            ing_key = ing_name
-
-                                if not insumo_data:
-                                    continue
-
-                                try:
-                                    ing_qty = float(ingred.get('qty', 0))
-                                except (TypeError, ValueError):
+                            for line in catalog.recipe_lines(product):
+                                insumo_data = line.insumo
+                                ing_key = line.key
+                                ing_qty = line.qty
+                                if ing_qty is None:
                                     continue
 
                                 total_needed = ing_qty * qty
@@ -1974,7 +1983,7 @@ def restaurant_table_order(table_id):
                         for acc_id in item_data['accompaniments']:
                             acc_prod = products_map.get(str(acc_id))
                             if not acc_prod:
-                                acc_prod = next((p for p in menu_items if p.get('name') == str(acc_id)), None)
+                                acc_prod = catalog.by_name.get(str(acc_id))
                             if acc_prod:
                                 accompaniment_menu_items.append(acc_prod)
                                 order_item['accompaniments'].append({
@@ -1994,28 +2003,11 @@ def restaurant_table_order(table_id):
                             deduction_mode = ''
                             deduction_reason = 'no_stock_mapping'
                             if acc_prod.get('recipe'):
-                                for ingred in acc_prod.get('recipe', []):
-                                    raw_ing_id = ingred.get('ingredient_id')
-                                    insumo_data = None
-                                    ing_key = None
-                                    if raw_ing_id is not None:
-                                        ing_key = str(raw_ing_id)
-                                        insumo_data = insumo_map.get(ing_key)
-                                    else:
-                                        ing_name = ingred.get('ingredient')
-                                        if ing_name:
-                                            insumo_data = next((i for i in products_insumos if i.get('name') == ing_name), None)
-                                            if insumo_data and insumo_data.get('id') is not None:
-                                                ing_key = str(insumo_data.get('id'))
-                                            else:
-                                                ing_key = ing_name
-                                    if not insumo_data:
-                                        continue
-                                    try:
-                                        ing_qty = float(ingred.get('qty', 0) or 0)
-                                    except Exception:
-                                        continue
-                                    if ing_qty <= 0:
+                                for line in catalog.recipe_lines(acc_prod):
+                                    insumo_data = line.insumo
+                                    ing_key = line.key
+                                    ing_qty = line.qty
+                                    if ing_qty is None or ing_qty <= 0:
                                         continue
                                     total_needed = ing_qty * qty
                                     with file_lock(STOCK_ENTRIES_FILE):
@@ -2037,8 +2029,8 @@ def restaurant_table_order(table_id):
                             else:
                                 acc_stock_product = resolve_stock_product_for_order_item(
                                     {'product_id': acc_prod.get('id'), 'name': acc_prod.get('name')},
-                                    menu_items,
-                                    products_insumos
+                                    catalog,
+                                    catalog.products
                                 )
                                 if acc_stock_product:
                                     log_stock_action(
@@ -2106,21 +2098,26 @@ def restaurant_table_order(table_id):
                     
                     # Print
                     printers = load_printers()
-                    print_res = print_order_items(table_id, waiter, new_order_items, printers, menu_items)
+                    print_res = print_order_items(table_id, waiter, new_order_items, printers, catalog)
                     
-                    # Mark as printed
-                    printed_ids = print_res.get('printed_ids', [])
-                    
-                    # Reload orders to ensure we have latest state (though we are single threaded here usually)
-                    # Just update memory object
-                    for item in orders[str_table_id]['items']:
-                        if item['id'] in printed_ids:
-                            item['printed'] = True
-                            item['print_status'] = 'printed'
-                        elif item in new_order_items and item['id'] not in printed_ids:
-                             item['print_status'] = 'error'
-                             
-                    save_table_orders(orders)
+                    # Mark as printed. Held under the table lock and reloaded, like
+                    # the spooler listener that settles tickets finishing later.
+                    with file_lock(table_order_lock_path(str_table_id)):
+                        pending_jobs, late_printed = _pending_print_jobs_by_item(print_res)
+                        printed_ids = set(print_res.get('printed_ids', [])) | late_printed
+                        new_item_ids = {item['id'] for item in new_order_items}
+                        orders = load_table_orders()
+                        for item in (orders.get(str_table_id) or {}).get('items', []):
+                            if item['id'] in printed_ids:
+                                item['printed'] = True
+                                item['print_status'] = 'printed'
+                            elif item['id'] in pending_jobs:
+                                # Still in the printer's spool queue; the job listener settles it.
+                                item['print_status'] = 'queued'
+                                item['print_job_id'] = pending_jobs[item['id']]
+                            elif item['id'] in new_item_ids:
+                                item['print_status'] = 'error'
+                        save_table_orders(orders)
                     
                     if print_res['results'].get('error'):
                         flash(f"Itens adicionados, mas houve erro na impressão: {print_res['results']['error']}")
@@ -2185,13 +2182,12 @@ def restaurant_table_order(table_id):
 
                 try:
                     printers = load_printers()
-                    menu_items = load_menu_items()
                     print_cancellation_items(
                         table_id,
                         session.get('user'),
                         batch_items,
                         printers,
-                        menu_items,
+                        get_menu_catalog(load_menu_items, load_products),
                         justification=f"Desfazer lote {batch_id}"
                     )
                 except Exception as e:
@@ -2235,7 +2231,7 @@ def restaurant_table_order(table_id):
                 if str_table_id in ['36', '68', '69']:
                     flash('Mesa especial deve ser finalizada pelo fluxo dedicado (Fechar Café/Cortesia/Proprietários).')
                     return redirect(url_for('restaurant.restaurant_table_order', table_id=table_id))
-                with file_lock(TABLE_ORDERS_FILE):
+                with file_lock(table_order_lock_path(str_table_id)):
                     orders = load_table_orders()
                     if str_table_id not in orders:
                         flash('Mesa não encontrada ou já fechada.')
@@ -2449,15 +2445,11 @@ def restaurant_table_order(table_id):
                         return redirect(url_for('restaurant.restaurant_table_order', table_id=table_id))
                 
                 # Deduct Stock (Batch Processing with Deduplication)
-                products_db = load_products()
-                menu_items_db = load_menu_items()
+                catalog = get_menu_catalog(load_menu_items, load_products)
                 low_stock_items = []
                 stock_entries_to_add = []
                 
                 deducted_products = []
-                menu_items_by_id = {str(m.get('id')): m for m in menu_items_db if m.get('id') is not None}
-                menu_items_by_name = {m.get('name'): m for m in menu_items_db if m.get('name')}
-                insumo_map = {str(p.get('id')): p for p in products_db if p.get('id') is not None}
                 for item in order['items']:
                     item_uuid = item.get('id') or str(uuid.uuid4())
                     deducted_acc_ids = set(str(x) for x in item.get('accompaniments_deducted_ids', []) if x is not None)
@@ -2471,27 +2463,18 @@ def restaurant_table_order(table_id):
                         parent_name = component.get('parent_name')
                         if origin == 'acompanhamento' and component_pid is not None and str(component_pid) in deducted_acc_ids:
                             continue
-                        menu_item_match = None
-                        if component_pid is not None:
-                            menu_item_match = menu_items_by_id.get(str(component_pid))
-                        if not menu_item_match and component_name:
-                            menu_item_match = menu_items_by_name.get(component_name)
+                        menu_item_match = catalog.menu_item(component_pid, component_name, last_wins=True)
 
                         if menu_item_match and menu_item_match.get('recipe'):
                             if origin == 'produto':
                                 continue
-                            for ingred in menu_item_match.get('recipe', []):
-                                ing_id = ingred.get('ingredient_id')
+                            for line in catalog.recipe_lines(menu_item_match):
+                                ing_id = line.ingredient_id
                                 if ing_id is None:
                                     continue
-                                insumo_data = insumo_map.get(str(ing_id))
-                                if not insumo_data:
-                                    continue
-                                try:
-                                    ing_qty = float(ingred.get('qty', 0) or 0)
-                                except Exception:
-                                    continue
-                                if ing_qty <= 0:
+                                insumo_data = line.insumo
+                                ing_qty = line.qty
+                                if ing_qty is None or ing_qty <= 0:
                                     continue
                                 total_needed = ing_qty * qty
                                 stock_entries_to_add.append({
@@ -2510,8 +2493,8 @@ def restaurant_table_order(table_id):
 
                         product_obj = resolve_stock_product_for_order_item(
                             {'product_id': component_pid, 'name': component_name},
-                            menu_items_db,
-                            products_db
+                            catalog,
+                            catalog.products
                         )
                         if not product_obj:
                             continue
@@ -2992,9 +2975,8 @@ def restaurant_table_order(table_id):
                 
                 # Print Cancellation Ticket to Kitchen
                 printers = load_printers()
-                menu_items = load_menu_items()
                 try:
-                    print_cancellation_items(table_id, session.get('user'), orders[str_table_id]['items'], printers, menu_items, justification="Cancelamento Mesa")
+                    print_cancellation_items(table_id, session.get('user'), orders[str_table_id]['items'], printers, get_menu_catalog(load_menu_items, load_products), justification="Cancelamento Mesa")
                 except Exception as e:
                     current_app.logger.error(f"Erro ao imprimir cancelamento: {e}")
                 
@@ -3356,11 +3338,7 @@ def restaurant_table_order(table_id):
                         current_app.logger.error(f"Falha ao lançar consumo de funcionário no caixa: {e}")
                     
                     # Deduct Stock
-                    products_db = load_products()
-                    menu_items_db = load_menu_items()
-                    menu_items_by_id = {str(m.get('id')): m for m in menu_items_db if m.get('id') is not None}
-                    menu_items_by_name = {m.get('name'): m for m in menu_items_db if m.get('name')}
-                    insumo_map = {str(p.get('id')): p for p in products_db if p.get('id') is not None}
+                    catalog = get_menu_catalog(load_menu_items, load_products)
                     for item in order['items']:
                         item_uuid = item.get('id') or str(uuid.uuid4())
                         deducted_acc_ids = set(str(x) for x in item.get('accompaniments_deducted_ids', []) if x is not None)
@@ -3375,27 +3353,18 @@ def restaurant_table_order(table_id):
                             if origin == 'acompanhamento' and component_pid is not None and str(component_pid) in deducted_acc_ids:
                                 continue
 
-                            menu_item_match = None
-                            if component_pid is not None:
-                                menu_item_match = menu_items_by_id.get(str(component_pid))
-                            if not menu_item_match and component_name:
-                                menu_item_match = menu_items_by_name.get(component_name)
+                            menu_item_match = catalog.menu_item(component_pid, component_name, last_wins=True)
 
                             if menu_item_match and menu_item_match.get('recipe'):
                                 if origin == 'produto':
                                     continue
-                                for ingred in menu_item_match.get('recipe', []):
-                                    ing_id = ingred.get('ingredient_id')
+                                for line in catalog.recipe_lines(menu_item_match):
+                                    ing_id = line.ingredient_id
                                     if ing_id is None:
                                         continue
-                                    insumo_data = insumo_map.get(str(ing_id))
-                                    if not insumo_data:
-                                        continue
-                                    try:
-                                        ing_qty = float(ingred.get('qty', 0) or 0)
-                                    except Exception:
-                                        continue
-                                    if ing_qty <= 0:
+                                    insumo_data = line.insumo
+                                    ing_qty = line.qty
+                                    if ing_qty is None or ing_qty <= 0:
                                         continue
                                     total_needed = ing_qty * qty
                                     with file_lock(STOCK_ENTRIES_FILE):
@@ -3415,8 +3384,8 @@ def restaurant_table_order(table_id):
 
                             product_obj = resolve_stock_product_for_order_item(
                                 {'product_id': component_pid, 'name': component_name},
-                                menu_items_db,
-                                products_db
+                                catalog,
+                                catalog.products
                             )
                             if not product_obj:
                                 continue
@@ -3921,8 +3890,6 @@ def api_restaurant_stats():
         target_date = datetime.strptime(date_q, '%Y-%m-%d').date()
     except:
         target_date = datetime.now().date()
-    date_br = target_date.strftime('%d/%m/%Y')
-    orders = load_table_orders()
     menu_items = load_menu_items()
     product_map = {p['name']: p for p in menu_items}
     bar_cats = {'Cervejas', 'Drinks', 'Vinhos', 'Refrigerante', 'Sucos e Águas', 'Doses'}
@@ -3932,78 +3899,58 @@ def api_restaurant_stats():
         if cat == 'Frigobar':
             return 'Ignore'
         return 'Bar' if cat in bar_cats else 'Cozinha'
-    def parse_ts(s):
-        try:
-            return datetime.strptime(s, '%d/%m/%Y %H:%M')
-        except:
-            return None
     def in_shift(h, start, end):
         return h >= start and h < end
     kpi_total_orders = 0
     kpi_attend_orders = set()
     shifts = {
-        'breakfast': {'hours': [7,8,9,10], 'items': [], 'waiters': {}, 'hourly': {7:0,8:0,9:0,10:0}},
-        'lunch': {'hours': list(range(11,17)), 'items': [], 'waiters': {}, 'hourly': {h:0 for h in range(11,17)}, 'hourly_kitchen': {h:0 for h in range(11,17)}, 'hourly_bar': {h:0 for h in range(11,17)}, 'att_hospedes': set(), 'att_passantes': set(), 'rank_kitchen': {}, 'rank_bar': {}},
-        'dinner': {'hours': list(range(17,23)), 'items': [], 'waiters': {}, 'hourly': {h:0 for h in range(17,23)}, 'hourly_kitchen': {h:0 for h in range(17,23)}, 'hourly_bar': {h:0 for h in range(17,23)}, 'att_hospedes': set(), 'att_passantes': set(), 'rank_kitchen': {}, 'rank_bar': {}}
+        'breakfast': {'hours': [7,8,9,10], 'items': {}, 'total': 0, 'waiters': {}, 'hourly': {7:0,8:0,9:0,10:0}},
+        'lunch': {'hours': list(range(11,17)), 'waiters': {}, 'hourly': {h:0 for h in range(11,17)}, 'hourly_kitchen': {h:0 for h in range(11,17)}, 'hourly_bar': {h:0 for h in range(11,17)}, 'att_hospedes': set(), 'att_passantes': set(), 'rank_kitchen': {}, 'rank_bar': {}},
+        'dinner': {'hours': list(range(17,23)), 'waiters': {}, 'hourly': {h:0 for h in range(17,23)}, 'hourly_kitchen': {h:0 for h in range(17,23)}, 'hourly_bar': {h:0 for h in range(17,23)}, 'att_hospedes': set(), 'att_passantes': set(), 'rank_kitchen': {}, 'rank_bar': {}}
     }
-    for tid, order in orders.items():
-        items = order.get('items', [])
-        cust = order.get('customer_type')
-        for it in items:
-            ts = parse_ts(it.get('created_at') or order.get('opened_at') or '')
-            if not ts or ts.date().strftime('%d/%m/%Y') != date_br:
-                continue
-            h = ts.hour
-            qty = float(it.get('qty', 0))
-            if qty <= 0:
+    # Launched items of the day (closed accounts + open tables) come
+    # pre-aggregated by hour/product/category/waiter/customer type.
+    day = get_sales_cube().day(target_date.strftime('%Y-%m-%d'))
+    sectors = {}
+    for h, name, cat, waiter, cust, qty, _revenue in iter_cells(day):
+        kpi_total_orders += qty
+        if in_shift(h,7,11):
+            s = shifts['breakfast']
+            s['total'] += qty
+            s['items'][name] = s['items'].get(name,0) + qty
+        elif in_shift(h,11,17):
+            s = shifts['lunch']
+        elif in_shift(h,17,23):
+            s = shifts['dinner']
+        else:
+            continue
+        s['hourly'][h] = s['hourly'].get(h,0) + qty
+        s['waiters'][waiter] = s['waiters'].get(waiter,0) + qty
+        if s is shifts['breakfast']:
+            continue
+        sector = sectors.get((name, cat))
+        if sector is None:
+            sector = sectors[(name, cat)] = sector_for(name, cat or None)
+        if sector == 'Cozinha':
+            s['hourly_kitchen'][h] = s['hourly_kitchen'].get(h,0) + qty
+            s['rank_kitchen'][name] = s['rank_kitchen'].get(name,0) + qty
+        elif sector == 'Bar':
+            s['hourly_bar'][h] = s['hourly_bar'].get(h,0) + qty
+            s['rank_bar'][name] = s['rank_bar'].get(name,0) + qty
+    for hour, by_type in day['visits'].items():
+        h = int(hour)
+        for cust, keys in by_type.items():
+            kpi_attend_orders.update(keys)
+            s = shifts['lunch'] if in_shift(h,11,17) else (shifts['dinner'] if in_shift(h,17,23) else None)
+            if s is None:
                 continue
-            kpi_total_orders += qty
-            kpi_attend_orders.add(tid)
-            waiter = it.get('waiter') or order.get('waiter') or 'N/A'
-            name = it.get('name')
-            cat = it.get('category')
-            sector = sector_for(name, cat)
-            if in_shift(h,7,11):
-                shifts['breakfast']['items'].append(it)
-                shifts['breakfast']['hourly'][h] = shifts['breakfast']['hourly'].get(h,0) + qty
-                shifts['breakfast']['waiters'][waiter] = shifts['breakfast']['waiters'].get(waiter,0) + qty
-            elif in_shift(h,11,17):
-                s = shifts['lunch']
-                s['items'].append(it)
-                s['hourly'][h] = s['hourly'].get(h,0) + qty
-                s['waiters'][waiter] = s['waiters'].get(waiter,0) + qty
-                if sector != 'Ignore':
-                    if sector == 'Cozinha':
-                        s['hourly_kitchen'][h] = s['hourly_kitchen'].get(h,0) + qty
-                        s['rank_kitchen'][name] = s['rank_kitchen'].get(name,0) + qty
-                    else:
-                        s['hourly_bar'][h] = s['hourly_bar'].get(h,0) + qty
-                        s['rank_bar'][name] = s['rank_bar'].get(name,0) + qty
-                if cust == 'hospede':
-                    s['att_hospedes'].add(tid)
-                elif cust != 'funcionario':
-                    s['att_passantes'].add(tid)
-            elif in_shift(h,17,23):
-                s = shifts['dinner']
-                s['items'].append(it)
-                s['hourly'][h] = s['hourly'].get(h,0) + qty
-                s['waiters'][waiter] = s['waiters'].get(waiter,0) + qty
-                if sector != 'Ignore':
-                    if sector == 'Cozinha':
-                        s['hourly_kitchen'][h] = s['hourly_kitchen'].get(h,0) + qty
-                        s['rank_kitchen'][name] = s['rank_kitchen'].get(name,0) + qty
-                    else:
-                        s['hourly_bar'][h] = s['hourly_bar'].get(h,0) + qty
-                        s['rank_bar'][name] = s['rank_bar'].get(name,0) + qty
-                if cust == 'hospede':
-                    s['att_hospedes'].add(tid)
-                elif cust != 'funcionario':
-                    s['att_passantes'].add(tid)
+            if cust == 'hospede':
+                s['att_hospedes'].update(keys)
+            elif cust != 'funcionario':
+                s['att_passantes'].update(keys)
     def top_n(d,k):
         return [{'name': a, 'qty': b} for a,b in sorted(d.items(), key=lambda x: x[1], reverse=True)[:k]]
-    breakfast_top = {}
-    for it in shifts['breakfast']['items']:
-        breakfast_top[it.get('name')] = breakfast_top.get(it.get('name'),0) + float(it.get('qty',0))
+    breakfast_top = shifts['breakfast']['items']
     resp = {
         'date': date_q,
         'kpi': {
@@ -4011,7 +3958,7 @@ def api_restaurant_stats():
             'total_atendimentos': len(kpi_attend_orders)
         },
         'breakfast': {
-            'total_pedidos': sum(float(i.get('qty',0)) for i in shifts['breakfast']['items']),
+            'total_pedidos': shifts['breakfast']['total'],
             'top_items': top_n(breakfast_top,5),
             'movement_hourly': [{'hour': h, 'count': shifts['breakfast']['hourly'].get(h,0)} for h in shifts['breakfast']['hours']],
             'attendants': [{'name': n, 'count': c} for n,c in sorted(shifts['breakfast']['waiters'].items(), key=lambda x: x[1], reverse=True)]
@@ -4041,6 +3988,37 @@ def api_restaurant_stats():
     }
     return jsonify(resp)
 
+@restaurant_bp.route('/api/restaurant/sales-cube', methods=['GET', 'POST'])
+@login_required
+def api_restaurant_sales_cube():
+    if session.get('role') != 'admin':
+        return jsonify({'success': False, 'error': 'Acesso não autorizado'}), 403
+    try:
+        cube = get_sales_cube()
+        if request.method == 'POST':
+            status = cube.rebuild()
+            log_system_action('Rebuild cubo de vendas', {'days': status.get('days'), 'closed_accounts': status.get('closed_accounts')}, user=session.get('user'), category='Restaurante')
+        else:
+            status = cube.status()
+        return jsonify({'success': True, 'cube': status})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@restaurant_bp.route('/api/restaurant/print-jobs/<job_id>')
+@login_required
+def api_print_job_status(job_id):
+    job = get_print_job(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Job de impressão não encontrado'}), 404
+    return jsonify({'success': True, 'job': job})
+
+@restaurant_bp.route('/api/restaurant/print-spooler')
+@login_required
+def api_print_spooler_status():
+    if session.get('role') not in ['admin', 'gerente']:
+        return jsonify({'success': False, 'error': 'Acesso não autorizado'}), 403
+    return jsonify({'success': True, 'spooler': get_print_spooler().status()})
+
 @restaurant_bp.route('/api/check_table/<table_id>')
 @login_required
 def check_table_status(table_id):
@@ -24,6 +24,7 @@ from app.services.data_service import (
 from app.services.stock_service import (
     calculate_suggested_min_stock, calculate_inventory, get_product_balances, get_product_balances_by_id, calculate_smart_stock_suggestions
 )
+from app.services.stock_balance_index_service import get_stock_balance_index
 from app.services.system_config_manager import (
     SALES_EXCEL_PATH, DEPARTMENTS, STOCK_ENTRIES_FILE, PRODUCTS_FILE, FIXED_ASSETS_FILE, get_data_path, get_legacy_root_json_path
 )
@@ -482,6 +483,22 @@ def api_smart_suggestions():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+@stock_bp.route('/api/stock/balance-index', methods=['GET', 'POST'])
+@login_required
+def api_stock_balance_index():
+    if session.get('role') != 'admin':
+        return jsonify({'success': False, 'error': 'Acesso não autorizado'}), 403
+    try:
+        index = get_stock_balance_index()
+        if request.method == 'POST':
+            status = index.rebuild()
+            log_system_action('Rebuild índice de saldos', status.get('sources'), user=session.get('user'), category='Estoque')
+        else:
+            status = index.status()
+        return jsonify({'success': True, 'index': status})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
     # Route stock_adjust_min_levels removed as per request
 
 @stock_bp.route('/stock/new', methods=['GET', 'POST'])
@@ -3941,11 +3958,8 @@ def view_stock_request(order_id):
 def stock_inventory():
     dept = session.get('department')
     products = load_products()
-    entries = load_stock_entries()
-    requests = load_stock_requests()
-    transfers = load_stock_transfers()
     
-    inventory = calculate_inventory(products, entries, requests, transfers, target_dept=dept)
+    inventory = calculate_inventory(products, target_dept=dept)
     return render_template('inventory.html', inventory=inventory, department=dept)
 
 @stock_bp.route('/stock/product/delete/<product_id>', methods=['POST'])
@@ -2,6 +2,7 @@ import json
 from datetime import datetime
 from typing import Any, Dict, List, Optional
 
+from app.services.audit_log_service import get_audit_log
 from app.services.cashier_service import file_lock
 from app.services.inventory_restriction_service import InventoryRestrictionService
 from app.services.logger_service import LoggerService
@@ -40,14 +41,8 @@ class ArrivalDepartureRestrictionService:
             cls._save_json(ARRIVAL_DEPARTURE_RESTRICTIONS_FILE, rows)
 
     @classmethod
-    def _load_logs(cls) -> List[Dict[str, Any]]:
-        data = cls._load_json(ARRIVAL_DEPARTURE_RESTRICTIONS_LOGS_FILE, [])
-        return data if isinstance(data, list) else []
-
-    @classmethod
-    def _save_logs(cls, rows: List[Dict[str, Any]]) -> None:
-        with file_lock(ARRIVAL_DEPARTURE_RESTRICTIONS_LOGS_FILE):
-            cls._save_json(ARRIVAL_DEPARTURE_RESTRICTIONS_LOGS_FILE, rows)
+    def _audit_log(cls):
+        return get_audit_log(ARRIVAL_DEPARTURE_RESTRICTIONS_LOGS_FILE, time_field='day_affected', entity_field='category')
 
     @classmethod
     def _normalize_type(cls, value: Any) -> str:
@@ -88,7 +83,7 @@ class ArrivalDepartureRestrictionService:
         if not dates:
             return {'updated': 0, 'dates': []}
         restrictions = cls._load_restrictions()
-        logs = cls._load_logs()
+        logs = []
         now = datetime.now().isoformat()
         updated = 0
         for day in dates:
@@ -142,8 +137,8 @@ class ArrivalDepartureRestrictionService:
                 departamento_id='Recepção',
                 colaborador_id=user,
             )
+        cls._audit_log().append(logs)
         cls._save_restrictions(restrictions)
-        cls._save_logs(logs)
         return {
             'updated': updated,
             'dates': dates,
@@ -200,14 +195,13 @@ class ArrivalDepartureRestrictionService:
         category: Optional[str] = None,
         restriction_type: Optional[str] = None,
     ) -> List[Dict[str, Any]]:
-        rows = cls._load_logs()
         start = PeriodSelectorService.parse_date(start_date).date() if start_date else None
         end = PeriodSelectorService.parse_date(end_date).date() if end_date else None
         category_norm = InventoryRestrictionService.normalize_category(category) if category else ''
         type_norm = cls._normalize_type(restriction_type) if restriction_type else ''
         user_norm = str(user or '').strip().lower()
         out = []
-        for row in rows:
+        for row in cls._audit_log().query(start=start, end=end, entity=category_norm, user=user_norm):
             day_text = str(row.get('day_affected') or row.get('date') or '')
             try:
                 day = PeriodSelectorService.parse_date(day_text).date()
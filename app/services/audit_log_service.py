@@ -0,0 +1,548 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from app.services.cashier_service import file_lock
+from app.services.json_document_cache import stat_token
+
+
+AUDIT_DIR_SUFFIX = '.audit'
+INDEX_NAME = 'index.json'
+ACTIVE_NAME = 'active.jsonl'
+DEFAULT_SEGMENT_BYTES = 1024 * 1024
+DEFAULT_SEGMENT_DAYS = 30
+# Distinct entity ids / users listed per sealed segment; a segment holding
+# more is indexed as "any" and is always read when filtering on that field.
+MAX_INDEXED_KEYS = 256
+
+_SEGMENT_RE = re.compile(r'^(\d{6})\.jsonl$')
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name, default):
+    raw = str(os.environ.get(name) or '').strip()
+    try:
+        return max(1, int(raw)) if raw else default
+    except ValueError:
+        return default
+
+
+def segment_max_bytes():
+    """Size at which the active segment is sealed (ALMAREIA_AUDIT_SEGMENT_BYTES)."""
+    return _env_int('ALMAREIA_AUDIT_SEGMENT_BYTES', DEFAULT_SEGMENT_BYTES)
+
+
+def segment_max_days():
+    """Age at which the active segment is sealed (ALMAREIA_AUDIT_SEGMENT_DAYS)."""
+    return _env_int('ALMAREIA_AUDIT_SEGMENT_DAYS', DEFAULT_SEGMENT_DAYS)
+
+
+def audit_dir_for(path):
+    root, _ext = os.path.splitext(os.path.abspath(path))
+    return root + AUDIT_DIR_SUFFIX
+
+
+def _norm(value):
+    return str(value or '').strip().lower()
+
+
+def _row_day(value):
+    """ISO day of an ISO date/timestamp or a dd/mm/yyyy date; None when neither."""
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    text = str(value or '').strip()
+    try:
+        return date.fromisoformat(text[:10]).isoformat()
+    except ValueError:
+        pass
+    try:
+        return datetime.strptime(text[:10], '%d/%m/%Y').date().isoformat()
+    except ValueError:
+        return None
+
+
+def _dump(row):
+    return json.dumps(row, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+def _read_rows(path):
+    """Rows of one segment; a torn or unreadable line is skipped."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    rows = []
+    for raw in data.splitlines():
+        if not raw.strip():
+            continue
+        try:
+            row = json.loads(raw.decode('utf-8'))
+        except ValueError:
+            logger.warning(f"audit_log_corrupt_line path={path}")
+            continue
+        if isinstance(row, dict):
+            rows.append(row)
+    return rows
+
+
+class AuditLog:
+    """
+    Append-only audit trail stored as segmented JSONL next to the legacy
+    JSON-array file it replaces (``<name>.audit/``).
+
+    Rows go to ``active.jsonl`` with one append per call instead of the
+    load-whole-file / append / rewrite cycle. The active segment is sealed
+    (renamed to ``000001.jsonl``, ...) once it passes ``segment_max_bytes()``
+    or ``segment_max_days()``; sealing records it in ``index.json`` with the
+    day range of ``time_field`` and the entity ids (``entity_field``) and
+    users it holds, so queries only open the sealed segments that can match.
+    The active segment is always scanned. The legacy file, if any, is
+    imported once as sealed segments the first time the log is used and is
+    left untouched.
+    """
+
+    def __init__(self, path, time_field='timestamp', entity_field=None, read_legacy=None):
+        self.path = path
+        self.directory = audit_dir_for(path)
+        self.index_path = os.path.join(self.directory, INDEX_NAME)
+        self.active_path = os.path.join(self.directory, ACTIVE_NAME)
+        self.time_field = time_field
+        self.entity_field = entity_field
+        self._read_legacy = read_legacy or self._load_legacy_json
+        self._lock = threading.RLock()
+        self._index = None
+        self._index_token = None
+        self.counters = {
+            'appends': 0, 'appended_rows': 0, 'rotations': 0, 'imported_rows': 0, 'torn_tails': 0,
+            'queries': 0, 'segments_read': 0, 'segments_skipped': 0, 'rows_scanned': 0,
+        }
+
+    def _load_legacy_json(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return []
+        return data if isinstance(data, list) else []
+
+    # -- index ------------------------------------------------------------
+
+    def _segment_path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _write_index(self):
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._index, f, ensure_ascii=False, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.index_path)
+        self._index_token = stat_token(self.index_path)
+
+    def _read_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = None
+        if not isinstance(index, dict) or not isinstance(index.get('segments'), list):
+            index = None
+        self._index = index
+        self._index_token = stat_token(self.index_path)
+        return index
+
+    def _fields_match(self, index):
+        return index.get('time_field') == self.time_field and index.get('entity_field') == self.entity_field
+
+    def _summarize(self, name, rows=None):
+        path = self._segment_path(name)
+        if rows is None:
+            rows = _read_rows(path)
+        days = []
+        undated = False
+        entities = set()
+        users = set()
+        for row in rows:
+            day = _row_day(row.get(self.time_field))
+            if day is None:
+                undated = True
+            else:
+                days.append(day)
+            if self.entity_field:
+                entities.add(_norm(row.get(self.entity_field)))
+            users.add(_norm(row.get('user')))
+        return {
+            'name': name,
+            'rows': len(rows),
+            'bytes': os.path.getsize(path),
+            'first_day': min(days) if days else None,
+            'last_day': max(days) if days else None,
+            'undated': undated,
+            'entities': sorted(entities) if self.entity_field and len(entities) <= MAX_INDEXED_KEYS else None,
+            'users': sorted(users) if len(users) <= MAX_INDEXED_KEYS else None,
+        }
+
+    def _new_segment_name(self):
+        name = '%06d.jsonl' % self._index['next_segment']
+        self._index['next_segment'] += 1
+        return name
+
+    def _create_index(self):
+        """Builds the index, importing the legacy JSON file as sealed segments."""
+        self._index = {
+            'version': 1,
+            'time_field': self.time_field,
+            'entity_field': self.entity_field,
+            'next_segment': 1,
+            'active_opened_at': None,
+            'imported_rows': 0,
+            'segments': [],
+        }
+        rows = []
+        if not self._sealed_names() and not os.path.exists(self.active_path):
+            # Only a brand-new log imports; segments left without an index
+            # are picked up as orphans by ``_index_locked``.
+            rows = [row for row in (self._read_legacy() or []) if isinstance(row, dict)]
+        limit = segment_max_bytes()
+        chunk = []
+        size = 0
+        for pos, row in enumerate(rows):
+            line = _dump(row)
+            chunk.append(line)
+            size += len(line.encode('utf-8'))
+            if size >= limit or pos == len(rows) - 1:
+                name = self._new_segment_name()
+                tmp_path = self._segment_path(name) + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(''.join(chunk))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self._segment_path(name))
+                self._index['segments'].append(self._summarize(name, [json.loads(line) for line in chunk]))
+                chunk = []
+                size = 0
+        self._index['imported_rows'] = len(rows)
+        self.counters['imported_rows'] += len(rows)
+        self._write_index()
+
+    def _index_locked(self):
+        """Current index; the caller holds the file lock."""
+        token = stat_token(self.index_path)
+        if token is None:
+            self._create_index()
+        elif self._index is None or token != self._index_token:
+            if self._read_index() is None:
+                self._create_index()
+        index = self._index
+        known = {item['name'] for item in index['segments']}
+        orphans = [name for name in self._sealed_names() if name not in known]
+        stale = not self._fields_match(index)
+        if orphans or stale:
+            # A seal interrupted between the rename and the index write, or
+            # an index built for other fields: summarize from the files.
+            segments = index['segments'] + [{'name': name} for name in orphans]
+            index['segments'] = [self._summarize(item['name']) if stale or item['name'] in orphans else item for item in segments]
+            index['segments'].sort(key=lambda item: item['name'])
+            index['time_field'] = self.time_field
+            index['entity_field'] = self.entity_field
+            numbers = [int(_SEGMENT_RE.match(item['name']).group(1)) for item in index['segments']]
+            index['next_segment'] = max([index['next_segment']] + [n + 1 for n in numbers])
+            self._write_index()
+        return index
+
+    def _current_index(self):
+        """Index for readers, without the file lock unless it must be created."""
+        token = stat_token(self.index_path)
+        if token is None:
+            os.makedirs(self.directory, exist_ok=True)
+            with file_lock(self.index_path):
+                return self._index_locked()
+        if self._index is None or token != self._index_token:
+            if self._read_index() is None:
+                with file_lock(self.index_path):
+                    return self._index_locked()
+        return self._index
+
+    def _sealed_names(self):
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        return sorted(name for name in names if _SEGMENT_RE.match(name))
+
+    # -- writes -----------------------------------------------------------
+
+    def _rotate_if_due(self, index):
+        try:
+            size = os.path.getsize(self.active_path)
+        except OSError:
+            return
+        if size <= 0:
+            return
+        opened_at = index.get('active_opened_at')
+        too_old = False
+        if opened_at:
+            try:
+                too_old = datetime.now() - datetime.fromisoformat(opened_at) >= timedelta(days=segment_max_days())
+            except ValueError:
+                too_old = True
+        if size < segment_max_bytes() and not too_old:
+            return
+        name = self._new_segment_name()
+        os.replace(self.active_path, self._segment_path(name))
+        index['segments'].append(self._summarize(name))
+        index['active_opened_at'] = None
+        self._write_index()
+        self.counters['rotations'] += 1
+
+    def _cut_torn_tail(self):
+        try:
+            with open(self.active_path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return
+        if not data or data.endswith(b'\n'):
+            return
+        self.counters['torn_tails'] += 1
+        with open(self.active_path, 'r+b') as f:
+            f.truncate(data.rfind(b'\n') + 1)
+
+    def append(self, rows):
+        """Appends dict rows; returns how many were written."""
+        rows = [row for row in (rows or []) if isinstance(row, dict)]
+        if not rows:
+            return 0
+        data = ''.join(_dump(row) for row in rows).encode('utf-8')
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock, file_lock(self.index_path):
+            index = self._index_locked()
+            self._rotate_if_due(index)
+            self._cut_torn_tail()
+            with open(self.active_path, 'ab') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            if not index.get('active_opened_at'):
+                index['active_opened_at'] = datetime.now().isoformat(timespec='seconds')
+                self._write_index()
+            self.counters['appends'] += 1
+            self.counters['appended_rows'] += len(rows)
+        return len(rows)
+
+    # -- reads ------------------------------------------------------------
+
+    def _may_match(self, summary, start_day, end_day, entity, user, user_contains):
+        if not summary.get('rows'):
+            return False
+        if not summary.get('undated'):
+            if start_day and summary.get('last_day') and summary['last_day'] < start_day:
+                return False
+            if end_day and summary.get('first_day') and summary['first_day'] > end_day:
+                return False
+        if entity and summary.get('entities') is not None and entity not in summary['entities']:
+            return False
+        users = summary.get('users')
+        if user and users is not None:
+            if user_contains and not any(user in name for name in users):
+                return False
+            if not user_contains and user not in users:
+                return False
+        return True
+
+    def _row_matches(self, row, start_day, end_day, entity, user, user_contains):
+        if start_day or end_day:
+            day = _row_day(row.get(self.time_field))
+            # Rows whose date this parser does not read are left to ``where``.
+            if day is not None and ((start_day and day < start_day) or (end_day and day > end_day)):
+                return False
+        if entity and _norm(row.get(self.entity_field)) != entity:
+            return False
+        if user:
+            name = _norm(row.get('user'))
+            if (user not in name) if user_contains else (name != user):
+                return False
+        return True
+
+    def query(self, *, start=None, end=None, entity=None, user=None, user_contains=False,
+              where=None, limit=None, offset=0, newest_first=False):
+        """
+        Rows in append order (newest first with ``newest_first``) whose
+        ``time_field`` day lies in [start, end], whose ``entity_field``
+        equals ``entity`` and whose user equals (or, with
+        ``user_contains``, contains) ``user`` -- all compared trimmed and
+        case-insensitively -- and for which ``where(row)`` holds. ``limit``
+        and ``offset`` page over the matching rows; reading stops as soon
+        as the page is full.
+        """
+        start_day = _row_day(start) if start else None
+        end_day = _row_day(end) if end else None
+        entity_key = _norm(entity) if entity and self.entity_field else ''
+        user_key = _norm(user)
+        with self._lock:
+            index = self._current_index()
+            prunable = self._fields_match(index)
+            planned = []
+            known = set()
+            skipped = 0
+            for summary in index['segments']:
+                known.add(summary['name'])
+                if prunable and not self._may_match(summary, start_day, end_day, entity_key, user_key, user_contains):
+                    skipped += 1
+                    continue
+                planned.append(summary['name'])
+        # Segments sealed by another worker since the index was read.
+        planned.extend(name for name in self._sealed_names() if name not in known)
+        planned.append(ACTIVE_NAME)
+        if newest_first:
+            planned.reverse()
+        out = []
+        read = 0
+        scanned = 0
+        skip = max(0, int(offset or 0))
+        for name in planned:
+            try:
+                rows = _read_rows(self._segment_path(name))
+            except FileNotFoundError:
+                if name != ACTIVE_NAME:
+                    continue
+                # The active segment was sealed meanwhile: read what it became.
+                rows = []
+                for sealed in self._sealed_names():
+                    if sealed not in known and sealed not in planned:
+                        rows.extend(_read_rows(self._segment_path(sealed)))
+            read += 1
+            scanned += len(rows)
+            if newest_first:
+                rows.reverse()
+            for row in rows:
+                if not self._row_matches(row, start_day, end_day, entity_key, user_key, user_contains):
+                    continue
+                if where is not None and not where(row):
+                    continue
+                if skip:
+                    skip -= 1
+                    continue
+                out.append(row)
+                if limit is not None and len(out) >= limit:
+                    break
+            if limit is not None and len(out) >= limit:
+                break
+        with self._lock:
+            self.counters['queries'] += 1
+            self.counters['segments_read'] += read
+            self.counters['segments_skipped'] += skipped
+            self.counters['rows_scanned'] += scanned
+        return out
+
+    def stats(self):
+        with self._lock:
+            index = self._index or {}
+            segments = index.get('segments') or []
+            try:
+                active_bytes = os.path.getsize(self.active_path)
+            except OSError:
+                active_bytes = 0
+            return dict(
+                self.counters,
+                sealed_segments=len(segments),
+                sealed_rows=sum(int(item.get('rows') or 0) for item in segments),
+                active_bytes=active_bytes,
+            )
+
+
+_LOGS = {}
+_LOGS_LOCK = threading.Lock()
+
+
+def get_audit_log(path, time_field='timestamp', entity_field=None, read_legacy=None):
+    key = os.path.abspath(path)
+    with _LOGS_LOCK:
+        log = _LOGS.get(key)
+        if log is None:
+            log = AuditLog(path, time_field=time_field, entity_field=entity_field, read_legacy=read_legacy)
+            _LOGS[key] = log
+        return log
+
+
+def audit_log_stats():
+    with _LOGS_LOCK:
+        logs = list(_LOGS.values())
+    return {os.path.basename(log.path): log.stats() for log in logs}
+
+
+def _benchmark(rows=5000, channels=12, days=365):
+    """Legacy load/append/rewrite of a JSON array vs segmented appends, and one filtered query."""
+    import random
+    import tempfile
+
+    rng = random.Random(3)
+    first = date(2026, 1, 1)
+    samples = [{
+        'id': str(i),
+        'timestamp': (datetime.combine(first, datetime.min.time()) + timedelta(minutes=i * days * 1440 // rows)).isoformat(timespec='seconds'),
+        'user': f"user{rng.randrange(8)}",
+        'channel': f"canal{rng.randrange(channels)}",
+        'before': {'value': rng.random()},
+        'after': {'value': rng.random()},
+    } for i in range(rows)]
+    tail = samples[-100:]
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, 'legacy.json')
+        with open(legacy_path, 'w', encoding='utf-8') as f:
+            json.dump(samples[:-100], f)
+        started = time.perf_counter()
+        for row in tail:
+            with open(legacy_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            data.append(row)
+            with open(legacy_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
+        legacy_append_s = time.perf_counter() - started
+
+        # Same starting rows, imported once as 256 KiB segments.
+        log = AuditLog(legacy_path, entity_field='channel', read_legacy=lambda: samples[:-100])
+        previous = os.environ.get('ALMAREIA_AUDIT_SEGMENT_BYTES')
+        os.environ['ALMAREIA_AUDIT_SEGMENT_BYTES'] = str(256 * 1024)
+        try:
+            log.query(limit=1)
+        finally:
+            if previous is None:
+                os.environ.pop('ALMAREIA_AUDIT_SEGMENT_BYTES', None)
+            else:
+                os.environ['ALMAREIA_AUDIT_SEGMENT_BYTES'] = previous
+        started = time.perf_counter()
+        for row in tail:
+            log.append([row])
+        audit_append_s = time.perf_counter() - started
+
+        window = (date(2026, 11, 1), date(2026, 11, 30))
+        started = time.perf_counter()
+        with open(legacy_path, 'r', encoding='utf-8') as f:
+            legacy_rows = [
+                row for row in json.load(f)
+                if window[0].isoformat() <= row['timestamp'][:10] <= window[1].isoformat() and row['channel'] == 'canal3'
+            ]
+        legacy_query_s = time.perf_counter() - started
+        started = time.perf_counter()
+        audit_rows = log.query(start=window[0], end=window[1], entity='canal3')
+        audit_query_s = time.perf_counter() - started
+        stats = log.stats()
+    assert len(audit_rows) == len(legacy_rows)
+    return {
+        'legacy_append_100_s': round(legacy_append_s, 4),
+        'audit_append_100_s': round(audit_append_s, 4),
+        'legacy_query_s': round(legacy_query_s, 4),
+        'audit_query_s': round(audit_query_s, 4),
+        'segments': stats['sealed_segments'] + 1,
+        'segments_read': stats['segments_read'],
+        'matches': len(audit_rows),
+    }
+
+
+if __name__ == '__main__':
+    print(_benchmark())
@@ -44,6 +44,7 @@ DEFAULT_BACKUP_CONFIGS = {
             'products.json',
             'suppliers.json',
             'stock_entries.json',
+            'stock_entries.journal.jsonl',
             'stock_transfers.json',
             'stock_logs.json',
             'stock_requests.json'
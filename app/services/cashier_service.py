@@ -18,6 +18,8 @@ try:
     from app.services.system_config_manager import get_backup_path, CASHIER_SESSIONS_FILE
 except ImportError:
     from system_config_manager import get_backup_path, CASHIER_SESSIONS_FILE
+from app.services.cashier_session_index import CashierSessionIndex
+from app.services.json_document_cache import is_racy, stat_token
 
 import logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -36,6 +38,12 @@ cashier_lock = Lock()
 _last_backup_hash = None
 _backup_thread_started = False
 
+# A snapshot read from a racy file (json_document_cache.is_racy) is used
+# once, not cached. Writes from this process adopt their own token.
+_SESSION_INDEX = None
+_SESSION_INDEX_LOCK = Lock()
+_SESSION_INDEX_STATS = {'builds': 0, 'hits': 0, 'adopted': 0, 'appends': 0}
+
 
 def _is_test_environment():
     path = os.path.normpath(CASHIER_SESSIONS_FILE).lower()
@@ -230,8 +238,13 @@ class CashierService:
             raise e
 
     @staticmethod
-    def _save_sessions(sessions):
+    def _save_sessions(sessions, appended=None):
+        """
+        ``appended`` maps session id -> transactions just appended to that
+        session; the session index folds them instead of being rebuilt.
+        """
         # Atomic write pattern: write to temp file then rename
+        previous_token = stat_token(CASHIER_SESSIONS_FILE)
         try:
             # Create a temp file in the same directory to ensure atomic rename works across filesystems
             dir_name = os.path.dirname(CASHIER_SESSIONS_FILE)
@@ -264,7 +277,8 @@ class CashierService:
                          time.sleep(0.1)
                     else:
                         raise
-                        
+
+            CashierService._adopt_session_index(sessions, appended, previous_token)
             return True
         except Exception as e:
             print(f"Error saving cashier sessions: {e}")
@@ -276,6 +290,90 @@ class CashierService:
                     pass
             raise e
 
+    @staticmethod
+    def _session_index():
+        """
+        Indexed snapshot of cashier_sessions.json, rebuilt only when the
+        file changes on disk. A missing or unreadable file goes through
+        ``_load_sessions`` (and its backup recovery) every time.
+        """
+        global _SESSION_INDEX
+        path = CASHIER_SESSIONS_FILE
+        token = stat_token(path)
+        if token is not None:
+            with _SESSION_INDEX_LOCK:
+                cached = _SESSION_INDEX
+                if cached is not None and cached[0] == (path, token):
+                    _SESSION_INDEX_STATS['hits'] += 1
+                    return cached[1]
+        index = CashierSessionIndex(CashierService._load_sessions())
+        racy = token is None or is_racy(token)
+        with _SESSION_INDEX_LOCK:
+            _SESSION_INDEX_STATS['builds'] += 1
+            if not racy and token == stat_token(path):
+                _SESSION_INDEX = ((path, token), index)
+        return index
+
+    @staticmethod
+    def _adopt_session_index(sessions, appended=None, previous_token=None):
+        """
+        Called with the list just written. Appended transactions are folded
+        into the cached snapshot only if it reflects the file as it was
+        before this write (``previous_token``); otherwise the list is
+        re-indexed.
+        """
+        global _SESSION_INDEX
+        path = CASHIER_SESSIONS_FILE
+        token = stat_token(path)
+        if token is None or not isinstance(sessions, list):
+            with _SESSION_INDEX_LOCK:
+                _SESSION_INDEX = None
+            return
+        try:
+            with _SESSION_INDEX_LOCK:
+                cached = _SESSION_INDEX
+            index = cached[1] if cached is not None and cached[0] == (path, previous_token) else None
+            if index is not None and appended:
+                by_id = {s.get('id'): s for s in sessions if isinstance(s, dict) and s.get('id') in appended}
+                if len(index) == len(sessions) and all(
+                    index.append_transactions(by_id.get(session_id), txs) for session_id, txs in appended.items()
+                ):
+                    counter = 'appends'
+                else:
+                    index = None
+            else:
+                index = None
+            if index is None:
+                index = CashierSessionIndex(sessions)
+                counter = 'adopted'
+        except Exception as e:
+            logger.error(f"Failed to update cashier session index: {e}")
+            index = None
+        with _SESSION_INDEX_LOCK:
+            if index is None:
+                _SESSION_INDEX = None
+                return
+            _SESSION_INDEX_STATS[counter] += 1
+            _SESSION_INDEX = ((path, token), index)
+
+    @staticmethod
+    def session_index_stats():
+        with _SESSION_INDEX_LOCK:
+            stats = dict(_SESSION_INDEX_STATS)
+            cached = _SESSION_INDEX
+        stats['cached'] = cached is not None
+        stats['sessions'] = len(cached[1]) if cached is not None else 0
+        stats['by_status'] = cached[1].counts('status') if cached is not None else {}
+        return stats
+
+    @staticmethod
+    def _session_totals(session):
+        """Running totals of ``session`` from the index, or None when it is not the stored copy."""
+        try:
+            return CashierService._session_index().totals_for(session)
+        except Exception:
+            return None
+
     @staticmethod
     def list_sessions():
         return CashierService._load_sessions()
@@ -464,17 +562,11 @@ class CashierService:
     @staticmethod
     def get_session_details(session_id):
         """Returns the full session details by ID."""
-        sessions = CashierService._load_sessions()
-        for s in sessions:
-            if s.get('id') == session_id:
-                return s
-        return None
+        return CashierService.get_session_by_id(session_id)
 
     @staticmethod
     def get_active_session(cashier_type):
         """Returns the active (open) session for the given type."""
-        sessions = CashierService._load_sessions()
-        
         # Compatibility mapping - Bidirectional
         target_types = [cashier_type]
         
@@ -486,13 +578,13 @@ class CashierService:
         
         # logger.debug(f"Checking active session for {cashier_type}. Target types: {target_types}")
         
-        for s in sessions:
-            if s.get('status') == 'open' and s.get('type') in target_types:
-                return s
-        return None
+        return CashierService._session_index().first_open(target_types)
 
     @staticmethod
     def _calculate_balance(session):
+        totals = CashierService._session_totals(session)
+        if totals is not None and totals['balance'] is not None:
+            return totals['balance']
         opening_balance = float(session.get('opening_balance', session.get('initial_balance', 0.0)) or 0.0)
         current_balance = opening_balance
         
@@ -524,6 +616,13 @@ class CashierService:
             'total_out': 0.0,
             'balance_by_method': {}
         }
+
+        totals = CashierService._session_totals(session)
+        if totals is not None:
+            summary['total_in'] = totals['total_in']
+            summary['total_out'] = totals['total_out']
+            summary['balance_by_method'] = dict(totals['balance_by_method'])
+            return summary
         
         for t in session.get('transactions', []) or []:
             try:
@@ -551,6 +650,9 @@ class CashierService:
         """
         Calculates the available PHYSICAL CASH balance in the session.
         """
+        totals = CashierService._session_totals(session)
+        if totals is not None:
+            return totals['cash_balance']
         # Opening balance is assumed to be Cash (Fundo de Troco)
         try:
             current_cash = float(session.get('opening_balance', session.get('initial_balance', 0.0)) or 0.0)
@@ -888,7 +990,7 @@ class CashierService:
             CashierService._apply_commission_contract(transaction)
             
             sessions[session_idx]['transactions'].append(transaction)
-            CashierService._save_sessions(sessions)
+            CashierService._save_sessions(sessions, appended={session.get('id'): [transaction]})
 
             # --- LEDGER INTEGRATION ---
             try:
@@ -1163,59 +1265,49 @@ class CashierService:
         """
         Returns a paginated, reversed (newest first), and prepared list of transactions.
         Groups transactions BEFORE slicing to prevent splitting groups across pages.
+        The grouped rows of each session are kept by the session index, so
+        paging only slices them.
         """
-        session = CashierService.get_session_by_id(session_id)
-        if not session:
+        result = CashierService._session_index().display_page(
+            session_id, CashierService.prepare_transactions_for_display, page, per_page
+        )
+        if result is None:
             return [], False
-
-        all_transactions = session.get('transactions', [])
-        # Reverse to get newest first (Display Order: Newest -> Oldest)
-        reversed_transactions = list(reversed(all_transactions))
-        
-        # Prepare (Group) ALL transactions first to ensure groups aren't broken by pagination slicing
-        # This is slightly more expensive but ensures consistency
-        prepared_all = CashierService.prepare_transactions_for_display(reversed_transactions)
-        
-        total_items = len(prepared_all)
-        start = (page - 1) * per_page
-        end = start + per_page
-        
-        # Slice the prepared list
-        sliced_transactions = prepared_all[start:end]
-        
-        has_more = end < total_items
-        
-        return sliced_transactions, has_more
+        return result
 
     @staticmethod
     def get_session_by_id(session_id):
-        sessions = CashierService._load_sessions()
-        for s in sessions:
-            if s.get('id') == session_id:
-                return s
-        return None
+        return CashierService._session_index().session(session_id)
 
     @staticmethod
-    def get_history(start_date=None, end_date=None, cashier_type=None):
-        sessions = CashierService._load_sessions()
-        filtered = []
-        
+    def _history_types(cashier_type):
+        if not cashier_type:
+            return None
+        if cashier_type == 'guest_consumption':
+            return ['guest_consumption', 'reception_room_billing']
+        return [cashier_type]
+
+    @staticmethod
+    def get_history(start_date=None, end_date=None, cashier_type=None, status=None, limit=None):
         # Parse dates if provided (dd/mm/yyyy)
         start_dt = datetime.strptime(start_date, '%d/%m/%Y') if start_date else None
         end_dt = datetime.strptime(end_date, '%d/%m/%Y') if end_date else None
-        
-        for s in sessions:
+
+        types = CashierService._history_types(cashier_type)
+        indexed = CashierService._session_index().history(
+            types=types, status=status, start_day=start_dt, end_day=end_dt, limit=limit
+        )
+        if indexed is not None:
+            return indexed
+
+        # Some opened_at cannot be sorted: scan as before (and raise as before).
+        filtered = []
+        for s in CashierService._session_index().entries():
             # Filter by Type
-            if cashier_type:
-                match = False
-                s_type = s.get('type')
-                if cashier_type == 'guest_consumption' and s_type in ['guest_consumption', 'reception_room_billing']:
-                    match = True
-                elif s_type == cashier_type:
-                    match = True
-                
-                if not match:
-                    continue
+            if types is not None and s.get('type') not in types:
+                continue
+            if status is not None and s.get('status') != status:
+                continue
             
             # Filter by Date (Opened At)
             if start_dt or end_dt:
@@ -1232,7 +1324,7 @@ class CashierService:
         
         # Sort by opened_at descending
         filtered.sort(key=lambda x: datetime.strptime(x['opened_at'], '%d/%m/%Y %H:%M') if x.get('opened_at') else datetime.min, reverse=True)
-        return filtered
+        return filtered[:limit] if limit is not None else filtered
 
     @staticmethod
     def validate_transfer_eligibility(source_type, target_type, user):
@@ -1420,7 +1512,10 @@ class CashierService:
             }
             target_session['transactions'].append(in_trans)
 
-            CashierService._save_sessions(sessions)
+            CashierService._save_sessions(sessions, appended={
+                source_session.get('id'): [out_trans],
+                target_session.get('id'): [in_trans],
+            })
             CashierService._perform_backup(sessions)
             
             # --- LEDGER INTEGRATION ---
@@ -1463,8 +1558,14 @@ class CashierService:
         """Returns the current status summary for a specific cashier type."""
         session = CashierService.get_active_session(cashier_type)
         if session:
-            current_balance = session['opening_balance']
-            for t in session.get('transactions', []):
+            totals = CashierService._session_totals(session)
+            if totals is not None and totals['status_balance'] is not None:
+                current_balance = totals['status_balance']
+                transactions = []
+            else:
+                current_balance = session['opening_balance']
+                transactions = session.get('transactions', [])
+            for t in transactions:
                 try:
                     amount = float(t.get('amount', 0))
                 except:
@@ -1485,10 +1586,8 @@ class CashierService:
                 'transaction_count': len(session['transactions'])
             }
         
-        # Get last closed session
-        history = CashierService.get_history(cashier_type=cashier_type)
-        # Filter for closed ones
-        closed = [s for s in history if s.get('status') == 'closed']
+        # Get last closed session (history is sorted desc)
+        closed = CashierService.get_history(cashier_type=cashier_type, status='closed', limit=1)
         if closed:
             last = closed[0] # history is sorted desc
             return {
@@ -0,0 +1,372 @@
+import marshal
+import threading
+import time
+from datetime import datetime
+
+
+_OUT_TYPES = ('out', 'withdrawal', 'refund', 'sangria')
+_IN_TYPES = ('in', 'deposit', 'sale', 'suprimento')
+_CASH_METHODS = ('dinheiro', 'espécie', 'especie', 'cash')
+_CASH_OPERATIONS = ('supply', 'suprimento', 'bleeding', 'sangria')
+_TRANSFER_METHODS = ('transfer', 'transferência', 'transferencia')
+_NON_CASH_METHODS = ('cartão', 'cartao', 'crédito', 'credito', 'débito', 'debito', 'pix', 'cheque')
+
+
+def _amount(t):
+    try:
+        return float(t.get('amount', 0.0) or 0.0)
+    except Exception:
+        return 0.0
+
+
+def _is_cash(t_type, method):
+    is_cash = False
+    if any(k in method for k in _CASH_METHODS):
+        is_cash = True
+    elif t_type in _CASH_OPERATIONS:
+        is_cash = True
+    elif any(k in method for k in _TRANSFER_METHODS):
+        is_cash = True
+    if any(k in method for k in _NON_CASH_METHODS):
+        is_cash = False
+    return is_cash
+
+
+def new_totals(session):
+    """
+    Running totals of a session before any transaction. Each field starts
+    from the opening balance exactly as the matching ``CashierService``
+    loop reads it; a field whose opening value the loop could not read is
+    ``None`` so the caller falls back to the loop (and its error).
+    """
+    try:
+        balance = float(session.get('opening_balance', session.get('initial_balance', 0.0)) or 0.0)
+    except Exception:
+        balance = None
+    try:
+        cash = float(session.get('opening_balance', session.get('initial_balance', 0.0)) or 0.0)
+    except Exception:
+        cash = 0.0
+    status = session.get('opening_balance')
+    if isinstance(status, bool) or not isinstance(status, (int, float)):
+        status = None
+    return {
+        'balance': balance,
+        'cash_balance': cash,
+        'status_balance': status,
+        'total_in': 0.0,
+        'total_out': 0.0,
+        'balance_by_method': {},
+        'count': 0,
+    }
+
+
+def fold_transaction(totals, t):
+    """Applies one transaction to ``totals`` (same rules, same order of float operations as the loops)."""
+    totals['count'] += 1
+    if not isinstance(t, dict):
+        return
+    amount = _amount(t)
+    t_type = str(t.get('type', '')).strip().lower()
+
+    if totals['balance'] is not None:
+        if t_type in _OUT_TYPES:
+            totals['balance'] -= abs(amount)
+        elif t_type in _IN_TYPES:
+            totals['balance'] += abs(amount)
+
+    method = t.get('payment_method', 'Outros')
+    by_method = totals['balance_by_method']
+    if t_type in ('in', 'sale', 'deposit'):
+        totals['total_in'] += amount
+        by_method[method] = by_method.get(method, 0.0) + amount
+    elif t_type in ('out', 'withdrawal'):
+        totals['total_out'] += amount
+        if method == 'Dinheiro' or method == 'Outros':
+            by_method[method] = by_method.get(method, 0.0) - amount
+
+    if _is_cash(t_type, str(t.get('payment_method', '')).strip().lower()):
+        if t_type in _OUT_TYPES:
+            totals['cash_balance'] -= abs(amount)
+        elif t_type in _IN_TYPES:
+            totals['cash_balance'] += abs(amount)
+
+    if totals['status_balance'] is not None:
+        try:
+            status_amount = float(t.get('amount', 0))
+        except Exception:
+            status_amount = 0.0
+        if str(t.get('type', '')).lower() in ('out', 'withdrawal', 'refund'):
+            totals['status_balance'] -= abs(status_amount)
+        else:
+            totals['status_balance'] += status_amount
+
+
+def _fingerprint(session):
+    txs = session.get('transactions')
+    if not isinstance(txs, list):
+        return None
+    last = txs[-1] if txs else None
+    last_id = last.get('id') if isinstance(last, dict) else None
+    return (len(txs), last_id, session.get('opening_balance'), session.get('initial_balance'))
+
+
+def _sort_key(session):
+    opened_at = session.get('opened_at')
+    return datetime.strptime(opened_at, '%d/%m/%Y %H:%M') if opened_at else datetime.min
+
+
+def _opened_day(session):
+    try:
+        return datetime.strptime(session['opened_at'].split(' ')[0], '%d/%m/%Y')
+    except Exception:
+        # get_history keeps sessions whose date cannot be read.
+        return None
+
+
+class CashierSessionIndex:
+    """
+    Snapshot of cashier_sessions.json with lookup tables.
+
+    Sessions are kept as marshal blobs so every caller gets its own copy.
+    Alongside them: position by id, open sessions by type, a history order
+    (``opened_at`` descending, ties in file order like ``list.sort``) with
+    type and status indexes holding *ranks* in that order, per-session
+    running totals (balances, totals in/out, balance per payment method)
+    and the prepared display rows of each session, both computed on first
+    use and updated when this process appends transactions.
+    """
+
+    def __init__(self, sessions):
+        self._lock = threading.Lock()
+        self._blobs = []
+        self._by_id = {}
+        self._meta = []
+        for session in sessions or []:
+            if not isinstance(session, dict):
+                continue
+            pos = len(self._blobs)
+            if isinstance(session.get('id'), (str, int)):
+                self._by_id.setdefault(session.get('id'), pos)
+            self._blobs.append(marshal.dumps(session))
+            self._meta.append(self._describe(session))
+        self._totals = {}
+        self._display = {}
+        self._build_order()
+
+    @staticmethod
+    def _describe(session):
+        try:
+            sort_key = _sort_key(session)
+        except Exception:
+            sort_key = None
+        return {
+            'type': session.get('type'),
+            'status': session.get('status'),
+            'day': _opened_day(session),
+            'sort_key': sort_key,
+            'fingerprint': _fingerprint(session),
+        }
+
+    def _build_order(self):
+        self._open = [pos for pos, meta in enumerate(self._meta) if meta['status'] == 'open']
+        if any(meta['sort_key'] is None for meta in self._meta):
+            # get_history raises on an unreadable opened_at; callers fall back to it.
+            self._order = None
+            return
+        self._order = sorted(range(len(self._meta)), key=lambda pos: self._meta[pos]['sort_key'], reverse=True)
+        self._by_type = {}
+        self._by_status = {}
+        for rank, pos in enumerate(self._order):
+            self._by_type.setdefault(self._meta[pos]['type'], []).append(rank)
+            self._by_status.setdefault(self._meta[pos]['status'], []).append(rank)
+
+    def __len__(self):
+        return len(self._blobs)
+
+    def entries(self):
+        """Copy of every session, in file order."""
+        return [marshal.loads(blob) for blob in self._blobs]
+
+    def session(self, session_id):
+        if not isinstance(session_id, (str, int)):
+            return None
+        pos = self._by_id.get(session_id)
+        if pos is None:
+            return None
+        return marshal.loads(self._blobs[pos])
+
+    def first_open(self, types):
+        """First open session (file order) whose type is in ``types``."""
+        for pos in self._open:
+            if self._meta[pos]['type'] in types:
+                return marshal.loads(self._blobs[pos])
+        return None
+
+    def counts(self, field='status'):
+        counts = {}
+        for meta in self._meta:
+            counts[meta[field]] = counts.get(meta[field], 0) + 1
+        return counts
+
+    def history(self, types=None, status=None, start_day=None, end_day=None, limit=None):
+        """
+        Sessions of ``types`` (any type if None) opened between the given
+        days, newest first, with ``get_history``'s rules: sessions with an
+        unreadable date are kept. ``None`` when the file has an
+        ``opened_at`` the history sort cannot parse.
+        """
+        if self._order is None:
+            return None
+        if types is None:
+            ranks = range(len(self._order))
+        else:
+            ranks = sorted(rank for t in set(types) for rank in self._by_type.get(t, []))
+        if status is not None:
+            keep = set(self._by_status.get(status, []))
+            ranks = [rank for rank in ranks if rank in keep]
+        page = []
+        for rank in ranks:
+            pos = self._order[rank]
+            day = self._meta[pos]['day']
+            if day is not None and ((start_day and day < start_day) or (end_day and day > end_day)):
+                continue
+            page.append(marshal.loads(self._blobs[pos]))
+            if limit is not None and len(page) >= limit:
+                break
+        return page
+
+    def totals_for(self, session):
+        """
+        Running totals for ``session`` if it is the stored one (same id,
+        transaction count, last transaction id and opening balance), else
+        ``None``. The returned dict is shared; callers must not mutate it.
+        """
+        if not isinstance(session, dict) or not isinstance(session.get('id'), (str, int)):
+            return None
+        fingerprint = _fingerprint(session)
+        with self._lock:
+            pos = self._by_id.get(session.get('id'))
+            if pos is None or self._meta[pos]['fingerprint'] != fingerprint:
+                return None
+            totals = self._totals.get(pos)
+            if totals is None:
+                stored = marshal.loads(self._blobs[pos])
+                totals = new_totals(stored)
+                for t in stored.get('transactions', []) or []:
+                    fold_transaction(totals, t)
+                self._totals[pos] = totals
+            return totals
+
+    def display_page(self, session_id, prepare, page, per_page):
+        """
+        ``(rows, has_more)`` of the session's transactions newest first,
+        grouped by ``prepare`` over the whole session once and sliced
+        afterwards. ``None`` for an unknown session.
+        """
+        pos = self._by_id.get(session_id) if isinstance(session_id, (str, int)) else None
+        if pos is None:
+            return None
+        with self._lock:
+            rows = self._display.get(pos)
+        if rows is None:
+            stored = marshal.loads(self._blobs[pos])
+            prepared = prepare(list(reversed(stored.get('transactions', []))))
+            rows = [marshal.dumps(row) for row in prepared]
+            with self._lock:
+                self._display[pos] = rows
+        start = (page - 1) * per_page
+        end = start + per_page
+        return [marshal.loads(blob) for blob in rows[start:end]], end < len(rows)
+
+    def append_transactions(self, session, transactions):
+        """
+        Adopts ``session`` as just written with ``transactions`` appended at
+        its end. Returns False when the stored copy is not the session as
+        it was before the append; the caller then rebuilds the index.
+        """
+        if not isinstance(session, dict) or not isinstance(session.get('id'), (str, int)):
+            return False
+        pos = self._by_id.get(session.get('id'))
+        txs = session.get('transactions')
+        if pos is None or not isinstance(txs, list):
+            return False
+        blob = marshal.dumps(session)
+        with self._lock:
+            previous = self._meta[pos]['fingerprint']
+            if previous is None or len(txs) != previous[0] + len(transactions):
+                return False
+            last = txs[previous[0] - 1] if previous[0] else None
+            if (last.get('id') if isinstance(last, dict) else None) != previous[1]:
+                return False
+            self._blobs[pos] = blob
+            self._meta[pos]['fingerprint'] = _fingerprint(session)
+            totals = self._totals.get(pos)
+            if totals is not None:
+                for t in transactions:
+                    fold_transaction(totals, t)
+            self._display.pop(pos, None)
+        return True
+
+
+def _benchmark(num_sessions=1500, txs_per_session=40, lookups=20):
+    """Full load + scans per call vs the index (active session, balances, history, first page)."""
+    import json
+    import random
+
+    rng = random.Random(20)
+    types = ['restaurant', 'guest_consumption', 'daily_rates', 'reservation_cashier']
+    methods = ['Dinheiro', 'Pix', 'Cartão de Crédito', 'Cartão de Débito']
+    sessions = []
+    for i in range(num_sessions):
+        opened = f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2025 {rng.randint(6, 22):02d}:00"
+        sessions.append({
+            'id': f"SESSION_{i:05d}",
+            'type': types[i % len(types)],
+            'status': 'closed',
+            'opened_at': opened,
+            'opening_balance': 100.0,
+            'transactions': [
+                {
+                    'id': f"TX_{i}_{j}",
+                    'type': rng.choice(['sale', 'sale', 'sale', 'out']),
+                    'amount': round(rng.uniform(5, 300), 2),
+                    'payment_method': rng.choice(methods),
+                    'description': f"Venda Mesa {rng.randint(1, 40)}",
+                    'timestamp': opened,
+                    'details': {},
+                }
+                for j in range(txs_per_session)
+            ],
+        })
+    for t in types:
+        sessions.append(dict(sessions[-1], id=f"SESSION_OPEN_{t}", type=t, status='open'))
+    raw = json.dumps(sessions)
+
+    def _scan_balance(session):
+        totals = new_totals(session)
+        for t in session['transactions']:
+            fold_transaction(totals, t)
+        return totals
+
+    started = time.perf_counter()
+    for n in range(lookups):
+        loaded = json.loads(raw)
+        active = next(s for s in loaded if s['status'] == 'open' and s['type'] == types[n % len(types)])
+        _scan_balance(active)
+    linear = time.perf_counter() - started
+
+    started = time.perf_counter()
+    index = CashierSessionIndex(json.loads(raw))
+    build = time.perf_counter() - started
+    started = time.perf_counter()
+    for n in range(lookups):
+        active = index.first_open([types[n % len(types)]])
+        index.totals_for(active)
+    index.history(types=['restaurant'], limit=20)
+    indexed = time.perf_counter() - started
+    return {'linear_s': round(linear, 4), 'index_build_s': round(build, 4), 'index_lookup_s': round(indexed, 4)}
+
+
+if __name__ == '__main__':
+    print(_benchmark())
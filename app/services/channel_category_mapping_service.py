@@ -2,6 +2,7 @@ from datetime import datetime
 from typing import Any, Dict, List, Optional
 import uuid
 
+from app.services.audit_log_service import get_audit_log
 from app.services.cashier_service import file_lock
 from app.services.channel_inventory_control_service import ChannelInventoryControlService
 from app.services.logger_service import LoggerService
@@ -71,10 +72,8 @@ class ChannelCategoryMappingService:
         return out
 
     @classmethod
-    def _append_log(cls, item: Dict[str, Any]) -> None:
-        logs = cls._load_json(CHANNEL_MANAGER_CATEGORY_MAPPINGS_LOGS_FILE, [])
-        logs.append(item)
-        cls._save_json(CHANNEL_MANAGER_CATEGORY_MAPPINGS_LOGS_FILE, logs)
+    def _mapping_log(cls):
+        return get_audit_log(CHANNEL_MANAGER_CATEGORY_MAPPINGS_LOGS_FILE, entity_field='channel_name')
 
     @classmethod
     def list_mappings(cls, *, channel_name: Optional[str] = None) -> Dict[str, Any]:
@@ -172,8 +171,8 @@ class ChannelCategoryMappingService:
                     })
         cls._save_json(CHANNEL_MANAGER_CATEGORY_MAPPINGS_FILE, out_rows)
         snapshot = cls.list_mappings()
-        for channel_name, missing in (snapshot.get('missing_by_channel') or {}).items():
-            cls._append_log({
+        cls._mapping_log().append([
+            {
                 'id': str(uuid.uuid4()),
                 'timestamp': now,
                 'user': user,
@@ -181,7 +180,9 @@ class ChannelCategoryMappingService:
                 'reason': clean_reason,
                 'channel_name': channel_name,
                 'missing_categories': missing,
-            })
+            }
+            for channel_name, missing in (snapshot.get('missing_by_channel') or {}).items()
+        ])
         LoggerService.log_acao(
             acao='Atualizou mapeamento de categorias por canal',
             entidade='Channel Manager',
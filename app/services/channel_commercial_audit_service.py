@@ -2,12 +2,9 @@ from datetime import datetime
 from typing import Any, Dict, List, Optional
 import uuid
 
-from app.services.cashier_service import file_lock
+from app.services.audit_log_service import get_audit_log
 from app.services.period_selector_service import PeriodSelectorService
-from app.services.system_config_manager import (
-    CHANNEL_MANAGER_COMMERCIAL_AUDIT_FILE,
-    CHANNEL_MANAGER_TARIFFS_LOGS_FILE,
-)
+from app.services.system_config_manager import CHANNEL_MANAGER_COMMERCIAL_AUDIT_FILE
 
 
 class ChannelCommercialAuditService:
@@ -23,20 +20,8 @@ class ChannelCommercialAuditService:
     }
 
     @classmethod
-    def _load_json(cls, path: str, fallback: Any) -> Any:
-        from app.services.revenue_management_service import RevenueManagementService
-
-        loaded = RevenueManagementService._load_json(path, fallback)
-        if isinstance(fallback, list):
-            return loaded if isinstance(loaded, list) else []
-        return loaded
-
-    @classmethod
-    def _save_json(cls, path: str, payload: Any) -> None:
-        from app.services.revenue_management_service import RevenueManagementService
-
-        with file_lock(path):
-            RevenueManagementService._save_json(path, payload)
+    def _audit_log(cls):
+        return get_audit_log(CHANNEL_MANAGER_COMMERCIAL_AUDIT_FILE, entity_field='channel')
 
     @classmethod
     def _normalize_event(cls, event_type: Any) -> str:
@@ -72,9 +57,7 @@ class ChannelCommercialAuditService:
             'new_value': new_value,
             'reason': clean_reason,
         }
-        rows = cls._load_json(CHANNEL_MANAGER_COMMERCIAL_AUDIT_FILE, [])
-        rows.append(row)
-        cls._save_json(CHANNEL_MANAGER_COMMERCIAL_AUDIT_FILE, rows)
+        cls._audit_log().append([row])
         return row
 
     @classmethod
@@ -88,7 +71,6 @@ class ChannelCommercialAuditService:
         category: Optional[str] = None,
         user: Optional[str] = None,
     ) -> List[Dict[str, Any]]:
-        rows = cls._load_json(CHANNEL_MANAGER_COMMERCIAL_AUDIT_FILE, [])
         start = PeriodSelectorService.parse_date(start_date).date() if start_date else None
         end = PeriodSelectorService.parse_date(end_date).date() if end_date else None
         event_filter = str(event_type or '').strip().lower()
@@ -96,9 +78,7 @@ class ChannelCommercialAuditService:
         category_filter = str(category or '').strip().lower()
         user_filter = str(user or '').strip().lower()
         out: List[Dict[str, Any]] = []
-        for row in rows:
-            if not isinstance(row, dict):
-                continue
+        for row in cls._audit_log().query(start=start, end=end, entity=channel_filter, user=user_filter):
             ts = str(row.get('timestamp') or '')
             try:
                 day = datetime.fromisoformat(ts).date()
@@ -146,6 +126,8 @@ class ChannelCommercialAuditService:
         category: Optional[str] = None,
         user: Optional[str] = None,
     ) -> List[Dict[str, Any]]:
+        start = PeriodSelectorService.parse_date(start_date).date() if start_date else None
+        end = PeriodSelectorService.parse_date(end_date).date() if end_date else None
         out: List[Dict[str, Any]] = []
         out.extend(cls.list_events(
             start_date=start_date,
@@ -178,10 +160,9 @@ class ChannelCommercialAuditService:
         except Exception:
             pass
         try:
-            tariff_logs = cls._load_json(CHANNEL_MANAGER_TARIFFS_LOGS_FILE, [])
-            for row in tariff_logs:
-                if not isinstance(row, dict):
-                    continue
+            from app.services.channel_tariff_service import ChannelTariffService
+
+            for row in ChannelTariffService._tariff_log().query(start=start, end=end):
                 out.append({
                     'id': row.get('id') or str(uuid.uuid4()),
                     'timestamp': row.get('timestamp') or row.get('updated_at'),
@@ -246,8 +227,6 @@ class ChannelCommercialAuditService:
         channel_filter = str(channel or '').strip().lower()
         category_filter = str(category or '').strip().lower()
         user_filter = str(user or '').strip().lower()
-        start = PeriodSelectorService.parse_date(start_date).date() if start_date else None
-        end = PeriodSelectorService.parse_date(end_date).date() if end_date else None
         filtered: List[Dict[str, Any]] = []
         for row in out:
             ts = str(row.get('timestamp') or '')
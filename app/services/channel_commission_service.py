@@ -2,6 +2,7 @@ from datetime import datetime
 from typing import Any, Dict, List, Optional
 import uuid
 
+from app.services.audit_log_service import get_audit_log
 from app.services.cashier_service import file_lock
 from app.services.channel_inventory_control_service import ChannelInventoryControlService
 from app.services.channel_manager_service import ChannelManagerService
@@ -78,10 +79,8 @@ class ChannelCommissionService:
         return 'comissao_percentual'
 
     @classmethod
-    def _append_audit(cls, row: Dict[str, Any]) -> None:
-        rows = cls._load_json(CHANNEL_MANAGER_COMMISSIONS_AUDIT_FILE, [])
-        rows.append(row)
-        cls._save_json(CHANNEL_MANAGER_COMMISSIONS_AUDIT_FILE, rows)
+    def _audit_log(cls):
+        return get_audit_log(CHANNEL_MANAGER_COMMISSIONS_AUDIT_FILE, entity_field='channel')
 
     @classmethod
     def _normalize_rule(cls, payload: Dict[str, Any], *, current: Optional[Dict[str, Any]], user: str) -> Dict[str, Any]:
@@ -142,6 +141,7 @@ class ChannelCommissionService:
             raise ValueError('Motivo obrigatório para salvar comissão por canal.')
         rows = cls._load_json(CHANNEL_MANAGER_COMMISSIONS_FILE, [])
         current_map = {str(item.get('channel_name') or ''): item for item in rows if isinstance(item, dict)}
+        audit_rows: List[Dict[str, Any]] = []
         for incoming in (payload.get('channels') if isinstance(payload.get('channels'), list) else []):
             if not isinstance(incoming, dict):
                 continue
@@ -149,7 +149,7 @@ class ChannelCommissionService:
             current = current_map.get(key)
             normalized = cls._normalize_rule(incoming, current=current, user=user)
             current_map[key] = normalized
-            cls._append_audit({
+            audit_rows.append({
                 'id': str(uuid.uuid4()),
                 'timestamp': datetime.now().isoformat(timespec='seconds'),
                 'user': user,
@@ -160,6 +160,7 @@ class ChannelCommissionService:
                 'new_value': normalized,
                 'reason': clean_reason,
             })
+        cls._audit_log().append(audit_rows)
         merged = list(current_map.values())
         merged.sort(key=lambda item: str(item.get('channel_name') or ''))
         cls._save_json(CHANNEL_MANAGER_COMMISSIONS_FILE, merged)
@@ -184,6 +185,10 @@ class ChannelCommissionService:
             return cls._normalize_pct(by_cat.get(category), fallback=rule.get('default_commission_pct') or 0.0)
         return cls._normalize_pct(rule.get('default_commission_pct'), fallback=0.0)
 
+    @classmethod
+    def _load_rules(cls) -> List[Dict[str, Any]]:
+        return cls._load_json(CHANNEL_MANAGER_COMMISSIONS_FILE, [])
+
     @classmethod
     def resolve_commission(
         cls,
@@ -191,10 +196,11 @@ class ChannelCommissionService:
         channel_name: str,
         category: str,
         day_iso: str,
+        rules: Optional[List[Dict[str, Any]]] = None,
     ) -> Dict[str, Any]:
         channel = cls._normalize_channel(channel_name)
         bucket = cls._normalize_category(category)
-        rows = cls._load_json(CHANNEL_MANAGER_COMMISSIONS_FILE, [])
+        rows = cls._load_rules() if rules is None else rules
         rule = next((item for item in rows if isinstance(item, dict) and str(item.get('channel_name') or '') == channel), None)
         if not rule:
             model = cls._channel_default_model(channel)
@@ -222,8 +228,9 @@ class ChannelCommissionService:
         category: str,
         day_iso: str,
         direct_tariff: float,
+        rules: Optional[List[Dict[str, Any]]] = None,
     ) -> Dict[str, Any]:
-        resolved = cls.resolve_commission(channel_name=channel_name, category=category, day_iso=day_iso)
+        resolved = cls.resolve_commission(channel_name=channel_name, category=category, day_iso=day_iso, rules=rules)
         model = str(resolved.get('commercial_model') or 'comissao_percentual')
         commission = float(resolved.get('commission_pct') or 0.0)
         direct = max(0.0, float(direct_tariff or 0.0))
@@ -262,15 +269,12 @@ class ChannelCommissionService:
         channel: Optional[str] = None,
         user: Optional[str] = None,
     ) -> List[Dict[str, Any]]:
-        rows = cls._load_json(CHANNEL_MANAGER_COMMISSIONS_AUDIT_FILE, [])
         start = PeriodSelectorService.parse_date(start_date).date() if start_date else None
         end = PeriodSelectorService.parse_date(end_date).date() if end_date else None
         channel_filter = cls._normalize_channel(channel) if channel else ''
         user_filter = str(user or '').strip().lower()
         out: List[Dict[str, Any]] = []
-        for row in rows:
-            if not isinstance(row, dict):
-                continue
+        for row in cls._audit_log().query(start=start, end=end, entity=channel_filter, user=user_filter):
             ts = str(row.get('timestamp') or '')
             try:
                 day = datetime.fromisoformat(ts).date()
@@ -2,6 +2,7 @@ import json
 from datetime import datetime
 from typing import Any, Dict, List, Optional
 
+from app.services.audit_log_service import get_audit_log
 from app.services.cashier_service import file_lock
 from app.services.inventory_restriction_service import InventoryRestrictionService
 from app.services.logger_service import LoggerService
@@ -87,14 +88,8 @@ class ChannelInventoryControlService:
             cls._save_json(CHANNEL_SALES_RESTRICTIONS_FILE, rows)
 
     @classmethod
-    def _load_channel_logs(cls) -> List[Dict[str, Any]]:
-        data = cls._load_json(CHANNEL_SALES_RESTRICTIONS_LOGS_FILE, [])
-        return data if isinstance(data, list) else []
-
-    @classmethod
-    def _save_channel_logs(cls, rows: List[Dict[str, Any]]) -> None:
-        with file_lock(CHANNEL_SALES_RESTRICTIONS_LOGS_FILE):
-            cls._save_json(CHANNEL_SALES_RESTRICTIONS_LOGS_FILE, rows)
+    def _channel_log(cls):
+        return get_audit_log(CHANNEL_SALES_RESTRICTIONS_LOGS_FILE, time_field='day_affected', entity_field='channel')
 
     @classmethod
     def _load_blackouts(cls) -> List[Dict[str, Any]]:
@@ -107,14 +102,8 @@ class ChannelInventoryControlService:
             cls._save_json(BLACKOUT_DATES_FILE, rows)
 
     @classmethod
-    def _load_blackout_logs(cls) -> List[Dict[str, Any]]:
-        data = cls._load_json(BLACKOUT_DATES_LOGS_FILE, [])
-        return data if isinstance(data, list) else []
-
-    @classmethod
-    def _save_blackout_logs(cls, rows: List[Dict[str, Any]]) -> None:
-        with file_lock(BLACKOUT_DATES_LOGS_FILE):
-            cls._save_json(BLACKOUT_DATES_LOGS_FILE, rows)
+    def _blackout_log(cls):
+        return get_audit_log(BLACKOUT_DATES_LOGS_FILE, time_field='day_affected', entity_field='category')
 
     @classmethod
     def _load_allotments(cls) -> List[Dict[str, Any]]:
@@ -127,14 +116,8 @@ class ChannelInventoryControlService:
             cls._save_json(CHANNEL_ALLOTMENTS_FILE, rows)
 
     @classmethod
-    def _load_allotment_logs(cls) -> List[Dict[str, Any]]:
-        data = cls._load_json(CHANNEL_ALLOTMENTS_LOGS_FILE, [])
-        return data if isinstance(data, list) else []
-
-    @classmethod
-    def _save_allotment_logs(cls, rows: List[Dict[str, Any]]) -> None:
-        with file_lock(CHANNEL_ALLOTMENTS_LOGS_FILE):
-            cls._save_json(CHANNEL_ALLOTMENTS_LOGS_FILE, rows)
+    def _allotment_log(cls):
+        return get_audit_log(CHANNEL_ALLOTMENTS_LOGS_FILE, time_field='day_affected', entity_field='channel')
 
     @classmethod
     def apply_channel_restriction(
@@ -159,7 +142,7 @@ class ChannelInventoryControlService:
         if not dates:
             return {'updated': 0, 'dates': []}
         rows = cls._load_channel_rules()
-        logs = cls._load_channel_logs()
+        logs = []
         now = datetime.now().isoformat()
         updated = 0
         for day in dates:
@@ -203,8 +186,8 @@ class ChannelInventoryControlService:
                 'origin': origin,
                 'weekdays': normalized_weekdays,
             })
+        cls._channel_log().append(logs)
         cls._save_channel_rules(rows)
-        cls._save_channel_logs(logs)
         LoggerService.log_acao(
             acao='Atualizou fechamento por canal',
             entidade='Revenue Management',
@@ -281,14 +264,13 @@ class ChannelInventoryControlService:
         category: Optional[str] = None,
         channel: Optional[str] = None,
     ) -> List[Dict[str, Any]]:
-        rows = cls._load_channel_logs()
         start = PeriodSelectorService.parse_date(start_date).date() if start_date else None
         end = PeriodSelectorService.parse_date(end_date).date() if end_date else None
         category_norm = cls._normalize_category(category) if category else ''
         channel_norm = cls._normalize_channel(channel) if channel else ''
         user_norm = str(user or '').strip().lower()
         out = []
-        for row in rows:
+        for row in cls._channel_log().query(start=start, end=end, entity=channel_norm, user=user_norm):
             day_text = str(row.get('day_affected') or '')
             try:
                 day = PeriodSelectorService.parse_date(day_text).date()
@@ -329,7 +311,7 @@ class ChannelInventoryControlService:
         if not dates:
             return {'updated': 0, 'dates': []}
         rows = cls._load_blackouts()
-        logs = cls._load_blackout_logs()
+        logs = []
         now = datetime.now().isoformat()
         updated = 0
         for day in dates:
@@ -367,8 +349,8 @@ class ChannelInventoryControlService:
                 'reason': clean_reason,
                 'origin': origin,
             })
+        cls._blackout_log().append(logs)
         cls._save_blackouts(rows)
-        cls._save_blackout_logs(logs)
         LoggerService.log_acao(
             acao='Atualizou blackout de venda',
             entidade='Revenue Management',
@@ -387,11 +369,11 @@ class ChannelInventoryControlService:
         }
 
     @classmethod
-    def is_blackout_for_period(cls, *, category: str, checkin: str, checkout: str) -> bool:
+    def is_blackout_for_period(cls, *, category: str, checkin: str, checkout: str, blackouts: Optional[List[Dict[str, Any]]] = None) -> bool:
         normalized_category = cls._normalize_category(category)
         active = {
             (str(row.get('category')), str(row.get('date'))): str(row.get('status') or 'inactive')
-            for row in cls._load_blackouts()
+            for row in (cls._load_blackouts() if blackouts is None else blackouts)
         }
         for day in cls._stay_dates(checkin, checkout):
             if active.get((normalized_category, day)) == 'active':
@@ -437,13 +419,12 @@ class ChannelInventoryControlService:
         user: Optional[str] = None,
         category: Optional[str] = None,
     ) -> List[Dict[str, Any]]:
-        rows = cls._load_blackout_logs()
         start = PeriodSelectorService.parse_date(start_date).date() if start_date else None
         end = PeriodSelectorService.parse_date(end_date).date() if end_date else None
         category_norm = cls._normalize_category(category) if category else ''
         user_norm = str(user or '').strip().lower()
         out = []
-        for row in rows:
+        for row in cls._blackout_log().query(start=start, end=end, entity=category_norm, user=user_norm):
             day_text = str(row.get('day_affected') or '')
             try:
                 day = PeriodSelectorService.parse_date(day_text).date()
@@ -525,7 +506,7 @@ class ChannelInventoryControlService:
         for day in dates:
             if per_day_total.get(day, 0) > capacity:
                 raise ValueError(f'Allotment excede capacidade da categoria em {day}.')
-        logs = cls._load_allotment_logs()
+        logs = []
         for day in dates:
             logs.append({
                 'timestamp': now,
@@ -539,8 +520,8 @@ class ChannelInventoryControlService:
                 'origin': origin,
                 'weekdays': normalized_weekdays,
             })
+        cls._allotment_log().append(logs)
         cls._save_allotments(staged)
-        cls._save_allotment_logs(logs)
         LoggerService.log_acao(
             acao='Atualizou allotment por canal',
             entidade='Revenue Management',
@@ -600,14 +581,13 @@ class ChannelInventoryControlService:
         channel: Optional[str] = None,
         user: Optional[str] = None,
     ) -> List[Dict[str, Any]]:
-        rows = cls._load_allotment_logs()
         start = PeriodSelectorService.parse_date(start_date).date() if start_date else None
         end = PeriodSelectorService.parse_date(end_date).date() if end_date else None
         category_norm = cls._normalize_category(category) if category else ''
         channel_norm = cls._normalize_channel(channel) if channel else ''
         user_norm = str(user or '').strip().lower()
         out = []
-        for row in rows:
+        for row in cls._allotment_log().query(start=start, end=end, entity=channel_norm, user=user_norm):
             day_text = str(row.get('day_affected') or '')
             try:
                 day = PeriodSelectorService.parse_date(day_text).date()
@@ -2,8 +2,10 @@ from datetime import datetime
 from typing import Any, Dict, List, Optional
 import uuid
 
+from app.services.audit_log_service import get_audit_log
 from app.services.channel_inventory_control_service import ChannelInventoryControlService
 from app.services.inventory_protection_service import InventoryProtectionService
+from app.services.inventory_restriction_service import InventoryRestrictionService
 from app.services.logger_service import LoggerService
 from app.services.period_selector_service import PeriodSelectorService
 from app.services.system_config_manager import (
@@ -75,11 +77,13 @@ class ChannelInventoryPlannerService:
     def _load_partial_rows(cls) -> List[Dict[str, Any]]:
         return cls._load_json(CHANNEL_MANAGER_INVENTORY_PARTIAL_CLOSURES_FILE, [])
 
+    @classmethod
+    def _audit_log(cls):
+        return get_audit_log(CHANNEL_MANAGER_INVENTORY_AUDIT_FILE, entity_field='category')
+
     @classmethod
     def _append_audit(cls, item: Dict[str, Any]) -> None:
-        rows = cls._load_json(CHANNEL_MANAGER_INVENTORY_AUDIT_FILE, [])
-        rows.append(item)
-        cls._save_json(CHANNEL_MANAGER_INVENTORY_AUDIT_FILE, rows)
+        cls._audit_log().append([item])
 
     @classmethod
     def _shared_enabled_for_day(cls, *, category: str, day_iso: str) -> bool:
@@ -238,106 +242,150 @@ class ChannelInventoryPlannerService:
         end_date: str,
         weekdays: Optional[List[str]],
     ) -> Dict[str, Any]:
+        normalized_category = cls._normalize_category(category)
+        by_day = cls.build_snapshots(
+            categories=[category],
+            start_date=start_date,
+            end_date=end_date,
+            weekdays=weekdays,
+        )[category]
+        rows = list(by_day.values())
+        return {
+            'category': normalized_category,
+            'start_date': start_date,
+            'end_date': end_date,
+            'weekdays': cls._normalize_weekdays(weekdays),
+            'rows': rows,
+            'count': len(rows),
+        }
+
+    @classmethod
+    def build_snapshots(
+        cls,
+        *,
+        categories: List[str],
+        start_date: str,
+        end_date: str,
+        weekdays: Optional[List[str]],
+    ) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """
+        ``build_snapshot`` rows by category and day. Channels, allotments,
+        closures, protections, shared/partial settings and reservations are
+        read once for the whole period and every category; reservations are
+        parsed once and bucketed by category instead of rescanned per day.
+        """
         from app.services.channel_manager_service import ChannelManagerService
         from app.services.reservation_service import ReservationService
 
-        normalized_category = cls._normalize_category(category)
         days = PeriodSelectorService.expand_dates(start_date, end_date, cls._normalize_weekdays(weekdays))
         channels = [cls._normalize_channel(item.get('name')) for item in ChannelManagerService.list_channels() if bool(item.get('active', True))]
         if 'Recepção' not in channels:
             channels.append('Recepção')
-        allotments = ChannelInventoryControlService.list_allotments(
-            start_date=start_date,
-            end_date=end_date,
-            category=normalized_category,
-        )
-        restrictions = ChannelInventoryControlService.list_channel_restrictions(
-            start_date=start_date,
-            end_date=end_date,
-            category=normalized_category,
-        )
-        protections = InventoryProtectionService.list_rules(
-            start_date=start_date,
-            end_date=end_date,
-            category=normalized_category,
-        )
-        reservations = ReservationService().get_february_reservations()
-        capacity = cls._category_capacity(normalized_category)
-        allotment_map: Dict[tuple, int] = {}
-        for row in allotments:
-            key = (str(row.get('date') or ''), cls._normalize_channel(row.get('channel')))
-            allotment_map[key] = int(row.get('rooms') or 0)
-        restriction_map: Dict[tuple, str] = {}
-        for row in restrictions:
-            key = (str(row.get('date') or ''), cls._normalize_channel(row.get('channel')))
-            restriction_map[key] = str(row.get('status') or 'inactive')
-        protection_map: Dict[str, int] = {}
-        for row in protections:
-            if str(row.get('status') or '') != 'active':
+        allotments = ChannelInventoryControlService.list_allotments(start_date=start_date, end_date=end_date)
+        restrictions = ChannelInventoryControlService.list_channel_restrictions(start_date=start_date, end_date=end_date)
+        protections = InventoryProtectionService.list_rules(start_date=start_date, end_date=end_date)
+        room_mapping = ReservationService().get_room_mapping()
+        shared_enabled_map: Dict[tuple, bool] = {}
+        for row in cls._load_shared_rows():
+            if isinstance(row, dict):
+                shared_enabled_map[(str(row.get('category') or ''), str(row.get('date') or ''))] = bool(row.get('shared_global_enabled'))
+        partial_map: Dict[tuple, int] = {}
+        for row in cls._load_partial_rows():
+            if not isinstance(row, dict):
                 continue
-            day = str(row.get('date') or '')
-            protection_map[day] = max(protection_map.get(day, 0), int(row.get('protected_rooms') or 0))
-        rows: List[Dict[str, Any]] = []
-        for day in days:
-            sold_total = 0
-            sold_by_channel: Dict[str, int] = {channel: 0 for channel in channels}
-            for reservation in reservations:
-                if not isinstance(reservation, dict):
+            key = (str(row.get('category') or ''), str(row.get('channel') or ''), str(row.get('date') or ''))
+            try:
+                partial_map[key] = max(partial_map.get(key, 0), int(row.get('closed_rooms') or 0))
+            except Exception:
+                continue
+        # (checkin, checkout, channel) of the countable stays, by category.
+        stays_by_category: Dict[str, List[tuple]] = {}
+        for reservation in ReservationService().get_february_reservations():
+            if not isinstance(reservation, dict):
+                continue
+            if not cls._status_allows_count(reservation.get('status')):
+                continue
+            try:
+                checkin = PeriodSelectorService.parse_date(str(reservation.get('checkin'))).date()
+                checkout = PeriodSelectorService.parse_date(str(reservation.get('checkout'))).date()
+            except Exception:
+                continue
+            stays_by_category.setdefault(cls._normalize_category(reservation.get('category')), []).append(
+                (checkin, checkout, cls._normalize_channel(reservation.get('channel') or reservation.get('origin')))
+            )
+
+        out: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for category in categories:
+            normalized_category = cls._normalize_category(category)
+            protection_category = InventoryRestrictionService.normalize_category(normalized_category)
+            capacity = len(room_mapping.get(normalized_category, []))
+            allotment_map: Dict[tuple, int] = {}
+            for row in allotments:
+                if str(row.get('category')) != normalized_category:
                     continue
-                if not cls._status_allows_count(reservation.get('status')):
+                key = (str(row.get('date') or ''), cls._normalize_channel(row.get('channel')))
+                allotment_map[key] = int(row.get('rooms') or 0)
+            restriction_map: Dict[tuple, str] = {}
+            for row in restrictions:
+                if str(row.get('category')) != normalized_category:
                     continue
-                if cls._normalize_category(reservation.get('category')) != normalized_category:
+                key = (str(row.get('date') or ''), cls._normalize_channel(row.get('channel')))
+                restriction_map[key] = str(row.get('status') or 'inactive')
+            protection_map: Dict[str, int] = {}
+            for row in protections:
+                if str(row.get('category')) != protection_category:
                     continue
-                if not cls._reservation_overlaps_day(reservation, day):
+                if str(row.get('status') or '') != 'active':
                     continue
-                sold_total += 1
-                res_channel = cls._normalize_channel(reservation.get('channel') or reservation.get('origin'))
-                sold_by_channel[res_channel] = sold_by_channel.get(res_channel, 0) + 1
-            protected = int(protection_map.get(day, 0))
-            shared_enabled = cls._shared_enabled_for_day(category=normalized_category, day_iso=day)
-            available_real = max(capacity - sold_total - protected, 0)
-            channels_rows = []
-            total_allotment = 0
-            for channel in channels:
-                allotment = int(allotment_map.get((day, channel), 0))
-                total_allotment += max(0, allotment)
-                partial_closed = cls._partial_closed_rooms(category=normalized_category, channel=channel, day_iso=day)
-                fully_closed = restriction_map.get((day, channel)) == 'active'
-                sold_channel = int(sold_by_channel.get(channel, 0))
-                channels_rows.append({
-                    'channel': channel,
-                    'allotment': allotment,
-                    'sold_existing': sold_channel,
-                    'partial_closed_rooms': partial_closed,
-                    'fully_closed': fully_closed,
-                })
-            shared_pool = max(available_real - total_allotment, 0) if shared_enabled else 0
-            for item in channels_rows:
-                quota = int(item.get('allotment') or 0)
-                base_available = quota if quota > 0 else shared_pool
-                sellable_stock = max(base_available - int(item.get('partial_closed_rooms') or 0), 0)
-                if item.get('fully_closed'):
-                    sellable_stock = 0
-                item['available_for_sale'] = max(sellable_stock - int(item.get('sold_existing') or 0), 0)
-            rows.append({
-                'date': day,
-                'category': normalized_category,
-                'capacity_real': capacity,
-                'sold_existing_total': sold_total,
-                'protected_rooms': protected,
-                'shared_global_enabled': shared_enabled,
-                'shared_available_pool': shared_pool,
-                'allotment_total': total_allotment,
-                'channels': channels_rows,
-            })
-        return {
-            'category': normalized_category,
-            'start_date': start_date,
-            'end_date': end_date,
-            'weekdays': cls._normalize_weekdays(weekdays),
-            'rows': rows,
-            'count': len(rows),
-        }
+                day = str(row.get('date') or '')
+                protection_map[day] = max(protection_map.get(day, 0), int(row.get('protected_rooms') or 0))
+            stays = stays_by_category.get(normalized_category, [])
+            rows: Dict[str, Dict[str, Any]] = {}
+            for day in days:
+                day_date = PeriodSelectorService.parse_date(day).date()
+                sold_total = 0
+                sold_by_channel: Dict[str, int] = {channel: 0 for channel in channels}
+                for checkin, checkout, res_channel in stays:
+                    if not (checkin <= day_date < checkout):
+                        continue
+                    sold_total += 1
+                    sold_by_channel[res_channel] = sold_by_channel.get(res_channel, 0) + 1
+                protected = int(protection_map.get(day, 0))
+                shared_enabled = shared_enabled_map.get((normalized_category, day), True)
+                available_real = max(capacity - sold_total - protected, 0)
+                channels_rows = []
+                total_allotment = 0
+                for channel in channels:
+                    allotment = int(allotment_map.get((day, channel), 0))
+                    total_allotment += max(0, allotment)
+                    channels_rows.append({
+                        'channel': channel,
+                        'allotment': allotment,
+                        'sold_existing': int(sold_by_channel.get(channel, 0)),
+                        'partial_closed_rooms': partial_map.get((normalized_category, channel, day), 0),
+                        'fully_closed': restriction_map.get((day, channel)) == 'active',
+                    })
+                shared_pool = max(available_real - total_allotment, 0) if shared_enabled else 0
+                for item in channels_rows:
+                    quota = int(item.get('allotment') or 0)
+                    base_available = quota if quota > 0 else shared_pool
+                    sellable_stock = max(base_available - int(item.get('partial_closed_rooms') or 0), 0)
+                    if item.get('fully_closed'):
+                        sellable_stock = 0
+                    item['available_for_sale'] = max(sellable_stock - int(item.get('sold_existing') or 0), 0)
+                rows[day] = {
+                    'date': day,
+                    'category': normalized_category,
+                    'capacity_real': capacity,
+                    'sold_existing_total': sold_total,
+                    'protected_rooms': protected,
+                    'shared_global_enabled': shared_enabled,
+                    'shared_available_pool': shared_pool,
+                    'allotment_total': total_allotment,
+                    'channels': channels_rows,
+                }
+            out[category] = rows
+        return out
 
     @classmethod
     def apply_inventory_plan(cls, *, payload: Dict[str, Any], user: str) -> Dict[str, Any]:
@@ -431,16 +479,13 @@ class ChannelInventoryPlannerService:
         channel: Optional[str] = None,
         user: Optional[str] = None,
     ) -> List[Dict[str, Any]]:
-        rows = cls._load_json(CHANNEL_MANAGER_INVENTORY_AUDIT_FILE, [])
         start = PeriodSelectorService.parse_date(start_date).date() if start_date else None
         end = PeriodSelectorService.parse_date(end_date).date() if end_date else None
         normalized_category = cls._normalize_category(category) if category else ''
         normalized_channel = cls._normalize_channel(channel) if channel else ''
         user_filter = str(user or '').strip().lower()
         out = []
-        for row in rows:
-            if not isinstance(row, dict):
-                continue
+        for row in cls._audit_log().query(start=start, end=end, entity=normalized_category, user=user_filter):
             ts = str(row.get('timestamp') or '')
             try:
                 day = datetime.fromisoformat(ts).date()
@@ -2,6 +2,7 @@ from datetime import datetime, timedelta
 from typing import Any, Dict, List, Optional
 import os
 
+from app.services.audit_log_service import audit_dir_for
 from app.services.channel_inventory_planner_service import ChannelInventoryPlannerService
 from app.services.channel_manager_service import ChannelManagerService
 from app.services.channel_restriction_service import ChannelRestrictionService
@@ -269,8 +270,8 @@ class ChannelManagerDashboardService:
             ('channel_inventory_rules', CHANNEL_MANAGER_TARIFFS_FILE),
             ('channel_restrictions', CHANNEL_MANAGER_RESTRICTIONS_FILE),
             ('channel_daily_rates', CHANNEL_MANAGER_TARIFFS_FILE),
-            ('channel_sync_logs', CHANNEL_MANAGER_SYNC_LOGS_FILE),
-            ('channel_audit_logs', CHANNEL_MANAGER_COMMERCIAL_AUDIT_FILE),
+            ('channel_sync_logs', audit_dir_for(CHANNEL_MANAGER_SYNC_LOGS_FILE)),
+            ('channel_audit_logs', audit_dir_for(CHANNEL_MANAGER_COMMERCIAL_AUDIT_FILE)),
             ('channel_allotments', CHANNEL_ALLOTMENTS_FILE),
             ('channel_promotions', REVENUE_PROMOTIONS_FILE),
             ('channel_packages', PROMOTIONAL_PACKAGES_FILE),
@@ -2,6 +2,7 @@ from datetime import datetime
 from typing import Any, Dict, List, Optional
 import uuid
 
+from app.services.audit_log_service import get_audit_log
 from app.services.cashier_service import file_lock
 from app.services.logger_service import LoggerService
 from app.services.system_config_manager import (
@@ -153,10 +154,8 @@ class ChannelManagerService:
         }
 
     @classmethod
-    def _append_log(cls, item: Dict[str, Any]) -> None:
-        rows = cls._load_json(CHANNEL_MANAGER_CHANNELS_LOGS_FILE, [])
-        rows.append(item)
-        cls._save_json(CHANNEL_MANAGER_CHANNELS_LOGS_FILE, rows)
+    def _channel_log(cls):
+        return get_audit_log(CHANNEL_MANAGER_CHANNELS_LOGS_FILE, entity_field='channel_id')
 
     @classmethod
     def _ensure_defaults(cls) -> List[Dict[str, Any]]:
@@ -192,6 +191,7 @@ class ChannelManagerService:
         current_by_id = {str(item.get('id') or ''): item for item in current}
         payload_items = items if isinstance(items, list) else []
         normalized_rows: List[Dict[str, Any]] = []
+        log_rows: List[Dict[str, Any]] = []
         for item in payload_items:
             if not isinstance(item, dict):
                 continue
@@ -200,7 +200,7 @@ class ChannelManagerService:
             merged = {**(existing or {}), **item, 'updated_by': user}
             normalized = cls._normalize_channel(merged, existing=existing)
             normalized_rows.append(normalized)
-            cls._append_log({
+            log_rows.append({
                 'id': str(uuid.uuid4()),
                 'timestamp': datetime.now().isoformat(timespec='seconds'),
                 'user': user,
@@ -211,6 +211,7 @@ class ChannelManagerService:
                 'before': existing or {},
                 'after': normalized,
             })
+        cls._channel_log().append(log_rows)
         cls._save_json(CHANNEL_MANAGER_CHANNELS_FILE, normalized_rows)
         LoggerService.log_acao(
             acao='Atualizou cadastro de canais de venda',
@@ -227,7 +228,6 @@ class ChannelManagerService:
 
     @classmethod
     def list_channel_logs(cls, *, limit: int = 200) -> List[Dict[str, Any]]:
-        rows = cls._load_json(CHANNEL_MANAGER_CHANNELS_LOGS_FILE, [])
-        out = [row for row in rows if isinstance(row, dict)]
+        out = cls._channel_log().query(newest_first=True, limit=max(1, int(limit)))
         out.sort(key=lambda item: str(item.get('timestamp') or ''), reverse=True)
-        return out[:max(1, int(limit))]
+        return out
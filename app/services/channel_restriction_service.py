@@ -2,6 +2,7 @@ from datetime import datetime
 from typing import Any, Dict, List, Optional
 import uuid
 
+from app.services.audit_log_service import get_audit_log
 from app.services.cashier_service import file_lock
 from app.services.channel_inventory_control_service import ChannelInventoryControlService
 from app.services.logger_service import LoggerService
@@ -80,10 +81,9 @@ class ChannelRestrictionService:
         return bool(str(value or 'true').strip().lower() in ('1', 'true', 'yes', 'sim', 'active', 'ativo'))
 
     @classmethod
-    def _append_audit(cls, row: Dict[str, Any]) -> None:
-        rows = cls._load_json(CHANNEL_MANAGER_RESTRICTIONS_AUDIT_FILE, [])
-        rows.append(row)
-        cls._save_json(CHANNEL_MANAGER_RESTRICTIONS_AUDIT_FILE, rows)
+    def _audit_log(cls):
+        # Listed by the day the restriction applies to, not by when it was set.
+        return get_audit_log(CHANNEL_MANAGER_RESTRICTIONS_AUDIT_FILE, time_field='day_affected', entity_field='channel')
 
     @classmethod
     def apply_restriction(
@@ -123,6 +123,7 @@ class ChannelRestrictionService:
             )
         ]
         normalized_value = cls._normalize_value(normalized_type, value)
+        audit_rows: List[Dict[str, Any]] = []
         for day in days:
             remaining.append({
                 'id': str(uuid.uuid4()),
@@ -136,7 +137,7 @@ class ChannelRestrictionService:
                 'updated_at': now,
                 'updated_by': user,
             })
-            cls._append_audit({
+            audit_rows.append({
                 'id': str(uuid.uuid4()),
                 'timestamp': now,
                 'user': user,
@@ -149,6 +150,7 @@ class ChannelRestrictionService:
                 'reason': clean_reason,
                 'period': {'start_date': start_date, 'end_date': end_date, 'weekdays': normalized_weekdays},
             })
+        cls._audit_log().append(audit_rows)
         cls._save_json(CHANNEL_MANAGER_RESTRICTIONS_FILE, remaining)
         LoggerService.log_acao(
             acao='Atualizou restrições por canal',
@@ -230,7 +232,6 @@ class ChannelRestrictionService:
         user: Optional[str] = None,
         restriction_type: Optional[str] = None,
     ) -> List[Dict[str, Any]]:
-        rows = cls._load_json(CHANNEL_MANAGER_RESTRICTIONS_AUDIT_FILE, [])
         start = PeriodSelectorService.parse_date(start_date).date() if start_date else None
         end = PeriodSelectorService.parse_date(end_date).date() if end_date else None
         category_norm = cls._normalize_category(category) if category else ''
@@ -238,9 +239,7 @@ class ChannelRestrictionService:
         user_norm = str(user or '').strip().lower()
         type_norm = str(restriction_type or '').strip().lower()
         out: List[Dict[str, Any]] = []
-        for row in rows:
-            if not isinstance(row, dict):
-                continue
+        for row in cls._audit_log().query(start=start, end=end, entity=channel_norm, user=user_norm):
             day_text = str(row.get('day_affected') or '')
             try:
                 day = PeriodSelectorService.parse_date(day_text).date()
@@ -273,6 +272,34 @@ class ChannelRestrictionService:
             channel=normalized_channel,
             status='active',
         )
+        return cls._resolve_rules(rules)
+
+    @classmethod
+    def resolve_rules_range(
+        cls,
+        *,
+        categories: List[str],
+        channel: str,
+        start_date: str,
+        end_date: str,
+        weekdays: Optional[List[str]] = None,
+    ) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """``resolve_day_rules`` for every category and day of the period, reading the restrictions once."""
+        normalized_channel = cls._normalize_channel(channel)
+        days = PeriodSelectorService.expand_dates(start_date, end_date, cls._normalize_weekdays(weekdays))
+        by_day: Dict[tuple, List[Dict[str, Any]]] = {}
+        if days:
+            for row in cls.list_restrictions(start_date=days[0], end_date=days[-1], channel=normalized_channel, status='active'):
+                day = PeriodSelectorService.parse_date(str(row.get('date') or '')).date().isoformat()
+                by_day.setdefault((str(row.get('category') or ''), day), []).append(row)
+        out: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for category in categories:
+            normalized_category = cls._normalize_category(category)
+            out[category] = {day: cls._resolve_rules(by_day.get((normalized_category, day), [])) for day in days}
+        return out
+
+    @classmethod
+    def _resolve_rules(cls, rules: List[Dict[str, Any]]) -> Dict[str, Any]:
         resolved: Dict[str, Any] = {
             'aberto_fechado': None,
             'stop_sell': False,
@@ -11,6 +11,90 @@ from app.services.revenue_management_service import RevenueManagementService
 from app.services.tariff_priority_engine_service import TariffPriorityEngineService
 
 
+class _LiveLookups:
+    """Per-call reads of every rule source (the single-quote path)."""
+
+    def is_blackout(self, bucket: str, checkin: str, checkout: str) -> bool:
+        return ChannelInventoryControlService.is_blackout_for_period(category=bucket, checkin=checkin, checkout=checkout)
+
+    def day_rules(self, bucket: str, channel: str, day: str) -> Dict[str, Any]:
+        return ChannelRestrictionService.resolve_day_rules(category=bucket, channel=channel, day=day)
+
+    def is_open(self, bucket: str, checkin: str, checkout: str) -> bool:
+        return InventoryRestrictionService.is_open_for_period(bucket, checkin, checkout)
+
+    def day_tariff(self, channel: str, bucket: str, day: str) -> Dict[str, Any]:
+        return ChannelRulePriorityEngineService._tariff_for_day(channel_name=channel, category=bucket, day_iso=day)
+
+    def dynamic_factor(self, bucket: str, sale_day: str) -> Dict[str, Any]:
+        return TariffPriorityEngineService._dynamic_factor(category=bucket, day=sale_day)
+
+    def channel_tariff(self, channel: str, bucket: str, day: str, direct_tariff: float) -> Dict[str, Any]:
+        return ChannelCommissionService.calculate_channel_tariff(
+            channel_name=channel,
+            category=bucket,
+            day_iso=day,
+            direct_tariff=direct_tariff,
+        )
+
+
+class _RangeLookups(_LiveLookups):
+    """
+    Every rule source read once for a channel, a set of buckets and a period
+    (``evaluate_range``); lookups outside the period fall back to the live reads.
+    """
+
+    def __init__(self, *, channel: str, buckets: List[str], days: List[str], simulation: Dict[str, Any]):
+        self.days = set(days)
+        self.blackouts = ChannelInventoryControlService._load_blackouts()
+        self.restrictions = InventoryRestrictionService._load_restrictions()
+        self.commissions = ChannelCommissionService._load_rules()
+        self.simulation = simulation
+        # check-out rules (CTD) look one day past the last check-in
+        last = PeriodSelectorService.parse_date(days[-1]).date()
+        self.rules = ChannelRestrictionService.resolve_rules_range(
+            categories=buckets,
+            channel=channel,
+            start_date=days[0],
+            end_date=last.fromordinal(last.toordinal() + 1).isoformat(),
+        )
+        self.tariffs = ChannelTariffService.calculate_tariffs_range(
+            channel_name=channel,
+            categories=buckets,
+            start_date=days[0],
+            end_date=days[-1],
+            simulation=simulation,
+        )
+
+    def is_blackout(self, bucket: str, checkin: str, checkout: str) -> bool:
+        return ChannelInventoryControlService.is_blackout_for_period(category=bucket, checkin=checkin, checkout=checkout, blackouts=self.blackouts)
+
+    def day_rules(self, bucket: str, channel: str, day: str) -> Dict[str, Any]:
+        resolved = self.rules.get(bucket, {}).get(day)
+        return resolved if resolved is not None else super().day_rules(bucket, channel, day)
+
+    def is_open(self, bucket: str, checkin: str, checkout: str) -> bool:
+        return InventoryRestrictionService.is_open_for_period(bucket, checkin, checkout, restrictions=self.restrictions)
+
+    def day_tariff(self, channel: str, bucket: str, day: str) -> Dict[str, Any]:
+        row = self.tariffs.get(bucket, {}).get(day)
+        return row if row is not None else super().day_tariff(channel, bucket, day)
+
+    def dynamic_factor(self, bucket: str, sale_day: str) -> Dict[str, Any]:
+        if sale_day not in self.days:
+            return super().dynamic_factor(bucket, sale_day)
+        return TariffPriorityEngineService._dynamic_factor(category=bucket, day=sale_day, simulation=self.simulation)
+
+    def channel_tariff(self, channel: str, bucket: str, day: str, direct_tariff: float) -> Dict[str, Any]:
+        return ChannelCommissionService.calculate_channel_tariff(
+            channel_name=channel,
+            category=bucket,
+            day_iso=day,
+            direct_tariff=direct_tariff,
+            rules=self.commissions,
+        )
+
+
 class ChannelRulePriorityEngineService:
     @classmethod
     def _stay_days(cls, checkin: str, checkout: str) -> List[str]:
@@ -74,6 +158,79 @@ class ChannelRulePriorityEngineService:
         sale_date: Optional[str] = None,
         package_selected: Optional[str] = None,
         apply_dynamic: bool = True,
+    ) -> Dict[str, Any]:
+        return cls._evaluate(
+            _LiveLookups(),
+            category=category,
+            channel=channel,
+            checkin=checkin,
+            checkout=checkout,
+            sale_date=sale_date,
+            package_selected=package_selected,
+            apply_dynamic=apply_dynamic,
+        )
+
+    @classmethod
+    def evaluate_range(
+        cls,
+        *,
+        categories: List[str],
+        channel: str,
+        start_date: str,
+        end_date: str,
+        weekdays: Optional[List[str]] = None,
+        package_selected: Optional[str] = None,
+        apply_dynamic: bool = True,
+        simulation: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """
+        ``evaluate`` of a one-night stay sold on its check-in day, for every
+        category and day of the period (the channel calendar grid). The rule
+        files and the RM projection are read once for the whole grid.
+        """
+        days = PeriodSelectorService.expand_dates(start_date, end_date, weekdays or [])
+        if not days:
+            return {category: {} for category in categories}
+        if simulation is None:
+            first = PeriodSelectorService.parse_date(days[0]).date()
+            last = PeriodSelectorService.parse_date(days[-1]).date()
+            simulation = RevenueManagementService.simulate_projection(
+                start_date=first.isoformat(),
+                days=(last - first).days + 1,
+                advanced_mode=True,
+            )
+        buckets = sorted({RevenueManagementService._booking_category_bucket(category) for category in categories})
+        lookups = _RangeLookups(channel=channel, buckets=buckets, days=days, simulation=simulation)
+        out: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for category in categories:
+            by_day: Dict[str, Dict[str, Any]] = {}
+            for day in days:
+                current = PeriodSelectorService.parse_date(day).date()
+                by_day[day] = cls._evaluate(
+                    lookups,
+                    category=category,
+                    channel=channel,
+                    checkin=day,
+                    checkout=current.fromordinal(current.toordinal() + 1).isoformat(),
+                    sale_date=day,
+                    package_selected=package_selected,
+                    apply_dynamic=apply_dynamic,
+                )
+            out[category] = by_day
+        return out
+
+    @classmethod
+    def _evaluate(
+        cls,
+        lookups: _LiveLookups,
+        *,
+        category: str,
+        channel: str,
+        checkin: str,
+        checkout: str,
+        sale_date: Optional[str],
+        package_selected: Optional[str],
+        apply_dynamic: bool,
     ) -> Dict[str, Any]:
         normalized_category = RevenueManagementService._normalize_booking_category(category)
         bucket = RevenueManagementService._booking_category_bucket(normalized_category)
@@ -84,18 +241,18 @@ class ChannelRulePriorityEngineService:
         sale_day = PeriodSelectorService.parse_date(sale_date or datetime.now().strftime('%Y-%m-%d')).date().isoformat()
         rules_trace: List[Dict[str, Any]] = []
 
-        if ChannelInventoryControlService.is_blackout_for_period(category=bucket, checkin=checkin, checkout=checkout):
+        if lookups.is_blackout(bucket, checkin, checkout):
             rules_trace.append({'priority': 1, 'rule': 'blackout_total', 'applied': True, 'result': 'blocked'})
             return {'sellable': False, 'message': 'Blackout total ativo no período.', 'rules_applied': rules_trace, 'nights': nights}
         rules_trace.append({'priority': 1, 'rule': 'blackout_total', 'applied': False, 'result': 'passed'})
 
-        first_day_rules = ChannelRestrictionService.resolve_day_rules(category=bucket, channel=channel, day=checkin_day)
+        first_day_rules = lookups.day_rules(bucket, channel, checkin_day)
         if bool(first_day_rules.get('stop_sell')):
             rules_trace.append({'priority': 2, 'rule': 'stop_sell_canal', 'applied': True, 'result': 'blocked', 'details': first_day_rules})
             return {'sellable': False, 'message': f'Canal {channel} com stop sell ativo.', 'rules_applied': rules_trace, 'nights': nights}
         rules_trace.append({'priority': 2, 'rule': 'stop_sell_canal', 'applied': False, 'result': 'passed'})
 
-        if not InventoryRestrictionService.is_open_for_period(bucket, checkin, checkout):
+        if not lookups.is_open(bucket, checkin, checkout):
             rules_trace.append({'priority': 3, 'rule': 'categoria_fechada', 'applied': True, 'result': 'blocked'})
             return {'sellable': False, 'message': 'Categoria fechada para venda no período.', 'rules_applied': rules_trace, 'nights': nights}
         rules_trace.append({'priority': 3, 'rule': 'categoria_fechada', 'applied': False, 'result': 'passed'})
@@ -105,14 +262,14 @@ class ChannelRulePriorityEngineService:
             return {'sellable': False, 'message': 'Restrição CTA ativa para a data de check-in.', 'rules_applied': rules_trace, 'nights': nights}
         rules_trace.append({'priority': 4, 'rule': 'cta', 'applied': False, 'result': 'passed'})
 
-        checkout_rules = ChannelRestrictionService.resolve_day_rules(category=bucket, channel=channel, day=checkout_day)
+        checkout_rules = lookups.day_rules(bucket, channel, checkout_day)
         if bool(checkout_rules.get('ctd')):
             rules_trace.append({'priority': 5, 'rule': 'ctd', 'applied': True, 'result': 'blocked', 'details': checkout_rules})
             return {'sellable': False, 'message': 'Restrição CTD ativa para a data de check-out.', 'rules_applied': rules_trace, 'nights': nights}
         rules_trace.append({'priority': 5, 'rule': 'ctd', 'applied': False, 'result': 'passed'})
 
-        min_stay = max([int(ChannelRestrictionService.resolve_day_rules(category=bucket, channel=channel, day=day).get('min_stay') or 0) for day in stay_days] or [0])
-        max_stay = max([int(ChannelRestrictionService.resolve_day_rules(category=bucket, channel=channel, day=day).get('max_stay') or 0) for day in stay_days] or [0])
+        min_stay = max([int(lookups.day_rules(bucket, channel, day).get('min_stay') or 0) for day in stay_days] or [0])
+        max_stay = max([int(lookups.day_rules(bucket, channel, day).get('max_stay') or 0) for day in stay_days] or [0])
         if min_stay > 0 and nights < min_stay:
             rules_trace.append({'priority': 6, 'rule': 'min_stay', 'applied': True, 'result': 'blocked', 'details': {'min_stay': min_stay}})
             return {'sellable': False, 'message': f'Estadia mínima de {min_stay} noite(s) ativa.', 'rules_applied': rules_trace, 'nights': nights}
@@ -127,7 +284,7 @@ class ChannelRulePriorityEngineService:
             return {'sellable': False, 'message': f'Pacote obrigatório ativo: {package_required}.', 'rules_applied': rules_trace, 'nights': nights}
         rules_trace.append({'priority': 7, 'rule': 'pacote_obrigatorio', 'applied': bool(package_required), 'result': 'passed', 'details': {'required': package_required}})
 
-        day_tariff = cls._tariff_for_day(channel_name=channel, category=bucket, day_iso=checkin_day)
+        day_tariff = lookups.day_tariff(channel, bucket, checkin_day)
         tarifa_direta = float(day_tariff.get('tarifa_direta') or 0.0)
         tarifa_canal = float(day_tariff.get('tarifa_canal') or tarifa_direta)
         promo_code = str(first_day_rules.get('promocao_especifica') or '').strip()
@@ -143,16 +300,11 @@ class ChannelRulePriorityEngineService:
         dynamic_details = {'factor': 1.0, 'details': {'mode': 'disabled'}}
         tariff_after_dynamic = tarifa_canal
         if apply_dynamic:
-            dynamic_details = TariffPriorityEngineService._dynamic_factor(category=bucket, day=sale_day)
+            dynamic_details = lookups.dynamic_factor(bucket, sale_day)
             tariff_after_dynamic = round(tariff_after_dynamic * float(dynamic_details.get('factor') or 1.0), 2)
         rules_trace.append({'priority': 10, 'rule': 'ajuste_dinamico_rm', 'applied': bool(apply_dynamic), 'result': 'passed', 'details': dynamic_details})
 
-        commission_calc = ChannelCommissionService.calculate_channel_tariff(
-            channel_name=channel,
-            category=bucket,
-            day_iso=checkin_day,
-            direct_tariff=tariff_after_dynamic,
-        )
+        commission_calc = lookups.channel_tariff(channel, bucket, checkin_day, tariff_after_dynamic)
         commission_pct = float(commission_calc.get('commission_pct') or 0.0)
         tariff_after_commission_model = float(commission_calc.get('tarifa_canal') or tariff_after_dynamic)
         liquido = float(commission_calc.get('liquido_estimado_hotel') or 0.0)
@@ -187,3 +339,39 @@ class ChannelRulePriorityEngineService:
                 'modelo_comercial': commission_calc.get('commercial_model'),
             },
         }
+
+
+def _benchmark(days=14, channel='Booking.com'):
+    """Channel calendar grid: one call per day × category (previous route) vs the range APIs."""
+    import time
+    from datetime import date, timedelta
+
+    from app.services.channel_inventory_planner_service import ChannelInventoryPlannerService
+
+    categories = [str(item.get('key')) for item in RevenueManagementService.BOOKING_CATEGORY_OPTIONS]
+    start = date.today()
+    span = [(start + timedelta(days=i)).isoformat() for i in range(days)]
+
+    started = time.perf_counter()
+    for day in span:
+        next_day = (PeriodSelectorService.parse_date(day).date() + timedelta(days=1)).isoformat()
+        for category in categories:
+            ChannelTariffService.calculate_tariffs(channel_name=channel, category=category, start_date=day, end_date=day, weekdays=[])
+            ChannelInventoryPlannerService.build_snapshot(category=category, start_date=day, end_date=day, weekdays=[])
+            ChannelRestrictionService.resolve_day_rules(category=category, channel=channel, day=day)
+            ChannelRulePriorityEngineService.evaluate(category=category, channel=channel, checkin=day, checkout=next_day, sale_date=day)
+    per_cell = time.perf_counter() - started
+
+    started = time.perf_counter()
+    span_args = {'start_date': span[0], 'end_date': span[-1], 'weekdays': []}
+    simulation = RevenueManagementService.simulate_projection(start_date=span[0], days=days, advanced_mode=True)
+    ChannelTariffService.calculate_tariffs_range(channel_name=channel, categories=categories, simulation=simulation, **span_args)
+    ChannelInventoryPlannerService.build_snapshots(categories=categories, **span_args)
+    ChannelRestrictionService.resolve_rules_range(categories=categories, channel=channel, **span_args)
+    ChannelRulePriorityEngineService.evaluate_range(categories=categories, channel=channel, simulation=simulation, **span_args)
+    batched = time.perf_counter() - started
+    return {'cells': days * len(categories), 'per_cell_s': round(per_cell, 3), 'batched_s': round(batched, 3)}
+
+
+if __name__ == '__main__':
+    print(_benchmark())
@@ -2,7 +2,7 @@ from datetime import datetime
 from typing import Any, Dict, List, Optional
 import uuid
 
-from app.services.cashier_service import file_lock
+from app.services.audit_log_service import get_audit_log
 from app.services.period_selector_service import PeriodSelectorService
 from app.services.system_config_manager import CHANNEL_MANAGER_SYNC_LOGS_FILE
 
@@ -20,20 +20,8 @@ class ChannelSyncLogService:
     }
 
     @classmethod
-    def _load_json(cls, path: str, fallback: Any) -> Any:
-        from app.services.revenue_management_service import RevenueManagementService
-
-        loaded = RevenueManagementService._load_json(path, fallback)
-        if isinstance(fallback, list):
-            return loaded if isinstance(loaded, list) else []
-        return loaded
-
-    @classmethod
-    def _save_json(cls, path: str, payload: Any) -> None:
-        from app.services.revenue_management_service import RevenueManagementService
-
-        with file_lock(path):
-            RevenueManagementService._save_json(path, payload)
+    def _sync_log(cls):
+        return get_audit_log(CHANNEL_MANAGER_SYNC_LOGS_FILE, entity_field='channel')
 
     @classmethod
     def _normalize_status(cls, status: Any) -> str:
@@ -86,9 +74,7 @@ class ChannelSyncLogService:
             'attempts': max(1, int(attempts or 1)),
             'error_message': str(error_message or '').strip(),
         }
-        rows = cls._load_json(CHANNEL_MANAGER_SYNC_LOGS_FILE, [])
-        rows.append(row)
-        cls._save_json(CHANNEL_MANAGER_SYNC_LOGS_FILE, rows)
+        cls._sync_log().append([row])
         return row
 
     @classmethod
@@ -101,16 +87,13 @@ class ChannelSyncLogService:
         sync_type: Optional[str] = None,
         status: Optional[str] = None,
     ) -> List[Dict[str, Any]]:
-        rows = cls._load_json(CHANNEL_MANAGER_SYNC_LOGS_FILE, [])
         start = PeriodSelectorService.parse_date(start_date).date() if start_date else None
         end = PeriodSelectorService.parse_date(end_date).date() if end_date else None
         channel_filter = str(channel or '').strip().lower()
         type_filter = str(sync_type or '').strip().lower()
         status_filter = cls._normalize_status(status) if status else ''
         out: List[Dict[str, Any]] = []
-        for row in rows:
-            if not isinstance(row, dict):
-                continue
+        for row in cls._sync_log().query(start=start, end=end, entity=channel_filter):
             ts = str(row.get('timestamp') or '')
             try:
                 day = datetime.fromisoformat(ts).date()
@@ -2,9 +2,11 @@ from datetime import datetime
 from typing import Any, Dict, List, Optional
 import uuid
 
+from app.services.audit_log_service import get_audit_log
 from app.services.cashier_service import file_lock
 from app.services.channel_inventory_control_service import ChannelInventoryControlService
 from app.services.logger_service import LoggerService
+from app.services.period_selector_service import PeriodSelectorService
 from app.services.system_config_manager import (
     CHANNEL_MANAGER_TARIFFS_FILE,
     CHANNEL_MANAGER_TARIFFS_LOGS_FILE,
@@ -37,6 +39,10 @@ class ChannelTariffService:
         with file_lock(file_path):
             RevenueManagementService._save_json(file_path, payload)
 
+    @classmethod
+    def _tariff_log(cls):
+        return get_audit_log(CHANNEL_MANAGER_TARIFFS_LOGS_FILE)
+
     @classmethod
     def _normalize_category(cls, category: Any) -> str:
         from app.services.revenue_management_service import RevenueManagementService
@@ -264,16 +270,14 @@ class ChannelTariffService:
         if updated:
             store['channels'] = list(current_by_channel.values())
             cls._save_json(CHANNEL_MANAGER_TARIFFS_FILE, store)
-        logs = cls._load_json(CHANNEL_MANAGER_TARIFFS_LOGS_FILE, [])
-        logs.append({
+        cls._tariff_log().append([{
             'id': str(uuid.uuid4()),
             'timestamp': datetime.now().isoformat(timespec='seconds'),
             'user': user,
             'action': 'save_channel_tariff_rules',
             'reason': clean_reason,
             'updated_channels': [item.get('channel_name') for item in updated],
-        })
-        cls._save_json(CHANNEL_MANAGER_TARIFFS_LOGS_FILE, logs)
+        }])
         LoggerService.log_acao(
             acao='Atualizou regras tarifárias por canal',
             entidade='Channel Manager',
@@ -337,6 +341,73 @@ class ChannelTariffService:
             return {'tariff': tariff, 'rule': f'promocao_percentual_{round(pct * 100, 2)}'}
         return None
 
+    @classmethod
+    def _channel_rule(cls, rules: Dict[str, Any], channel_name: str) -> Dict[str, Any]:
+        by_channel = {
+            cls._normalize_channel(item.get('channel_name')): item
+            for item in (rules.get('channels') or [])
+            if isinstance(item, dict)
+        }
+        return by_channel.get(channel_name) or cls._default_channel_rule(channel_name)
+
+    @classmethod
+    def _tariff_limits(cls, rule: Dict[str, Any]) -> tuple:
+        min_tariff = max(0.0, float(rule.get('min_tariff') or 0.0))
+        max_tariff = max(0.0, float(rule.get('max_tariff') or 0.0))
+        if max_tariff > 0 and max_tariff < min_tariff:
+            max_tariff = min_tariff
+        return min_tariff, max_tariff
+
+    @classmethod
+    def _tariff_row(cls, *, rule: Dict[str, Any], row: Dict[str, Any], min_tariff: float, max_tariff: float) -> Dict[str, Any]:
+        day_iso = str(row.get('date') or '')
+        bucket = cls._normalize_category(row.get('category'))
+        direct = max(0.0, float(row.get('tarifa_direta') or row.get('current_bar') or 0.0))
+        commission = cls._pick_commission_pct(rule=rule, category=bucket, day_iso=day_iso)
+        mode = cls._normalize_mode(rule.get('tariff_mode'))
+        applied_rule = mode
+        fixed_tariff = cls._pick_fixed_tariff(rule=rule, category=bucket, day_iso=day_iso)
+        manual_map = rule.get('manual_tariff_by_category') or {}
+        if not isinstance(manual_map, dict):
+            manual_map = {}
+        if fixed_tariff is not None:
+            channel_tariff = fixed_tariff
+            applied_rule = 'tarifa_fixa_periodo'
+        elif mode == 'usar_tarifa_direta_grossup_comissao':
+            denominator = max(1.0 - commission, 0.0001)
+            channel_tariff = direct / denominator
+            applied_rule = 'grossup_comissao'
+        elif mode == 'usar_tarifa_manual_canal':
+            channel_tariff = max(0.0, float(manual_map.get(bucket, direct) or 0.0))
+            applied_rule = 'tarifa_manual_canal'
+        elif mode == 'usar_promocao_especifica_canal':
+            promo = cls._apply_promotion(rule=rule, category=bucket, day_iso=day_iso, base_value=direct)
+            if promo:
+                channel_tariff = max(0.0, float(promo.get('tariff') or 0.0))
+                applied_rule = str(promo.get('rule') or 'promocao_especifica_canal')
+            else:
+                channel_tariff = direct
+                applied_rule = 'promocao_especifica_canal_sem_regra'
+        else:
+            channel_tariff = direct
+            applied_rule = 'tarifa_direta'
+        if min_tariff > 0:
+            channel_tariff = max(channel_tariff, min_tariff)
+        if max_tariff > 0:
+            channel_tariff = min(channel_tariff, max_tariff)
+        net = channel_tariff * (1.0 - commission)
+        return {
+            'date': day_iso,
+            'category': bucket,
+            'category_label': row.get('category_label') or bucket,
+            'tarifa_direta': round(direct, 2),
+            'tarifa_canal': round(channel_tariff, 2),
+            'comissao_aplicada_percentual': round(commission, 6),
+            'comissao_aplicada_valor': round(max(0.0, channel_tariff - net), 2),
+            'liquido_estimado_hotel': round(net, 2),
+            'regra_comercial_aplicada': applied_rule,
+        }
+
     @classmethod
     def calculate_tariffs(
         cls,
@@ -350,73 +421,18 @@ class ChannelTariffService:
         from app.services.revenue_management_service import RevenueManagementService
 
         normalized_channel = cls._normalize_channel(channel_name)
-        rules = cls.get_tariff_rules()
-        by_channel = {
-            cls._normalize_channel(item.get('channel_name')): item
-            for item in (rules.get('channels') or [])
-            if isinstance(item, dict)
-        }
-        rule = by_channel.get(normalized_channel) or cls._default_channel_rule(normalized_channel)
+        rule = cls._channel_rule(cls.get_tariff_rules(), normalized_channel)
         calendar = RevenueManagementService.calendar_direct_vs_ota(
             category=category,
             start_date=start_date,
             end_date=end_date,
             weekdays=weekdays or [],
         )
-        rows = calendar.get('rows') or []
-        out_rows: List[Dict[str, Any]] = []
-        min_tariff = max(0.0, float(rule.get('min_tariff') or 0.0))
-        max_tariff = max(0.0, float(rule.get('max_tariff') or 0.0))
-        if max_tariff > 0 and max_tariff < min_tariff:
-            max_tariff = min_tariff
-        for row in rows:
-            day_iso = str(row.get('date') or '')
-            bucket = cls._normalize_category(row.get('category'))
-            direct = max(0.0, float(row.get('tarifa_direta') or row.get('current_bar') or 0.0))
-            commission = cls._pick_commission_pct(rule=rule, category=bucket, day_iso=day_iso)
-            mode = cls._normalize_mode(rule.get('tariff_mode'))
-            applied_rule = mode
-            fixed_tariff = cls._pick_fixed_tariff(rule=rule, category=bucket, day_iso=day_iso)
-            manual_map = rule.get('manual_tariff_by_category') or {}
-            if not isinstance(manual_map, dict):
-                manual_map = {}
-            if fixed_tariff is not None:
-                channel_tariff = fixed_tariff
-                applied_rule = 'tarifa_fixa_periodo'
-            elif mode == 'usar_tarifa_direta_grossup_comissao':
-                denominator = max(1.0 - commission, 0.0001)
-                channel_tariff = direct / denominator
-                applied_rule = 'grossup_comissao'
-            elif mode == 'usar_tarifa_manual_canal':
-                channel_tariff = max(0.0, float(manual_map.get(bucket, direct) or 0.0))
-                applied_rule = 'tarifa_manual_canal'
-            elif mode == 'usar_promocao_especifica_canal':
-                promo = cls._apply_promotion(rule=rule, category=bucket, day_iso=day_iso, base_value=direct)
-                if promo:
-                    channel_tariff = max(0.0, float(promo.get('tariff') or 0.0))
-                    applied_rule = str(promo.get('rule') or 'promocao_especifica_canal')
-                else:
-                    channel_tariff = direct
-                    applied_rule = 'promocao_especifica_canal_sem_regra'
-            else:
-                channel_tariff = direct
-                applied_rule = 'tarifa_direta'
-            if min_tariff > 0:
-                channel_tariff = max(channel_tariff, min_tariff)
-            if max_tariff > 0:
-                channel_tariff = min(channel_tariff, max_tariff)
-            net = channel_tariff * (1.0 - commission)
-            out_rows.append({
-                'date': day_iso,
-                'category': bucket,
-                'category_label': row.get('category_label') or bucket,
-                'tarifa_direta': round(direct, 2),
-                'tarifa_canal': round(channel_tariff, 2),
-                'comissao_aplicada_percentual': round(commission, 6),
-                'comissao_aplicada_valor': round(max(0.0, channel_tariff - net), 2),
-                'liquido_estimado_hotel': round(net, 2),
-                'regra_comercial_aplicada': applied_rule,
-            })
+        min_tariff, max_tariff = cls._tariff_limits(rule)
+        out_rows = [
+            cls._tariff_row(rule=rule, row=row, min_tariff=min_tariff, max_tariff=max_tariff)
+            for row in (calendar.get('rows') or [])
+        ]
         return {
             'channel_name': normalized_channel,
             'category': category,
@@ -429,3 +445,43 @@ class ChannelTariffService:
             'rows': out_rows,
             'count': len(out_rows),
         }
+
+    @classmethod
+    def calculate_tariffs_range(
+        cls,
+        *,
+        channel_name: str,
+        categories: List[str],
+        start_date: str,
+        end_date: str,
+        weekdays: Optional[List[str]] = None,
+        simulation: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """
+        ``calculate_tariffs`` rows by category and day for the whole period:
+        the channel rules are read and the RM projection is run once, and
+        only the direct tariff of ``calendar_direct_vs_ota`` is derived from
+        it (the OTA restriction columns are not needed here).
+        """
+        from app.services.revenue_management_service import RevenueManagementService
+
+        normalized_channel = cls._normalize_channel(channel_name)
+        rule = cls._channel_rule(cls.get_tariff_rules(), normalized_channel)
+        min_tariff, max_tariff = cls._tariff_limits(rule)
+        days = PeriodSelectorService.expand_dates(start_date, end_date, weekdays or [])
+        if simulation is None and days:
+            first = PeriodSelectorService.parse_date(days[0]).date()
+            last = PeriodSelectorService.parse_date(days[-1]).date()
+            simulation = RevenueManagementService.simulate_projection(
+                start_date=first.isoformat(),
+                days=(last - first).days + 1,
+                advanced_mode=True,
+            )
+        direct_rows = RevenueManagementService.direct_tariff_rows(categories=categories, days=days, simulation=simulation or {})
+        return {
+            category: {
+                day: cls._tariff_row(rule=rule, row=row, min_tariff=min_tariff, max_tariff=max_tariff)
+                for day, row in direct_rows[category].items()
+            }
+            for category in categories
+        }
@@ -4,11 +4,11 @@ import uuid
 import unicodedata
 import logging
 import hashlib
-import threading
-import copy
 from datetime import datetime
 from flask import session
 from app.services.data_cleanup_monitor_service import record_data_cleanup_event
+from app.services.json_document_cache import get_document_cache, invalidate_document
+from app.services.request_metrics_service import timed_section
 
 from app.services.system_config_manager import (
     SETTINGS_FILE, SALES_PRODUCTS_FILE, SALES_HISTORY_FILE,
@@ -50,6 +50,7 @@ _CRITICAL_JSON_FILENAMES = {
     'stock_logs.json',
 }
 _LEGACY_DIVERGENCE_ALERTED = set()
+_LEGACY_DIVERGENCE_CHECKED = {}
 
 def _critical_filename(filepath):
     return os.path.basename(str(filepath or '')).lower()
@@ -82,6 +83,15 @@ def _alert_legacy_divergence_once(filepath):
         return
     if not os.path.exists(canonical) or not os.path.exists(legacy):
         return
+    try:
+        canonical_stat = os.stat(canonical)
+        legacy_stat = os.stat(legacy)
+        signature = (canonical_stat.st_mtime_ns, canonical_stat.st_size, legacy_stat.st_mtime_ns, legacy_stat.st_size)
+    except OSError:
+        return
+    if _LEGACY_DIVERGENCE_CHECKED.get(filename) == signature:
+        return
+    _LEGACY_DIVERGENCE_CHECKED[filename] = signature
     try:
         with open(canonical, 'rb') as stream:
             canonical_hash = hashlib.sha256(stream.read()).hexdigest()
@@ -124,6 +134,14 @@ def normalize_room_simple(r):
     return s
 
 # --- Generic Load/Save Helper ---
+def _read_json_file(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def get_json_cache_stats():
+    return get_document_cache().stats()
+
+@timed_section('json_load')
 def _load_json(filepath, default=None, strict=False):
     import time
     if default is None: default = []
@@ -145,8 +163,7 @@ def _load_json(filepath, default=None, strict=False):
     max_retries = 20
     for i in range(max_retries):
         try:
-            with open(target_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return get_document_cache().get(target_path, _read_json_file)
         except (PermissionError, OSError):
             if i == max_retries - 1:
                 logging.error(f"Could not acquire lock for {target_path} after {max_retries} attempts.")
@@ -178,10 +195,12 @@ def _load_json(filepath, default=None, strict=False):
             
     return default
 
+@timed_section('json_save')
 def _save_json(filepath, data):
     filepath = _canonical_write_path(filepath)
     if os.path.abspath(filepath) in _CRITICAL_JSON_PATHS:
         return _save_json_atomic(filepath, data)
+    invalidate_document(filepath)
     try:
         with open(filepath, 'w', encoding='utf-8') as f:
             json.dump(data, f, indent=4, ensure_ascii=False)
@@ -189,11 +208,15 @@ def _save_json(filepath, data):
     except Exception as e:
         print(f"Error saving {filepath}: {e}")
         return False
+    finally:
+        invalidate_document(filepath)
 
+@timed_section('json_save')
 def _save_json_atomic(filepath, data):
     filepath = _canonical_write_path(filepath)
     import time
     temp_file = filepath + ".tmp"
+    invalidate_document(filepath)
     try:
         with open(temp_file, 'w', encoding='utf-8') as f:
             json.dump(data, f, indent=4, ensure_ascii=False)
@@ -221,6 +244,8 @@ def _save_json_atomic(filepath, data):
             try: os.remove(temp_file)
             except: pass
         return False
+    finally:
+        invalidate_document(filepath)
 
 def _backup_before_write(filepath, max_backups=30):
     filepath = _canonical_write_path(filepath)
@@ -544,8 +569,60 @@ def get_current_cashier(user=None, cashier_type=None):
 def load_sales_products(): return _load_json(SALES_PRODUCTS_FILE, {})
 def save_sales_products(data): return _save_json(SALES_PRODUCTS_FILE, data)
 
+# --- Append-only ledgers ---
+# stock_entries and sales_history keep their JSON array as a snapshot and
+# take appends through a JSONL journal (ledger_journal_service), so adding a
+# few rows no longer rewrites and backs up the whole history.
+def _ledger_journal(filepath):
+    from app.services.ledger_journal_service import get_ledger_journal
+
+    def write_snapshot(rows):
+        _backup_before_write(filepath)
+        return _save_json_atomic(filepath, rows)
+
+    return get_ledger_journal(
+        _canonical_write_path(filepath),
+        read_snapshot=lambda: _load_json(filepath, [], strict=True),
+        write_snapshot=write_snapshot,
+    )
+
+def compact_ledgers():
+    """Folds pending journal rows of every ledger into its JSON snapshot."""
+    return {
+        os.path.basename(path): _ledger_journal(path).compact()
+        for path in (STOCK_ENTRIES_FILE, SALES_HISTORY_FILE)
+    }
+
+def _sales_row_date(row):
+    from app.services.ledger_stream_service import parse_row_date
+    return parse_row_date(row.get('closed_at') or row.get('date')) if isinstance(row, dict) else None
+
+def _stock_entry_date(row):
+    from app.services.ledger_stream_service import parse_row_date
+    return parse_row_date(row.get('date') or row.get('entry_date')) if isinstance(row, dict) else None
+
 # --- Sales History ---
-def load_sales_history(): return _load_json(SALES_HISTORY_FILE, [], strict=True)
+def load_sales_history(): return _ledger_journal(SALES_HISTORY_FILE).load()
+
+def iter_sales_history(start=None, end=None):
+    """Yields sales rows closed within [start, end] (datetimes, both optional)."""
+    return _ledger_journal(SALES_HISTORY_FILE).iter_rows(start, end, _sales_row_date)
+
+def append_sales_history(rows):
+    rows = list(rows or [])
+    appended = _ledger_journal(SALES_HISTORY_FILE).append(rows)
+    if appended:
+        _notify_sales_cube(rows, appended=True)
+    return appended
+
+# Writers keep the per-day sales cube (sales_cube_service) in step the same
+# way the stock writers feed the balance index.
+def _notify_sales_cube(rows, appended):
+    from app.services.sales_cube_service import notify_sales_appended, notify_sales_replaced
+    if appended:
+        notify_sales_appended(rows)
+    else:
+        notify_sales_replaced(rows)
 
 def save_sales_history(data):
     return secure_save_sales_history(data, user_id='Sistema')
@@ -565,8 +642,11 @@ def secure_save_sales_history(new_data, user_id='Sistema'):
             MenuSecurityService.create_menu_sales_backup()
             MenuSecurityService.log_audit('BULK_DELETE_ALERT_SALES', user_id, 'ALL', {'message': msg})
             
-        _backup_before_write(SALES_HISTORY_FILE)
-        return _save_json_atomic(SALES_HISTORY_FILE, new_data)
+        # Pure appends land in the journal; anything else rewrites the snapshot.
+        saved, appended = _ledger_journal(SALES_HISTORY_FILE).save(new_data)
+        if saved:
+            _notify_sales_cube(new_data if appended is None else appended, appended=appended is not None)
+        return saved
     except Exception as e:
         logging.error(f"Secure Save Sales History Error: {e}")
         raise e
@@ -576,14 +656,53 @@ def load_maintenance_requests(): return _load_json(MAINTENANCE_FILE, [])
 def save_maintenance_requests(data): return _save_json(MAINTENANCE_FILE, data)
 
 # --- Stock ---
+# Writers below keep the materialized balance index (stock_balance_index_service)
+# in step: appends are folded in, full rewrites re-derive that ledger.
+def _notify_stock_index(source, rows, appended):
+    from app.services.stock_balance_index_service import notify_rows_appended, notify_source_replaced
+    if appended:
+        notify_rows_appended(source, rows)
+    else:
+        notify_source_replaced(source, rows)
+
 def load_stock_requests(): return _load_json(STOCK_FILE, [])
-def save_stock_requests(data): return _save_json(STOCK_FILE, data)
+
+def _stock_request_date(row):
+    from app.services.ledger_stream_service import parse_row_date
+    return parse_row_date(row.get('date')) if isinstance(row, dict) else None
+
+def iter_stock_requests(start=None, end=None):
+    """Yields stock requests dated within [start, end] (datetimes, both optional)."""
+    from app.services.ledger_stream_service import NotAJsonArray, get_ledger_stream_index, in_window
+    path = STOCK_FILE
+    if not os.path.exists(path):
+        legacy = _legacy_read_candidate(path)
+        path = legacy if legacy and os.path.exists(legacy) else None
+    if path:
+        streamed = False
+        try:
+            for row in get_ledger_stream_index().iter_range(path, start, end, _stock_request_date):
+                streamed = True
+                yield row
+            return
+        except (NotAJsonArray, ValueError, OSError):
+            if streamed:
+                raise
+    for row in load_stock_requests():
+        if in_window(row, start, end, _stock_request_date):
+            yield row
+def save_stock_requests(data):
+    saved = _save_json(STOCK_FILE, data)
+    if saved:
+        _notify_stock_index('requests', data, appended=False)
+    return saved
 def save_all_stock_requests(data): return save_stock_requests(data)
 
 def save_stock_request(req):
     requests = load_stock_requests()
     requests.append(req)
-    save_stock_requests(requests)
+    if _save_json(STOCK_FILE, requests):
+        _notify_stock_index('requests', [req], appended=True)
 
 def load_stock_logs(): return _load_json(STOCK_LOGS_FILE, [])
 def save_stock_logs(data): return _save_json(STOCK_LOGS_FILE, data)
@@ -631,7 +750,6 @@ def load_products():
     )
     return products
 
-from app.utils.lock import file_lock
 from app.services.system_config_manager import PRODUCTS_FILE
 
 def save_products(data):
@@ -789,38 +907,45 @@ def _get_payables_path():
 def load_payables(): return _load_json(_get_payables_path(), [])
 def save_payables(data): return _save_json(_get_payables_path(), data)
 
-def load_stock_entries(): return _load_json(STOCK_ENTRIES_FILE, [], strict=True)
+def load_stock_entries(): return _ledger_journal(STOCK_ENTRIES_FILE).load()
+
+def iter_stock_entries(start=None, end=None):
+    """Yields stock entries dated within [start, end] (datetimes, both optional)."""
+    return _ledger_journal(STOCK_ENTRIES_FILE).iter_rows(start, end, _stock_entry_date)
+
 def save_stock_entries(data):
-    _backup_before_write(STOCK_ENTRIES_FILE)
-    return _save_json_atomic(STOCK_ENTRIES_FILE, data)
+    saved, appended = _ledger_journal(STOCK_ENTRIES_FILE).save(data)
+    if saved:
+        if appended is not None:
+            _notify_stock_index('entries', appended, appended=True)
+        else:
+            _notify_stock_index('entries', data, appended=False)
+    return saved
 
 def save_stock_entry(entry):
-    entries = load_stock_entries()
-    entries.append(entry)
-    save_stock_entries(entries)
+    if _ledger_journal(STOCK_ENTRIES_FILE).append([entry]):
+        _notify_stock_index('entries', [entry], appended=True)
 
 def add_stock_entries_batch(new_entries):
     """
     Adds multiple stock entries with deduplication check based on 'id'.
     Does NOT handle locking; caller must ensure concurrency control if needed.
     """
-    entries = load_stock_entries()
-    existing_ids = set(e.get('id') for e in entries if e.get('id'))
+    existing_ids = set(e.get('id') for e in load_stock_entries() if e.get('id'))
     
-    added_count = 0
+    added = []
     for entry in new_entries:
         if entry.get('id') and entry['id'] not in existing_ids:
-            entries.append(entry)
             existing_ids.add(entry['id'])
-            added_count += 1
+            added.append(entry)
         elif not entry.get('id'):
             # If no ID, append anyway (legacy support) but ideally all should have IDs
-            entries.append(entry)
-            added_count += 1
+            added.append(entry)
             
-    if added_count > 0:
-        save_stock_entries(entries)
-    return added_count
+    if added:
+        if _ledger_journal(STOCK_ENTRIES_FILE).append(added):
+            _notify_stock_index('entries', added, appended=True)
+    return len(added)
 
 def load_conferences(): return _load_json(CONFERENCES_FILE, [])
 def save_conferences(data): return _save_json(CONFERENCES_FILE, data)
@@ -832,7 +957,11 @@ def load_conference_skipped_items(): return _load_json(CONFERENCE_SKIPPED_FILE,
 def save_conference_skipped_items(data): return _save_json(CONFERENCE_SKIPPED_FILE, data)
 
 def load_stock_transfers(): return _load_json(STOCK_TRANSFERS_FILE, [])
-def save_stock_transfers(data): return _save_json(STOCK_TRANSFERS_FILE, data)
+def save_stock_transfers(data):
+    saved = _save_json(STOCK_TRANSFERS_FILE, data)
+    if saved:
+        _notify_stock_index('transfers', data, appended=False)
+    return saved
 
 # --- Fixed Assets ---
 def load_fixed_assets(): return _load_json(FIXED_ASSETS_FILE, [])
@@ -841,77 +970,49 @@ def save_fixed_assets(data): return _save_json(FIXED_ASSETS_FILE, data)
 def load_asset_conferences(): return _load_json(ASSET_CONFERENCES_FILE, [])
 def save_asset_conferences(data): return _save_json(ASSET_CONFERENCES_FILE, data)
 
-import shutil
-import logging
-_table_orders_context = threading.local()
-
-def _table_orders_hash(data):
-    try:
-        payload = json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
-    except Exception:
-        payload = json.dumps({}, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
-    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
-
-def _merge_table_orders_data(current_data, incoming_data):
-    if not isinstance(current_data, dict):
-        current_data = {}
-    if not isinstance(incoming_data, dict):
-        return current_data
-    merged = copy.deepcopy(current_data)
-    for key, value in incoming_data.items():
-        if value is None:
-            merged.pop(key, None)
-            continue
-        merged[key] = value
-    return merged
-
 # --- Table Orders ---
-def load_table_orders():
-    data = _load_json(TABLE_ORDERS_FILE, {}, strict=True)
-    _table_orders_context.last_loaded_hash = _table_orders_hash(data)
-    return data
-
-def save_table_orders(data):
-    with file_lock(TABLE_ORDERS_FILE):
-        try:
-            user = session.get('user') if session else 'system'
-        except:
-            user = 'unknown'
-
-        incoming_data = data if isinstance(data, dict) else {}
-        current_data = _load_json(TABLE_ORDERS_FILE, {}) if os.path.exists(TABLE_ORDERS_FILE) else {}
-        current_hash = _table_orders_hash(current_data)
-        expected_hash = getattr(_table_orders_context, 'last_loaded_hash', None)
-        if expected_hash and expected_hash != current_hash:
-            incoming_data = _merge_table_orders_data(current_data, incoming_data)
-            logging.warning(f"Concurrent update detected in table_orders. User: {user}. Applying merge strategy.")
-
-        current_size = len(incoming_data) if incoming_data else 0
-        logging.info(f"Attempting to save table_orders. User: {user}. Items count: {current_size}")
+def _table_orders_store():
+    from app.services.table_orders_store import get_table_orders_store
+
+    view_path = _canonical_write_path(TABLE_ORDERS_FILE)
+    return get_table_orders_store(
+        view_path,
+        read_view=lambda: _load_json(view_path, {}, strict=True),
+        write_file=lambda path, payload: _save_json_atomic(path, payload),
+        journal_dir=os.path.join(os.path.dirname(view_path), 'backups', 'table_orders'),
+    )
 
-        if os.path.exists(TABLE_ORDERS_FILE):
-            try:
-                old_size = len(current_data)
-                if old_size > 0 and current_size == 0:
-                    logging.warning(f"CRITICAL: Wipe detected on table_orders.json! User: {user}. Backing up before wipe.")
+def table_order_lock_path(table_id):
+    """Lock base that holds one table across a load/modify/save cycle."""
+    return _table_orders_store().mutex_path(table_id)
 
-                backup_dir = os.path.join(os.path.dirname(TABLE_ORDERS_FILE), 'backups', 'table_orders')
-                os.makedirs(backup_dir, exist_ok=True)
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
-                backup_path = os.path.join(backup_dir, f"table_orders_{timestamp}_{user}.json")
-                shutil.copy2(TABLE_ORDERS_FILE, backup_path)
+def table_orders_history(table_id, limit=20):
+    return _table_orders_store().history(table_id, limit=limit)
 
-                backups = sorted([os.path.join(backup_dir, f) for f in os.listdir(backup_dir)], key=os.path.getmtime)
-                while len(backups) > 50:
-                    os.remove(backups.pop(0))
+def load_table_orders():
+    return _table_orders_store().load()
 
-            except Exception as e:
-                logging.error(f"Failed to create backup for table_orders: {e}")
+def table_orders_segments():
+    """{table_id: (version, marshal blob)} of open tables, without decoding unchanged ones."""
+    return _table_orders_store().open_segments()
 
-        saved = _save_json_atomic(TABLE_ORDERS_FILE, incoming_data)
-        if saved:
-            _table_orders_context.last_loaded_hash = _table_orders_hash(incoming_data)
-        return saved
+def save_table_orders(data):
+    try:
+        user = session.get('user') if session else 'system'
+    except:
+        user = 'unknown'
+
+    incoming_data = data if isinstance(data, dict) else {}
+    logging.info(f"Attempting to save table_orders. User: {user}. Items count: {len(incoming_data)}")
+    # Only the tables this caller changed are rewritten, each under its own lock.
+    saved = _table_orders_store().save(incoming_data, user=user)
+    _notify_kds()
+    return saved
+
+# Held KDS screens (kds_event_service) wake up on every table orders commit.
+def _notify_kds():
+    from app.services.kds_event_service import notify_kds_orders_changed
+    notify_kds_orders_changed()
 
 # --- Restaurant Settings ---
 def load_restaurant_table_settings(): return _load_json(RESTAURANT_TABLE_SETTINGS_FILE, {})
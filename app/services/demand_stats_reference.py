@@ -0,0 +1,93 @@
+"""
+Per-product minimum-stock calculation that predates the NumPy demand matrix
+in ``demand_stats_service``. Not used by the app.
+"""
+import math
+import statistics
+from datetime import datetime, timedelta
+
+from app.services.demand_stats_service import (
+    ANALYSIS_DAYS, DATE_FORMAT, DEFAULT_LEAD_TIME, FREQUENCY_LEAD_TIMES, Z_SCORE_95, _no_history_row,
+)
+
+
+def reference_suggestions(requests, entries, products, start_date):
+    """Original per-product calculation, kept for equivalence tests and the benchmark."""
+    daily_demand = {}
+    for req in requests:
+        try:
+            req_date = datetime.strptime(req['date'], DATE_FORMAT)
+            if req_date >= start_date:
+                d_str = req['date']
+                if 'items_structured' in req:
+                    for item in req['items_structured']:
+                        name = item['name']
+                        qty = float(item.get('delivered_qty', item.get('qty', 0)))
+                        if name not in daily_demand: daily_demand[name] = {}
+                        daily_demand[name][d_str] = daily_demand[name].get(d_str, 0) + qty
+                elif 'items' in req and isinstance(req['items'], str):
+                    for part in req['items'].split(', '):
+                        if 'x ' in part:
+                            try:
+                                qty_str, name = part.split('x ', 1)
+                                if name not in daily_demand: daily_demand[name] = {}
+                                daily_demand[name][d_str] = daily_demand[name].get(d_str, 0) + float(qty_str)
+                            except: pass
+        except: pass
+    for entry in entries:
+        try:
+            entry_date = datetime.strptime(entry.get('date', ''), DATE_FORMAT)
+            if entry_date >= start_date:
+                qty = float(entry.get('qty', 0))
+                if qty < 0:
+                    name = entry.get('product')
+                    d_str = entry.get('date')
+                    if name not in daily_demand: daily_demand[name] = {}
+                    daily_demand[name][d_str] = daily_demand[name].get(d_str, 0) + abs(qty)
+        except: pass
+
+    suggestions = []
+    for p in products:
+        name = p['name']
+        history = daily_demand.get(name, {})
+        current_min = p.get('min_stock', 0) or 0
+        if not history:
+            suggestions.append(_no_history_row(p, current_min))
+            continue
+        daily_values = []
+        total_qty = 0
+        for i in range(ANALYSIS_DAYS):
+            val = history.get((start_date + timedelta(days=i)).strftime(DATE_FORMAT), 0)
+            daily_values.append(val)
+            total_qty += val
+        avg_daily = total_qty / ANALYSIS_DAYS
+        avg_monthly = avg_daily * 30
+        if total_qty == 0:
+            continue
+        std_dev_day = statistics.stdev(daily_values) if len(daily_values) > 1 else 0
+        lead_time = FREQUENCY_LEAD_TIMES.get(p.get('frequency', 'Semanal'), DEFAULT_LEAD_TIME)
+        safety_stock = Z_SCORE_95 * std_dev_day * math.sqrt(lead_time)
+        calculated_min = avg_daily * lead_time + safety_stock
+        lower_bound = avg_monthly * 0.01
+        upper_bound = avg_monthly * 0.50
+        final_suggestion = calculated_min
+        notes = []
+        if final_suggestion < lower_bound:
+            final_suggestion = lower_bound
+            notes.append("Ajustado p/ 1% da demanda mensal")
+        elif final_suggestion > upper_bound:
+            final_suggestion = upper_bound
+            notes.append("Limitado a 50% da demanda mensal (Regra de Negócio)")
+        suggestions.append({
+            'id': p['id'],
+            'product': name,
+            'current_min': current_min,
+            'avg_monthly': round(avg_monthly, 2),
+            'std_dev': round(std_dev_day, 2),
+            'lead_time': lead_time,
+            'suggested_min': round(final_suggestion, 2),
+            'raw_calculated': round(calculated_min, 2),
+            'justification': f"Lead Time: {lead_time}d, Var: {round(std_dev_day, 2)}. " + "; ".join(notes),
+            'has_history': True
+        })
+    return suggestions
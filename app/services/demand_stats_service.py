@@ -0,0 +1,290 @@
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+
+ANALYSIS_DAYS = 60
+Z_SCORE_95 = 1.645
+FREQUENCY_LEAD_TIMES = {'Diário': 1, 'Semanal': 7, 'Quinzenal': 15, 'Mensal': 30}
+DEFAULT_LEAD_TIME = 7
+# Lead-time inference: purchases (positive entries) looked at and the
+# minimum number of distinct purchase days before the median gap is trusted.
+LEAD_TIME_LOOKBACK_DAYS = 180
+MIN_PURCHASE_DAYS = 3
+MAX_INFERRED_LEAD_TIME = 30
+DATE_FORMAT = '%d/%m/%Y'
+
+
+class DemandMatrix:
+    """
+    Daily demand as a products × days float matrix.
+
+    ``names`` maps rows to product names; ``seen`` holds every name that
+    had any movement in the window (even on days outside the matrix),
+    which is what separates "no history" from "history summing to zero".
+    """
+
+    def __init__(self, names, values, start_date, days, seen):
+        self.names = names
+        self.row_of = {name: idx for idx, name in enumerate(names)}
+        self.values = values
+        self.start_date = start_date
+        self.days = days
+        self.seen = seen
+
+
+def build_demand_matrix(requests, entries, start_date, days=ANALYSIS_DAYS):
+    """
+    One pass over stock requests (consumption) and negative stock entries
+    (sales) into a DemandMatrix. Row filtering and parsing follow the
+    legacy per-product loop exactly, including which malformed rows are
+    skipped part-way.
+    """
+    names = []
+    row_of = {}
+    seen = set()
+    rows, cols, qtys = [], [], []
+    first_day = start_date.date()
+    parsed_dates = {}
+    canonical = set()
+
+    def parse(d_str):
+        # Ledgers repeat the same few hundred date strings; parse each once.
+        if d_str not in parsed_dates:
+            parsed_dates[d_str] = datetime.strptime(d_str, DATE_FORMAT)
+            if parsed_dates[d_str].strftime(DATE_FORMAT) == d_str:
+                canonical.add(d_str)
+        return parsed_dates[d_str]
+
+    def add(name, d_str, parsed, qty):
+        # The legacy code keyed by the raw date string and then looked days
+        # up by their canonical form, so non-canonical strings never count.
+        offset = (parsed.date() - first_day).days
+        if 0 <= offset < days and d_str in canonical:
+            idx = row_of.get(name)
+            if idx is None:
+                idx = row_of[name] = len(names)
+                names.append(name)
+            rows.append(idx)
+            cols.append(offset)
+            qtys.append(qty)
+
+    for req in requests:
+        try:
+            req_date = parse(req['date'])
+            if req_date < start_date:
+                continue
+            d_str = req['date']
+            if 'items_structured' in req:
+                for item in req['items_structured']:
+                    name = item['name']
+                    qty = float(item.get('delivered_qty', item.get('qty', 0)))
+                    seen.add(name)
+                    add(name, d_str, req_date, qty)
+            elif 'items' in req and isinstance(req['items'], str):
+                for part in req['items'].split(', '):
+                    if 'x ' in part:
+                        try:
+                            qty_str, name = part.split('x ', 1)
+                            seen.add(name)
+                            add(name, d_str, req_date, float(qty_str))
+                        except Exception:
+                            pass
+        except Exception:
+            pass
+
+    for entry in entries:
+        try:
+            entry_date = parse(entry.get('date', ''))
+            if entry_date < start_date:
+                continue
+            qty = float(entry.get('qty', 0))
+            if qty < 0:
+                name = entry.get('product')
+                seen.add(name)
+                add(name, entry.get('date'), entry_date, abs(qty))
+        except Exception:
+            pass
+
+    values = np.zeros((len(names), days), dtype=np.float64)
+    if qtys:
+        np.add.at(values, (np.asarray(rows, dtype=np.intp), np.asarray(cols, dtype=np.intp)), np.asarray(qtys, dtype=np.float64))
+    return DemandMatrix(names, values, start_date, days, seen)
+
+
+def infer_lead_times(entries, since, min_purchase_days=MIN_PURCHASE_DAYS):
+    """
+    Median gap in days between distinct purchase days (positive entries)
+    per product since ``since``; products with too few purchases are left
+    out so the caller falls back to the configured frequency.
+    """
+    purchase_days = {}
+    for entry in entries:
+        try:
+            qty = float(entry.get('qty', 0))
+            if qty <= 0:
+                continue
+            entry_date = datetime.strptime(entry.get('date', ''), DATE_FORMAT)
+        except Exception:
+            continue
+        if entry_date >= since:
+            purchase_days.setdefault(entry.get('product'), set()).add(entry_date.toordinal())
+    lead_times = {}
+    for name, days in purchase_days.items():
+        if len(days) < min_purchase_days:
+            continue
+        gaps = np.diff(np.fromiter(sorted(days), dtype=np.int64, count=len(days)))
+        lead_times[name] = int(min(MAX_INFERRED_LEAD_TIME, max(1, round(float(np.median(gaps))))))
+    return lead_times
+
+
+def _no_history_row(product, current_min):
+    return {
+        'id': product['id'],
+        'product': product['name'],
+        'current_min': current_min,
+        'avg_monthly': 0,
+        'std_dev': 0,
+        'lead_time': 0,
+        'suggested_min': 0,
+        'raw_calculated': 0,
+        'justification': "Sem histórico de movimentação recente.",
+        'has_history': False
+    }
+
+
+def compute_min_stock(products, matrix, inferred_lead_times=None):
+    """
+    Min stock for every product at once: reorder point
+    (avg daily demand × lead time) + safety stock (Z × σ_day × √lead time),
+    clamped to 1%–50% of monthly demand.
+    """
+    inferred_lead_times = inferred_lead_times or {}
+    days = matrix.days
+    rows = np.array([matrix.row_of.get(p['name'], -1) for p in products], dtype=np.intp)
+    has_row = rows >= 0
+    values = np.zeros((len(products), days), dtype=np.float64)
+    values[has_row] = matrix.values[rows[has_row]]
+
+    totals = values.sum(axis=1)
+    avg_daily = totals / days
+    avg_monthly = avg_daily * 30
+    std_dev_day = values.std(axis=1, ddof=1) if days > 1 else np.zeros(len(products))
+
+    lead_source = []
+    lead_list = []
+    for p in products:
+        inferred = inferred_lead_times.get(p['name'])
+        if inferred:
+            lead_list.append(inferred)
+            lead_source.append('entries')
+        else:
+            lead_list.append(FREQUENCY_LEAD_TIMES.get(p.get('frequency', 'Semanal'), DEFAULT_LEAD_TIME))
+            lead_source.append('frequency')
+    lead_time = np.asarray(lead_list, dtype=np.float64)
+
+    safety_stock = Z_SCORE_95 * std_dev_day * np.sqrt(lead_time)
+    calculated_min = avg_daily * lead_time + safety_stock
+    lower_bound = avg_monthly * 0.01
+    upper_bound = avg_monthly * 0.50
+    below = calculated_min < lower_bound
+    above = ~below & (calculated_min > upper_bound)
+    final = np.where(below, lower_bound, np.where(above, upper_bound, calculated_min))
+
+    suggestions = []
+    for i, p in enumerate(products):
+        current_min = p.get('min_stock', 0) or 0
+        if p['name'] not in matrix.seen:
+            suggestions.append(_no_history_row(p, current_min))
+            continue
+        if totals[i] == 0:
+            continue
+        notes = []
+        if below[i]:
+            notes.append("Ajustado p/ 1% da demanda mensal")
+        elif above[i]:
+            notes.append("Limitado a 50% da demanda mensal (Regra de Negócio)")
+        std = round(float(std_dev_day[i]), 2)
+        lt = int(lead_time[i])
+        suggestions.append({
+            'id': p['id'],
+            'product': p['name'],
+            'current_min': current_min,
+            'avg_monthly': round(float(avg_monthly[i]), 2),
+            'std_dev': std,
+            'lead_time': lt,
+            'lead_time_source': lead_source[i],
+            'suggested_min': round(float(final[i]), 2),
+            'raw_calculated': round(float(calculated_min[i]), 2),
+            'justification': f"Lead Time: {lt}d, Var: {std}. " + "; ".join(notes),
+            'has_history': True
+        })
+    return suggestions
+
+
+def smart_stock_suggestions(requests, entries, products, start_date, days=ANALYSIS_DAYS, lead_time_since=None):
+    """
+    ``entries`` may reach back to ``lead_time_since`` for lead-time
+    inference; demand only uses rows from ``start_date`` on. Pass
+    ``lead_time_since=None`` to use the configured frequencies only.
+    """
+    entries = entries if isinstance(entries, list) else list(entries)
+    matrix = build_demand_matrix(requests, entries, start_date, days)
+    inferred = infer_lead_times(entries, lead_time_since) if lead_time_since is not None else {}
+    return compute_min_stock(products, matrix, inferred)
+
+
+def synthetic_ledger(num_products=3000, years=2, seed=7, today=None):
+    """Products, stock requests and stock entries covering ``years`` of history."""
+    rng = np.random.default_rng(seed)
+    today = today or datetime.now()
+    frequencies = list(FREQUENCY_LEAD_TIMES)
+    products = [
+        {'id': str(i), 'name': f"Produto {i:05d}", 'min_stock': int(rng.integers(0, 20)), 'frequency': frequencies[i % len(frequencies)]}
+        for i in range(num_products)
+    ]
+    requests, entries = [], []
+    for day in range(years * 365, -1, -1):
+        d_str = (today - timedelta(days=day)).strftime(DATE_FORMAT)
+        picked = rng.choice(num_products, size=max(1, num_products // 20), replace=False)
+        requests.append({
+            'date': d_str,
+            'items_structured': [{'name': products[i]['name'], 'qty': float(rng.integers(1, 6))} for i in picked[: len(picked) // 2]],
+        })
+        for i in picked[len(picked) // 2:]:
+            entries.append({'product': products[i]['name'], 'qty': -float(rng.integers(1, 4)), 'date': d_str})
+        if day % 7 == 0:
+            for i in rng.choice(num_products, size=max(1, num_products // 10), replace=False):
+                entries.append({'product': products[i]['name'], 'qty': float(rng.integers(10, 50)), 'date': d_str})
+    return products, requests, entries
+
+
+def _benchmark(num_products=3000, years=2):
+    from app.services.demand_stats_reference import reference_suggestions
+
+    products, requests, entries = synthetic_ledger(num_products, years)
+    start_date = datetime.now() - timedelta(days=ANALYSIS_DAYS)
+    print(f"Ledger sintético: {len(products)} produtos, {len(requests)} requisições, {len(entries)} entradas")
+
+    started = time.perf_counter()
+    reference = reference_suggestions(requests, entries, products, start_date)
+    before_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    matrix = build_demand_matrix(requests, entries, start_date)
+    matrix_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    suggestions = compute_min_stock(products, matrix)
+    compute_s = time.perf_counter() - started
+
+    after_s = matrix_s + compute_s
+    print(f"Antes (por produto): {before_s:.3f}s ({len(reference)} sugestões)")
+    print(f"Depois (matriz):     {after_s:.3f}s ({len(suggestions)} sugestões; "
+          f"matriz {matrix_s:.3f}s, estoque mínimo {compute_s:.3f}s)")
+    print(f"Ganho: {before_s / after_s if after_s else float('inf'):.1f}x")
+
+
+if __name__ == '__main__':
+    _benchmark()
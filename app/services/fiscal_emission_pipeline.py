@@ -0,0 +1,146 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+
+def fetch_workers():
+    """Threads downloading XML/PDF of authorized notes (ALMAREIA_FISCAL_FETCH_WORKERS)."""
+    raw = str(os.environ.get('ALMAREIA_FISCAL_FETCH_WORKERS') or '').strip()
+    try:
+        return max(1, int(raw)) if raw else 4
+    except ValueError:
+        return 4
+
+
+class EmissionRateLimiter:
+    """
+    Token bucket per emitting CNPJ holding at most one token, refilled
+    every ``interval`` seconds: emissions of one CNPJ start at least
+    ``interval`` apart, and a CNPJ idle for longer emits immediately.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self.waited_s = 0.0
+
+    def acquire(self, key, interval):
+        interval = float(interval or 0)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                tokens, last = self._buckets.get(key, (1.0, now))
+                if interval > 0:
+                    tokens = min(1.0, tokens + (now - last) / interval)
+                else:
+                    tokens = 1.0
+                if tokens >= 1.0:
+                    self._buckets[key] = (tokens - 1.0, now)
+                    return
+                wait = (1.0 - tokens) * interval
+                self.waited_s += wait
+            time.sleep(wait)
+
+    def reset(self):
+        with self._lock:
+            self._buckets = {}
+
+
+class EmissionStateStore:
+    """
+    Durable per-item progress of the emission pipeline, one JSON object
+    keyed by emission id. Only items in flight are kept:
+
+    - ``emitting``: the call to the provider started, outcome unknown;
+    - ``emitted``: authorized (nfe_id/serie/number/access_key known),
+      XML/PDF not fetched yet.
+
+    Every change is written with a temp file + ``os.replace``, so a crash
+    leaves either the previous or the new state on disk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._items = self._read()
+
+    def _read(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _write(self):
+        if not self._items and not os.path.exists(self.path):
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._items, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def items(self):
+        with self._lock:
+            return {key: dict(value) for key, value in self._items.items()}
+
+    def ids(self):
+        with self._lock:
+            return set(self._items)
+
+    def put(self, emission_id, stage, **fields):
+        with self._lock:
+            record = dict(self._items.get(emission_id) or {})
+            record.update(fields)
+            record['stage'] = stage
+            record['updated_at'] = datetime.now().isoformat()
+            self._items[emission_id] = record
+            self._write()
+
+    def discard(self, emission_id):
+        with self._lock:
+            if self._items.pop(emission_id, None) is not None:
+                self._write()
+
+
+def _benchmark(notes=12, interval=0.05, fetch_s=0.2):
+    """Serial emit+fetch vs paced emission with overlapped fetch (simulated provider)."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    def emit():
+        time.sleep(0.01)
+
+    def fetch():
+        time.sleep(fetch_s)
+
+    started = time.perf_counter()
+    last = None
+    for _ in range(notes):
+        if last is not None:
+            time.sleep(max(0.0, interval - (time.monotonic() - last)))
+        last = time.monotonic()
+        emit()
+        fetch()
+    serial = time.perf_counter() - started
+
+    limiter = EmissionRateLimiter()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=fetch_workers()) as pool:
+        futures = []
+        for _ in range(notes):
+            limiter.acquire('28952732000109', interval)
+            emit()
+            futures.append(pool.submit(fetch))
+        for future in futures:
+            future.result()
+    pipelined = time.perf_counter() - started
+    return {'serial_s': round(serial, 3), 'pipeline_s': round(pipelined, 3)}
+
+
+if __name__ == '__main__':
+    print(_benchmark())
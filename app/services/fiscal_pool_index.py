@@ -0,0 +1,136 @@
+import bisect
+import marshal
+import time
+
+
+class FiscalPoolIndex:
+    """
+    Immutable snapshot of fiscal_pool.json with secondary indexes.
+
+    Entries are kept as marshal blobs so every caller gets its own copy
+    (the routes mutate what they get back before saving). ``_order`` holds
+    entry positions sorted by ``closed_at`` descending, with ties in file
+    order like ``sorted(..., reverse=True)``; the status, origin and
+    fiscal_type indexes store *ranks* in that order, already sorted, so a
+    date window is a bisect on each list instead of a scan.
+    """
+
+    def __init__(self, pool):
+        self._blobs = []
+        self._by_id = {}
+        closed_at = []
+        self._attrs = []
+        for entry in pool or []:
+            if not isinstance(entry, dict):
+                continue
+            if entry.get('id') is not None:
+                self._by_id.setdefault(str(entry['id']), len(self._blobs))
+            self._blobs.append(marshal.dumps(entry))
+            closed_at.append(str(entry.get('closed_at') or ''))
+            self._attrs.append((entry.get('status'), entry.get('origin'), entry.get('fiscal_type')))
+        self._order = sorted(range(len(self._blobs)), key=lambda pos: closed_at[pos], reverse=True)
+        # Ascending view of the closed_at column for bisect (rank = n - 1 - i).
+        self._closed_asc = [closed_at[pos] for pos in reversed(self._order)]
+        self._by_status = {}
+        self._by_origin = {}
+        self._by_type = {}
+        for rank, pos in enumerate(self._order):
+            status, origin, fiscal_type = self._attrs[pos]
+            self._by_status.setdefault(status, []).append(rank)
+            self._by_origin.setdefault(origin, []).append(rank)
+            self._by_type.setdefault(fiscal_type, []).append(rank)
+
+    def __len__(self):
+        return len(self._blobs)
+
+    def entries(self):
+        """Copy of the whole pool, in file order."""
+        return [marshal.loads(blob) for blob in self._blobs]
+
+    def position(self, entry_id):
+        return self._by_id.get(str(entry_id))
+
+    def entry(self, entry_id):
+        pos = self.position(entry_id)
+        if pos is None:
+            return None
+        return marshal.loads(self._blobs[pos])
+
+    def counts(self, field='status'):
+        index = {'status': self._by_status, 'origin': self._by_origin, 'fiscal_type': self._by_type}[field]
+        return {key: len(ranks) for key, ranks in index.items()}
+
+    def _rank_window(self, date_start, date_end):
+        n = len(self._closed_asc)
+        start = n - bisect.bisect_right(self._closed_asc, date_end) if date_end else 0
+        stop = n - bisect.bisect_left(self._closed_asc, date_start) if date_start else n
+        return start, max(start, stop)
+
+    def query(self, status=None, origin=None, fiscal_type=None, date_start=None, date_end=None, offset=0, limit=None):
+        """
+        Entries matching every given filter, newest ``closed_at`` first.
+
+        Same matching rules as the old linear ``get_pool`` (exact status,
+        origin and fiscal_type; plain string compare on the dates). Returns
+        ``(page, total)`` where ``total`` counts all matches.
+        """
+        start, stop = self._rank_window(date_start, date_end)
+        candidates = None
+        for index, value in ((self._by_status, status), (self._by_origin, origin), (self._by_type, fiscal_type)):
+            if value is None:
+                continue
+            ranks = index.get(value, [])
+            ranks = ranks[bisect.bisect_left(ranks, start):bisect.bisect_left(ranks, stop)]
+            if candidates is None:
+                candidates = ranks
+            else:
+                keep = set(ranks)
+                candidates = [rank for rank in candidates if rank in keep]
+        if candidates is None:
+            candidates = range(start, stop)
+        total = len(candidates)
+        offset = max(0, int(offset or 0))
+        end = total if limit is None else min(total, offset + max(0, int(limit)))
+        page = [marshal.loads(self._blobs[self._order[rank]]) for rank in candidates[offset:end]]
+        return page, total
+
+
+def _benchmark(num_entries=8000, lookups=300):
+    """get_pool/get_entry over a synthetic pool: linear scan + sort vs index."""
+    import random
+
+    rng = random.Random(13)
+    pool = [
+        {
+            'id': f"E{i:06d}",
+            'status': rng.choice(['pending', 'emitted', 'emitted', 'ignored', 'rejected']),
+            'origin': rng.choice(['restaurant', 'reception', 'daily_rates']),
+            'fiscal_type': rng.choice(['nfce', 'nfse']),
+            'closed_at': f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} 12:00:00",
+            'items': [{'name': 'Prato', 'qty': 1, 'price': 10.0}] * 4,
+            'history': [],
+        }
+        for i in range(num_entries)
+    ]
+    ids = [rng.choice(pool)['id'] for _ in range(lookups)]
+
+    started = time.perf_counter()
+    for entry_id in ids:
+        next((e for e in pool if e['id'] == entry_id), None)
+    pending = [e for e in pool if e['status'] == 'pending' and e['fiscal_type'] == 'nfce']
+    sorted(pending, key=lambda x: x['closed_at'], reverse=True)
+    linear = time.perf_counter() - started
+
+    started = time.perf_counter()
+    index = FiscalPoolIndex(pool)
+    build = time.perf_counter() - started
+    started = time.perf_counter()
+    for entry_id in ids:
+        index.entry(entry_id)
+    index.query(status='pending', fiscal_type='nfce')
+    indexed = time.perf_counter() - started
+    return {'linear_s': round(linear, 4), 'index_build_s': round(build, 4), 'index_lookup_s': round(indexed, 6)}
+
+
+if __name__ == '__main__':
+    print(_benchmark())
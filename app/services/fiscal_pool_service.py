@@ -3,15 +3,30 @@ import os
 import re
 import uuid
 import threading
+import time
 import requests
 import shutil
 from datetime import datetime
 from json import JSONDecodeError
 from app.services.system_config_manager import get_config_value, FISCAL_POOL_FILE
 from app.services.data_service import load_menu_items, load_room_occupancy
+from app.services.fiscal_pool_index import FiscalPoolIndex
+from app.services.json_document_cache import is_racy, stat_token
 
 # FISCAL_POOL_FILE = get_data_path('fiscal_pool.json')
 
+# Bump when _migrate_pool gains a step: files stamped with an older
+# version go through the backfill once more on their next load.
+POOL_SCHEMA_VERSION = 2
+_POOL_INDEX = None
+_POOL_INDEX_LOCK = threading.Lock()
+_POOL_INDEX_STATS = {'builds': 0, 'hits': 0, 'migrations': 0}
+# Pool writers re-read the file and save it while holding this lock, so
+# updates from concurrent threads (fiscal emission lanes and the XML/PDF
+# fetch pool) do not overwrite one another.
+_POOL_WRITE_LOCK = threading.RLock()
+
+
 class FiscalPoolService:
     MIRAPRAIA_CNPJ = '28952732000109'
     CANONICAL_STATUSES = {'pending', 'issuing', 'emitted', 'rejected', 'manual_retry_required', 'ignored'}
@@ -241,8 +256,7 @@ class FiscalPoolService:
         return recovered
 
     @staticmethod
-    def _load_pool():
-        import time
+    def _read_pool_file():
         if not os.path.exists(FISCAL_POOL_FILE):
             return []
         
@@ -295,87 +309,170 @@ class FiscalPoolService:
         if not loaded:
              raise OSError(f"Failed to load {FISCAL_POOL_FILE}")
             
-        try:
-            # Migration / Backfill
-            modified = False
-            normalized_pool = FiscalPoolService._normalize_pool_payload(pool)
-            if len(normalized_pool) != len(pool) if isinstance(pool, list) else True:
-                pool = normalized_pool
-                modified = True
-            else:
-                pool = normalized_pool
+        normalized_pool = FiscalPoolService._normalize_pool_payload(pool)
+        if not isinstance(pool, list) or len(normalized_pool) != len(pool):
+            # Dropped non-dict rows must not come back on the next load.
+            try:
+                FiscalPoolService._backup_pool_file()
+                FiscalPoolService._write_pool_atomic(normalized_pool)
+            except Exception:
+                pass
+        return normalized_pool
 
-            for entry in pool:
-                # Backfill 'closed_at' if missing
-                if 'closed_at' not in entry:
-                    entry['closed_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    modified = True
-                normalized_status = FiscalPoolService._normalize_status(entry.get('status'))
-                if entry.get('status') != normalized_status:
-                    entry['status'] = normalized_status
+    @staticmethod
+    def _migrate_pool(pool):
+        """Backfills legacy entries in place; returns True when any changed."""
+        modified = False
+        for entry in pool:
+            # Backfill 'closed_at' if missing
+            if 'closed_at' not in entry:
+                entry['closed_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                modified = True
+            normalized_status = FiscalPoolService._normalize_status(entry.get('status'))
+            if entry.get('status') != normalized_status:
+                entry['status'] = normalized_status
+                modified = True
+            if entry.get('fiscal_type') == 'nfce':
+                normalized_cnpj = FiscalPoolService._normalize_digits(entry.get('cnpj_emitente'))
+                if not normalized_cnpj or normalized_cnpj != FiscalPoolService.MIRAPRAIA_CNPJ:
+                    entry['cnpj_emitente'] = FiscalPoolService.MIRAPRAIA_CNPJ
                     modified = True
-                if entry.get('fiscal_type') == 'nfce':
-                    normalized_cnpj = FiscalPoolService._normalize_digits(entry.get('cnpj_emitente'))
-                    if not normalized_cnpj or normalized_cnpj != FiscalPoolService.MIRAPRAIA_CNPJ:
-                        entry['cnpj_emitente'] = FiscalPoolService.MIRAPRAIA_CNPJ
-                        modified = True
+            
+            # Check if we need to recalculate fiscal_amount
+            # Scenarios:
+            # 1. Missing 'fiscal_amount'
+            # 2. 'fiscal_amount' is 0 but total > 0, and payments don't have explicit 'is_fiscal' flags (Legacy migration issue)
+            
+            recalc_needed = False
+            if 'fiscal_amount' not in entry:
+                recalc_needed = True
+            elif entry.get('fiscal_amount', 0) == 0 and entry.get('total_amount', 0) > 0:
+                # Check if any payment has is_fiscal flag
+                pms = entry.get('payment_methods') or []
+                has_explicit_flag = any('is_fiscal' in pm for pm in pms)
+                if not has_explicit_flag:
+                    recalc_needed = True
+            
+            if recalc_needed:
+                pms = entry.get('payment_methods') or []
+                fiscal_val = 0.0
+                has_fiscal_flag = False
                 
-                # Check if we need to recalculate fiscal_amount
-                # Scenarios:
-                # 1. Missing 'fiscal_amount'
-                # 2. 'fiscal_amount' is 0 but total > 0, and payments don't have explicit 'is_fiscal' flags (Legacy migration issue)
+                for pm in pms:
+                    # If flag exists, use it
+                    if pm.get('is_fiscal'):
+                        has_fiscal_flag = True
+                        fiscal_val += float(pm.get('amount', 0.0))
                 
-                recalc_needed = False
-                if 'fiscal_amount' not in entry:
-                    recalc_needed = True
-                elif entry.get('fiscal_amount', 0) == 0 and entry.get('total_amount', 0) > 0:
-                    # Check if any payment has is_fiscal flag
-                    pms = entry.get('payment_methods') or []
-                    has_explicit_flag = any('is_fiscal' in pm for pm in pms)
-                    if not has_explicit_flag:
-                        recalc_needed = True
+                if has_fiscal_flag:
+                    entry['fiscal_amount'] = round(fiscal_val, 2)
+                else:
+                    # Fallback for legacy data without flags: assume total is fiscal
+                    # This fixes the migration of old closed accounts
+                    entry['fiscal_amount'] = float(entry.get('total_amount', 0.0))
                 
-                if recalc_needed:
-                    pms = entry.get('payment_methods') or []
-                    fiscal_val = 0.0
-                    has_fiscal_flag = False
-                    
-                    for pm in pms:
-                        # If flag exists, use it
-                        if pm.get('is_fiscal'):
-                            has_fiscal_flag = True
-                            fiscal_val += float(pm.get('amount', 0.0))
-                    
-                    if has_fiscal_flag:
-                        entry['fiscal_amount'] = round(fiscal_val, 2)
-                    else:
-                        # Fallback for legacy data without flags: assume total is fiscal
-                        # This fixes the migration of old closed accounts
-                        entry['fiscal_amount'] = float(entry.get('total_amount', 0.0))
+                # Cap at total
+                if entry['fiscal_amount'] > float(entry.get('total_amount', 0.0)):
+                    entry['fiscal_amount'] = float(entry.get('total_amount', 0.0))
                     
-                    # Cap at total
-                    if entry['fiscal_amount'] > float(entry.get('total_amount', 0.0)):
-                        entry['fiscal_amount'] = float(entry.get('total_amount', 0.0))
-                        
-                    modified = True
-            
-            if modified:
-                try:
+                modified = True
+        
+        return modified
+
+    @staticmethod
+    def _pool_meta_path():
+        return os.path.splitext(FISCAL_POOL_FILE)[0] + '.meta.json'
+
+    @staticmethod
+    def _read_pool_meta():
+        try:
+            with open(FiscalPoolService._pool_meta_path(), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return meta if isinstance(meta, dict) else {}
+
+    @staticmethod
+    def _write_pool_meta():
+        """Records that the file as it is now went through the current migration."""
+        token = stat_token(FISCAL_POOL_FILE)
+        if token is None:
+            return
+        meta_path = FiscalPoolService._pool_meta_path()
+        temp_path = f"{meta_path}.tmp.{uuid.uuid4().hex}"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'schema_version': POOL_SCHEMA_VERSION, 'token': list(token)}, f)
+            os.replace(temp_path, meta_path)
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _pool_index():
+        """
+        Indexed snapshot of fiscal_pool.json, rebuilt only when the file
+        changes on disk. The backfill migration runs when the file was not
+        written by this schema version (upgrade, restore, manual edit),
+        not on every load.
+        """
+        global _POOL_INDEX
+        token = stat_token(FISCAL_POOL_FILE)
+        if token is None:
+            return FiscalPoolIndex([])
+        with _POOL_INDEX_LOCK:
+            cached = _POOL_INDEX
+            if cached is not None and cached[0] == (FISCAL_POOL_FILE, token):
+                _POOL_INDEX_STATS['hits'] += 1
+                return cached[1]
+        pool = FiscalPoolService._read_pool_file()
+        meta = FiscalPoolService._read_pool_meta()
+        if meta.get('schema_version') != POOL_SCHEMA_VERSION or meta.get('token') != list(token):
+            try:
+                if FiscalPoolService._migrate_pool(pool):
                     FiscalPoolService._backup_pool_file()
                     FiscalPoolService._write_pool_atomic(pool)
-                except: pass
-                
-            return pool
-        except Exception:
-            return []
+            except Exception:
+                return FiscalPoolIndex([])
+            FiscalPoolService._write_pool_meta()
+            with _POOL_INDEX_LOCK:
+                _POOL_INDEX_STATS['migrations'] += 1
+            token = stat_token(FISCAL_POOL_FILE)
+        index = FiscalPoolIndex(pool)
+        # A snapshot read from a racy file is used once, not cached.
+        racy = token is None or is_racy(token)
+        with _POOL_INDEX_LOCK:
+            _POOL_INDEX_STATS['builds'] += 1
+            if not racy and token == stat_token(FISCAL_POOL_FILE):
+                _POOL_INDEX = ((FISCAL_POOL_FILE, token), index)
+        return index
+
+    @staticmethod
+    def _load_pool():
+        return FiscalPoolService._pool_index().entries()
 
     @staticmethod
     def _save_pool(pool):
+        with _POOL_WRITE_LOCK:
+            return FiscalPoolService._save_pool_locked(pool)
+
+    @staticmethod
+    def _save_pool_locked(pool):
+        try:
+            FiscalPoolService._migrate_pool(pool)
+            migrated = True
+        except Exception:
+            migrated = False
         try:
             FiscalPoolService._backup_pool_file()
-            return FiscalPoolService._write_pool_atomic(pool)
+            written = FiscalPoolService._write_pool_atomic(pool)
         except Exception:
             return False
+        if migrated:
+            FiscalPoolService._write_pool_meta()
+        return written
 
     @staticmethod
     def save_pool(pool):
@@ -387,8 +484,6 @@ class FiscalPoolService:
         Adds a closed account snapshot to the fiscal pool.
         origin: 'restaurant', 'reception', 'daily_rates'
         """
-        pool = FiscalPoolService._load_pool()
-        
         # Determine fiscal type and issuer CNPJ
         fiscal_type = 'nfce'
         cnpj_emitente = FiscalPoolService.MIRAPRAIA_CNPJ
@@ -552,8 +647,10 @@ class FiscalPoolService:
         except Exception:
             pass
         
-        pool.append(entry)
-        FiscalPoolService._save_pool(pool)
+        with _POOL_WRITE_LOCK:
+            pool = FiscalPoolService._load_pool()
+            pool.append(entry)
+            FiscalPoolService._save_pool(pool)
         
         # Async Sync to Remote
         try:
@@ -609,90 +706,107 @@ class FiscalPoolService:
         """
         Marks an entry as having its XML available and optionally stores the path.
         """
-        pool = FiscalPoolService._load_pool()
-        for entry in pool:
-            if entry['id'] == entry_id:
-                entry['xml_ready'] = bool(ready)
-                if xml_path:
-                    entry['xml_path'] = xml_path
-                return FiscalPoolService._save_pool(pool)
+        with _POOL_WRITE_LOCK:
+            pool = FiscalPoolService._load_pool()
+            for entry in pool:
+                if entry['id'] == entry_id:
+                    entry['xml_ready'] = bool(ready)
+                    if xml_path:
+                        entry['xml_path'] = xml_path
+                    return FiscalPoolService._save_pool(pool)
         return False
 
     @staticmethod
     def set_pdf_ready(entry_id, ready=True, pdf_path=None):
-        pool = FiscalPoolService._load_pool()
-        for entry in pool:
-            if entry['id'] == entry_id:
-                entry['pdf_ready'] = bool(ready)
-                if pdf_path:
-                    entry['pdf_path'] = pdf_path
-                return FiscalPoolService._save_pool(pool)
+        with _POOL_WRITE_LOCK:
+            pool = FiscalPoolService._load_pool()
+            for entry in pool:
+                if entry['id'] == entry_id:
+                    entry['pdf_ready'] = bool(ready)
+                    if pdf_path:
+                        entry['pdf_path'] = pdf_path
+                    return FiscalPoolService._save_pool(pool)
         return False
 
+    @staticmethod
+    def query_pool(filters=None, offset=0, limit=None):
+        """
+        Paged ``get_pool``: {'entries': [...], 'total': n}, newest first.
+        Filters: status, origin, fiscal_type ('all' or empty = any),
+        date_start and date_end (string compare, YYYY-MM-DD prefixes).
+        """
+        filters = filters or {}
+
+        def _value(key):
+            value = filters.get(key)
+            return None if not value or value == 'all' else value
+
+        entries, total = FiscalPoolService._pool_index().query(
+            status=_value('status'),
+            origin=_value('origin'),
+            fiscal_type=_value('fiscal_type'),
+            date_start=filters.get('date_start') or None,
+            date_end=filters.get('date_end') or None,
+            offset=offset,
+            limit=limit,
+        )
+        return {'entries': entries, 'total': total}
+
     @staticmethod
     def get_pool(filters=None):
-        pool = FiscalPoolService._load_pool()
-        if not filters:
-            # Return sorted by date desc
-            return sorted(pool, key=lambda x: x['closed_at'], reverse=True)
-            
-        filtered = []
-        for entry in pool:
-            match = True
-            if filters.get('status') and filters['status'] != 'all' and entry['status'] != filters['status']:
-                match = False
-            if filters.get('origin') and filters['origin'] != 'all' and entry['origin'] != filters['origin']:
-                match = False
-            if filters.get('date_start'):
-                # Simple string compare works if format is YYYY-MM-DD
-                if entry['closed_at'] < filters['date_start']:
-                    match = False
-            if filters.get('date_end'):
-                if entry['closed_at'] > filters['date_end']:
-                    match = False
-                    
-            if match:
-                filtered.append(entry)
-                
-        return sorted(filtered, key=lambda x: x['closed_at'], reverse=True)
+        return FiscalPoolService.query_pool(filters)['entries']
+
+    @staticmethod
+    def get_pending_nfce():
+        """NFC-e entries waiting for emission, straight from the status index."""
+        return FiscalPoolService.get_pool({'status': 'pending', 'fiscal_type': 'nfce'})
+
+    @staticmethod
+    def pool_index_stats():
+        with _POOL_INDEX_LOCK:
+            return dict(_POOL_INDEX_STATS, cached=_POOL_INDEX is not None)
 
     @staticmethod
     def get_entry(entry_id):
-        pool = FiscalPoolService._load_pool()
-        for entry in pool:
-            if entry['id'] == entry_id:
-                return entry
-        return None
+        return FiscalPoolService._pool_index().entry(entry_id)
 
     @staticmethod
     def update_status(entry_id, new_status, fiscal_doc_uuid=None, user='Sistema', serie=None, number=None, error_msg=None, access_key=None):
-        pool = FiscalPoolService._load_pool()
-        for entry in pool:
-            if entry['id'] == entry_id:
-                old_status = entry['status']
-                entry['status'] = FiscalPoolService._normalize_status(new_status)
-                if fiscal_doc_uuid:
-                    entry['fiscal_doc_uuid'] = fiscal_doc_uuid
-                
-                if serie:
-                    entry['fiscal_serie'] = serie
-                if number:
-                    entry['fiscal_number'] = number
-                if access_key:
-                    entry['access_key'] = str(access_key)
-                
-                if error_msg:
-                    entry['last_error'] = error_msg
-                
-                entry['history'].append({
-                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                    'action': 'status_change',
-                    'from': old_status,
-                    'to': new_status,
-                    'user': user,
-                    'details': error_msg
-                })
-                
-                FiscalPoolService._save_pool(pool)
-                return True
-        return False
+        with _POOL_WRITE_LOCK:
+            index = FiscalPoolService._pool_index()
+            pos = index.position(entry_id)
+            if pos is None:
+                return False
+            pool = index.entries()
+            return FiscalPoolService._apply_status(
+                pool, pool[pos], new_status, fiscal_doc_uuid, user, serie, number, error_msg, access_key,
+            )
+
+    @staticmethod
+    def _apply_status(pool, entry, new_status, fiscal_doc_uuid, user, serie, number, error_msg, access_key):
+        old_status = entry['status']
+        entry['status'] = FiscalPoolService._normalize_status(new_status)
+        if fiscal_doc_uuid:
+            entry['fiscal_doc_uuid'] = fiscal_doc_uuid
+        
+        if serie:
+            entry['fiscal_serie'] = serie
+        if number:
+            entry['fiscal_number'] = number
+        if access_key:
+            entry['access_key'] = str(access_key)
+        
+        if error_msg:
+            entry['last_error'] = error_msg
+        
+        entry['history'].append({
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'action': 'status_change',
+            'from': old_status,
+            'to': new_status,
+            'user': user,
+            'details': error_msg
+        })
+        
+        FiscalPoolService._save_pool(pool)
+        return True
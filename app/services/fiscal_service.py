@@ -1,4 +1,3 @@
-import requests
 import json
 import logging
 import os
@@ -8,6 +7,8 @@ import csv
 import uuid
 import threading
 import importlib.util
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal, ROUND_HALF_UP
 from datetime import datetime, timedelta
 from app.services.system_config_manager import (
@@ -17,7 +18,9 @@ from app.services.system_config_manager import (
 )
 from app.services.printing_service import print_fiscal_receipt
 from app.services.printer_manager import load_printer_settings, load_printers
+from app.services.fiscal_emission_pipeline import EmissionRateLimiter, EmissionStateStore, fetch_workers
 from app.services.fiscal_pool_service import FiscalPoolService
+from app.services.integration_http_client import get_integration_client, get_token_cache
 from app.services.sefaz_service import SefazService
 
 # Configure logging
@@ -26,7 +29,14 @@ logger = logging.getLogger(__name__)
 PENDING_EMISSIONS_FILE = PENDING_FISCAL_EMISSIONS_FILE
 EMISSION_MIN_INTERVAL_SECONDS = 1.2
 _EMISSION_LOCK = threading.Lock()
-_LAST_EMISSION_TS = None
+_EMISSION_RATE = EmissionRateLimiter()
+_FISCAL_SETTINGS_LOCK = threading.Lock()
+# Keep-alive pools, timeouts, retries and circuit breaker for Nuvem Fiscal.
+NUVEM_FISCAL_HTTP = get_integration_client('nuvem_fiscal')
+# Bearer token -> (token cache key, get_access_token args), to renew it on 401.
+_ISSUED_TOKENS = {}
+_ISSUED_BY_KEY = {}
+_ISSUED_TOKENS_LOCK = threading.Lock()
 
 def _round_money(val):
     try:
@@ -316,21 +326,325 @@ def _normalize_doc(value):
         return digits
     return ''
 
-def _enforce_serial_emission_interval():
-    global _LAST_EMISSION_TS
-    now_ts = time.time()
-    min_interval = float(EMISSION_MIN_INTERVAL_SECONDS or 0)
-    if _LAST_EMISSION_TS is not None and min_interval > 0:
-        elapsed = now_ts - _LAST_EMISSION_TS
-        wait_for = min_interval - elapsed
-        if wait_for > 0:
-            time.sleep(wait_for)
-    _LAST_EMISSION_TS = time.time()
+def _emission_state():
+    """Pipeline progress, kept next to the pending emissions queue."""
+    path = os.path.join(os.path.dirname(PENDING_EMISSIONS_FILE), 'fiscal_emission_state.json')
+    return EmissionStateStore(path)
+
+def _record_emission_failure(emission, source, msg, cap_attempts=True):
+    if source == 'pool':
+        FiscalPoolService.update_status(emission['id'], 'manual_retry_required', error_msg=msg)
+    else:
+        emission['attempts'] = emission.get('attempts', 0) + 1
+        emission['last_error'] = msg
+        if cap_attempts and emission['attempts'] >= 3:
+            emission['status'] = 'failed'
+
+def _queue_integration_settings(settings, emission, source):
+    emission_cnpj = str(emission.get('cnpj_emitente') or '')
+    integration_settings = get_fiscal_integration(settings, emission_cnpj).copy()
+    snap = emission.get('fiscal_snapshot') or {}
+    if source != 'pool' and isinstance(snap, dict) and snap:
+        for k in ['sefaz_environment', 'environment', 'serie', 'ie_emitente', 'CRT', 'crt']:
+            if snap.get(k) is not None:
+                integration_settings[k] = snap.get(k)
+    return integration_settings
+
+def _emit_one(entry, settings, products_map, state, counts):
+    """
+    Emit stage for one queue/pool item. Returns the job for the fetch
+    stage when the note was authorized, None otherwise (already counted).
+    """
+    emission = entry['data']
+    source = entry['source']
+    if source == 'pool':
+        FiscalPoolService.update_status(emission['id'], 'issuing', user='Sistema')
+    if emission.get('items'):
+        for item in emission['items']:
+            p_id = str(item.get('id', ''))
+            p_id_alt = str(item.get('product_id', ''))
+            product_data = None
+            if p_id in products_map:
+                product_data = products_map[p_id]
+            elif p_id_alt in products_map:
+                product_data = products_map[p_id_alt]
+            if product_data:
+                if product_data.get('ncm'):
+                    ncm_clean = str(product_data.get('ncm', '')).replace('.', '').strip()
+                    if ncm_clean:
+                        item['ncm'] = ncm_clean
+                if product_data.get('cest'):
+                    cest_clean = str(product_data.get('cest', '')).replace('.', '').strip()
+                    if cest_clean:
+                        item['cest'] = cest_clean
+                if product_data.get('cfop_default'):
+                    cfop_clean = str(product_data.get('cfop_default', '')).replace('.', '').strip()
+                    if cfop_clean:
+                        item['cfop'] = cfop_clean
+                if product_data.get('origin'):
+                    item['origin'] = product_data.get('origin')
+
+    payments = emission.get('payments') or emission.get('payment_methods') or []
+    primary_method = 'Outros'
+    if payments:
+        fiscal_method = next((p.get('method') for p in payments if p.get('is_fiscal')), None)
+        if fiscal_method:
+            primary_method = fiscal_method
+        else:
+            try:
+                from app.services.data_service import load_payment_methods
+                all_methods = load_payment_methods()
+                fiscal_names = {m['name'] for m in all_methods if m.get('is_fiscal')}
+                fiscal_match = next((p.get('method') for p in payments if p.get('method') in fiscal_names), None)
+                primary_method = fiscal_match or payments[0].get('method', 'Outros')
+            except Exception:
+                primary_method = payments[0].get('method', 'Outros')
+
+    transaction = {
+        'id': emission['id'],
+        'amount': emission['total_amount'] if 'total_amount' in emission else emission['amount'],
+        'payment_method': primary_method,
+    }
+
+    emission_cnpj = str(emission.get('cnpj_emitente') or '')
+    if source == 'pool':
+        if _normalize_digits(emission_cnpj) != '28952732000109':
+            err = 'Emitente inválido para consumo. Obrigatório Mirapraia 28952732000109.'
+            FiscalPoolService.update_status(emission['id'], 'manual_retry_required', error_msg=err)
+            counts.add('failed')
+            return None
+    integration_settings = _queue_integration_settings(settings, emission, source)
+
+    if not integration_settings:
+        _record_emission_failure(emission, source, "Configuração fiscal não encontrada para este CNPJ", cap_attempts=False)
+        counts.add('failed')
+        return None
+
+    customer_info = emission.get('customer', {})
+    customer_cpf_cnpj = _normalize_doc(
+        emission.get('customer_document')
+        or emission.get('customer_cpf_cnpj')
+        or customer_info.get('cpf_cnpj')
+        or customer_info.get('doc')
+        or customer_info.get('doc_id')
+    )
+    try:
+        amount_value = float(emission.get('fiscal_amount', emission.get('total_amount', 0)) or 0)
+    except Exception:
+        amount_value = 0.0
+    if amount_value > 999.0 and not customer_cpf_cnpj:
+        _record_emission_failure(emission, source, 'CPF/CNPJ obrigatório para emissão acima de R$ 999,00.', cap_attempts=False)
+        counts.add('failed')
+        return None
+
+    if not integration_settings.get('client_id') or not integration_settings.get('client_secret'):
+        _record_emission_failure(emission, source, f"Credenciais ausentes para CNPJ {emission_cnpj}", cap_attempts=False)
+        counts.add('failed')
+        return None
+
+    _EMISSION_RATE.acquire(_normalize_digits(emission_cnpj), EMISSION_MIN_INTERVAL_SECONDS)
+    state.put(emission['id'], 'emitting', source=source, cnpj=emission_cnpj)
+    try:
+        result = emit_invoice(transaction, integration_settings, emission['items'], customer_cpf_cnpj)
+    except Exception:
+        state.discard(emission['id'])
+        raise
+
+    if not result['success']:
+        state.discard(emission['id'])
+        error_msg = result.get('message')
+        if source == 'pool':
+            next_status = 'rejected' if _status_is_rejected_message(error_msg) else 'manual_retry_required'
+            FiscalPoolService.update_status(emission['id'], next_status, error_msg=error_msg)
+        else:
+            emission['attempts'] = emission.get('attempts', 0) + 1
+            emission['last_error'] = error_msg
+            if emission['attempts'] >= 3:
+                emission['status'] = 'failed'
+        counts.add('failed')
+        return None
+
+    result_data = result.get('data') or {}
+    nfe_id = result_data.get('id') or result_data.get('uuid')
+    nfe_number = result_data.get('numero')
+    if not nfe_number and 'numero_sequencial' in result_data:
+        nfe_number = result_data['numero_sequencial']
+    if not nfe_id:
+        state.discard(emission['id'])
+        _record_emission_failure(emission, source, "Emissão retornou sucesso, mas sem UUID fiscal para rastreamento/impressão.")
+        counts.add('failed')
+        return None
+
+    job = {
+        'source': source,
+        'emission': emission,
+        'integration_settings': integration_settings,
+        'nfe_id': nfe_id,
+        'serie': result_data.get('serie'),
+        'number': nfe_number,
+        'access_key': _extract_access_key(result_data),
+    }
+    state.put(
+        emission['id'], 'emitted', source=source, cnpj=emission_cnpj,
+        nfe_id=nfe_id, serie=job['serie'], number=job['number'], access_key=job['access_key'],
+    )
+    # The number is taken once SEFAZ authorized the note; the next emission
+    # of this CNPJ may start while this one's XML/PDF are still downloading.
+    with _FISCAL_SETTINGS_LOCK:
+        increment_fiscal_number(settings, emission_cnpj)
+    return job
+
+def _complete_emission(job, state, counts):
+    """Fetch stage: XML (required), emitted status, PDF (best effort)."""
+    emission = job['emission']
+    source = job['source']
+    integration_settings = job['integration_settings']
+    nfe_id = job['nfe_id']
+    try:
+        xml_ok = False
+        xml_error_msg = None
+        try:
+            xml_path = download_xml(nfe_id, integration_settings)
+            if xml_path:
+                xml_ok = True
+                if source == 'queue':
+                    emission['xml_path'] = xml_path
+                if source == 'pool':
+                    try:
+                        FiscalPoolService.set_xml_ready(emission['id'], True, xml_path)
+                    except Exception:
+                        pass
+            else:
+                xml_error_msg = "XML da NFC-e não disponível na Nuvem Fiscal (verifique autorização)."
+        except Exception as e:
+            xml_error_msg = f"Falha ao baixar XML da NFC-e: {e}"
+
+        if not xml_ok:
+            _record_emission_failure(emission, source, xml_error_msg or "XML da NFC-e não disponível.")
+            counts.add('failed')
+            return
+
+        if source == 'pool':
+            FiscalPoolService.update_status(
+                emission['id'],
+                'emitted',
+                fiscal_doc_uuid=nfe_id,
+                serie=job['serie'],
+                number=job['number'],
+                access_key=job['access_key']
+            )
+        else:
+            emission['status'] = 'emitted'
+            emission['nfe_id'] = nfe_id
+            if job['access_key']:
+                emission['access_key'] = job['access_key']
+            emission['emitted_at'] = datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+            if emission.get('id', '').startswith('POOL-'):
+                try:
+                    pool_id = emission['id'].replace('POOL-', '')
+                    FiscalPoolService.update_status(
+                        pool_id,
+                        'emitted',
+                        fiscal_doc_uuid=nfe_id,
+                        serie=job['serie'],
+                        number=job['number'],
+                        access_key=job['access_key']
+                    )
+                except Exception:
+                    pass
+        try:
+            pdf_path = download_pdf(nfe_id, integration_settings)
+            if pdf_path:
+                if source == 'queue':
+                    emission['pdf_path'] = pdf_path
+                if source == 'pool':
+                    try:
+                        FiscalPoolService.set_pdf_ready(emission['id'], True, pdf_path)
+                    except Exception:
+                        pass
+        except Exception:
+            pass
+        counts.add('success')
+    finally:
+        # Queue items keep their record until the queue file is saved
+        # (_discard_settled_queue_state); pool entries are already durable.
+        if source != 'queue':
+            state.discard(emission['id'])
+
+def _resume_interrupted_emissions(state, queue, settings, counts):
+    """
+    Jobs for notes a previous run got authorized but did not finish
+    fetching. Items interrupted during the provider call are never
+    re-emitted automatically: their outcome is unknown, so they go to
+    manual retry.
+    """
+    jobs = []
+    queue_by_id = {str(item.get('id')): item for item in queue if isinstance(item, dict)}
+    for emission_id, record in state.items().items():
+        source = record.get('source')
+        if source == 'queue':
+            emission = queue_by_id.get(emission_id)
+        else:
+            emission = FiscalPoolService.get_entry(emission_id)
+        if not emission:
+            state.discard(emission_id)
+            continue
+        if record.get('stage') != 'emitted' or not record.get('nfe_id'):
+            if source != 'queue':
+                state.discard(emission_id)
+            _record_emission_failure(
+                emission, source,
+                'Emissão interrompida antes da resposta da SEFAZ; confira a nota na Nuvem Fiscal antes de reemitir.',
+                cap_attempts=False,
+            )
+            counts.add('failed')
+            continue
+        jobs.append({
+            'source': source,
+            'emission': emission,
+            'integration_settings': _queue_integration_settings(settings, emission, source),
+            'nfe_id': record['nfe_id'],
+            'serie': record.get('serie'),
+            'number': record.get('number'),
+            'access_key': record.get('access_key') or '',
+        })
+    return jobs
+
+def _discard_settled_queue_state(state, queue):
+    """
+    Drops the state of queue items once the queue file holds their outcome.
+    Notes authorized but still waiting for their XML stay recorded, so the
+    next run resumes the download instead of emitting them again.
+    """
+    queue_by_id = {str(item.get('id')): item for item in queue if isinstance(item, dict)}
+    for emission_id, record in state.items().items():
+        if record.get('source') != 'queue':
+            continue
+        item = queue_by_id.get(emission_id)
+        if item is not None and record.get('stage') == 'emitted' and item.get('status') == 'pending':
+            continue
+        state.discard(emission_id)
+
+class _EmissionCounts:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.values = {'success': 0, 'failed': 0}
+
+    def add(self, key):
+        with self._lock:
+            self.values[key] += 1
 
 def process_pending_emissions(settings=None, specific_id=None):
     """
     Processes all pending fiscal emissions (Queue + Pool).
     Returns summary of success/failures.
+
+    Emission is serial per emitting CNPJ and paced by its token bucket
+    (EMISSION_MIN_INTERVAL_SECONDS); different CNPJs emit in parallel.
+    Authorized notes go to a worker pool that downloads XML/PDF and marks
+    them emitted, overlapping the next emissions. Progress is kept in the
+    emission state file, so notes authorized by an interrupted run are
+    completed by the next one instead of being emitted twice.
     """
     with _EMISSION_LOCK:
         if settings is None:
@@ -338,257 +652,87 @@ def process_pending_emissions(settings=None, specific_id=None):
 
         all_pending = []
         queue = load_pending_emissions()
-        
+        state = _emission_state()
+        counts = _EmissionCounts()
+        resumed = _resume_interrupted_emissions(state, queue, settings, counts) if state.ids() else []
+        in_flight = {str(job['emission'].get('id')) for job in resumed}
+
         if specific_id:
             found = False
             queue_item = next((i for i in queue if i['id'] == specific_id), None)
             if queue_item and queue_item.get('status') != 'emitted':
-                all_pending.append({'source': 'queue', 'data': queue_item})
                 found = True
-            if not found:
+                if specific_id not in in_flight:
+                    all_pending.append({'source': 'queue', 'data': queue_item})
+            if not found and specific_id not in in_flight:
                 pool_entry = FiscalPoolService.get_entry(specific_id)
                 if pool_entry and pool_entry.get('fiscal_type') == 'nfce':
                     if pool_entry.get('status') in ['pending', 'manual_retry_required', 'rejected']:
                         all_pending.append({'source': 'pool', 'data': pool_entry})
         else:
-            pending_queue = [e for e in queue if e.get('status') == 'pending']
-            pool_pending = FiscalPoolService.get_pool(filters={'status': 'pending'})
-            pool_to_process = [p for p in pool_pending if p.get('fiscal_type') == 'nfce']
+            pending_queue = [e for e in queue if e.get('status') == 'pending' and str(e.get('id')) not in in_flight]
+            pool_to_process = FiscalPoolService.get_pending_nfce()
             for item in pending_queue:
                 all_pending.append({'source': 'queue', 'data': item})
             for item in pool_to_process:
                 all_pending.append({'source': 'pool', 'data': item})
 
-        if not all_pending:
-            return {"processed": 0, "success": 0, "failed": 0}
-            
-        success_count = 0
-        failed_count = 0
-        
+        interrupted = counts.values['failed']
+        processed = len(all_pending) + len(resumed) + interrupted
+        if not all_pending and not resumed:
+            if interrupted:
+                save_pending_emissions(queue)
+                _discard_settled_queue_state(state, queue)
+            return {"processed": processed, "success": 0, "failed": interrupted}
+
         from app.services.data_service import load_products
         try:
             products_db = load_products()
             products_map = {str(p['id']): p for p in products_db}
         except Exception:
             products_map = {}
-        
-        for entry in all_pending:
-            emission = entry['data']
-            source = entry['source']
-            if source == 'pool':
-                FiscalPoolService.update_status(emission['id'], 'issuing', user='Sistema')
-            if emission.get('items'):
-                for item in emission['items']:
-                    p_id = str(item.get('id', ''))
-                    p_id_alt = str(item.get('product_id', ''))
-                    product_data = None
-                    if p_id in products_map:
-                        product_data = products_map[p_id]
-                    elif p_id_alt in products_map:
-                        product_data = products_map[p_id_alt]
-                    if product_data:
-                        if product_data.get('ncm'):
-                            ncm_clean = str(product_data.get('ncm', '')).replace('.', '').strip()
-                            if ncm_clean:
-                                item['ncm'] = ncm_clean
-                        if product_data.get('cest'):
-                            cest_clean = str(product_data.get('cest', '')).replace('.', '').strip()
-                            if cest_clean:
-                                item['cest'] = cest_clean
-                        if product_data.get('cfop_default'):
-                            cfop_clean = str(product_data.get('cfop_default', '')).replace('.', '').strip()
-                            if cfop_clean:
-                                item['cfop'] = cfop_clean
-                        if product_data.get('origin'):
-                            item['origin'] = product_data.get('origin')
-            
-            payments = emission.get('payments') or emission.get('payment_methods') or []
-            primary_method = 'Outros'
-            if payments:
-                fiscal_method = next((p.get('method') for p in payments if p.get('is_fiscal')), None)
-                if fiscal_method:
-                    primary_method = fiscal_method
-                else:
-                    try:
-                        from app.services.data_service import load_payment_methods
-                        all_methods = load_payment_methods()
-                        fiscal_names = {m['name'] for m in all_methods if m.get('is_fiscal')}
-                        fiscal_match = next((p.get('method') for p in payments if p.get('method') in fiscal_names), None)
-                        primary_method = fiscal_match or payments[0].get('method', 'Outros')
-                    except Exception:
-                        primary_method = payments[0].get('method', 'Outros')
-            
-            transaction = {
-                'id': emission['id'],
-                'amount': emission['total_amount'] if 'total_amount' in emission else emission['amount'],
-                'payment_method': primary_method, 
-            }
-            
-            emission_cnpj = str(emission.get('cnpj_emitente') or '')
-            if source == 'pool':
-                if _normalize_digits(emission_cnpj) != '28952732000109':
-                    err = 'Emitente inválido para consumo. Obrigatório Mirapraia 28952732000109.'
-                    FiscalPoolService.update_status(emission['id'], 'manual_retry_required', error_msg=err)
-                    failed_count += 1
-                    continue
-            integration_settings = get_fiscal_integration(settings, emission_cnpj).copy()
-            snap = emission.get('fiscal_snapshot') or {}
-            if source != 'pool' and isinstance(snap, dict) and snap:
-                for k in ['sefaz_environment', 'environment', 'serie', 'ie_emitente', 'CRT', 'crt']:
-                    if snap.get(k) is not None:
-                        integration_settings[k] = snap.get(k)
-            
-            if not integration_settings:
-                msg = "Configuração fiscal não encontrada para este CNPJ"
-                if source == 'pool':
-                    FiscalPoolService.update_status(emission['id'], 'manual_retry_required', error_msg=msg)
-                else:
-                    emission['attempts'] = emission.get('attempts', 0) + 1
-                    emission['last_error'] = msg
-                failed_count += 1
-                continue
 
-            customer_info = emission.get('customer', {})
-            customer_cpf_cnpj = _normalize_doc(
-                emission.get('customer_document')
-                or emission.get('customer_cpf_cnpj')
-                or customer_info.get('cpf_cnpj')
-                or customer_info.get('doc')
-                or customer_info.get('doc_id')
-            )
-            try:
-                amount_value = float(emission.get('fiscal_amount', emission.get('total_amount', 0)) or 0)
-            except Exception:
-                amount_value = 0.0
-            if amount_value > 999.0 and not customer_cpf_cnpj:
-                msg = 'CPF/CNPJ obrigatório para emissão acima de R$ 999,00.'
-                if source == 'pool':
-                    FiscalPoolService.update_status(emission['id'], 'manual_retry_required', error_msg=msg)
-                else:
-                    emission['attempts'] = emission.get('attempts', 0) + 1
-                    emission['last_error'] = msg
-                failed_count += 1
-                continue
-            
-            if not integration_settings.get('client_id') or not integration_settings.get('client_secret'):
-                msg = f"Credenciais ausentes para CNPJ {emission_cnpj}"
-                if source == 'pool':
-                    FiscalPoolService.update_status(emission['id'], 'manual_retry_required', error_msg=msg)
-                else:
-                    emission['attempts'] = emission.get('attempts', 0) + 1
-                    emission['last_error'] = msg
-                failed_count += 1
-                continue
+        lanes = {}
+        for entry in all_pending:
+            lanes.setdefault(_normalize_digits(entry['data'].get('cnpj_emitente')), []).append(entry)
 
-            _enforce_serial_emission_interval()
-            result = emit_invoice(transaction, integration_settings, emission['items'], customer_cpf_cnpj)
-            
-            if result['success']:
-                result_data = result.get('data') or {}
-                nfe_id = result_data.get('id') or result_data.get('uuid')
-                nfe_serie = result_data.get('serie')
-                nfe_number = result_data.get('numero')
-                if not nfe_number and 'numero_sequencial' in result_data:
-                    nfe_number = result_data['numero_sequencial']
-                access_key = _extract_access_key(result_data)
-                if not nfe_id:
-                    err_msg = "Emissão retornou sucesso, mas sem UUID fiscal para rastreamento/impressão."
-                    if source == 'pool':
-                        FiscalPoolService.update_status(emission['id'], 'manual_retry_required', error_msg=err_msg)
-                    else:
-                        emission['attempts'] = emission.get('attempts', 0) + 1
-                        emission['last_error'] = err_msg
-                        if emission['attempts'] >= 3:
-                            emission['status'] = 'failed'
-                    failed_count += 1
-                    continue
+        errors = []
+        with ThreadPoolExecutor(max_workers=fetch_workers(), thread_name_prefix='fiscal-fetch') as fetch_pool:
+            futures = [fetch_pool.submit(_complete_emission, job, state, counts) for job in resumed]
+            futures_lock = threading.Lock()
 
-                xml_ok = False
-                xml_error_msg = None
+            def _run_lane(entries):
                 try:
-                    xml_path = download_xml(nfe_id, integration_settings)
-                    if xml_path:
-                        xml_ok = True
-                        if source == 'queue':
-                            emission['xml_path'] = xml_path
-                        if source == 'pool':
-                            try:
-                                FiscalPoolService.set_xml_ready(emission['id'], True, xml_path)
-                            except Exception:
-                                pass
-                    else:
-                        xml_error_msg = "XML da NFC-e não disponível na Nuvem Fiscal (verifique autorização)."
+                    for entry in entries:
+                        job = _emit_one(entry, settings, products_map, state, counts)
+                        if job is not None:
+                            with futures_lock:
+                                futures.append(fetch_pool.submit(_complete_emission, job, state, counts))
                 except Exception as e:
-                    xml_error_msg = f"Falha ao baixar XML da NFC-e: {e}"
-
-                if not xml_ok:
-                    err_msg = xml_error_msg or "XML da NFC-e não disponível."
-                    if source == 'pool':
-                        FiscalPoolService.update_status(emission['id'], 'manual_retry_required', error_msg=err_msg)
-                    else:
-                        emission['attempts'] = emission.get('attempts', 0) + 1
-                        emission['last_error'] = err_msg
-                        if emission['attempts'] >= 3:
-                            emission['status'] = 'failed'
-                    failed_count += 1
-                    continue
+                    errors.append(e)
 
-                if source == 'pool':
-                    FiscalPoolService.update_status(
-                        emission['id'],
-                        'emitted',
-                        fiscal_doc_uuid=nfe_id,
-                        serie=nfe_serie,
-                        number=nfe_number,
-                        access_key=access_key
-                    )
-                else:
-                    emission['status'] = 'emitted'
-                    emission['nfe_id'] = nfe_id
-                    if access_key:
-                        emission['access_key'] = access_key
-                    emission['emitted_at'] = datetime.now().strftime('%d/%m/%Y %H:%M:%S')
-                    if emission.get('id', '').startswith('POOL-'):
-                        try:
-                            pool_id = emission['id'].replace('POOL-', '')
-                            FiscalPoolService.update_status(
-                                pool_id,
-                                'emitted',
-                                fiscal_doc_uuid=nfe_id,
-                                serie=nfe_serie,
-                                number=nfe_number,
-                                access_key=access_key
-                            )
-                        except Exception:
-                            pass
-                increment_fiscal_number(settings, emission_cnpj)
-                try:
-                    pdf_path = download_pdf(nfe_id, integration_settings)
-                    if pdf_path:
-                        if source == 'queue':
-                            emission['pdf_path'] = pdf_path
-                        if source == 'pool':
-                            try:
-                                FiscalPoolService.set_pdf_ready(emission['id'], True, pdf_path)
-                            except Exception:
-                                pass
-                except Exception:
-                    pass
-                success_count += 1
+            if len(lanes) <= 1:
+                for entries in lanes.values():
+                    _run_lane(entries)
             else:
-                error_msg = result.get('message')
-                if source == 'pool':
-                    next_status = 'rejected' if _status_is_rejected_message(error_msg) else 'manual_retry_required'
-                    FiscalPoolService.update_status(emission['id'], next_status, error_msg=error_msg)
-                else:
-                    emission['attempts'] = emission.get('attempts', 0) + 1
-                    emission['last_error'] = error_msg
-                    if emission['attempts'] >= 3:
-                        emission['status'] = 'failed'
-                failed_count += 1
-                
+                threads = [
+                    threading.Thread(target=_run_lane, args=(entries,), name=f"fiscal-emit-{cnpj}", daemon=True)
+                    for cnpj, entries in lanes.items()
+                ]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            for future in list(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append(e)
         save_pending_emissions(queue)
-        return {"processed": len(all_pending), "success": success_count, "failed": failed_count}
+        _discard_settled_queue_state(state, queue)
+        if errors:
+            raise errors[0]
+        return {"processed": processed, "success": counts.values['success'], "failed": counts.values['failed']}
 
 def get_access_token(client_id, client_secret, scope="nfce", audience=None):
     url = "https://auth.nuvemfiscal.com.br/oauth/token"
@@ -601,13 +745,53 @@ def get_access_token(client_id, client_secret, scope="nfce", audience=None):
         "scope": scope,
         "audience": audience
     }
-    try:
-        response = requests.post(url, data=payload)
-        response.raise_for_status()
-        return response.json().get("access_token")
-    except Exception as e:
-        logger.error(f"Error getting access token: {e}")
-        return None
+    secret_digest = hashlib.sha256(str(client_secret or "").encode("utf-8")).hexdigest()
+    key = (url, client_id, secret_digest, scope, audience)
+
+    def _fetch():
+        try:
+            response = NUVEM_FISCAL_HTTP.post(url, data=payload)
+            response.raise_for_status()
+            data = response.json()
+            token = data.get("access_token")
+        except Exception as e:
+            logger.error(f"Error getting access token: {e}")
+            return None, None
+        if token:
+            with _ISSUED_TOKENS_LOCK:
+                _ISSUED_TOKENS.pop(_ISSUED_BY_KEY.get(key), None)
+                _ISSUED_BY_KEY[key] = token
+                _ISSUED_TOKENS[token] = (key, (client_id, client_secret, scope, audience))
+        return token, data.get("expires_in")
+
+    return get_token_cache().get(key, _fetch)
+
+
+def _nuvem_fiscal_call(method, url, headers=None, **kwargs):
+    """
+    ``NUVEM_FISCAL_HTTP.<method>(url, ...)``; when Nuvem Fiscal rejects a
+    cached Bearer token with 401, the token is dropped from the cache and the
+    call is retried once with a fresh one. ``headers`` is updated in place so
+    later calls made with the same dict already carry the new token.
+    """
+    send = getattr(NUVEM_FISCAL_HTTP, method)
+    response = send(url, headers=headers, **kwargs)
+    if response.status_code != 401 or not headers:
+        return response
+    rejected = str(headers.get("Authorization") or "")[len("Bearer "):]
+    with _ISSUED_TOKENS_LOCK:
+        issued = _ISSUED_TOKENS.get(rejected)
+    if issued is None:
+        return response
+    key, args = issued
+    get_token_cache().invalidate(key)
+    token = get_access_token(*args)
+    if not token or token == rejected:
+        return response
+    logger.info("Nuvem Fiscal rejeitou o token (401); repetindo com um token novo.")
+    response.close()
+    headers["Authorization"] = f"Bearer {token}"
+    return send(url, headers=headers, **kwargs)
 
 def _normalize_digits(value):
     if value is None:
@@ -704,7 +888,7 @@ def sync_nfce_company_settings(integration_settings):
     }
 
     try:
-        response = requests.put(api_url, json=payload, headers=headers, timeout=30)
+        response = _nuvem_fiscal_call('put', api_url, json=payload, headers=headers, timeout=30)
         if response.status_code in (200, 201):
             try:
                 return {"success": True, "message": "Configuração NFC-e sincronizada.", "data": response.json()}
@@ -744,7 +928,7 @@ def download_xml(nfe_id, settings):
         attempts = 5
         response = None
         for _ in range(attempts):
-            response = requests.get(api_url, headers=headers)
+            response = _nuvem_fiscal_call('get', api_url, headers=headers)
             if response.status_code == 200:
                 break
             time.sleep(2)
@@ -819,7 +1003,7 @@ def download_pdf(nfe_id, settings):
         attempts = 5
         response = None
         for _ in range(attempts):
-            response = requests.get(api_url, headers=headers)
+            response = _nuvem_fiscal_call('get', api_url, headers=headers)
             if response.status_code == 200:
                 break
             time.sleep(2)
@@ -855,7 +1039,7 @@ def get_nfce_status(nfe_id, settings):
     api_url = f"{base_url}/nfce/{nfe_id}"
     headers = {"Authorization": f"Bearer {token}"}
     try:
-        response = requests.get(api_url, headers=headers, timeout=20)
+        response = _nuvem_fiscal_call('get', api_url, headers=headers, timeout=20)
         if response.status_code != 200:
             try:
                 err_data = response.json()
@@ -926,7 +1110,7 @@ def manifest_nfe(access_key, settings, event_code=210210):
     }
     
     try:
-        response = requests.post(api_url, json=payload, headers=headers)
+        response = _nuvem_fiscal_call('post', api_url, json=payload, headers=headers)
         if response.status_code in [200, 201]:
             return True, None
         else:
@@ -1006,13 +1190,13 @@ def consult_nfe_sefaz(access_key, settings, allow_manifestation=False):
     }
 
     try:
-        response = requests.get(api_url, headers=headers)
+        response = _nuvem_fiscal_call('get', api_url, headers=headers)
         if response.status_code == 200:
             return response.content, None
         elif response.status_code == 404:
              # Try /nfe/{access_key}/xml (maybe it's already synchronized in the account)
              api_url_internal = f"{base_url}/nfe/{access_key}/xml"
-             response_internal = requests.get(api_url_internal, headers=headers)
+             response_internal = _nuvem_fiscal_call('get', api_url_internal, headers=headers)
              if response_internal.status_code == 200:
                  return response_internal.content, None
 
@@ -1200,6 +1384,34 @@ def load_certificate(settings):
         }
 
 
+def _manifestation_result(result):
+    return {
+        "success": bool(result.get("success")),
+        "cStat": str(result.get("cStat") or ""),
+        "xMotivo": str(result.get("xMotivo") or result.get("message") or ""),
+        "protocol": str(result.get("protocol") or ""),
+        "tpEvento": str(result.get("tpEvento") or "210210"),
+        "dhRegEvento": str(result.get("dhRegEvento") or ""),
+        "event_result_type": str(result.get("event_result_type") or ""),
+        "event_cStat": str(result.get("event_cStat") or ""),
+        "event_xMotivo": str(result.get("event_xMotivo") or ""),
+        "event_nProt": str(result.get("event_nProt") or ""),
+        "event_dhRegEvento": str(result.get("event_dhRegEvento") or ""),
+        "event_tpEvento": str(result.get("event_tpEvento") or ""),
+        "event_chNFe": str(result.get("event_chNFe") or ""),
+        "event_nSeqEvento": str(result.get("event_nSeqEvento") or ""),
+        "lote_cStat": str(result.get("lote_cStat") or ""),
+        "lote_xMotivo": str(result.get("lote_xMotivo") or ""),
+        "raw_xml": str(result.get("raw_xml") or ""),
+        "http_status": result.get("http_status"),
+        "faultcode": str(result.get("faultcode") or ""),
+        "faultstring": str(result.get("faultstring") or ""),
+        "remote_body_excerpt": str(result.get("remote_body_excerpt") or ""),
+        "response_content_type": str(result.get("response_content_type") or ""),
+        "request_diagnostics": result.get("request_diagnostics") if isinstance(result.get("request_diagnostics"), dict) else {},
+    }
+
+
 def send_manifestation_ciencia_operacao(access_key, settings, sequencia_evento=1, correlation_id=None, binding_profile=None):
     if settings.get('provider') != 'sefaz_direto':
         return {"success": False, "message": "Manifestação SEFAZ Direto disponível apenas para provider 'sefaz_direto'."}
@@ -1244,36 +1456,51 @@ def send_manifestation_ciencia_operacao(access_key, settings, sequencia_evento=1
                 str(result.get("xMotivo") or ""),
                 str(result.get("protocol") or ""),
             )
-            return {
-                "success": bool(result.get("success")),
-                "cStat": str(result.get("cStat") or ""),
-                "xMotivo": str(result.get("xMotivo") or result.get("message") or ""),
-                "protocol": str(result.get("protocol") or ""),
-                "tpEvento": str(result.get("tpEvento") or "210210"),
-                "dhRegEvento": str(result.get("dhRegEvento") or ""),
-                "event_result_type": str(result.get("event_result_type") or ""),
-                "event_cStat": str(result.get("event_cStat") or ""),
-                "event_xMotivo": str(result.get("event_xMotivo") or ""),
-                "event_nProt": str(result.get("event_nProt") or ""),
-                "event_dhRegEvento": str(result.get("event_dhRegEvento") or ""),
-                "event_tpEvento": str(result.get("event_tpEvento") or ""),
-                "event_chNFe": str(result.get("event_chNFe") or ""),
-                "event_nSeqEvento": str(result.get("event_nSeqEvento") or ""),
-                "lote_cStat": str(result.get("lote_cStat") or ""),
-                "lote_xMotivo": str(result.get("lote_xMotivo") or ""),
-                "raw_xml": str(result.get("raw_xml") or ""),
-                "http_status": result.get("http_status"),
-                "faultcode": str(result.get("faultcode") or ""),
-                "faultstring": str(result.get("faultstring") or ""),
-                "remote_body_excerpt": str(result.get("remote_body_excerpt") or ""),
-                "response_content_type": str(result.get("response_content_type") or ""),
-                "request_diagnostics": result.get("request_diagnostics") if isinstance(result.get("request_diagnostics"), dict) else {},
-            }
+            return _manifestation_result(result)
     except Exception as e:
         logger.exception("manifestation_send_exception access_key=%s error=%s", str(access_key), str(e))
         return {"success": False, "message": str(e)}
 
 
+
+def send_manifestation_ciencia_operacao_batch(access_keys, settings, sequencia_evento=1, correlation_id=None, binding_profile=None):
+    """
+    Ciência da Operação for several notes with one certificate load, one
+    signer and the pooled SEFAZ connection. Returns ``{access_key: result}``
+    with the same result fields as ``send_manifestation_ciencia_operacao``.
+    """
+    keys = [str(key or "").strip() for key in access_keys or [] if str(key or "").strip()]
+    if settings.get('provider') != 'sefaz_direto':
+        failure = {"success": False, "message": "Manifestação SEFAZ Direto disponível apenas para provider 'sefaz_direto'."}
+        return {key: dict(failure) for key in keys}
+    deps = check_xml_signature_dependencies()
+    if not deps.get("ok"):
+        failure = {
+            "success": False,
+            "message": "Assinatura fiscal indisponível: bibliotecas XML não instaladas no servidor.",
+            "missing_dependencies": deps.get("missing") or [],
+        }
+        return {key: dict(failure) for key in keys}
+    service = _get_sefaz_service_instance(settings)
+    if not service:
+        return {key: {"success": False, "message": "Certificado A1 não configurado ou inválido."} for key in keys}
+    ambiente = 2 if settings.get('environment') == 'homologation' else 1
+    logger.info("manifestation_batch_start keys=%s ambiente=%s correlation_id=%s", len(keys), str(ambiente), str(correlation_id or ''))
+    try:
+        with service:
+            results = service.manifestar_ciencia_operacao_lote(
+                keys,
+                settings.get('cnpj_emitente'),
+                ambiente=ambiente,
+                sequencia_evento=sequencia_evento,
+                correlation_id=correlation_id,
+                binding_profile=binding_profile,
+            )
+            return {key: _manifestation_result(result) for key, result in results}
+    except Exception as e:
+        logger.exception("manifestation_batch_exception keys=%s error=%s", len(keys), str(e))
+        return {key: {"success": False, "message": str(e)} for key in keys}
+
 def get_sefaz_certificate_runtime_status(settings):
     resolved = _resolve_sefaz_certificate_config(settings)
     response = {
@@ -1664,7 +1891,7 @@ def list_received_nfes(settings):
                 "dist_nsu": nsu_atual
             }
             try:
-                resp_sync = requests.post(trigger_url, headers=headers, json=payload)
+                resp_sync = _nuvem_fiscal_call('post', trigger_url, headers=headers, json=payload)
                 consultas_feitas += 1
 
                 if resp_sync.status_code in [200, 201, 202]:
@@ -1698,7 +1925,7 @@ def list_received_nfes(settings):
             "dist_nsu": nsu_forward
         }
                 try:
-                    resp_sync = requests.post(trigger_url, headers=headers, json=payload)
+                    resp_sync = _nuvem_fiscal_call('post', trigger_url, headers=headers, json=payload)
                     consultas_feitas += 1
 
                     if resp_sync.status_code in [200, 201, 202]:
@@ -1728,7 +1955,7 @@ def list_received_nfes(settings):
         
         # 2. Fetch DFe documents from cache
         logger.info(f"Fetching DFe from: {api_url}")
-        response = requests.get(api_url, headers=headers, params=params)
+        response = _nuvem_fiscal_call('get', api_url, headers=headers, params=params)
         
         if response.status_code == 200:
             data = response.json()
@@ -2222,7 +2449,7 @@ def emit_invoice(transaction, settings, order_items, customer_cpf_cnpj=None):
         }
         
         logger.info(f"Emitting NFC-e for {transaction['id']} to {api_url}")
-        response = requests.post(api_url, json=payload, headers=headers, timeout=30)
+        response = _nuvem_fiscal_call('post', api_url, json=payload, headers=headers, timeout=30)
         
         if response.status_code in (200, 201):
             resp_data = response.json()
@@ -2,7 +2,7 @@ import json
 from datetime import datetime
 
 from app.services.system_config_manager import get_data_path
-from app.services.data_service import load_products, load_stock_entries, load_stock_requests, load_stock_transfers, add_stock_entries_batch
+from app.services.data_service import load_products, add_stock_entries_batch
 from app.services.stock_service import calculate_inventory
 
 
@@ -110,10 +110,7 @@ def list_governance_candidate_products():
 
 
 def _balance_map(products):
-    entries = load_stock_entries()
-    requests = load_stock_requests()
-    transfers = load_stock_transfers()
-    inventory = calculate_inventory(products, entries, requests, transfers, target_dept='Geral')
+    inventory = calculate_inventory(products, target_dept='Geral')
     out = {}
     for name, info in (inventory or {}).items():
         try:
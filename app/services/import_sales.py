@@ -6,10 +6,12 @@ from datetime import datetime
 import locale
 
 from app.services.system_config_manager import (
-    SALES_HISTORY_FILE, SALES_PRODUCTS_FILE,
-    CASHIER_SESSIONS_FILE, STOCK_FILE, STOCK_ENTRIES_FILE, SALES_DIR
+    SALES_PRODUCTS_FILE,
+    CASHIER_SESSIONS_FILE, STOCK_FILE, SALES_DIR
+)
+from app.services.data_service import (
+    load_sales_history, load_stock_entries, save_stock_entries, secure_save_sales_history,
 )
-from app.services.data_service import save_stock_entries, secure_save_sales_history
 
 # Constants
 SALES_FOLDER = SALES_DIR
@@ -157,14 +159,15 @@ def process_sales_files():
     messages = []
     messages.append("Iniciando processamento de arquivos de vendas...")
     
-    history_data = load_json(SALES_HISTORY_FILE)
+    # Ledgers go through data_service so rows still in the append journal are seen.
+    history_data = load_sales_history()
     if isinstance(history_data, list):
         history_data = {"last_processed_date": "", "history": history_data}
     
     processed_files = {h['filename'] for h in history_data.get('history', [])}
     
     sales_products = load_json(SALES_PRODUCTS_FILE)
-    stock_entries = load_json(STOCK_ENTRIES_FILE)
+    stock_entries = load_stock_entries()
     
     if not os.path.exists(SALES_FOLDER):
         return ["Pasta de vendas não encontrada."]
@@ -0,0 +1,376 @@
+import os
+import re
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.services.request_metrics_service import LatencyHistogram
+
+
+RETRY_STATUSES = (502, 503, 504)
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS')
+# Path segments that identify a record (numbers, access keys, uuids) are
+# folded so the metrics stay per endpoint, not per document.
+_ID_SEGMENT = re.compile(r'^(?:\d+|[0-9a-fA-F-]{16,}|[A-Za-z0-9_-]*\d[A-Za-z0-9_-]{11,})$')
+
+
+def _env_float(name, default):
+    raw = str(os.environ.get(name) or '').strip()
+    if not raw:
+        return default
+    try:
+        return max(0.0, float(raw))
+    except ValueError:
+        return default
+
+
+def default_timeout():
+    """(connect, read) seconds applied to calls that do not pass their own."""
+    return (
+        _env_float('ALMAREIA_HTTP_CONNECT_TIMEOUT', 5.0),
+        _env_float('ALMAREIA_HTTP_READ_TIMEOUT', 30.0),
+    )
+
+
+def endpoint_key(method, url):
+    parts = urlsplit(url)
+    segments = ['{id}' if _ID_SEGMENT.match(seg) else seg for seg in parts.path.split('/')]
+    return f"{method.upper()} {parts.netloc}{'/'.join(segments)}"
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of calling a host whose circuit is open."""
+
+
+class RetryBudget:
+    """
+    Retries allowed per sliding window: ``ratio`` of the requests made in
+    the window, and at least ``minimum``. Keeps a struggling provider from
+    receiving a retry storm on top of the normal traffic.
+    """
+
+    def __init__(self, ratio=0.2, minimum=5, window_seconds=60.0):
+        self.ratio = ratio
+        self.minimum = minimum
+        self.window = window_seconds
+        self._requests = deque()
+        self._retries = deque()
+
+    def _trim(self, now):
+        cutoff = now - self.window
+        while self._requests and self._requests[0] < cutoff:
+            self._requests.popleft()
+        while self._retries and self._retries[0] < cutoff:
+            self._retries.popleft()
+
+    def record_request(self, now):
+        self._trim(now)
+        self._requests.append(now)
+
+    def try_spend(self, now):
+        self._trim(now)
+        allowed = max(self.minimum, int(len(self._requests) * self.ratio))
+        if len(self._retries) >= allowed:
+            return False
+        self._retries.append(now)
+        return True
+
+
+class CircuitBreaker:
+    """
+    Opens after ``threshold`` consecutive failures; after ``cooldown``
+    seconds one trial call is let through (half-open) and its outcome
+    closes or re-opens the circuit.
+    """
+
+    def __init__(self, threshold=5, cooldown_seconds=30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.opens = 0
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half_open' if self.trial_in_flight else 'open'
+
+    def allow(self, now):
+        if self.opened_at is None:
+            return True
+        if self.trial_in_flight or now - self.opened_at < self.cooldown:
+            return False
+        self.trial_in_flight = True
+        return True
+
+    def record(self, ok, now):
+        if ok:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+            return
+        self.failures += 1
+        if self.trial_in_flight or self.failures >= self.threshold:
+            if self.opened_at is None or self.trial_in_flight:
+                self.opens += 1
+            self.opened_at = now
+            self.trial_in_flight = False
+
+
+class TokenCache:
+    """OAuth access tokens kept until shortly before they expire."""
+
+    def __init__(self, margin_seconds=60.0):
+        self.margin = margin_seconds
+        self._lock = threading.Lock()
+        self._tokens = {}
+        self.counters = {'hits': 0, 'fetches': 0}
+
+    def get(self, key, fetch):
+        """
+        Token for ``key``; ``fetch()`` must return ``(token, expires_in)``
+        and is only called on a miss. Failed fetches (no token) are not cached.
+        """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._tokens.get(key)
+            if cached and cached[1] > now:
+                self.counters['hits'] += 1
+                return cached[0]
+        token, expires_in = fetch()
+        with self._lock:
+            self.counters['fetches'] += 1
+            if token:
+                ttl = max(0.0, float(expires_in or 0) - self.margin)
+                if ttl > 0:
+                    self._tokens[key] = (token, time.monotonic() + ttl)
+        return token
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._tokens.clear()
+            else:
+                self._tokens.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, cached=len(self._tokens))
+
+
+class IntegrationHttpClient:
+    """
+    Shared HTTP client for one external integration.
+
+    - one keep-alive ``requests.Session`` per host, with its own urllib3
+      connection pool;
+    - ``default_timeout()`` for calls that do not pass ``timeout``;
+    - connection errors and 502/503/504 are retried (idempotent methods;
+      POST only when the connection was never established) while the
+      retry budget allows;
+    - a circuit breaker per host;
+    - a latency histogram per endpoint (method + host + path template).
+
+    ``get``/``post``/``put`` take the same arguments as ``requests`` and
+    return a ``requests.Response``; errors surface as ``requests``
+    exceptions, so existing ``except`` blocks keep working.
+    """
+
+    def __init__(self, name, pool_maxsize=8, max_retries=2, backoff_seconds=0.2, breaker_threshold=5, breaker_cooldown_seconds=30.0):
+        self.name = name
+        self.pool_maxsize = pool_maxsize
+        self.max_retries = max_retries
+        self.backoff = backoff_seconds
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown_seconds
+        self.budget = RetryBudget()
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._breakers = {}
+        self._endpoints = {}
+
+    def _session(self, host):
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._sessions[host] = session
+            return session
+
+    def _breaker(self, host):
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = self._breakers[host] = CircuitBreaker(self.breaker_threshold, self.breaker_cooldown)
+        return breaker
+
+    def _observe(self, key, ms, failed, retried):
+        with self._lock:
+            entry = self._endpoints.get(key)
+            if entry is None:
+                entry = self._endpoints[key] = {'latency': LatencyHistogram(), 'errors': 0, 'retries': 0}
+            entry['latency'].add(ms)
+            if failed:
+                entry['errors'] += 1
+            if retried:
+                entry['retries'] += 1
+
+    def request(self, method, url, **kwargs):
+        method = method.upper()
+        host = urlsplit(url).netloc
+        key = endpoint_key(method, url)
+        kwargs.setdefault('timeout', default_timeout())
+        session = self._session(host)
+        attempt = 0
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                breaker = self._breaker(host)
+                if not breaker.allow(now):
+                    raise CircuitOpenError(f"{self.name}: circuito aberto para {host}")
+                self.budget.record_request(now)
+            started = time.perf_counter()
+            response = None
+            error = None
+            try:
+                response = session.request(method, url, **kwargs)
+            except requests.exceptions.RequestException as exc:
+                error = exc
+            ms = (time.perf_counter() - started) * 1000.0
+            failed = error is not None or response.status_code >= 500
+            with self._lock:
+                breaker.record(not failed, time.monotonic())
+            if error is not None:
+                retryable = _never_connected(error) or (
+                    method in IDEMPOTENT_METHODS
+                    and isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+                )
+            else:
+                retryable = response.status_code in RETRY_STATUSES and method in IDEMPOTENT_METHODS
+            retry = False
+            if retryable and attempt < self.max_retries:
+                with self._lock:
+                    retry = self.budget.try_spend(time.monotonic())
+            self._observe(key, ms, failed, attempt > 0)
+            if not retry:
+                if error is not None:
+                    raise error
+                return response
+            attempt += 1
+            if response is not None:
+                response.close()
+            time.sleep(self.backoff * (2 ** (attempt - 1)))
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def stats(self):
+        with self._lock:
+            endpoints = [
+                {'endpoint': key, 'errors': entry['errors'], 'retries': entry['retries'], **entry['latency'].summary()}
+                for key, entry in self._endpoints.items()
+            ]
+            breakers = {
+                host: {'state': breaker.state, 'consecutive_failures': breaker.failures, 'opens': breaker.opens}
+                for host, breaker in self._breakers.items()
+            }
+            hosts = sorted(self._sessions)
+        endpoints.sort(key=lambda e: e['total_ms'], reverse=True)
+        return {'name': self.name, 'hosts': hosts, 'circuits': breakers, 'endpoints': endpoints}
+
+    def close(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions = {}
+        for session in sessions:
+            session.close()
+
+
+def _never_connected(error):
+    """True when the request cannot have reached the server (safe to resend a POST)."""
+    text = str(error)
+    return isinstance(error, requests.exceptions.ConnectTimeout) or any(
+        marker in text for marker in ('NewConnectionError', 'Connection refused', 'Name or service not known', 'Failed to resolve')
+    )
+
+
+_CLIENTS = {}
+_CLIENTS_LOCK = threading.Lock()
+_TOKENS = TokenCache()
+
+
+def get_integration_client(name):
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(name)
+        if client is None:
+            client = _CLIENTS[name] = IntegrationHttpClient(name)
+        return client
+
+
+def get_token_cache():
+    return _TOKENS
+
+
+def integration_http_stats():
+    with _CLIENTS_LOCK:
+        clients = list(_CLIENTS.values())
+    return {
+        'clients': [client.stats() for client in clients],
+        'oauth_tokens': _TOKENS.stats(),
+    }
+
+
+def _benchmark(calls=50):
+    """Sequential GETs to a local server: new connection per call vs pooled session."""
+    import http.server
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            body = b'{"ok": true}'
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/nfce/123/status"
+    try:
+        started = time.perf_counter()
+        for _ in range(calls):
+            requests.get(url, timeout=5)
+        fresh = time.perf_counter() - started
+        client = IntegrationHttpClient('benchmark')
+        started = time.perf_counter()
+        for _ in range(calls):
+            client.get(url)
+        pooled = time.perf_counter() - started
+        client.close()
+    finally:
+        server.shutdown()
+    return {'new_connection_s': round(fresh, 4), 'pooled_s': round(pooled, 4)}
+
+
+if __name__ == '__main__':
+    print(_benchmark())
@@ -2,6 +2,7 @@ import json
 from datetime import datetime
 from typing import Any, Dict, List, Optional
 
+from app.services.audit_log_service import get_audit_log
 from app.services.cashier_service import file_lock
 from app.services.inventory_restriction_service import InventoryRestrictionService
 from app.services.logger_service import LoggerService
@@ -37,14 +38,8 @@ class InventoryProtectionService:
             cls._save_json(INVENTORY_PROTECTION_RULES_FILE, rows)
 
     @classmethod
-    def _load_logs(cls) -> List[Dict[str, Any]]:
-        data = cls._load_json(INVENTORY_PROTECTION_LOGS_FILE, [])
-        return data if isinstance(data, list) else []
-
-    @classmethod
-    def _save_logs(cls, rows: List[Dict[str, Any]]) -> None:
-        with file_lock(INVENTORY_PROTECTION_LOGS_FILE):
-            cls._save_json(INVENTORY_PROTECTION_LOGS_FILE, rows)
+    def _audit_log(cls):
+        return get_audit_log(INVENTORY_PROTECTION_LOGS_FILE, time_field='day_affected', entity_field='category')
 
     @classmethod
     def apply_rule(
@@ -72,7 +67,7 @@ class InventoryProtectionService:
         if not dates:
             return {'updated': 0, 'dates': []}
         rows = cls._load_rules()
-        logs = cls._load_logs()
+        logs = []
         now = datetime.now().isoformat()
         updated = 0
         for day in dates:
@@ -114,8 +109,8 @@ class InventoryProtectionService:
                 'new_protected_rooms': protected,
                 'origin': origin,
             })
+        cls._audit_log().append(logs)
         cls._save_rules(rows)
-        cls._save_logs(logs)
         LoggerService.log_acao(
             acao='Atualizou proteção de inventário',
             entidade='Revenue Management',
@@ -254,13 +249,12 @@ class InventoryProtectionService:
         category: Optional[str] = None,
         user: Optional[str] = None,
     ) -> List[Dict[str, Any]]:
-        rows = cls._load_logs()
         start = PeriodSelectorService.parse_date(start_date).date() if start_date else None
         end = PeriodSelectorService.parse_date(end_date).date() if end_date else None
         category_norm = InventoryRestrictionService.normalize_category(category) if category else ''
         user_norm = str(user or '').strip().lower()
         out = []
-        for row in rows:
+        for row in cls._audit_log().query(start=start, end=end, entity=category_norm, user=user_norm):
             try:
                 day = PeriodSelectorService.parse_date(str(row.get('day_affected') or '')).date()
             except Exception:
@@ -2,6 +2,7 @@ import json
 from datetime import datetime, timedelta
 from typing import Any, Dict, List, Optional
 
+from app.services.audit_log_service import get_audit_log
 from app.services.cashier_service import file_lock
 from app.services.logger_service import LoggerService
 from app.services.period_selector_service import PeriodSelectorService
@@ -77,14 +78,8 @@ class InventoryRestrictionService:
             cls._save_json(INVENTORY_RESTRICTIONS_FILE, rows)
 
     @classmethod
-    def _load_logs(cls) -> List[Dict[str, Any]]:
-        data = cls._load_json(INVENTORY_RESTRICTION_LOGS_FILE, [])
-        return data if isinstance(data, list) else []
-
-    @classmethod
-    def _save_logs(cls, rows: List[Dict[str, Any]]) -> None:
-        with file_lock(INVENTORY_RESTRICTION_LOGS_FILE):
-            cls._save_json(INVENTORY_RESTRICTION_LOGS_FILE, rows)
+    def _audit_log(cls):
+        return get_audit_log(INVENTORY_RESTRICTION_LOGS_FILE, time_field='day_affected', entity_field='category')
 
     @classmethod
     def _dates_for_rule(cls, start_date: str, end_date: str, weekdays: Optional[List[str]] = None) -> List[str]:
@@ -115,7 +110,7 @@ class InventoryRestrictionService:
         if not dates:
             return {'updated': 0, 'dates': []}
         restrictions = cls._load_restrictions()
-        logs = cls._load_logs()
+        logs = []
         now = datetime.now().isoformat()
         updated = 0
         for day in dates:
@@ -163,8 +158,8 @@ class InventoryRestrictionService:
                 departamento_id='Recepção',
                 colaborador_id=user,
             )
+        cls._audit_log().append(logs)
         cls._save_restrictions(restrictions)
-        cls._save_logs(logs)
         return {
             'updated': updated,
             'dates': dates,
@@ -183,13 +178,14 @@ class InventoryRestrictionService:
         return cls.DEFAULT_STATUS
 
     @classmethod
-    def is_open_for_period(cls, category: str, checkin: str, checkout: str) -> bool:
+    def is_open_for_period(cls, category: str, checkin: str, checkout: str, restrictions: Optional[List[Dict[str, Any]]] = None) -> bool:
         start = cls._parse_date(checkin).date()
         end = cls._parse_date(checkout).date()
         if end < start:
             start, end = end, start
         normalized_category = cls.normalize_category(category)
-        restricted = {(str(row.get('category')), str(row.get('date'))): str(row.get('status') or cls.DEFAULT_STATUS) for row in cls._load_restrictions()}
+        rows = cls._load_restrictions() if restrictions is None else restrictions
+        restricted = {(str(row.get('category')), str(row.get('date'))): str(row.get('status') or cls.DEFAULT_STATUS) for row in rows}
         current = start
         while current < end:
             key = (normalized_category, current.isoformat())
@@ -233,13 +229,12 @@ class InventoryRestrictionService:
 
     @classmethod
     def list_logs(cls, start_date: Optional[str] = None, end_date: Optional[str] = None, user: Optional[str] = None, category: Optional[str] = None) -> List[Dict[str, Any]]:
-        rows = cls._load_logs()
         category_norm = cls.normalize_category(category) if category else None
         start = cls._parse_date(start_date).date() if start_date else None
         end = cls._parse_date(end_date).date() if end_date else None
         user_norm = str(user or '').strip().lower()
         out = []
-        for row in rows:
+        for row in cls._audit_log().query(start=start, end=end, entity=category_norm, user=user_norm):
             day = str(row.get('day_affected') or row.get('date') or '')
             cat = str(row.get('category') or '')
             row_user = str(row.get('user') or '').strip().lower()
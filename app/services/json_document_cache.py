@@ -0,0 +1,210 @@
+import logging
+import marshal
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+DEFAULT_MAX_BYTES = 96 * 1024 * 1024
+# Files modified less than this long ago are not trusted by stat signature
+# alone: coarse filesystem timestamps can hide a same-size rewrite. Every
+# stat-token cache in app.services uses this window through is_racy().
+RACY_WINDOW_SECONDS = 2.0
+
+
+def _env_max_bytes() -> int:
+    raw = str(os.environ.get('ALMAREIA_JSON_CACHE_MAX_BYTES') or '').strip()
+    if not raw:
+        return DEFAULT_MAX_BYTES
+    try:
+        return max(0, int(raw))
+    except ValueError:
+        return DEFAULT_MAX_BYTES
+
+
+def _env_enabled() -> bool:
+    raw = str(os.environ.get('ALMAREIA_JSON_CACHE', '1') or '1').strip().lower()
+    return raw not in ('0', 'false', 'no', 'off')
+
+
+def cache_key(filepath) -> str:
+    return os.path.normcase(os.path.realpath(os.path.abspath(str(filepath))))
+
+
+def stat_token(path: str) -> Optional[Tuple[int, int, int]]:
+    """``(mtime_ns, size, inode)`` of ``path``, or None if it cannot be stat'ed."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (int(st.st_mtime_ns), int(st.st_size), int(st.st_ino))
+
+
+def is_racy(token) -> bool:
+    """True if the file behind ``token`` (from stat_token) changed within RACY_WINDOW_SECONDS."""
+    return token is not None and (time.time_ns() - token[0]) < int(RACY_WINDOW_SECONDS * 1e9)
+
+
+class JsonDocumentCache:
+    """
+    Process-wide cache of parsed JSON documents.
+
+    Entries are keyed by canonical path and validated on every read by
+    (mtime_ns, size, inode). Documents are stored as marshal blobs so every
+    reader gets its own private copy (copy-on-read) at a fraction of the
+    cost of json parsing, and the blob size drives the LRU byte budget.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None, enabled: Optional[bool] = None):
+        self._lock = threading.RLock()
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._bytes = 0
+        self.max_bytes = _env_max_bytes() if max_bytes is None else int(max_bytes)
+        self.enabled = _env_enabled() if enabled is None else bool(enabled)
+        self._counters = self._empty_counters()
+
+    @staticmethod
+    def _empty_counters() -> Dict[str, float]:
+        return {
+            'hits': 0,
+            'misses': 0,
+            'stale': 0,
+            'racy_skips': 0,
+            'invalidations': 0,
+            'evictions': 0,
+            'uncacheable': 0,
+            'parse_seconds': 0.0,
+            'parse_seconds_saved': 0.0,
+        }
+
+    def get(self, path: str, loader: Callable[[str], Any]) -> Any:
+        """
+        Returns a private copy of the document at ``path``.
+        ``loader`` is called with the path on a miss and must return the
+        parsed document or raise; its exceptions propagate untouched.
+        """
+        if not self.enabled or self.max_bytes <= 0:
+            return loader(path)
+
+        key = cache_key(path)
+        signature = stat_token(path)
+        if signature is not None:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    if entry['signature'] == signature:
+                        self._entries.move_to_end(key)
+                        self._counters['hits'] += 1
+                        blob = entry['blob']
+                        parse_seconds = entry['parse_seconds']
+                    else:
+                        self._counters['stale'] += 1
+                        self._drop(key)
+                        blob = None
+                else:
+                    blob = None
+            if blob is not None:
+                started = time.perf_counter()
+                value = marshal.loads(blob)
+                saved = parse_seconds - (time.perf_counter() - started)
+                if saved > 0:
+                    with self._lock:
+                        self._counters['parse_seconds_saved'] += saved
+                return value
+
+        started = time.perf_counter()
+        value = loader(path)
+        parse_seconds = time.perf_counter() - started
+        with self._lock:
+            self._counters['misses'] += 1
+            self._counters['parse_seconds'] += parse_seconds
+        self._store(key, path, signature, value, parse_seconds)
+        return value
+
+    def _store(self, key, path, signature, value, parse_seconds):
+        if signature is None:
+            return
+        # The file may have been rewritten while we were parsing it.
+        if stat_token(path) != signature:
+            return
+        try:
+            blob = marshal.dumps(value)
+        except ValueError:
+            with self._lock:
+                self._counters['uncacheable'] += 1
+            return
+        size = len(blob)
+        if size > self.max_bytes:
+            with self._lock:
+                self._counters['uncacheable'] += 1
+            return
+        with self._lock:
+            if is_racy(signature):
+                self._counters['racy_skips'] += 1
+                return
+            self._drop(key)
+            self._entries[key] = {
+                'signature': signature,
+                'blob': blob,
+                'size': size,
+                'parse_seconds': parse_seconds,
+            }
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self._counters['evictions'] += 1
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry['size']
+
+    def invalidate(self, path) -> None:
+        key = cache_key(path)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+                self._counters['invalidations'] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._counters = self._empty_counters()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            lookups = counters['hits'] + counters['misses']
+            counters['hit_ratio'] = round(counters['hits'] / lookups, 4) if lookups else 0.0
+            counters['parse_seconds'] = round(counters['parse_seconds'], 6)
+            counters['parse_seconds_saved'] = round(counters['parse_seconds_saved'], 6)
+            counters['entries'] = len(self._entries)
+            counters['bytes'] = self._bytes
+            counters['max_bytes'] = self.max_bytes
+            counters['enabled'] = self.enabled
+            counters['files'] = [
+                {'path': key, 'bytes': entry['size']}
+                for key, entry in reversed(self._entries.items())
+            ]
+            return counters
+
+
+_DOCUMENT_CACHE = JsonDocumentCache()
+
+
+def get_document_cache() -> JsonDocumentCache:
+    return _DOCUMENT_CACHE
+
+
+def invalidate_document(path) -> None:
+    try:
+        _DOCUMENT_CACHE.invalidate(path)
+    except Exception as exc:
+        logging.getLogger(__name__).error(f"json_cache_invalidate_failed path={path} error={exc}")
@@ -0,0 +1,270 @@
+import marshal
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from app.services.table_orders_store import _table_sort_key
+
+
+def _env_float(name, default):
+    raw = str(os.environ.get(name) or '').strip()
+    if not raw:
+        return default
+    try:
+        return max(0.0, float(raw))
+    except ValueError:
+        return default
+
+
+# Longest a screen's request is held waiting for a change.
+LONG_POLL_MAX_SECONDS = _env_float('ALMAREIA_KDS_LONG_POLL_SECONDS', 25.0)
+# Held requests re-check the table segments this often, so writes made by
+# another process (which cannot notify this bus) still reach the screens.
+RECHECK_SECONDS = _env_float('ALMAREIA_KDS_RECHECK_SECONDS', 2.0)
+# Tombstones of closed tables kept for screens that are behind; a screen
+# older than the oldest one dropped gets a full payload.
+MAX_TOMBSTONES = 500
+
+
+class KdsEventBus:
+    """
+    Wakes held KDS requests. ``data_service.save_table_orders`` publishes
+    after every commit (orders launched from the restaurant, KDS status
+    updates, closings); waiters block on the bus version instead of
+    sleeping between polls.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self.version = 0
+
+    def publish(self):
+        with self._cond:
+            self.version += 1
+            self._cond.notify_all()
+
+    def wait(self, seen, timeout):
+        """Blocks until the bus moves past ``seen`` or ``timeout``; returns the current version."""
+        with self._cond:
+            if timeout > 0:
+                self._cond.wait_for(lambda: self.version != seen, timeout)
+            return self.version
+
+
+class _StationView:
+    def __init__(self):
+        self.inputs = {}     # table_id -> segment version the card was built from
+        self.cards = {}      # table_id -> (seq, card or None, section counts, (prep sum, prep count))
+        self.removed = {}    # table_id -> seq of the closing
+        self.minute = None
+        self.context = None
+        self.last_seq = 0
+
+
+class KdsFeed:
+    """
+    Versioned per-table KDS cards by station.
+
+    A refresh compares the table segments' versions (``table_orders_segments``)
+    with the ones each card was built from and only decodes and rebuilds
+    the tables that changed, plus every table when the minute (wait times)
+    or the KDS configuration (SLA, printers) moved. A rebuilt card that
+    differs from the previous one gets a new sequence number from one
+    process-wide counter; screens send the last number they saw and
+    receive just the tables changed or closed since then.
+
+    ``epoch`` changes with the process, so a screen that talked to another
+    worker or to a restarted server gets a full payload.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+        self._seq = 0
+        self._floor = 0
+        self.epoch = uuid.uuid4().hex[:12]
+        self.counters = {'refreshes': 0, 'tables_built': 0, 'not_modified': 0, 'deltas': 0, 'full': 0}
+
+    def _refresh(self, station, now, segments, context, build_table):
+        minute = now.replace(second=0, microsecond=0)
+        with self._lock:
+            view = self._views.setdefault(station, _StationView())
+            self.counters['refreshes'] += 1
+            everything = view.minute != minute or view.context != context
+            view.minute = minute
+            view.context = context
+            for table_id, (version, blob) in segments.items():
+                if not everything and view.inputs.get(table_id) == version:
+                    continue
+                card, sections, prep = build_table(table_id, marshal.loads(blob), now, context)
+                self.counters['tables_built'] += 1
+                view.inputs[table_id] = version
+                previous = view.cards.get(table_id)
+                if previous is not None and previous[1:] == (card, sections, prep):
+                    continue
+                shown_before = previous is not None and previous[1] is not None
+                if card is None and not shown_before:
+                    # Not on this station's screen; nothing to send.
+                    view.cards[table_id] = (previous[0] if previous else 0, None, sections, prep)
+                    continue
+                self._seq += 1
+                view.cards[table_id] = (self._seq, card, sections, prep)
+                if card is None:
+                    # Everything on the card was archived: the screen drops it.
+                    view.removed[table_id] = self._seq
+                else:
+                    view.removed.pop(table_id, None)
+                view.last_seq = self._seq
+            for table_id in [t for t in view.cards if t not in segments]:
+                _seq, card, _sections, _prep = view.cards.pop(table_id)
+                view.inputs.pop(table_id, None)
+                if card is not None:
+                    self._seq += 1
+                    view.removed[table_id] = self._seq
+                    view.last_seq = self._seq
+            if len(view.removed) > MAX_TOMBSTONES:
+                for table_id, seq in sorted(view.removed.items(), key=lambda kv: kv[1])[:-MAX_TOMBSTONES]:
+                    view.removed.pop(table_id)
+                    self._floor = max(self._floor, seq)
+            return view
+
+    def snapshot(self, station, since, epoch, now, segments, context, build_table):
+        """
+        ``(payload, modified)``. Not modified: ``{'version', 'epoch',
+        'not_modified': True}``. Otherwise the KDS header fields of
+        ``_build_kds_payload`` plus ``orders`` (changed cards, or all of
+        them when ``full``), ``removed`` table ids and ``table_order``.
+        """
+        view = self._refresh(station, now, segments, context, build_table)
+        with self._lock:
+            version = self._seq
+            full = epoch != self.epoch or since is None or since < self._floor or since > version
+            if not full and view.last_seq <= since:
+                self.counters['not_modified'] += 1
+                return {'version': version, 'epoch': self.epoch, 'not_modified': True}, False
+            self.counters['full' if full else 'deltas'] += 1
+            table_order = sorted((t for t, entry in view.cards.items() if entry[1] is not None), key=_table_sort_key)
+            orders = [view.cards[t][1] for t in table_order if full or view.cards[t][0] > since]
+            removed = [] if full else sorted((t for t, seq in view.removed.items() if seq > since), key=_table_sort_key)
+            sections_counter = {}
+            prep_sum = prep_count = 0
+            for table_id in sorted(view.cards, key=_table_sort_key):
+                _seq, _card, sections, prep = view.cards[table_id]
+                for name, pending in sections:
+                    sections_counter[name] = sections_counter.get(name, 0) + pending
+                prep_sum += prep[0]
+                prep_count += prep[1]
+        avg_prep_seconds = int(prep_sum / prep_count) if prep_count else 20 * 60
+        payload = {
+            'station': station,
+            'generated_at': now.isoformat(),
+            'avg_prep_seconds': avg_prep_seconds,
+            'avg_prep_minutes': max(1, int(round(avg_prep_seconds / 60.0))),
+            'orders': orders,
+            'sections_summary': [{'name': name, 'pending': count} for name, count in sections_counter.items()],
+            'version': version,
+            'epoch': self.epoch,
+            'full': full,
+            'removed': removed,
+            'table_order': table_order,
+        }
+        return payload, True
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self.counters,
+                version=self._seq,
+                epoch=self.epoch,
+                stations={name: len([c for c in view.cards.values() if c[1] is not None]) for name, view in self._views.items()},
+            )
+
+
+_BUS = KdsEventBus()
+_FEED = KdsFeed()
+
+
+def get_kds_bus():
+    return _BUS
+
+
+def get_kds_feed():
+    return _FEED
+
+
+def notify_kds_orders_changed():
+    _BUS.publish()
+
+
+def wait_for_kds_changes(station, since, epoch, wait_seconds, load_state, build_table, clock=datetime.now):
+    """
+    Long-poll: the station's delta since ``since``, waiting up to
+    ``wait_seconds`` (capped by LONG_POLL_MAX_SECONDS) for one to appear.
+    ``load_state()`` returns ``(segments, context)``; it is called again on
+    every wake-up (bus publish, recheck interval or minute boundary).
+    ``build_table(table_id, order, now, context)`` returns ``(card or None,
+    ((section, pending), ...), (prep seconds sum, prep count))``.
+    """
+    deadline = time.monotonic() + min(max(0.0, float(wait_seconds or 0)), LONG_POLL_MAX_SECONDS)
+    while True:
+        seen = _BUS.version
+        now = clock()
+        segments, context = load_state()
+        payload, modified = _FEED.snapshot(station, since, epoch, now, segments, context, build_table)
+        remaining = deadline - time.monotonic()
+        if modified or remaining <= 0:
+            return payload, modified
+        next_minute = (now.replace(second=0, microsecond=0) + timedelta(minutes=1) - now).total_seconds()
+        _BUS.wait(seen, min(remaining, RECHECK_SECONDS or remaining, max(0.05, next_minute)))
+
+
+def kds_event_stats():
+    return dict(_FEED.stats(), bus_version=_BUS.version)
+
+
+def _benchmark(tables=40, items_per_table=12, polls=300):
+    """Full rebuild per poll vs the versioned feed (one station, no writes between polls)."""
+    from app.services.table_orders_store import _encode
+
+    now = datetime(2026, 3, 10, 20, 0, 0)
+    orders = {
+        str(t): {
+            'status': 'open',
+            'opened_at': '10/03/2026 19:30',
+            'items': [
+                {'id': f"{t}-{i}", 'name': f"Prato {i}", 'qty': 1, 'category': 'Pratos',
+                 'created_at': '10/03/2026 19:40', 'kds_status': 'pending'}
+                for i in range(items_per_table)
+            ],
+        }
+        for t in range(1, tables + 1)
+    }
+    segments = {table_id: (1, _encode(order)) for table_id, order in orders.items()}
+
+    def build_table(table_id, order, now, context):
+        items = [
+            {'id': item['id'], 'name': item['name'], 'status': item['kds_status'],
+             'wait_minutes': int((now - datetime.strptime(item['created_at'], '%d/%m/%Y %H:%M')).total_seconds() / 60)}
+            for item in order['items']
+        ]
+        return {'table_id': table_id, 'items': items}, (('Cozinha', len(items)),), (0, 0)
+
+    started = time.perf_counter()
+    for _ in range(polls):
+        decoded = {table_id: marshal.loads(blob) for table_id, (_v, blob) in segments.items()}
+        [build_table(table_id, order, now, None) for table_id, order in decoded.items()]
+    full = time.perf_counter() - started
+
+    feed = KdsFeed()
+    payload, _ = feed.snapshot('kitchen', None, None, now, segments, None, build_table)
+    started = time.perf_counter()
+    for _ in range(polls):
+        feed.snapshot('kitchen', payload['version'], payload['epoch'], now, segments, None, build_table)
+    incremental = time.perf_counter() - started
+    return {'full_rebuild_s': round(full, 4), 'versioned_feed_s': round(incremental, 4)}
+
+
+if __name__ == '__main__':
+    print(_benchmark())
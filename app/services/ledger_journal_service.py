@@ -0,0 +1,352 @@
+import copy
+import json
+import logging
+import marshal
+import os
+import threading
+from datetime import datetime
+
+from app.services.ledger_stream_service import NotAJsonArray, get_ledger_stream_index, in_window
+
+
+JOURNAL_SUFFIX = '.journal.jsonl'
+DEFAULT_COMPACT_ROWS = 2000
+
+logger = logging.getLogger(__name__)
+
+
+def journal_enabled():
+    raw = str(os.environ.get('ALMAREIA_LEDGER_JOURNAL', '1') or '1').strip().lower()
+    return raw not in ('0', 'false', 'no', 'off')
+
+
+def compact_rows_threshold():
+    raw = str(os.environ.get('ALMAREIA_LEDGER_COMPACT_ROWS') or '').strip()
+    try:
+        return max(1, int(raw)) if raw else DEFAULT_COMPACT_ROWS
+    except ValueError:
+        return DEFAULT_COMPACT_ROWS
+
+
+def journal_path_for(snapshot_path):
+    root, _ext = os.path.splitext(os.path.abspath(snapshot_path))
+    return root + JOURNAL_SUFFIX
+
+
+def _file_token(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [int(st.st_ino), int(st.st_size), int(st.st_mtime_ns)]
+
+
+def ledger_signature(snapshot_path):
+    """Stat signature covering the snapshot and its journal tail."""
+    parts = []
+    for path in (snapshot_path, journal_path_for(snapshot_path)):
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        parts.extend([int(st.st_mtime_ns), int(st.st_size)])
+    return parts or None
+
+
+def _row_key(row):
+    return json.dumps(row, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def _copy_rows(rows):
+    try:
+        return marshal.loads(marshal.dumps(rows))
+    except ValueError:
+        return copy.deepcopy(rows)
+
+
+class LedgerJournal:
+    """
+    Append-only journal in front of a JSON-array ledger file.
+
+    The JSON file stays the snapshot every other reader knows about; rows
+    appended since the last compaction live in ``<name>.journal.jsonl``,
+    one batch per line. The first line records the snapshot's stat token
+    the journal applies to, so a snapshot rewritten by a compaction (or by
+    anyone else) makes the old journal stale instead of double-applying it.
+    A torn last line from a crash is ignored on read and cut off by the
+    next append.
+
+    A full rewrite (``replace``) keeps journal rows the writer never saw:
+    ``load()`` marks, per thread, how much of the journal it handed out, and
+    pending rows past that mark that are missing from the new list (a list
+    built from the snapshot file alone, or rows another thread appended
+    meanwhile) are carried over at the end. Rows the writer did load are
+    its to remove or edit.
+    """
+
+    def __init__(self, snapshot_path, read_snapshot, write_snapshot):
+        self.snapshot_path = snapshot_path
+        self.path = journal_path_for(snapshot_path)
+        self._read_snapshot = read_snapshot
+        self._write_snapshot = write_snapshot
+        self._lock = threading.RLock()
+        self._seen = threading.local()
+        self._reset_tail()
+        self.counters = {
+            'appends': 0, 'appended_rows': 0, 'compactions': 0, 'replaces': 0, 'torn_tails': 0,
+            'stale_journals': 0, 'carried_rows': 0,
+        }
+
+    def _reset_tail(self):
+        self._tail_token = None
+        self._tail_offset = 0
+        self._tail_base = None
+        self._tail_rows = []
+        self._tail_torn = False
+
+    def _refresh_tail(self):
+        token = _file_token(self.path)
+        if token is None:
+            self._reset_tail()
+            return
+        if self._tail_token is not None and (token[0] != self._tail_token[0] or token[1] < self._tail_offset):
+            self._reset_tail()
+        if self._tail_token == token:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._tail_offset)
+            chunk = f.read()
+        end = chunk.rfind(b'\n') + 1
+        self._tail_torn = end < len(chunk)
+        offset = self._tail_offset
+        for raw in chunk[:end].splitlines(keepends=True):
+            try:
+                record = json.loads(raw.decode('utf-8'))
+            except ValueError:
+                # A complete but unreadable line: keep what came before it.
+                logger.warning(f"ledger_journal_corrupt_line path={self.path} offset={offset}")
+                self._tail_torn = True
+                break
+            if offset == 0:
+                self._tail_base = record.get('base') if isinstance(record, dict) else None
+            elif isinstance(record, dict) and isinstance(record.get('rows'), list):
+                self._tail_rows.extend(record['rows'])
+            offset += len(raw)
+        self._tail_offset = offset
+        self._tail_token = token
+
+    def _current_tail(self, snapshot_token=None):
+        self._refresh_tail()
+        if not self._tail_rows:
+            return []
+        if self._tail_base != (snapshot_token or _file_token(self.snapshot_path)):
+            return []
+        return self._tail_rows
+
+    def load(self):
+        with self._lock:
+            rows = self._load()
+            self._seen.mark = (self._tail_base, len(self._tail_rows))
+            return rows
+
+    def _load(self):
+        with self._lock:
+            for _attempt in range(3):
+                token = _file_token(self.snapshot_path)
+                snapshot = self._read_snapshot()
+                if _file_token(self.snapshot_path) == token:
+                    break
+            tail = self._current_tail(token)
+            if not tail or not isinstance(snapshot, list):
+                return snapshot
+            return snapshot + _copy_rows(tail)
+
+    def iter_rows(self, start=None, end=None, date_of=None):
+        """
+        Yields rows whose ``date_of(row)`` falls in [start, end] (datetimes,
+        either bound optional). Rows without a parseable date are skipped
+        when a bound is given. The snapshot is streamed through its date
+        sidecar, so only rows inside the window are parsed.
+        """
+        with self._lock:
+            token = _file_token(self.snapshot_path)
+            tail = _copy_rows(self._current_tail(token))
+        streamed = False
+        if token is not None:
+            try:
+                for row in get_ledger_stream_index().iter_range(self.snapshot_path, start, end, date_of):
+                    streamed = True
+                    yield row
+                streamed = True
+            except (NotAJsonArray, ValueError, OSError):
+                # Only safe to fall back before anything was yielded.
+                if streamed:
+                    raise
+        if not streamed:
+            snapshot = self._read_snapshot()
+            for row in self._as_list(snapshot):
+                if in_window(row, start, end, date_of):
+                    yield row
+        for row in tail:
+            if in_window(row, start, end, date_of):
+                yield row
+
+    def pending_rows(self):
+        with self._lock:
+            return len(self._current_tail())
+
+    def append(self, rows):
+        rows = list(rows or [])
+        if not rows:
+            return True
+        with self._lock:
+            if not journal_enabled():
+                return self.replace(self._as_list(self._load()) + rows)
+            snapshot_token = _file_token(self.snapshot_path)
+            if snapshot_token is None:
+                # Materialize the snapshot first (it may come from a legacy
+                # fallback path) so the journal has a base to point at.
+                if not self._write_snapshot(self._as_list(self._read_snapshot())):
+                    return False
+                snapshot_token = _file_token(self.snapshot_path)
+            try:
+                self._refresh_tail()
+                if self._tail_token is not None and self._tail_base != snapshot_token:
+                    self.counters['stale_journals'] += 1
+                    os.remove(self.path)
+                    self._reset_tail()
+                elif self._tail_torn:
+                    self.counters['torn_tails'] += 1
+                    with open(self.path, 'r+b') as f:
+                        f.truncate(self._tail_offset)
+                    self._tail_torn = False
+                lines = []
+                if self._tail_offset == 0:
+                    lines.append(json.dumps({'base': snapshot_token, 'created_at': datetime.now().isoformat()}))
+                lines.append(json.dumps({'at': datetime.now().isoformat(), 'rows': rows}, ensure_ascii=False, separators=(',', ':')))
+                with open(self.path, 'ab') as f:
+                    f.write(('\n'.join(lines) + '\n').encode('utf-8'))
+                    f.flush()
+                    os.fsync(f.fileno())
+            except OSError as e:
+                logger.error(f"ledger_journal_append_failed path={self.path} error={e}")
+                self._reset_tail()
+                return False
+            self.counters['appends'] += 1
+            self.counters['appended_rows'] += len(rows)
+            self._refresh_tail()
+            if len(self._tail_rows) >= compact_rows_threshold():
+                self.compact()
+            return True
+
+    def save(self, rows):
+        """
+        Persists the full ``rows`` list. When it only extends what is stored,
+        the new rows go to the journal. Returns (saved, appended_rows) where
+        appended_rows is None for a full rewrite.
+        """
+        with self._lock:
+            current = self._load()
+            if isinstance(current, list) and isinstance(rows, list) and len(rows) > len(current) and rows[:len(current)] == current:
+                appended = rows[len(current):]
+                self._seen.mark = None
+                return self.append(appended), appended
+            return self.replace(rows), None
+
+    def replace(self, rows):
+        with self._lock:
+            if isinstance(rows, list):
+                rows = self._with_unseen(rows)
+            if not self._write_snapshot(rows):
+                return False
+            self.counters['replaces'] += 1
+            self._drop_journal()
+            return True
+
+    def _with_unseen(self, rows):
+        """``rows`` plus the pending journal rows this thread never loaded and ``rows`` lacks."""
+        mark = getattr(self._seen, 'mark', None)
+        self._seen.mark = None
+        tail = self._current_tail()
+        if mark is not None and mark[0] == self._tail_base:
+            tail = tail[mark[1]:]
+        if not tail:
+            return rows
+        wanted = {}
+        for row in tail:
+            key = _row_key(row)
+            wanted[key] = wanted.get(key, 0) + 1
+        for row in rows:
+            key = _row_key(row)
+            if wanted.get(key):
+                wanted[key] -= 1
+        missing = []
+        for row in tail:
+            key = _row_key(row)
+            if wanted.get(key):
+                wanted[key] -= 1
+                missing.append(row)
+        if not missing:
+            return rows
+        logger.warning(f"ledger_journal_carried_rows path={self.snapshot_path} rows={len(missing)}")
+        self.counters['carried_rows'] += len(missing)
+        return rows + _copy_rows(missing)
+
+    def compact(self):
+        with self._lock:
+            rows = self._load()
+            if not self._write_snapshot(rows):
+                return False
+            self.counters['compactions'] += 1
+            self._drop_journal()
+            return True
+
+    def _drop_journal(self):
+        # The snapshot was just rewritten, so the old journal is already
+        # stale by its base token; removing it is housekeeping only.
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"ledger_journal_remove_failed path={self.path} error={e}")
+        self._reset_tail()
+
+    @staticmethod
+    def _as_list(data):
+        if isinstance(data, list):
+            return data
+        if isinstance(data, dict):
+            return list(data.values())
+        return []
+
+    def stats(self):
+        with self._lock:
+            return {
+                'journal_path': self.path,
+                'pending_rows': len(self._current_tail()),
+                'journal_bytes': self._tail_offset,
+                'compact_rows': compact_rows_threshold(),
+                'enabled': journal_enabled(),
+                **self.counters,
+            }
+
+
+_JOURNALS = {}
+_JOURNALS_LOCK = threading.Lock()
+
+
+def get_ledger_journal(snapshot_path, read_snapshot, write_snapshot):
+    key = os.path.abspath(snapshot_path)
+    with _JOURNALS_LOCK:
+        journal = _JOURNALS.get(key)
+        if journal is None:
+            journal = LedgerJournal(snapshot_path, read_snapshot, write_snapshot)
+            _JOURNALS[key] = journal
+        return journal
+
+
+def ledger_journal_stats():
+    with _JOURNALS_LOCK:
+        journals = list(_JOURNALS.values())
+    return {os.path.basename(j.snapshot_path): j.stats() for j in journals}
@@ -0,0 +1,620 @@
+import hashlib
+import hmac
+import json
+import logging
+import marshal
+import os
+import re
+import secrets
+import shutil
+import threading
+import uuid
+from datetime import datetime
+
+
+GENESIS_HASH = "0" * 64
+DEFAULT_CHECKPOINT_EVERY = 500
+DEFAULT_SEGMENT_RECORDS = 10000
+_SEGMENT_RE = re.compile(r'^segment_(\d{6})\.jsonl$')
+
+logger = logging.getLogger(__name__)
+
+
+def checkpoint_every():
+    raw = str(os.environ.get('ALMAREIA_LEDGER_CHECKPOINT_EVERY') or '').strip()
+    try:
+        return max(1, int(raw)) if raw else DEFAULT_CHECKPOINT_EVERY
+    except ValueError:
+        return DEFAULT_CHECKPOINT_EVERY
+
+
+def segment_records():
+    raw = str(os.environ.get('ALMAREIA_LEDGER_SEGMENT_RECORDS') or '').strip()
+    try:
+        return max(1, int(raw)) if raw else DEFAULT_SEGMENT_RECORDS
+    except ValueError:
+        return DEFAULT_SEGMENT_RECORDS
+
+
+def _parse_ts(value):
+    try:
+        return datetime.fromisoformat(str(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _apply_balance(balances, record):
+    # Same rule as the old full replay: destination gets +value, source
+    # gets -value, and a box moving money to itself only counts the credit.
+    value = float(record['value'])
+    dest = record.get('dest_box')
+    source = record.get('source_box')
+    if isinstance(dest, str):
+        balances[dest] = balances.get(dest, 0.0) + value
+    if isinstance(source, str) and source != dest:
+        balances[source] = balances.get(source, 0.0) - value
+
+
+def _at_line_boundary(path, offset):
+    if not offset:
+        return True
+    try:
+        with open(path, 'rb') as f:
+            f.seek(offset - 1)
+            return f.read(1) == b'\n'
+    except OSError:
+        return False
+
+
+class _Cursor:
+    """Running totals of the chain up to (segment, offset)."""
+
+    __slots__ = ('segment', 'offset', 'count', 'seg_count', 'last_hash', 'balances', 'max_ts', 'interval_min', 'interval_max', 'interval_unknown')
+
+    def __init__(self):
+        self.segment = 1
+        self.offset = 0
+        self.count = 0
+        self.seg_count = 0
+        self.last_hash = GENESIS_HASH
+        self.balances = {}
+        # Latest timestamp of the whole chain, and the spread of the
+        # records appended since the last checkpoint.
+        self.max_ts = None
+        self.interval_min = None
+        self.interval_max = None
+        self.interval_unknown = False
+
+    @classmethod
+    def from_checkpoint(cls, checkpoint):
+        cursor = cls()
+        cursor.segment = checkpoint['segment']
+        cursor.offset = checkpoint['offset']
+        cursor.count = checkpoint['count']
+        cursor.seg_count = checkpoint['seg_count']
+        cursor.last_hash = checkpoint['last_hash']
+        cursor.balances = dict(checkpoint['balances'])
+        cursor.max_ts = _parse_ts(checkpoint.get('max_ts'))
+        return cursor
+
+    def advance(self, record, segment, offset):
+        if segment != self.segment:
+            self.seg_count = 0
+        self.segment = segment
+        self.offset = offset
+        self.count += 1
+        self.seg_count += 1
+        self.last_hash = record.get('current_hash')
+        _apply_balance(self.balances, record)
+        ts = _parse_ts(record.get('timestamp'))
+        if ts is None:
+            self.interval_unknown = True
+            return
+        if self.max_ts is None or ts > self.max_ts:
+            self.max_ts = ts
+        if self.interval_min is None or ts < self.interval_min:
+            self.interval_min = ts
+        if self.interval_max is None or ts > self.interval_max:
+            self.interval_max = ts
+
+
+class LedgerSegmentStore:
+    """
+    Append-only storage for the hash-chained financial ledger.
+
+    Records live one per line in ``<name>.d/segment_NNNNNN.jsonl``; a
+    segment is closed after ``ALMAREIA_LEDGER_SEGMENT_RECORDS`` records and
+    never written again. Every ``ALMAREIA_LEDGER_CHECKPOINT_EVERY`` records
+    a checkpoint line goes to ``checkpoints.jsonl`` with the record count,
+    the position in the segments, the running hash, every box balance and
+    the timestamp range, signed with HMAC-SHA256. Verification and balance
+    queries start from the newest checkpoint they can use instead of
+    replaying the chain from genesis.
+
+    Segment files only grow, so (inode, size) identifies their content. A
+    torn last line from a crash is ignored on read and cut off by the next
+    append. Callers serialize writers (LedgerService holds its file lock).
+    """
+
+    def __init__(self, legacy_path, key_path=None):
+        self.legacy_path = os.path.abspath(legacy_path)
+        root, _ext = os.path.splitext(self.legacy_path)
+        self.dir = root + '.d'
+        self.checkpoints_path = os.path.join(self.dir, 'checkpoints.jsonl')
+        self.key_path = key_path or os.path.join(os.path.dirname(self.legacy_path), 'ledger_checkpoint.key')
+        self._lock = threading.RLock()
+        self._key = None
+        self._generation = None
+        self._cursor = None
+        self._checkpoints = []
+        self._checkpoints_offset = 0
+        self._trusted = []
+        self._trusted_error = None
+        self._rows = []
+        self._rows_pos = (1, 0)
+        self.counters = {'appends': 0, 'checkpoints_written': 0, 'migrated_records': 0, 'torn_tails': 0, 'replayed_records': 0}
+
+    # -- keys and signatures -------------------------------------------------
+
+    def _signing_key(self):
+        env_key = str(os.environ.get('ALMAREIA_LEDGER_CHECKPOINT_KEY') or '').strip()
+        if env_key:
+            return env_key.encode('utf-8')
+        if self._key is None:
+            try:
+                with open(self.key_path, 'rb') as f:
+                    self._key = f.read().strip()
+            except FileNotFoundError:
+                key = secrets.token_hex(32).encode('ascii')
+                os.makedirs(os.path.dirname(self.key_path), exist_ok=True)
+                fd = os.open(self.key_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(key)
+                self._key = key
+        return self._key
+
+    def _sign(self, checkpoint):
+        payload = {k: v for k, v in checkpoint.items() if k != 'sig'}
+        raw = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+        return hmac.new(self._signing_key(), raw.encode('utf-8'), hashlib.sha256).hexdigest()
+
+    def _checkpoint_is_valid(self, checkpoint):
+        sig = checkpoint.get('sig')
+        return isinstance(sig, str) and hmac.compare_digest(sig, self._sign(checkpoint))
+
+    # -- files ---------------------------------------------------------------
+
+    def segment_path(self, number):
+        return os.path.join(self.dir, f"segment_{number:06d}.jsonl")
+
+    def _segment_numbers(self):
+        try:
+            names = os.listdir(self.dir)
+        except FileNotFoundError:
+            return []
+        return sorted(int(m.group(1)) for m in map(_SEGMENT_RE.match, names) if m)
+
+    @staticmethod
+    def _read_lines(path, offset=0, end=None):
+        """Yields (record, offset_after) for each complete line from ``offset``."""
+        try:
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                chunk = f.read() if end is None else f.read(max(0, end - offset))
+        except FileNotFoundError:
+            return
+        for raw in chunk.splitlines(keepends=True):
+            if not raw.endswith(b'\n'):
+                return
+            offset += len(raw)
+            yield json.loads(raw.decode('utf-8')), offset
+
+    def _iter_records(self, start=(1, 0), stop=None):
+        """Records between two (segment, offset) positions, with their positions."""
+        numbers = [n for n in self._segment_numbers() if n >= start[0] and (stop is None or n <= stop[0])]
+        for number in numbers:
+            begin = start[1] if number == start[0] else 0
+            end = stop[1] if stop is not None and number == stop[0] else None
+            for record, offset in self._read_lines(self.segment_path(number), begin, end):
+                yield record, number, offset
+
+    def _dir_generation(self):
+        try:
+            return os.stat(self.dir).st_ino
+        except FileNotFoundError:
+            return None
+
+    # -- state ---------------------------------------------------------------
+
+    def _refresh_checkpoints(self):
+        try:
+            with open(self.checkpoints_path, 'rb') as f:
+                f.seek(self._checkpoints_offset)
+                chunk = f.read()
+        except FileNotFoundError:
+            return
+        for raw in chunk.splitlines(keepends=True):
+            if not raw.endswith(b'\n'):
+                break
+            self._checkpoints_offset += len(raw)
+            try:
+                self._checkpoints.append(json.loads(raw.decode('utf-8')))
+            except ValueError:
+                self._checkpoints.append({'corrupt': True})
+
+    def _refresh(self):
+        """Catches the cached cursor/checkpoints up with what is on disk."""
+        self._ensure_migrated()
+        generation = self._dir_generation()
+        # Anything rewritten in place instead of appended (a restore, a
+        # manual edit) leaves a cached position off a line boundary.
+        moved = (
+            not _at_line_boundary(self.checkpoints_path, self._checkpoints_offset)
+            or (self._cursor is not None and not _at_line_boundary(self.segment_path(self._cursor.segment), self._cursor.offset))
+            or not _at_line_boundary(self.segment_path(self._rows_pos[0]), self._rows_pos[1])
+        )
+        if generation != self._generation or moved:
+            self._generation = generation
+            self._cursor = None
+            self._checkpoints = []
+            self._checkpoints_offset = 0
+            self._trusted = []
+            self._trusted_error = None
+            self._rows = []
+            self._rows_pos = (1, 0)
+        self._refresh_checkpoints()
+        if self._cursor is None:
+            trusted = self.trusted_checkpoints()[0]
+            self._cursor = _Cursor.from_checkpoint(trusted[-1]) if trusted else _Cursor()
+        cursor = self._cursor
+        for record, segment, offset in self._iter_records((cursor.segment, cursor.offset)):
+            cursor.advance(record, segment, offset)
+            self.counters['replayed_records'] += 1
+        return cursor
+
+    def trusted_checkpoints(self):
+        """(valid checkpoints, error) — stops at the first bad signature."""
+        # Signatures are checked once per loaded checkpoint, not per query.
+        trusted = self._trusted
+        while self._trusted_error is None and len(trusted) < len(self._checkpoints):
+            checkpoint = self._checkpoints[len(trusted)]
+            if checkpoint.get('corrupt') or not self._checkpoint_is_valid(checkpoint):
+                self._trusted_error = f"Invalid checkpoint signature after record {trusted[-1]['count'] if trusted else 0}."
+            elif trusted and checkpoint['count'] <= trusted[-1]['count']:
+                self._trusted_error = f"Checkpoint out of order at record {checkpoint['count']}."
+            else:
+                trusted.append(checkpoint)
+        return list(trusted), self._trusted_error
+
+    def tail(self):
+        with self._lock:
+            cursor = self._refresh()
+            return cursor.count, cursor.last_hash
+
+    # -- writes --------------------------------------------------------------
+
+    def append(self, record):
+        """Appends one record whose ``previous_hash`` must be the current tip."""
+        with self._lock:
+            cursor = self._refresh()
+            if record.get('previous_hash') != cursor.last_hash:
+                raise ValueError("Ledger tip moved: previous_hash does not match")
+            os.makedirs(self.dir, exist_ok=True)
+            if self._generation is None:
+                self._generation = self._dir_generation()
+            segment, offset = cursor.segment, cursor.offset
+            if cursor.seg_count >= segment_records():
+                segment, offset = segment + 1, 0
+            path = self.segment_path(segment)
+            line = json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+            with open(path, 'ab') as f:
+                if f.tell() > offset:
+                    # Torn tail from an interrupted append.
+                    self.counters['torn_tails'] += 1
+                    f.truncate(offset)
+                f.write(line.encode('utf-8'))
+                f.flush()
+                os.fsync(f.fileno())
+                end = f.tell()
+            cursor.advance(record, segment, end)
+            self.counters['appends'] += 1
+            if cursor.count % checkpoint_every() == 0:
+                self._write_checkpoint(cursor)
+            return record
+
+    def _checkpoint_for(self, cursor):
+        checkpoint = {
+            'count': cursor.count,
+            'segment': cursor.segment,
+            'offset': cursor.offset,
+            'seg_count': cursor.seg_count,
+            'last_hash': cursor.last_hash,
+            'balances': dict(cursor.balances),
+            'max_ts': cursor.max_ts.isoformat() if cursor.max_ts else None,
+            # None when some record in the interval has no usable timestamp:
+            # balance queries then replay it instead of skipping it.
+            'interval_min_ts': None if cursor.interval_unknown or cursor.interval_min is None else cursor.interval_min.isoformat(),
+            'interval_max_ts': None if cursor.interval_unknown or cursor.interval_max is None else cursor.interval_max.isoformat(),
+            'created_at': datetime.now().isoformat(),
+        }
+        checkpoint['sig'] = self._sign(checkpoint)
+        return checkpoint
+
+    def _write_checkpoint(self, cursor):
+        checkpoint = self._checkpoint_for(cursor)
+        line = json.dumps(checkpoint, ensure_ascii=False, separators=(',', ':')) + '\n'
+        with open(self.checkpoints_path, 'ab') as f:
+            if f.tell() > self._checkpoints_offset:
+                f.truncate(self._checkpoints_offset)
+            f.write(line.encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+            self._checkpoints_offset = f.tell()
+        self._checkpoints.append(checkpoint)
+        cursor.interval_min = cursor.interval_max = None
+        cursor.interval_unknown = False
+        self.counters['checkpoints_written'] += 1
+
+    def _build_dir(self, target_dir, records):
+        """Writes ``records`` as a fresh segment directory; returns how many were written."""
+        staging = LedgerSegmentStore.__new__(LedgerSegmentStore)
+        staging.__dict__.update(self.__dict__)
+        staging._lock = threading.RLock()
+        staging.dir = target_dir
+        staging.checkpoints_path = os.path.join(target_dir, 'checkpoints.jsonl')
+        staging._checkpoints = []
+        staging._checkpoints_offset = 0
+        staging._trusted = []
+        staging._trusted_error = None
+        staging.counters = dict(self.counters)
+        os.makedirs(target_dir)
+        cursor = _Cursor()
+        handles = {}
+        chain_ok = True
+        try:
+            for record in records:
+                if cursor.seg_count >= segment_records():
+                    cursor.segment += 1
+                    cursor.seg_count = 0
+                    cursor.offset = 0
+                if cursor.segment not in handles:
+                    for handle in handles.values():
+                        handle.close()
+                    handles = {cursor.segment: open(staging.segment_path(cursor.segment), 'wb')}
+                handle = handles[cursor.segment]
+                handle.write((json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8'))
+                # Only the prefix whose hashes check out gets signed checkpoints;
+                # a broken legacy chain stays visible to verify_integrity.
+                chain_ok = chain_ok and record.get('previous_hash') == cursor.last_hash
+                cursor.advance(record, cursor.segment, handle.tell())
+                if cursor.count % checkpoint_every() == 0 and chain_ok:
+                    handle.flush()
+                    staging._write_checkpoint(cursor)
+        finally:
+            for handle in handles.values():
+                handle.close()
+        return cursor.count
+
+    def _ensure_migrated(self):
+        """Moves a legacy ``financial_ledger.json`` array into segments once."""
+        if os.path.isdir(self.dir) or not os.path.exists(self.legacy_path):
+            return
+        try:
+            with open(self.legacy_path, 'r', encoding='utf-8') as f:
+                records = json.load(f)
+        except (ValueError, OSError) as e:
+            logger.error(f"ledger_migration_read_failed path={self.legacy_path} error={e}")
+            return
+        records = [r for r in records if isinstance(r, dict)] if isinstance(records, list) else []
+        self._replace_dir(records)
+        self.counters['migrated_records'] += len(records)
+        try:
+            os.replace(self.legacy_path, self.legacy_path + '.migrated')
+        except OSError as e:
+            logger.warning(f"ledger_migration_rename_failed path={self.legacy_path} error={e}")
+
+    def _replace_dir(self, records):
+        staging_dir = f"{self.dir}.tmp.{uuid.uuid4().hex}"
+        old_dir = None
+        try:
+            self._build_dir(staging_dir, records)
+            if os.path.isdir(self.dir):
+                old_dir = f"{self.dir}.old.{uuid.uuid4().hex}"
+                os.replace(self.dir, old_dir)
+            try:
+                os.replace(staging_dir, self.dir)
+            except OSError:
+                if old_dir:
+                    os.replace(old_dir, self.dir)
+                    old_dir = None
+                raise
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+        if old_dir:
+            shutil.rmtree(old_dir, ignore_errors=True)
+        self._generation = object()  # forces a reload on the next _refresh
+
+    def replace(self, records):
+        """Rewrites the whole ledger (no hash recomputation) from ``records``."""
+        with self._lock:
+            self._ensure_migrated()
+            self._replace_dir([r for r in records or [] if isinstance(r, dict)])
+            return True
+
+    # -- reads ---------------------------------------------------------------
+
+    def records(self):
+        """Every record in chain order (a private copy for the caller)."""
+        with self._lock:
+            self._refresh()
+            for record, segment, offset in self._iter_records(self._rows_pos):
+                self._rows.append(record)
+                self._rows_pos = (segment, offset)
+            return marshal.loads(marshal.dumps(self._rows))
+
+    def find(self, record_id):
+        for record in self.records():
+            if record.get('id') == record_id:
+                return record
+        return None
+
+    def balance(self, box_name, cutoff_dt=None):
+        """
+        Balance of ``box_name`` from the checkpoints plus the records they do
+        not cover. With ``cutoff_dt`` only records at or before it count:
+        the base is the newest checkpoint whose whole history is older than
+        the cutoff, and later intervals that start after it are skipped.
+        """
+        with self._lock:
+            cursor = self._refresh()
+            if cutoff_dt is None:
+                return cursor.balances.get(box_name, 0.0)
+            trusted = self.trusted_checkpoints()[0]
+        base = None
+        later = []
+        for checkpoint in trusted:
+            max_ts = _parse_ts(checkpoint.get('max_ts'))
+            if not later and max_ts is not None and max_ts <= cutoff_dt:
+                base = checkpoint
+            else:
+                later.append(checkpoint)
+        balance = base['balances'].get(box_name, 0.0) if base else 0.0
+        position = (base['segment'], base['offset']) if base else (1, 0)
+        for checkpoint in later + [None]:
+            stop = (checkpoint['segment'], checkpoint['offset']) if checkpoint else None
+            min_ts = _parse_ts(checkpoint.get('interval_min_ts')) if checkpoint else None
+            if min_ts is None or min_ts <= cutoff_dt:
+                for record, _segment, _offset in self._iter_records(position, stop):
+                    if datetime.fromisoformat(record['timestamp']) > cutoff_dt:
+                        continue
+                    value = float(record['value'])
+                    if record['dest_box'] == box_name:
+                        balance += value
+                    elif record['source_box'] == box_name:
+                        balance -= value
+            if stop is not None:
+                position = stop
+        return balance
+
+    def verify(self, calculate_hash, full=False):
+        """
+        Checks the chain from the newest trusted checkpoint (or genesis
+        with ``full=True``, which also checks every checkpoint's hash and
+        balances against the records). Returns (bool, message).
+        """
+        with self._lock:
+            try:
+                self._refresh()
+            except (ValueError, KeyError) as e:
+                self._cursor = None
+                return False, f"Unreadable ledger segment: {e}"
+            trusted, error = self.trusted_checkpoints()
+            if error:
+                return False, error
+            start = trusted[-1] if trusted and not full else None
+            expected_prev_hash = start['last_hash'] if start else GENESIS_HASH
+            index = start['count'] if start else 0
+            position = (start['segment'], start['offset']) if start else (1, 0)
+            if start:
+                try:
+                    size = os.path.getsize(self.segment_path(start['segment']))
+                except OSError:
+                    size = -1
+                if size < start['offset']:
+                    return False, f"Segment {start['segment']} truncated before checkpoint at record {index}."
+            pending = {cp['count']: cp for cp in trusted} if full else {}
+            balances = {}
+            seen = False
+            try:
+                for record, _segment, _offset in self._iter_records(position):
+                    seen = True
+                    if record['previous_hash'] != expected_prev_hash:
+                        return False, f"Broken chain at index {index} (ID: {record['id']}). Prev hash mismatch."
+                    if calculate_hash(record, expected_prev_hash) != record['current_hash']:
+                        return False, f"Data tampering detected at index {index} (ID: {record['id']}). Hash mismatch."
+                    expected_prev_hash = record['current_hash']
+                    index += 1
+                    if full:
+                        _apply_balance(balances, record)
+                        checkpoint = pending.get(index)
+                        if checkpoint and (checkpoint['last_hash'] != expected_prev_hash or checkpoint['balances'] != balances):
+                            return False, f"Checkpoint at record {index} does not match the chain."
+            except (ValueError, KeyError) as e:
+                return False, f"Unreadable record at index {index}: {e}"
+            if not seen and not trusted:
+                return True, "Ledger empty"
+            if start:
+                return True, f"Ledger integrity verified from checkpoint {start['count']} ({index - start['count']} new records)"
+            return True, "Ledger integrity verified"
+
+    def stats(self):
+        with self._lock:
+            cursor = self._refresh()
+            return {
+                'dir': self.dir,
+                'records': cursor.count,
+                'segments': len(self._segment_numbers()),
+                'checkpoints': len(self._checkpoints),
+                'checkpoint_every': checkpoint_every(),
+                **self.counters,
+            }
+
+
+_STORES = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_ledger_segment_store(legacy_path):
+    key = os.path.abspath(legacy_path)
+    with _STORES_LOCK:
+        store = _STORES.get(key)
+        if store is None:
+            store = LedgerSegmentStore(legacy_path)
+            _STORES[key] = store
+        return store
+
+
+def _benchmark(num_records=100000, queries=20):
+    """Balance-as-of queries on a synthetic chain: full replay vs checkpoints."""
+    import tempfile
+    import time
+    from datetime import timedelta
+
+    start = datetime(2026, 1, 1)
+    boxes = ['Caixa Restaurante', 'Caixa Recepção', 'EXTERNO']
+    records = []
+    previous_hash = GENESIS_HASH
+    for idx in range(num_records):
+        record = {
+            'id': str(idx), 'timestamp': (start + timedelta(minutes=idx)).isoformat(),
+            'source_box': boxes[idx % 3], 'dest_box': boxes[(idx + 1) % 3],
+            'value': float(idx % 97), 'previous_hash': previous_hash,
+        }
+        record['current_hash'] = previous_hash = hashlib.sha256(f"{previous_hash}|{idx}".encode()).hexdigest()
+        records.append(record)
+    cutoffs = [start + timedelta(minutes=num_records * (q + 1) // (queries + 1)) for q in range(queries)]
+
+    started = time.perf_counter()
+    for cutoff in cutoffs:
+        balance = 0.0
+        for tx in records:
+            if datetime.fromisoformat(tx['timestamp']) > cutoff:
+                continue
+            if tx['dest_box'] == boxes[0]:
+                balance += tx['value']
+            elif tx['source_box'] == boxes[0]:
+                balance -= tx['value']
+    replay = time.perf_counter() - started
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = LedgerSegmentStore(os.path.join(tmp, 'financial_ledger.json'))
+        store.replace(records)
+        started = time.perf_counter()
+        for cutoff in cutoffs:
+            store.balance(boxes[0], cutoff)
+        indexed = time.perf_counter() - started
+    return {'replay_s': round(replay, 4), 'checkpoint_s': round(indexed, 4)}
+
+
+if __name__ == '__main__':
+    print(_benchmark())
@@ -1,4 +1,3 @@
-import json
 import os
 import hashlib
 import time
@@ -6,6 +5,7 @@ import uuid
 from datetime import datetime
 from contextlib import contextmanager
 from app.services.system_config_manager import FINANCIAL_LEDGER_FILE
+from app.services.ledger_segment_store import get_ledger_segment_store
 
 # --- File Locking Mechanism (copied from transfer_service.py for consistency) ---
 @contextmanager
@@ -62,32 +62,29 @@ class LedgerService:
         )
         return hashlib.sha256(payload.encode('utf-8')).hexdigest()
 
+    @staticmethod
+    def _store():
+        return get_ledger_segment_store(LedgerService.FILE_PATH)
+
     @staticmethod
     def _load_ledger():
-        if not os.path.exists(LedgerService.FILE_PATH):
-            return []
         try:
-            with open(LedgerService.FILE_PATH, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, OSError):
+            return LedgerService._store().records()
+        except (ValueError, OSError):
             return []
 
     @staticmethod
     def _save_ledger(data):
-        # Atomic write
-        temp_path = LedgerService.FILE_PATH + '.tmp'
-        try:
-            with open(temp_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=4, ensure_ascii=False)
-            
-            if os.path.exists(LedgerService.FILE_PATH):
-                os.replace(temp_path, LedgerService.FILE_PATH)
-            else:
-                os.rename(temp_path, LedgerService.FILE_PATH)
-        except Exception as e:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-            raise e
+        # Full rewrite; normal writes append through _append_record.
+        LedgerService._store().replace(data)
+
+    @classmethod
+    def _append_record(cls, record):
+        """Chains ``record`` to the current tip and appends it (caller holds the lock)."""
+        _count, previous_hash = cls._store().tail()
+        record['previous_hash'] = previous_hash
+        record['current_hash'] = cls._calculate_hash(record, previous_hash)
+        return cls._store().append(record)
 
     @classmethod
     def record_transaction(cls, user, source_box, dest_box, operation_type, value, payment_method, reference):
@@ -103,14 +100,6 @@ class LedgerService:
             raise ValueError("Invalid value amount")
 
         with file_lock(cls.FILE_PATH):
-            ledger = cls._load_ledger()
-            
-            # Determine previous hash
-            if not ledger:
-                previous_hash = "0" * 64 # Genesis hash
-            else:
-                previous_hash = ledger[-1].get('current_hash')
-
             new_record = {
                 'id': str(uuid.uuid4()),
                 'timestamp': timestamp,
@@ -121,17 +110,8 @@ class LedgerService:
                 'value': value,
                 'payment_method': payment_method,
                 'reference': reference,
-                'previous_hash': previous_hash
             }
-
-            # Calculate and append current hash
-            current_hash = cls._calculate_hash(new_record, previous_hash)
-            new_record['current_hash'] = current_hash
-
-            ledger.append(new_record)
-            cls._save_ledger(ledger)
-            
-            return new_record
+            return cls._append_record(new_record)
 
     @classmethod
     def reverse_transaction(cls, original_tx_id, user, reason):
@@ -140,10 +120,8 @@ class LedgerService:
         Does NOT delete the original.
         """
         with file_lock(cls.FILE_PATH):
-            ledger = cls._load_ledger()
-            
             # Find original transaction
-            original_tx = next((item for item in ledger if item["id"] == original_tx_id), None)
+            original_tx = cls._store().find(original_tx_id)
             
             if not original_tx:
                 raise ValueError("Transaction not found")
@@ -155,8 +133,6 @@ class LedgerService:
             # Reversal swaps source/dest logic or just negates value? 
             # Usually for a ledger, we want to show money moving back.
             # So Source becomes Dest, Dest becomes Source.
-            
-            previous_hash = ledger[-1].get('current_hash')
             timestamp = datetime.now().isoformat()
             
             reversal_record = {
@@ -169,44 +145,19 @@ class LedgerService:
                 'value': original_tx['value'],
                 'payment_method': original_tx['payment_method'],
                 'reference': f"ESTORNO: {reason} (Ref: {original_tx_id})",
-                'previous_hash': previous_hash
             }
-
-            current_hash = cls._calculate_hash(reversal_record, previous_hash)
-            reversal_record['current_hash'] = current_hash
-
-            ledger.append(reversal_record)
-            cls._save_ledger(ledger)
-            
-            return reversal_record
+            return cls._append_record(reversal_record)
 
     @classmethod
-    def verify_integrity(cls):
+    def verify_integrity(cls, full=False):
         """
-        Verifies the cryptographic integrity of the entire ledger.
+        Verifies the cryptographic integrity of the ledger.
+        Starts from the last signed checkpoint; ``full=True`` re-hashes
+        the whole chain from genesis and cross-checks every checkpoint.
         Returns (bool, message)
         """
         with file_lock(cls.FILE_PATH):
-            ledger = cls._load_ledger()
-            
-            if not ledger:
-                return True, "Ledger empty"
-
-            expected_prev_hash = "0" * 64
-            
-            for i, record in enumerate(ledger):
-                # 1. Check if previous hash matches the chain
-                if record['previous_hash'] != expected_prev_hash:
-                    return False, f"Broken chain at index {i} (ID: {record['id']}). Prev hash mismatch."
-                
-                # 2. Check if current hash is valid
-                calculated_hash = cls._calculate_hash(record, expected_prev_hash)
-                if calculated_hash != record['current_hash']:
-                    return False, f"Data tampering detected at index {i} (ID: {record['id']}). Hash mismatch."
-                
-                expected_prev_hash = record['current_hash']
-                
-            return True, "Ledger integrity verified"
+            return cls._store().verify(cls._calculate_hash, full=full)
 
     @classmethod
     def get_transactions(cls, filters=None):
@@ -232,12 +183,10 @@ class LedgerService:
     @classmethod
     def rebuild_balance(cls, box_name, date_cutoff=None):
         """
-        Reconstrói o saldo de um caixa específico a partir do zero usando o Ledger Imutável.
+        Saldo de um caixa específico segundo o Ledger Imutável.
         date_cutoff: se fornecido, calcula o saldo até essa data (inclusive).
+        Parte dos checkpoints assinados e só relê as transações que eles não cobrem.
         """
-        ledger = cls._load_ledger()
-        balance = 0.0
-        
         cutoff_dt = None
         if date_cutoff:
             try:
@@ -245,23 +194,8 @@ class LedgerService:
             except:
                 pass
 
-        for tx in ledger:
-            # Check Date
-            if cutoff_dt:
-                tx_dt = datetime.fromisoformat(tx['timestamp'])
-                if tx_dt > cutoff_dt:
-                    continue
-
-            value = float(tx['value'])
-            
-            # Logic: 
-            # If box is DESTINATION -> Money IN (+ value)
-            # If box is SOURCE -> Money OUT (- value)
-            # REVERSAL is just a transaction with swapped source/dest, so logic holds.
-            
-            if tx['dest_box'] == box_name:
-                balance += value
-            elif tx['source_box'] == box_name:
-                balance -= value
-                
-        return balance
+        # Logic: 
+        # If box is DESTINATION -> Money IN (+ value)
+        # If box is SOURCE -> Money OUT (- value)
+        # REVERSAL is just a transaction with swapped source/dest, so logic holds.
+        return cls._store().balance(box_name, cutoff_dt)
@@ -0,0 +1,266 @@
+import codecs
+import json
+import logging
+import os
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+from app.services.json_document_cache import is_racy
+
+
+SIDECAR_VERSION = 1
+SIDECAR_SUFFIX = '.dates.idx'
+CHUNK_SIZE = 64 * 1024
+# Rows whose date cannot be parsed are indexed under this ordinal.
+NO_DATE = -1
+DATE_FORMATS = ('%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d/%m/%Y', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d')
+
+logger = logging.getLogger(__name__)
+_WS = ' \t\r\n'
+
+
+def parse_row_date(value):
+    text = str(value or '').strip()
+    if not text:
+        return None
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    try:
+        return datetime.fromisoformat(text).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+class NotAJsonArray(ValueError):
+    pass
+
+
+def iter_json_array(f, chunk_size=CHUNK_SIZE):
+    """
+    Incrementally parses a JSON array from binary file ``f``.
+
+    Yields ``(byte_offset, byte_length, value)`` per element while holding
+    at most one chunk plus one element in memory.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    buf = ''
+    pos = 0
+    byte_pos = 0  # file offset of buf[pos]
+    eof = False
+    opened = False
+
+    def fill():
+        nonlocal buf, pos, eof
+        chunk = f.read(chunk_size)
+        if not chunk:
+            eof = True
+            buf = buf[pos:] + utf8.decode(b'', final=True)
+        else:
+            buf = buf[pos:] + utf8.decode(chunk)
+        pos = 0
+
+    def skip(chars):
+        nonlocal pos, byte_pos
+        start = pos
+        while True:
+            while pos < len(buf) and buf[pos] in chars:
+                pos += 1
+            if pos < len(buf) or eof:
+                break
+            byte_pos += len(buf[start:pos].encode('utf-8'))
+            fill()
+            start = pos
+        byte_pos += len(buf[start:pos].encode('utf-8'))
+
+    fill()
+    if buf.startswith('\ufeff'):
+        buf = buf[1:]
+        byte_pos = 3
+    while True:
+        skip(_WS + (',' if opened else ''))
+        if pos >= len(buf):
+            raise NotAJsonArray('unexpected end of JSON array')
+        if not opened:
+            if buf[pos] != '[':
+                raise NotAJsonArray('document is not a JSON array')
+            pos += 1
+            byte_pos += 1
+            opened = True
+            continue
+        if buf[pos] == ']':
+            return
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill()
+                continue
+            if end == len(buf) and not eof:
+                # A number may continue in the next chunk.
+                fill()
+                continue
+            break
+        length = len(buf[pos:end].encode('utf-8'))
+        yield byte_pos, length, value
+        byte_pos += length
+        pos = end
+
+
+def sidecar_path_for(path):
+    root, _ext = os.path.splitext(os.path.abspath(path))
+    return root + SIDECAR_SUFFIX
+
+
+def _fstat_token(f):
+    # stat_token layout, as a list: it is persisted in the sidecar file.
+    st = os.fstat(f.fileno())
+    return [int(st.st_mtime_ns), int(st.st_size), int(st.st_ino)]
+
+
+class DateSidecar:
+    """
+    Per-file date index for a JSON-array ledger: one (day ordinal, byte
+    offset, byte length) triple per row, sorted by day. A date-window query
+    bisects the ordinals and reads only the matching byte ranges.
+    """
+
+    def __init__(self, token, extractor, ordinals, offsets, lengths):
+        self.token = token
+        self.extractor = extractor
+        self.ordinals = ordinals
+        self.offsets = offsets
+        self.lengths = lengths
+
+    @classmethod
+    def build(cls, f, token, extractor, date_of):
+        triples = []
+        for offset, length, row in iter_json_array(f):
+            when = date_of(row)
+            triples.append((when.toordinal() if when else NO_DATE, offset, length))
+        triples.sort()
+        return cls(token, extractor, [t[0] for t in triples], [t[1] for t in triples], [t[2] for t in triples])
+
+    def window(self, start=None, end=None):
+        """Byte ranges of rows dated within the day window, in file order."""
+        lo = bisect_left(self.ordinals, start.toordinal() if start else NO_DATE + 1)
+        hi = bisect_right(self.ordinals, end.toordinal()) if end else len(self.ordinals)
+        return sorted(zip(self.offsets[lo:hi], self.lengths[lo:hi]))
+
+    def to_payload(self):
+        return {
+            'version': SIDECAR_VERSION,
+            'token': self.token,
+            'extractor': self.extractor,
+            'ordinals': self.ordinals,
+            'offsets': self.offsets,
+            'lengths': self.lengths,
+        }
+
+    @classmethod
+    def from_payload(cls, payload):
+        if not isinstance(payload, dict) or payload.get('version') != SIDECAR_VERSION:
+            return None
+        return cls(payload.get('token'), payload.get('extractor'), payload['ordinals'], payload['offsets'], payload['lengths'])
+
+
+class LedgerStreamIndex:
+    """Keeps the date sidecars of ledger files in memory and on disk."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sidecars = {}
+        self.counters = {'sidecar_builds': 0, 'sidecar_loads': 0, 'sidecar_hits': 0, 'rows_read': 0}
+
+    def _sidecar(self, path, f, extractor, date_of):
+        token = _fstat_token(f)
+        key = os.path.abspath(path)
+        with self._lock:
+            cached = self._sidecars.get(key)
+        if cached and cached.token == token and cached.extractor == extractor:
+            self.counters['sidecar_hits'] += 1
+            return cached
+        sidecar = self._read_sidecar_file(path, token, extractor)
+        if sidecar is None:
+            f.seek(0)
+            sidecar = DateSidecar.build(f, token, extractor, date_of)
+            self.counters['sidecar_builds'] += 1
+            # The sidecar of a racy file is used once, not persisted.
+            if is_racy(token):
+                return sidecar
+            self._write_sidecar_file(path, sidecar)
+        with self._lock:
+            self._sidecars[key] = sidecar
+        return sidecar
+
+    def _read_sidecar_file(self, path, token, extractor):
+        target = sidecar_path_for(path)
+        if not os.path.exists(target):
+            return None
+        try:
+            with open(target, 'r', encoding='utf-8') as sf:
+                sidecar = DateSidecar.from_payload(json.load(sf))
+        except Exception as e:
+            logger.warning(f"ledger_sidecar_unreadable path={target} error={e}")
+            return None
+        if sidecar is None or sidecar.token != token or sidecar.extractor != extractor:
+            return None
+        self.counters['sidecar_loads'] += 1
+        return sidecar
+
+    def _write_sidecar_file(self, path, sidecar):
+        target = sidecar_path_for(path)
+        tmp_path = f"{target}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as sf:
+                json.dump(sidecar.to_payload(), sf, separators=(',', ':'))
+            os.replace(tmp_path, target)
+        except OSError as e:
+            logger.warning(f"ledger_sidecar_write_failed path={target} error={e}")
+
+    def iter_range(self, path, start=None, end=None, date_of=None, extractor=None):
+        """
+        Yields rows of the JSON array at ``path`` with ``date_of(row)`` in
+        [start, end]. With no bounds it streams every row in file order.
+        Raises NotAJsonArray (or a JSON error) if the file is not an array.
+        """
+        with open(path, 'rb') as f:
+            if start is None and end is None:
+                for _offset, _length, row in iter_json_array(f):
+                    self.counters['rows_read'] += 1
+                    yield row
+                return
+            extractor = extractor or getattr(date_of, '__qualname__', 'date')
+            sidecar = self._sidecar(path, f, extractor, date_of)
+            for offset, length in sidecar.window(start, end):
+                f.seek(offset)
+                row = json.loads(f.read(length).decode('utf-8'))
+                self.counters['rows_read'] += 1
+                # The sidecar works in whole days; the exact bounds are checked here.
+                if in_window(row, start, end, date_of):
+                    yield row
+
+    def stats(self):
+        with self._lock:
+            cached = len(self._sidecars)
+        return {'cached_sidecars': cached, **self.counters}
+
+
+_INDEX = LedgerStreamIndex()
+
+
+def get_ledger_stream_index():
+    return _INDEX
+
+
+def in_window(row, start, end, date_of):
+    if start is None and end is None:
+        return True
+    when = date_of(row) if date_of else None
+    return when is not None and (start is None or when >= start) and (end is None or when <= end)
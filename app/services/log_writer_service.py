@@ -0,0 +1,229 @@
+import atexit
+import os
+import queue
+import threading
+import time
+import traceback
+
+
+DEFAULT_QUEUE_MAX = 10000
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_FLUSH_INTERVAL_MS = 500
+SHUTDOWN_DRAIN_SECONDS = 5.0
+# Old-log cleanup used to run on ~1% of inserts; keep the same cadence per row.
+CLEANUP_EVERY_ROWS = 100
+# Severities that are never dropped on overflow: they are written inline instead.
+INLINE_ON_OVERFLOW = ('CRITICAL', 'ERROR')
+
+
+def _env_int(name, default):
+    raw = str(os.environ.get(name) or '').strip()
+    if not raw:
+        return default
+    try:
+        return max(1, int(raw))
+    except ValueError:
+        return default
+
+
+def async_logging_enabled():
+    raw = str(os.environ.get('ALMAREIA_LOG_ASYNC', '1') or '1').strip().lower()
+    return raw not in ('0', 'false', 'no', 'off')
+
+
+def flush_policy():
+    return {
+        'queue_max': _env_int('ALMAREIA_LOG_QUEUE_MAX', DEFAULT_QUEUE_MAX),
+        'batch_size': _env_int('ALMAREIA_LOG_BATCH_SIZE', DEFAULT_BATCH_SIZE),
+        'flush_interval_ms': _env_int('ALMAREIA_LOG_FLUSH_INTERVAL_MS', DEFAULT_FLUSH_INTERVAL_MS),
+    }
+
+
+class BatchedLogWriter:
+    """
+    Background writer for department action logs.
+
+    Request threads only build the row and put it on a bounded queue; a
+    single daemon thread commits rows in batches (``batch_size`` rows or
+    ``flush_interval_ms``, whichever comes first), so one SQLite commit
+    covers many log lines. ``write_batch(app, rows)`` does the actual
+    insert and is injected so the writer stays independent of the models.
+    """
+
+    def __init__(self, write_batch, queue_max=DEFAULT_QUEUE_MAX, batch_size=DEFAULT_BATCH_SIZE,
+                 flush_interval_ms=DEFAULT_FLUSH_INTERVAL_MS, after_flush=None):
+        self.write_batch = write_batch
+        self.after_flush = after_flush
+        self.queue_max = int(queue_max)
+        self.batch_size = int(batch_size)
+        self.flush_interval = float(flush_interval_ms) / 1000.0
+        self._queue = queue.Queue(maxsize=self.queue_max)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._in_flight = 0
+        self._thread = None
+        self._stopping = False
+        self.counters = {
+            'enqueued': 0,
+            'written': 0,
+            'dropped': 0,
+            'failed': 0,
+            'flushes': 0,
+            'inline_writes': 0,
+            'last_batch_size': 0,
+            'last_flush_ms': None,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+        }
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+            self._thread.start()
+
+    def submit(self, app, row):
+        """Queues ``row`` for ``app``; returns False only if it was dropped."""
+        self._ensure_thread()
+        with self._lock:
+            try:
+                self._queue.put_nowait((app, row))
+            except queue.Full:
+                inline = str(row.get('nivel_severidade') or '').upper() in INLINE_ON_OVERFLOW
+                self.counters['inline_writes' if inline else 'dropped'] += 1
+            else:
+                self._in_flight += 1
+                self.counters['enqueued'] += 1
+                return True
+        if inline:
+            return self._write([(app, row)])
+        return False
+
+    def _take_batch(self):
+        try:
+            first = self._queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch:
+                self._write(batch)
+                with self._idle:
+                    self._in_flight -= len(batch)
+                    self._idle.notify_all()
+            elif self._stopping:
+                return
+
+    def _write(self, batch):
+        started = time.perf_counter()
+        ok = True
+        by_app = {}
+        for app, row in batch:
+            by_app.setdefault(id(app), (app, []))[1].append(row)
+        for app, rows in by_app.values():
+            try:
+                self.write_batch(app, rows)
+                self.counters['written'] += len(rows)
+            except Exception as e:
+                ok = False
+                self.counters['failed'] += len(rows)
+                print(f"ERRO CRÍTICO AO SALVAR LOG: {type(e).__name__}: {e}")
+                traceback.print_exc()
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        self.counters['flushes'] += 1
+        self.counters['last_batch_size'] = len(batch)
+        self.counters['last_flush_ms'] = round(elapsed_ms, 3)
+        self.counters['total_flush_ms'] += elapsed_ms
+        self.counters['max_flush_ms'] = max(self.counters['max_flush_ms'], round(elapsed_ms, 3))
+        if ok and self.after_flush:
+            for app, rows in by_app.values():
+                try:
+                    self.after_flush(app, len(rows))
+                except Exception as e:
+                    print(f"LoggerService after-flush hook failed: {e}")
+        return ok
+
+    def flush(self, timeout=SHUTDOWN_DRAIN_SECONDS):
+        """Waits until every queued row has been written; returns True if drained."""
+        deadline = time.monotonic() + max(0.0, float(timeout))
+        with self._idle:
+            while self._in_flight > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def shutdown(self, timeout=SHUTDOWN_DRAIN_SECONDS):
+        drained = self.flush(timeout)
+        self._stopping = True
+        if not drained:
+            print(f"LoggerService: {self._queue.qsize()} log(s) not written at shutdown.")
+        return drained
+
+    def stats(self):
+        flushes = self.counters['flushes']
+        data = dict(self.counters)
+        data['queue_depth'] = self._queue.qsize()
+        data['queue_max'] = self.queue_max
+        data['batch_size'] = self.batch_size
+        data['flush_interval_ms'] = int(self.flush_interval * 1000)
+        data['avg_flush_ms'] = round(data.pop('total_flush_ms') / flushes, 3) if flushes else None
+        return data
+
+
+def _apply_sqlite_pragmas(dbapi_connection, _record):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+    finally:
+        cursor.close()
+
+
+def enable_sqlite_wal(engine):
+    """
+    Puts a SQLite database in WAL mode with synchronous=NORMAL on every
+    pooled connection (synchronous is per connection). No-op elsewhere.
+    """
+    if engine.dialect.name != 'sqlite':
+        return False
+    from sqlalchemy import event
+    if not event.contains(engine, 'connect', _apply_sqlite_pragmas):
+        event.listen(engine, 'connect', _apply_sqlite_pragmas)
+        engine.dispose()
+    with engine.connect() as conn:
+        mode = conn.exec_driver_sql('PRAGMA journal_mode').scalar()
+    return str(mode).lower() == 'wal'
+
+
+_WRITER = None
+_WRITER_LOCK = threading.Lock()
+
+
+def get_log_writer(write_batch, after_flush=None):
+    global _WRITER
+    with _WRITER_LOCK:
+        if _WRITER is None:
+            _WRITER = BatchedLogWriter(write_batch, after_flush=after_flush, **flush_policy())
+            atexit.register(_WRITER.shutdown)
+        return _WRITER
+
+
+def current_log_writer():
+    return _WRITER
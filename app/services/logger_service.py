@@ -6,18 +6,35 @@ import traceback
 import random
 import os
 from datetime import datetime, timedelta
+from app.services.log_writer_service import (
+    CLEANUP_EVERY_ROWS, async_logging_enabled, current_log_writer,
+    enable_sqlite_wal, get_log_writer
+)
 
 class LoggerService:
     _app = None
+    _rows_since_cleanup = 0
 
     @staticmethod
     def init_app(app):
         LoggerService._app = app
+        if str(os.environ.get('ALMAREIA_LOG_SQLITE_WAL', '1')).strip().lower() not in ('0', 'false', 'no', 'off'):
+            try:
+                with app.app_context():
+                    enable_sqlite_wal(db.engine)
+            except Exception as e:
+                print(f"LoggerService: não foi possível ativar WAL: {e}")
 
     @staticmethod
     def log_acao(acao, entidade, detalhes=None, nivel_severidade='INFO', departamento_id=None, colaborador_id=None):
         """
         Registra uma ação no sistema de logs departamental.
+
+        Retorna True quando a linha foi gravada ou, com a gravação em lote
+        (ALMAREIA_LOG_ASYNC), apenas enfileirada: nesse caso uma falha do
+        commit aparece depois, no log de erros e no contador ``failed`` de
+        ``pipeline_stats()``. Retorna False se a linha foi descartada ou não
+        pôde ser gravada.
         """
         # Ensure we are in an application context
         try:
@@ -66,16 +83,23 @@ class LoggerService:
                 else:
                     detalhes_str = str(detalhes)
             
-            new_log = LogAcaoDepartamento(
-                departamento_id=str(departamento_id),
-                colaborador_id=str(colaborador_id),
-                acao=acao,
-                entidade=entidade,
-                detalhes=detalhes_str,
-                nivel_severidade=nivel_severidade
-            )
-            
-            db.session.add(new_log)
+            row = {
+                'timestamp': datetime.now(),
+                'departamento_id': str(departamento_id),
+                'colaborador_id': str(colaborador_id),
+                'acao': acao,
+                'entidade': entidade,
+                'detalhes': detalhes_str,
+                'nivel_severidade': nivel_severidade
+            }
+
+            if async_logging_enabled():
+                # Gravação em lote numa thread de fundo; a requisição não espera o commit
+                # e True aqui significa "enfileirada" (ver log_acao).
+                writer = get_log_writer(LoggerService._write_batch, after_flush=LoggerService._after_flush)
+                return writer.submit(current_app._get_current_object(), row)
+
+            db.session.add(LogAcaoDepartamento(**row))
             db.session.commit()
             
             # Executa limpeza de logs antigos ocasionalmente (1% das vezes)
@@ -88,6 +112,42 @@ class LoggerService:
             traceback.print_exc()
             return False
 
+    @staticmethod
+    def _write_batch(app, rows):
+        with app.app_context():
+            try:
+                db.session.add_all([LogAcaoDepartamento(**row) for row in rows])
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+    @staticmethod
+    def _after_flush(app, written):
+        LoggerService._rows_since_cleanup += written
+        if LoggerService._rows_since_cleanup >= CLEANUP_EVERY_ROWS:
+            LoggerService._rows_since_cleanup = 0
+            with app.app_context():
+                LoggerService.cleanup_logs()
+
+    @staticmethod
+    def flush(timeout=5.0):
+        """Aguarda a gravação dos logs pendentes na fila."""
+        writer = current_log_writer()
+        return writer.flush(timeout) if writer else True
+
+    @staticmethod
+    def shutdown(timeout=5.0):
+        writer = current_log_writer()
+        return writer.shutdown(timeout) if writer else True
+
+    @staticmethod
+    def pipeline_stats():
+        writer = current_log_writer()
+        stats = writer.stats() if writer else {'queue_depth': 0, 'enqueued': 0, 'written': 0, 'dropped': 0}
+        stats['async'] = async_logging_enabled()
+        return stats
+
     @staticmethod
     def cleanup_logs(retention_days=45):
         """
@@ -109,6 +169,8 @@ class LoggerService:
         """
         Recupera logs com filtros e paginação.
         """
+        # Logs ainda na fila também devem aparecer na consulta.
+        LoggerService.flush(timeout=1.0)
         query = LogAcaoDepartamento.query
         
         if departamento_id:
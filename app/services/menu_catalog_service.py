@@ -0,0 +1,256 @@
+import threading
+import time
+
+from app.services import data_service
+from app.services.json_document_cache import is_racy, stat_token
+from app.services.system_config_manager import MENU_ITEMS_FILE, PRODUCTS_FILE, get_legacy_root_json_path
+
+
+class RecipeLine:
+    """One recipe ingredient already resolved to its stock product (insumo)."""
+
+    __slots__ = ('insumo', 'key', 'ingredient_id', 'qty')
+
+    def __init__(self, insumo, key, ingredient_id, qty):
+        self.insumo = insumo
+        self.key = key
+        self.ingredient_id = ingredient_id
+        # None when the recipe quantity is not a number.
+        self.qty = qty
+
+    def __repr__(self):
+        return f"RecipeLine({self.key!r}, qty={self.qty!r})"
+
+
+def build_print_routes(menu_items):
+    """{menu item name: {'should_print', 'printer_id'}} as used by print_order_items."""
+    routes = {}
+    for item in menu_items or []:
+        if not isinstance(item, dict):
+            continue
+        name = item.get('name')
+        if not name:
+            continue
+        routes[name] = {
+            'should_print': item.get('should_print', True),
+            'printer_id': item.get('printer_id'),
+        }
+    return routes
+
+
+class MenuCatalog:
+    """
+    Read-only lookup tables over menu_items.json and products.json.
+
+    Menu items and stock products are indexed by id and name (ids: last
+    row wins, like the id maps the routes used to build; names: first row
+    wins, like the ``next(...)`` scans), menu items also by category, and
+    every recipe is expanded once into ``RecipeLine``s pointing at the
+    stock product it consumes. The dicts are shared by every request
+    using the same catalog: callers must not mutate them.
+
+    Duplicated menu ids or names resolve differently depending on the path
+    the lookup replaced: ``menu_item()`` keeps the first row, like the
+    ``next(...)`` scans; ``menu_item(..., last_wins=True)`` keeps the last
+    one, like the ``{m['name']: m}`` maps that close_order, staff
+    consumption and the room transfer built.
+    """
+
+    def __init__(self, menu_items, products):
+        self.menu_items = menu_items if isinstance(menu_items, list) else []
+        self.products = products if isinstance(products, list) else []
+        self.by_id = {}
+        self.by_name = {}
+        self.last_by_name = {}
+        self.by_category = {}
+        self._first_by_id = {}
+        for item in self.menu_items:
+            if not isinstance(item, dict):
+                continue
+            if item.get('id') is not None:
+                self.by_id[str(item['id'])] = item
+                self._first_by_id.setdefault(str(item['id']), item)
+            if item.get('name'):
+                self.by_name.setdefault(item['name'], item)
+                self.last_by_name[item['name']] = item
+            self.by_category.setdefault(item.get('category'), []).append(item)
+        self.products_by_id = {}
+        self.products_by_name = {}
+        for product in self.products:
+            if not isinstance(product, dict):
+                continue
+            if product.get('id') is not None:
+                self.products_by_id[str(product['id'])] = product
+            if product.get('name'):
+                self.products_by_name.setdefault(product['name'], product)
+        self.print_routes = build_print_routes(self.menu_items)
+        self._recipes = {
+            id(item): self._expand_recipe(item.get('recipe'))
+            for item in self.menu_items
+            if isinstance(item, dict) and item.get('recipe')
+        }
+
+    def _expand_recipe(self, recipe):
+        lines = []
+        for ingred in recipe or []:
+            if not isinstance(ingred, dict):
+                continue
+            raw_ing_id = ingred.get('ingredient_id')
+            insumo = None
+            key = None
+            if raw_ing_id is not None:
+                key = str(raw_ing_id)
+                insumo = self.products_by_id.get(key)
+            else:
+                ing_name = ingred.get('ingredient')
+                if ing_name:
+                    insumo = self.products_by_name.get(ing_name)
+                    if insumo and insumo.get('id') is not None:
+                        key = str(insumo.get('id'))
+                    else:
+                        key = ing_name
+            if not insumo:
+                continue
+            try:
+                qty = float(ingred.get('qty', 0))
+            except (TypeError, ValueError):
+                qty = None
+            lines.append(RecipeLine(insumo, key, raw_ing_id, qty))
+        return tuple(lines)
+
+    def menu_item(self, product_id=None, name=None, last_wins=False):
+        by_id, by_name = (self.by_id, self.last_by_name) if last_wins else (self._first_by_id, self.by_name)
+        item = None
+        if product_id is not None:
+            item = by_id.get(str(product_id))
+        if not item and name:
+            item = by_name.get(name)
+        return item
+
+    def recipe_lines(self, menu_item):
+        """Ingredients of ``menu_item`` that map to a stock product."""
+        if not menu_item or not menu_item.get('recipe'):
+            return ()
+        lines = self._recipes.get(id(menu_item))
+        if lines is None:
+            lines = self._expand_recipe(menu_item.get('recipe'))
+        return lines
+
+    def stock_product_for(self, order_item):
+        """Stock product sold directly by an order line (None for recipes)."""
+        menu_item = self.menu_item(order_item.get('product_id'), order_item.get('name'))
+        if menu_item and menu_item.get('recipe'):
+            return None
+        if menu_item:
+            linked_stock_id = menu_item.get('stock_product_id') or menu_item.get('inventory_product_id')
+            if linked_stock_id is not None:
+                linked_product = self.products_by_id.get(str(linked_stock_id))
+                if linked_product:
+                    return linked_product
+            menu_name = menu_item.get('name')
+            if menu_name and menu_name in self.products_by_name:
+                return self.products_by_name[menu_name]
+        item_name = order_item.get('name')
+        if item_name:
+            return self.products_by_name.get(item_name)
+        return None
+
+
+class _CatalogCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entry = None
+        self.counters = {'builds': 0, 'hits': 0, 'uncached_builds': 0}
+
+    @staticmethod
+    def _signature():
+        paths = (
+            data_service._canonical_write_path(MENU_ITEMS_FILE),
+            data_service._canonical_write_path(PRODUCTS_FILE),
+            get_legacy_root_json_path('products.json'),
+        )
+        return tuple(stat_token(path) for path in paths)
+
+    def get(self):
+        signature = self._signature()
+        with self._lock:
+            if self._entry is not None and self._entry[0] == signature:
+                self.counters['hits'] += 1
+                return self._entry[1]
+        catalog = MenuCatalog(data_service.load_menu_items(), data_service.load_products())
+        # A build from a racy file is used once, not cached.
+        racy = any(is_racy(token) for token in signature)
+        with self._lock:
+            self.counters['builds'] += 1
+            if not racy and signature == self._signature():
+                self._entry = (signature, catalog)
+        return catalog
+
+    def clear(self):
+        with self._lock:
+            self._entry = None
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, cached=self._entry is not None)
+
+
+_CACHE = _CatalogCache()
+
+
+def get_menu_catalog(load_menu=None, load_prods=None):
+    """
+    Catalog of the current menu and stock products, rebuilt only when
+    menu_items.json or products.json change on disk.
+
+    Callers may pass the loaders they were given; anything other than the
+    data_service ones (e.g. an import preview) gets a fresh, uncached catalog.
+    """
+    load_menu = load_menu or data_service.load_menu_items
+    load_prods = load_prods or data_service.load_products
+    if load_menu is data_service.load_menu_items and load_prods is data_service.load_products:
+        return _CACHE.get()
+    with _CACHE._lock:
+        _CACHE.counters['uncached_builds'] += 1
+    return MenuCatalog(load_menu(), load_prods())
+
+
+def menu_catalog_stats():
+    return _CACHE.stats()
+
+
+def _benchmark(num_items=1500, num_products=1200, order_lines=400):
+    """Resolves ``order_lines`` items against synthetic data: linear scans vs catalog."""
+    import random
+
+    rng = random.Random(7)
+    products = [{'id': str(i), 'name': f"Insumo {i:05d}", 'price': 1.0} for i in range(num_products)]
+    menu_items = [
+        {
+            'id': str(10000 + i),
+            'name': f"Prato {i:05d}",
+            'recipe': [{'ingredient': f"Insumo {rng.randrange(num_products):05d}", 'qty': 0.1} for _ in range(4)],
+        }
+        for i in range(num_items)
+    ]
+    lines = [rng.choice(menu_items) for _ in range(order_lines)]
+
+    started = time.perf_counter()
+    for line in lines:
+        menu_item = next(m for m in menu_items if str(m.get('id')) == line['id'])
+        for ingred in menu_item['recipe']:
+            next((p for p in products if p.get('name') == ingred['ingredient']), None)
+    linear = time.perf_counter() - started
+
+    started = time.perf_counter()
+    catalog = MenuCatalog(menu_items, products)
+    build = time.perf_counter() - started
+    started = time.perf_counter()
+    for line in lines:
+        catalog.recipe_lines(catalog.menu_item(line['id']))
+    indexed = time.perf_counter() - started
+    return {'linear_s': round(linear, 4), 'catalog_build_s': round(build, 4), 'catalog_lookup_s': round(indexed, 6)}
+
+
+if __name__ == '__main__':
+    print(_benchmark())
@@ -146,6 +146,15 @@ class MenuSecurityService:
                 
         return is_bulk, details
 
+    @staticmethod
+    def _compact_sales_journal():
+        # Backups copy sales_history.json as-is; fold the append journal in first.
+        try:
+            from app.services.data_service import _ledger_journal
+            _ledger_journal(SALES_HISTORY_FILE).compact()
+        except Exception as e:
+            logging.error(f"Erro ao compactar diário de vendas antes do backup: {e}")
+
     @staticmethod
     def create_menu_sales_backup():
         """
@@ -158,6 +167,7 @@ class MenuSecurityService:
             
             # Files to backup
             files = ['menu_items.json', 'sales_history.json']
+            MenuSecurityService._compact_sales_journal()
             
             for fname in files:
                 src = get_data_path(fname)
@@ -256,6 +266,7 @@ class MenuSecurityService:
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             
             files = ['menu_items.json', 'sales_history.json']
+            MenuSecurityService._compact_sales_journal()
             saved_paths = []
             
             for fname in files:
@@ -0,0 +1,193 @@
+import marshal
+import time
+
+
+def digits_only(value):
+    return "".join(ch for ch in str(value or "") if ch.isdigit())
+
+
+def normalize_text(value):
+    return str(value or "").strip().lower()
+
+
+class NoteKeyIndex:
+    """
+    Positions of notes by ``chave_nfe`` and by ``nsu`` (first note wins).
+
+    ``find`` answers exactly like the old ``_find_note`` scan: the earliest
+    note whose key *or* NSU matches. ``add`` keeps the tables in step while
+    the ingest appends new notes.
+    """
+
+    def __init__(self, notes):
+        self.notes = notes
+        self.by_key = {}
+        self.by_nsu = {}
+        for pos, note in enumerate(notes):
+            self._register(pos, note)
+
+    def _register(self, pos, note):
+        chave = str(note.get("chave_nfe") or "")
+        nsu = str(note.get("nsu") or "")
+        if chave:
+            self.by_key.setdefault(chave, pos)
+        if nsu:
+            self.by_nsu.setdefault(nsu, pos)
+
+    def add(self, note):
+        self.notes.append(note)
+        self._register(len(self.notes) - 1, note)
+
+    def position(self, nsu, chave):
+        hits = []
+        chave_value = str(chave or "")
+        nsu_value = str(nsu or "")
+        if chave_value and chave_value in self.by_key:
+            hits.append(self.by_key[chave_value])
+        if nsu_value and nsu_value in self.by_nsu:
+            hits.append(self.by_nsu[nsu_value])
+        return min(hits) if hits else None
+
+    def find(self, nsu, chave):
+        pos = self.position(nsu, chave)
+        return None if pos is None else self.notes[pos]
+
+
+class NfeRepositoryIndex:
+    """
+    Read-only lookup tables over one version of nfe_received_repository.json.
+
+    - notes by access key / NSU (``NoteKeyIndex``);
+    - supplier history: the supplier already chosen for a normalized CNPJ
+      (first note wins, like the old scan's ``break``) and for a normalized
+      emitter name (last note wins);
+    - item bindings sorted by ``last_used_at`` desc, per supplier, with the
+      first 500 of each supplier keyed by normalized product code and
+      description — the window ``suggest_item_binding`` always looked at.
+
+    Notes and bindings handed out are copies; the tables are shared.
+    """
+
+    BINDING_WINDOW = 500
+
+    def __init__(self, data):
+        notes = data.get("notes") if isinstance(data.get("notes"), list) else []
+        self._notes = [note for note in notes if isinstance(note, dict)]
+        self._keys = NoteKeyIndex(self._notes)
+        self._supplier_by_cnpj = {}
+        self._supplier_by_name = {}
+        for note in self._notes:
+            supplier_id = str(note.get("supplier_id") or "")
+            if not supplier_id.strip():
+                continue
+            cnpj = digits_only(note.get("cnpj_emitente"))
+            name = normalize_text(note.get("nome_emitente"))
+            if cnpj:
+                self._supplier_by_cnpj.setdefault(cnpj, supplier_id)
+            if name:
+                self._supplier_by_name[name] = supplier_id
+        rows = data.get("item_bindings") if isinstance(data.get("item_bindings"), list) else []
+        self._bindings = sorted(
+            (row for row in rows if isinstance(row, dict)),
+            key=lambda r: str(r.get("last_used_at") or ""),
+            reverse=True,
+        )
+        self._bindings_by_supplier = {}
+        for row in self._bindings:
+            self._bindings_by_supplier.setdefault(str(row.get("supplier_id") or ""), []).append(row)
+        self._binding_by_code = {}
+        self._binding_by_name = {}
+        for supplier_id, supplier_rows in self._bindings_by_supplier.items():
+            for row in supplier_rows[: self.BINDING_WINDOW]:
+                code = normalize_text(row.get("supplier_product_code"))
+                name = normalize_text(row.get("supplier_product_name"))
+                if code:
+                    self._binding_by_code.setdefault((supplier_id, code), row)
+                if name:
+                    self._binding_by_name.setdefault((supplier_id, name), row)
+
+    def __len__(self):
+        return len(self._notes)
+
+    def note_by_key(self, chave):
+        pos = self._keys.by_key.get(str(chave or ""))
+        if pos is None:
+            return None
+        return marshal.loads(marshal.dumps(self._notes[pos]))
+
+    def history_supplier(self, cnpj, name):
+        """Supplier id a previous note with this CNPJ (or else name) was bound to."""
+        if cnpj and cnpj in self._supplier_by_cnpj:
+            return self._supplier_by_cnpj[cnpj]
+        if name:
+            return self._supplier_by_name.get(name)
+        return None
+
+    def bindings(self, supplier_id="", product_id="", limit=1000):
+        rows = self._bindings_by_supplier.get(supplier_id, []) if supplier_id else self._bindings
+        out = []
+        for row in rows:
+            if product_id and str(row.get("product_id") or "") != product_id:
+                continue
+            out.append(dict(row))
+            if len(out) >= limit:
+                break
+        return out
+
+    def binding_by_code(self, supplier_id, code):
+        row = self._binding_by_code.get((supplier_id, code)) if code else None
+        return dict(row) if row is not None else None
+
+    def binding_by_name(self, supplier_id, name):
+        row = self._binding_by_name.get((supplier_id, name)) if name else None
+        return dict(row) if row is not None else None
+
+    def binding_containing_name(self, supplier_id, name):
+        """First binding in the window whose description contains ``name``."""
+        if not name:
+            return None
+        for row in self._bindings_by_supplier.get(supplier_id, [])[: self.BINDING_WINDOW]:
+            if name in normalize_text(row.get("supplier_product_name")):
+                return dict(row)
+        return None
+
+
+def _benchmark(num_notes=5000, num_bindings=3000, items_per_note=60, docs=400):
+    """Conference assist of a 60-item NF-e and a 400-doc ingest: scans vs index."""
+    import random
+
+    rng = random.Random(15)
+    notes = [
+        {"nsu": str(i + 1), "chave_nfe": f"{i:044d}", "supplier_id": f"S{i % 40}", "cnpj_emitente": f"{i % 40:014d}", "nome_emitente": f"Fornecedor {i % 40}"}
+        for i in range(num_notes)
+    ]
+    bindings = [
+        {"supplier_id": f"S{rng.randrange(40)}", "product_id": str(i), "supplier_product_code": f"C{i}", "supplier_product_name": f"Produto {i}", "last_used_at": f"2026-01-{rng.randint(1, 28):02d}"}
+        for i in range(num_bindings)
+    ]
+    items = [(f"C{rng.randrange(num_bindings * 2)}", f"Produto {rng.randrange(num_bindings * 2)}") for _ in range(items_per_note)]
+    incoming = [(str(rng.randrange(num_notes * 2)), f"{rng.randrange(num_notes * 2):044d}") for _ in range(docs)]
+
+    started = time.perf_counter()
+    for code, name in items:
+        rows = sorted((dict(r) for r in bindings if r["supplier_id"] == "S1"), key=lambda r: r["last_used_at"], reverse=True)[:500]
+        next((r for r in rows if r["supplier_product_code"].lower() == code.lower()), None) or next((r for r in rows if r["supplier_product_name"].lower() == name.lower()), None)
+    for nsu, chave in incoming:
+        next((n for n in notes if n["chave_nfe"] == chave or n["nsu"] == nsu), None)
+    linear = time.perf_counter() - started
+
+    started = time.perf_counter()
+    index = NfeRepositoryIndex({"notes": notes, "item_bindings": bindings})
+    build = time.perf_counter() - started
+    started = time.perf_counter()
+    for code, name in items:
+        index.binding_by_code("S1", code.lower()) or index.binding_by_name("S1", name.lower())
+    keys = NoteKeyIndex(list(notes))
+    for nsu, chave in incoming:
+        keys.find(nsu, chave)
+    indexed = time.perf_counter() - started
+    return {"linear_s": round(linear, 4), "index_build_s": round(build, 4), "index_lookup_s": round(indexed, 6)}
+
+
+if __name__ == "__main__":
+    print(_benchmark())
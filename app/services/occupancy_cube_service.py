@@ -0,0 +1,326 @@
+import threading
+import time
+from datetime import date
+
+
+BUCKETS = ('alma', 'mar', 'areia')
+# Lead-time thresholds of the reservation curve (share of the final
+# occupancy already on the books N days before arrival).
+CURVE_THRESHOLDS = (30, 15, 7, 3)
+# Pickup windows (rooms booked at most N days before the stay night).
+PICKUP_WINDOWS = (1, 3, 7, 14)
+# Per (day, bucket) counters: present (any status), active, then one per
+# curve threshold and one per pickup window.
+_PRESENT = 0
+_ACTIVE = 1
+_CURVE = 2
+_PICKUP = _CURVE + len(CURVE_THRESHOLDS)
+_WIDTH = _PICKUP + len(PICKUP_WINDOWS)
+# Distinct (today, season map) aggregate sets kept at once.
+MAX_AGGREGATES = 4
+
+
+class OccupancyCube:
+    """
+    Historical occupancy profile behind the RM forecasts.
+
+    Mirrors the merged ReservationIndex as per-night counters keyed by
+    (date, category bucket) -- rooms present, active, on the books per curve
+    threshold and picked up per window -- plus per-night revenue by channel
+    for the projection and per-bucket lead-time/cancellation totals.
+
+    Each reservation's contribution is kept by index position: a new index
+    (spreadsheet or side file changed, day turned) rebuilds the cube, while
+    writes folded into the same index by ``ReservationIndex.upsert`` only
+    swap the contribution of the positions it logged. The (weekday, season)
+    averages the forecast needs are derived once per (today, season map)
+    and dropped whenever the counters move, so editing ``season_by_month``
+    in the advanced RM settings takes effect on the next read.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+        self._revision = 0
+        self._contributions = {}
+        self.days = {}       # day_iso -> {bucket: [present, active, curve..., pickup...]}
+        self.revenue = {}    # day_iso -> {bucket: {channel: [occupied, revenue]}}
+        self.totals = {bucket: [0.0, 0, 0, 0] for bucket in BUCKETS}  # lead sum, lead count, cancelled, reservations
+        self._aggregates = {}
+        self.counters = {'builds': 0, 'incremental_updates': 0, 'aggregate_builds': 0, 'aggregate_hits': 0, 'build_ms': 0.0}
+
+    def sync(self, index, contribution):
+        """
+        Brings the cube up to ``index``. ``contribution(reservation)`` returns
+        ``{'bucket', 'nights': [(day_iso, active, curve flags, pickup flags)],
+        'lead', 'cancelled', 'revenue': [(day_iso, channel, value)]}`` or None.
+        """
+        with self._lock:
+            if index is not self._index:
+                started = time.perf_counter()
+                self.days = {}
+                self.revenue = {}
+                self.totals = {bucket: [0.0, 0, 0, 0] for bucket in BUCKETS}
+                self._contributions = {}
+                self._revision = index.revision
+                for pos in range(index.count):
+                    self._add(pos, contribution(index.row(pos)))
+                self._index = index
+                self._aggregates = {}
+                self.counters['builds'] += 1
+                self.counters['build_ms'] = round((time.perf_counter() - started) * 1000.0, 3)
+            elif index.revision != self._revision:
+                revision = index.revision
+                for pos in index.changed_since(self._revision):
+                    self._remove(pos)
+                    self._add(pos, contribution(index.row(pos)))
+                self._revision = revision
+                self._aggregates = {}
+                self.counters['incremental_updates'] += 1
+        return self
+
+    def _add(self, pos, contrib):
+        if contrib is None:
+            return
+        self._contributions[pos] = contrib
+        self._apply(contrib, 1)
+
+    def _remove(self, pos):
+        contrib = self._contributions.pop(pos, None)
+        if contrib is not None:
+            self._apply(contrib, -1)
+
+    def _apply(self, contrib, sign):
+        bucket = contrib['bucket']
+        totals = self.totals[bucket]
+        if contrib['nights']:
+            if contrib['lead'] is not None:
+                totals[0] += sign * contrib['lead']
+                totals[1] += sign
+            totals[2] += sign * int(contrib['cancelled'])
+            totals[3] += sign
+        for day_iso, active, curve, pickup in contrib['nights']:
+            by_bucket = self.days.setdefault(day_iso, {})
+            cell = by_bucket.get(bucket)
+            if cell is None:
+                cell = by_bucket[bucket] = [0] * _WIDTH
+            cell[_PRESENT] += sign
+            cell[_ACTIVE] += sign * active
+            for offset, flag in enumerate(curve):
+                cell[_CURVE + offset] += sign * flag
+            for offset, flag in enumerate(pickup):
+                cell[_PICKUP + offset] += sign * flag
+            if cell[_PRESENT] <= 0:
+                del by_bucket[bucket]
+                if not by_bucket:
+                    del self.days[day_iso]
+        for day_iso, channel, value in contrib['revenue']:
+            by_channel = self.revenue.setdefault(day_iso, {}).setdefault(bucket, {})
+            slot = by_channel.setdefault(channel, [0, 0.0])
+            slot[0] += sign
+            slot[1] += sign * value
+            if slot[0] <= 0:
+                del by_channel[channel]
+                if not by_channel:
+                    del self.revenue[day_iso][bucket]
+                    if not self.revenue[day_iso]:
+                        del self.revenue[day_iso]
+
+    def occupied(self, day_iso, bucket):
+        """Active reservations of ``bucket`` staying the night of ``day_iso``."""
+        with self._lock:
+            cell = (self.days.get(day_iso) or {}).get(bucket)
+            return cell[_ACTIVE] if cell else 0
+
+    def pickup(self, day_iso, bucket=''):
+        """{window: rooms booked at most ``window`` days before the night}; every bucket when empty."""
+        out = {window: 0 for window in PICKUP_WINDOWS}
+        with self._lock:
+            for name, cell in (self.days.get(day_iso) or {}).items():
+                if bucket and name != bucket:
+                    continue
+                for offset, window in enumerate(PICKUP_WINDOWS):
+                    out[window] += cell[_PICKUP + offset]
+        return out
+
+    def reservation_totals(self, bucket=''):
+        """(lead sum, lead count, cancelled, reservations) for ``bucket`` or every bucket."""
+        with self._lock:
+            rows = [self.totals[bucket]] if bucket else list(self.totals.values())
+            return (
+                sum(row[0] for row in rows),
+                sum(row[1] for row in rows),
+                sum(row[2] for row in rows),
+                sum(row[3] for row in rows),
+            )
+
+    def projection(self, day_iso):
+        """{bucket: [(channel, occupied, revenue), ...]} for active stays on ``day_iso``."""
+        with self._lock:
+            return {
+                bucket: [(channel, slot[0], slot[1]) for channel, slot in by_channel.items()]
+                for bucket, by_channel in (self.revenue.get(day_iso) or {}).items()
+            }
+
+    def history(self, today, season_by_month):
+        """
+        Past-night aggregates by (bucket, weekday, season) for nights before
+        ``today``: ``occupancy`` maps to [active room-nights, nights with any
+        reservation, nights with one of the bucket] and ``curve`` holds the
+        reservation curve models (mean on-the-books share per threshold, by
+        "bucket|weekday|season" signature and by bucket).
+        """
+        seasons = {
+            month: str(season_by_month.get(str(month), 'media')).strip().lower()
+            for month in range(1, 13)
+        }
+        key = (today, tuple(sorted(seasons.items())))
+        with self._lock:
+            cached = self._aggregates.get(key)
+            if cached is not None:
+                self.counters['aggregate_hits'] += 1
+                return cached
+            occupancy = {}
+            signature_sums = {}
+            bucket_sums = {}
+            for day_iso, by_bucket in self.days.items():
+                day = date.fromisoformat(day_iso)
+                if day >= today:
+                    continue
+                weekday = day.weekday()
+                season = seasons[day.month]
+                for bucket in BUCKETS:
+                    slot = occupancy.setdefault((bucket, weekday, season), [0, 0, 0])
+                    slot[1] += 1
+                    cell = by_bucket.get(bucket)
+                    if cell is None:
+                        continue
+                    slot[0] += cell[_ACTIVE]
+                    slot[2] += 1
+                    if cell[_ACTIVE] <= 0:
+                        continue
+                    shares = [cell[_CURVE + offset] / cell[_ACTIVE] for offset in range(len(CURVE_THRESHOLDS))]
+                    for sums in (
+                        signature_sums.setdefault(f"{bucket}|{weekday}|{season}", [0, [0.0] * len(shares)]),
+                        bucket_sums.setdefault(bucket, [0, [0.0] * len(shares)]),
+                    ):
+                        sums[0] += 1
+                        for offset, share in enumerate(shares):
+                            sums[1][offset] += share
+
+            def _means(groups):
+                return {
+                    name: {threshold: total[offset] / count for offset, threshold in enumerate(CURVE_THRESHOLDS)}
+                    for name, (count, total) in groups.items()
+                }
+
+            aggregates = {
+                'occupancy': occupancy,
+                'curve': {
+                    'thresholds': CURVE_THRESHOLDS,
+                    'by_signature': _means(signature_sums),
+                    'by_bucket': _means(bucket_sums),
+                },
+            }
+            if len(self._aggregates) >= MAX_AGGREGATES:
+                self._aggregates.clear()
+            self._aggregates[key] = aggregates
+            self.counters['aggregate_builds'] += 1
+            return aggregates
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self.counters,
+                nights=len(self.days),
+                reservations=len(self._contributions),
+                index_revision=self._revision,
+            )
+
+
+_CUBE = OccupancyCube()
+
+
+def get_occupancy_cube():
+    return _CUBE
+
+
+def occupancy_cube_stats():
+    return _CUBE.stats()
+
+
+def _benchmark(reservations=3000, horizon_days=540, queries=20):
+    """Legacy full scans per RM call vs the cube (occupancy forecast of 30 nights, historical part)."""
+    import random
+    from datetime import timedelta
+
+    rng = random.Random(7)
+    today = date(2026, 6, 1)
+    first = today - timedelta(days=horizon_days)
+    rows = []
+    for i in range(reservations):
+        checkin = first + timedelta(days=rng.randrange(horizon_days + 60))
+        nights = rng.randint(1, 5)
+        rows.append({
+            'bucket': BUCKETS[i % 3],
+            'active': rng.random() > 0.1,
+            'nights': [(checkin + timedelta(days=n)).isoformat() for n in range(nights)],
+        })
+    seasons = {str(m): ('alta' if m in (1, 7, 12) else 'media') for m in range(1, 13)}
+
+    def legacy():
+        by_day = {}
+        for row in rows:
+            for day_iso in row['nights']:
+                slot = by_day.setdefault(day_iso, {'alma': 0, 'mar': 0, 'areia': 0})
+                if row['active']:
+                    slot[row['bucket']] += 1
+        out = []
+        for i in range(30):
+            target = today + timedelta(days=i)
+            season = seasons[str(target.month)]
+            for bucket in BUCKETS:
+                sample = [
+                    occ[bucket] for day_iso, occ in by_day.items()
+                    if date.fromisoformat(day_iso) < today
+                    and date.fromisoformat(day_iso).weekday() == target.weekday()
+                    and seasons[str(date.fromisoformat(day_iso).month)] == season
+                ]
+                out.append(sum(sample) / len(sample) if sample else 0.0)
+        return out
+
+    class _Index:
+        revision = 0
+        count = len(rows)
+
+        def row(self, pos):
+            return rows[pos]
+
+    def contribution(row):
+        return {
+            'bucket': row['bucket'], 'lead': None, 'cancelled': not row['active'], 'revenue': [],
+            'nights': [(day_iso, int(row['active']), (0, 0, 0, 0), (0, 0, 0, 0)) for day_iso in row['nights']],
+        }
+
+    started = time.perf_counter()
+    for _ in range(queries):
+        legacy()
+    legacy_s = time.perf_counter() - started
+
+    cube = OccupancyCube()
+    index = _Index()
+    started = time.perf_counter()
+    for _ in range(queries):
+        cube.sync(index, contribution)
+        history = cube.history(today, seasons)['occupancy']
+        for i in range(30):
+            target = today + timedelta(days=i)
+            for bucket in BUCKETS:
+                occ, nights, _own = history.get((bucket, target.weekday(), seasons[str(target.month)]), (0, 0, 0))
+                occ / nights if nights else 0.0
+    cube_s = time.perf_counter() - started
+    return {'legacy_s': round(legacy_s, 4), 'cube_s': round(cube_s, 4), 'cube_build_ms': cube.counters['build_ms']}
+
+
+if __name__ == '__main__':
+    print(_benchmark())
@@ -2,10 +2,12 @@ from datetime import datetime
 from typing import Any, Dict, List, Optional
 import uuid
 
+from app.services.audit_log_service import get_audit_log
 from app.services.booking_connectivity_auth_service import BookingConnectivityAuthService
 from app.services.cashier_service import file_lock
 from app.services.logger_service import LoggerService
 from app.services.ota_booking_integration_service import OTABookingIntegrationService
+from app.services.ota_distribution_engine import get_distribution_engine, iter_days
 from app.services.period_selector_service import PeriodSelectorService
 from app.services.system_config_manager import (
     OTA_BOOKING_CATEGORY_MAPPING_FILE,
@@ -13,6 +15,7 @@ from app.services.system_config_manager import (
     OTA_BOOKING_COMMERCIAL_AUDIT_FILE,
     OTA_BOOKING_COMMERCIAL_RESTRICTIONS_FILE,
     OTA_BOOKING_DISTRIBUTION_LOGS_FILE,
+    OTA_BOOKING_DISTRIBUTION_STATE_FILE,
     OTA_BOOKING_ERROR_LOGS_FILE,
     OTA_BOOKING_PENDING_RATES_FILE,
     OTA_BOOKING_STATUS_HISTORY_FILE,
@@ -28,6 +31,8 @@ class OTABookingRMService:
         {'key': 'alma', 'label': 'Alma'},
         {'key': 'alma_diamante', 'label': 'Alma Diamante'},
     ]
+    # Values of one rate row compared against the last acknowledged send.
+    RATE_VALUE_FIELDS = ('tarifa_ota_final', 'tarifa_direta', 'comissao_percentual', 'liquido_estimado_hotel')
 
     @classmethod
     def _load_json(cls, file_path: str, fallback: Any) -> Any:
@@ -48,10 +53,21 @@ class OTABookingRMService:
             RevenueManagementService._save_json(file_path, payload)
 
     @classmethod
-    def _append_log(cls, file_path: str, item: Dict[str, Any]) -> None:
-        rows = cls._load_json(file_path, [])
-        rows.append(item)
-        cls._save_json(file_path, rows)
+    def _audit_log(cls, file_path: str, time_field: str = 'timestamp', entity_field: str = 'integration_id'):
+        # The distribution and error logs may still hold rows in the JSONL
+        # journal they used before; the one-time import reads through it.
+        from app.services.ledger_journal_service import LedgerJournal
+
+        def read_legacy() -> List[Dict[str, Any]]:
+            journal = LedgerJournal(file_path, read_snapshot=lambda: cls._load_json(file_path, []), write_snapshot=lambda rows: False)
+            rows = journal.load()
+            return rows if isinstance(rows, list) else []
+
+        return get_audit_log(file_path, time_field=time_field, entity_field=entity_field, read_legacy=read_legacy)
+
+    @classmethod
+    def _append_log(cls, file_path: str, item: Dict[str, Any], time_field: str = 'timestamp') -> None:
+        cls._audit_log(file_path, time_field=time_field).append([item])
 
     @classmethod
     def _replace_rows(cls, file_path: str, rows: List[Dict[str, Any]]) -> None:
@@ -69,11 +85,13 @@ class OTABookingRMService:
         right = cls._normalize_booking_category(target_category)
         return left == right or str(rule_category or '').strip() in ('*', 'all', 'all_booking_categories')
 
+    @classmethod
+    def _commercial_audit_log(cls):
+        return get_audit_log(OTA_BOOKING_COMMERCIAL_AUDIT_FILE, time_field='changed_at', entity_field='event_type')
+
     @classmethod
     def _append_commercial_audit(cls, item: Dict[str, Any]) -> None:
-        rows = cls._load_json(OTA_BOOKING_COMMERCIAL_AUDIT_FILE, [])
-        rows.append(item)
-        cls._save_json(OTA_BOOKING_COMMERCIAL_AUDIT_FILE, rows)
+        cls._commercial_audit_log().append([item])
 
     @classmethod
     def _load_category_mapping_rows(cls) -> List[Dict[str, Any]]:
@@ -221,13 +239,10 @@ class OTABookingRMService:
 
     @classmethod
     def list_commercial_audit(cls, start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[Dict[str, Any]]:
-        rows = cls._load_json(OTA_BOOKING_COMMERCIAL_AUDIT_FILE, [])
         start_dt = PeriodSelectorService.parse_date(start_date).date() if start_date else None
         end_dt = PeriodSelectorService.parse_date(end_date).date() if end_date else None
         out: List[Dict[str, Any]] = []
-        for row in rows:
-            if not isinstance(row, dict):
-                continue
+        for row in cls._commercial_audit_log().query(start=start_dt, end=end_dt):
             ts = str(row.get('changed_at') or '')
             try:
                 day = datetime.fromisoformat(ts).date()
@@ -286,7 +301,7 @@ class OTABookingRMService:
             'health_message': health.get('message') or '',
             'user': user,
         }
-        cls._append_log(OTA_BOOKING_STATUS_HISTORY_FILE, snapshot)
+        cls._append_log(OTA_BOOKING_STATUS_HISTORY_FILE, snapshot, time_field='checked_at')
         return {
             'integration': integration,
             'status': status,
@@ -381,6 +396,95 @@ class OTABookingRMService:
             'log_id': item.get('id'),
         }
 
+    @classmethod
+    def _distribution_state(cls):
+        return get_distribution_engine().state(OTA_BOOKING_DISTRIBUTION_STATE_FILE)
+
+    @staticmethod
+    def _iso_day(value: Any) -> str:
+        try:
+            return PeriodSelectorService.parse_date(value).date().isoformat()
+        except Exception:
+            return ''
+
+    @classmethod
+    def _rate_cell(cls, row: Dict[str, Any]):
+        """(key, date, values) of one rate row for the distribution engine; date is '' when invalid."""
+        key = (row.get('room_type_id_booking'), row.get('rate_plan_id_booking'), row.get('category'))
+        return key, cls._iso_day(row.get('date')), tuple(row.get(field) for field in cls.RATE_VALUE_FIELDS)
+
+    @classmethod
+    def _rate_range_rows(cls, batch) -> List[Dict[str, Any]]:
+        return [
+            {
+                'start_date': start,
+                'end_date': end,
+                'room_type_id_booking': key[0],
+                'rate_plan_id_booking': key[1],
+                'category': key[2],
+                **dict(zip(cls.RATE_VALUE_FIELDS, values)),
+            }
+            for key, start, end, values in batch
+        ]
+
+    @classmethod
+    def _distribute(
+        cls,
+        *,
+        integration_id: str,
+        kind: str,
+        cells: Dict[Any, Dict[str, Any]],
+        build_payload,
+        distribution_type: str,
+        endpoint_path: str,
+        user: str,
+        log_context=None,
+        force: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Sends only the dates of ``cells`` ({key: {date: values}}) that differ
+        from what Booking last acknowledged, as date ranges in parallel
+        batches (ota_distribution_engine). ``log_context(batch)`` adds fields
+        to each call's distribution log.
+        """
+        def send(payload: Dict[str, Any], batch) -> Dict[str, Any]:
+            context = dict(log_context(batch) if callable(log_context) else (log_context or {}))
+            context['ranges'] = len(batch)
+            context['days'] = sum(1 for _key, start, end, _values in batch for _day in iter_days(start, end))
+            return cls._send_distribution(
+                integration_id=integration_id,
+                distribution_type=distribution_type,
+                endpoint_path=endpoint_path,
+                payload=payload,
+                user=user,
+                method='POST',
+                log_context=context,
+            )
+
+        return get_distribution_engine().distribute(
+            cls._distribution_state(), integration_id, kind, cells, build_payload, send, force=force,
+        )
+
+    @staticmethod
+    def _distribution_summary(distribution_type: str, outcome: Dict[str, Any]) -> Dict[str, Any]:
+        results = [result for _batch, result in outcome.get('batches') or []]
+        all_success = all(bool(item.get('success')) for item in results)
+        if not results:
+            status = 'sem_alteracao'
+        else:
+            status = 'enviado' if all_success else 'erro'
+        return {
+            'success': all_success,
+            'distribution_type': distribution_type,
+            'status': status,
+            'results': results,
+            'calls': outcome.get('calls', 0),
+            'ranges': outcome.get('ranges', 0),
+            'days': outcome.get('days', 0),
+            'unchanged_days': outcome.get('unchanged_days', 0),
+            'payload_bytes': outcome.get('payload_bytes', 0),
+        }
+
     @classmethod
     def apply_channel_cta_ctd(
         cls,
@@ -602,6 +706,7 @@ class OTABookingRMService:
         weekdays: Optional[List[str]],
         user: str,
         mode: str = 'manual',
+        force: bool = False,
     ) -> Dict[str, Any]:
         from app.services.revenue_management_service import RevenueManagementService
 
@@ -613,14 +718,6 @@ class OTABookingRMService:
             weekdays=weekdays or [],
         )
         rate_rows = cls._build_rate_payload_rows(calendar.get('rows') or [], rate_plan)
-        payload = {
-            'category': category,
-            'rate_plan_id_booking': rate_plan,
-            'start_date': start_date,
-            'end_date': end_date,
-            'weekdays': weekdays or [],
-            'rates': rate_rows,
-        }
         if mode == 'lote':
             queued = cls.queue_rate_distribution(
                 integration_id=integration_id,
@@ -638,18 +735,30 @@ class OTABookingRMService:
                 'queued': queued.get('queued', 0),
                 'queue_ids': queued.get('queue_ids', []),
             }
-        return cls._send_distribution(
+        cells: Dict[Any, Dict[str, Any]] = {}
+        for row in rate_rows:
+            key, day_iso, values = cls._rate_cell(row)
+            if day_iso:
+                cells.setdefault(key, {})[day_iso] = values
+        outcome = cls._distribute(
             integration_id=integration_id,
+            kind='rates',
+            cells=cells,
+            build_payload=lambda batch: {
+                'category': category,
+                'rate_plan_id_booking': rate_plan,
+                'start_date': start_date,
+                'end_date': end_date,
+                'weekdays': weekdays or [],
+                'rates': cls._rate_range_rows(batch),
+            },
             distribution_type='envio_tarifas',
             endpoint_path='rates',
-            payload=payload,
             user=user,
-            method='POST',
-            log_context={
-                'mode': mode,
-                'rate_plan_id_booking': rate_plan,
-            },
+            log_context={'mode': mode, 'rate_plan_id_booking': rate_plan},
+            force=force,
         )
+        return cls._distribution_summary('envio_tarifas', outcome)
 
     @classmethod
     def queue_rate_distribution(
@@ -714,64 +823,75 @@ class OTABookingRMService:
         pending = cls._load_json(OTA_BOOKING_PENDING_RATES_FILE, [])
         if not isinstance(pending, list):
             pending = []
-        processed = 0
-        sent = 0
-        failed = 0
-        for item in pending:
-            if processed >= max(1, int(limit)):
-                break
-            if str(item.get('status') or '') != 'pendente':
-                continue
+        selected = [item for item in pending if isinstance(item, dict) and str(item.get('status') or '') == 'pendente'][:max(1, int(limit))]
+        now_text = datetime.now().isoformat(timespec='seconds')
+        # Later queue entries for the same room type/rate plan/date win; every
+        # entry of a date shares the outcome of the value actually sent.
+        cells: Dict[Any, Dict[str, Any]] = {}
+        owners: Dict[Any, List[Dict[str, Any]]] = {}
+        invalid = set()
+        for item in selected:
             payload = item.get('payload') if isinstance(item.get('payload'), dict) else {}
-            date_value = str(payload.get('date') or '').strip()
-            day_payload = {
-                'rate_plan_id_booking': payload.get('rate_plan_id_booking'),
-                'room_type_id_booking': payload.get('room_type_id_booking'),
-                'category': payload.get('category'),
-                'rates': [
-                    {
-                        'date': date_value,
-                        'room_type_id_booking': payload.get('room_type_id_booking'),
-                        'rate_plan_id_booking': payload.get('rate_plan_id_booking'),
-                        'tarifa_ota_final': payload.get('tarifa_ota_final'),
-                        'tarifa_direta': payload.get('tarifa_direta'),
-                        'comissao_percentual': payload.get('comissao_percentual'),
-                        'liquido_estimado_hotel': payload.get('liquido_estimado_hotel'),
-                    }
-                ],
-            }
-            call = cls._send_distribution(
+            key, day_iso, values = cls._rate_cell(payload)
+            if not day_iso:
+                invalid.add(id(item))
+                continue
+            cells.setdefault(key, {})[day_iso] = values
+            owners.setdefault((key, day_iso), []).append(item)
+
+        def batch_items(batch) -> List[Dict[str, Any]]:
+            return [
+                item
+                for key, start, end, _values in batch
+                for day_iso in iter_days(start, end)
+                for item in owners.get((key, day_iso), [])
+            ]
+
+        outcome = {'batches': []}
+        if cells:
+            outcome = cls._distribute(
                 integration_id=integration_id,
+                kind='rates',
+                cells=cells,
+                build_payload=lambda batch: {'rates': cls._rate_range_rows(batch)},
                 distribution_type='envio_tarifas',
                 endpoint_path='rates',
-                payload=day_payload,
                 user=user,
-                method='POST',
-                log_context={
+                log_context=lambda batch: {
                     'mode': 'lote',
-                    'queue_id': item.get('id'),
-                    'queue_date': date_value,
-                    'rate_plan_id_booking': payload.get('rate_plan_id_booking'),
-                    'status': 'reprocessado' if int(item.get('attempts') or 0) > 0 else 'enviado',
-                    'attempts': int(item.get('attempts') or 0) + 1,
+                    'queue_ids': [item.get('id') for item in batch_items(batch)],
+                    'attempts': max([int(item.get('attempts') or 0) for item in batch_items(batch)] or [0]) + 1,
                 },
             )
-            processed += 1
-            if call.get('success'):
-                item['status'] = 'enviado'
-                item['processed_at'] = datetime.now().isoformat(timespec='seconds')
-                sent += 1
-            else:
+        results: Dict[int, Dict[str, Any]] = {}
+        for batch, result in outcome.get('batches') or []:
+            for item in batch_items(batch):
+                results[id(item)] = result
+        sent = failed = unchanged = 0
+        for item in selected:
+            item['processed_at'] = now_text
+            result = results.get(id(item))
+            if id(item) in invalid or (result is not None and not result.get('success')):
                 item['status'] = 'erro'
                 item['attempts'] = int(item.get('attempts') or 0) + 1
-                item['last_error'] = str(call.get('response_preview') or call.get('message') or 'Falha no envio')
-                item['processed_at'] = datetime.now().isoformat(timespec='seconds')
+                item['last_error'] = 'Data inválida.' if result is None else str(result.get('response_preview') or 'Falha no envio')
                 failed += 1
+            elif result is None:
+                # Same values Booking already acknowledged: nothing to send.
+                item['status'] = 'sem_alteracao'
+                unchanged += 1
+            else:
+                item['status'] = 'enviado'
+                sent += 1
         cls._replace_rows(OTA_BOOKING_PENDING_RATES_FILE, pending)
         return {
-            'processed': processed,
+            'processed': len(selected),
             'sent': sent,
             'failed': failed,
+            'unchanged': unchanged,
+            'calls': outcome.get('calls', 0),
+            'ranges': outcome.get('ranges', 0),
+            'payload_bytes': outcome.get('payload_bytes', 0),
         }
 
     @classmethod
@@ -800,15 +920,59 @@ class OTABookingRMService:
         integration_id: str,
         payload: Dict[str, Any],
         user: str,
+        force: bool = False,
     ) -> Dict[str, Any]:
-        return cls._send_distribution(
+        cells = cls._availability_cells(payload)
+        if not cells:
+            return cls._send_distribution(
+                integration_id=integration_id,
+                distribution_type='envio_disponibilidade',
+                endpoint_path='availability',
+                payload=payload,
+                user=user,
+                method='POST',
+            )
+        base = {k: v for k, v in payload.items() if k not in ('dates', 'start_date', 'end_date', 'rooms_available')}
+        outcome = cls._distribute(
             integration_id=integration_id,
+            kind='availability',
+            cells=cells,
+            build_payload=lambda batch: {
+                **base,
+                'availability': [
+                    {'start_date': start, 'end_date': end, 'rooms_available': values[0]}
+                    for _key, start, end, values in batch
+                ],
+            },
             distribution_type='envio_disponibilidade',
             endpoint_path='availability',
-            payload=payload,
             user=user,
-            method='POST',
+            force=force,
         )
+        return cls._distribution_summary('envio_disponibilidade', outcome)
+
+    @classmethod
+    def _availability_cells(cls, payload: Dict[str, Any]) -> Dict[Any, Dict[str, Any]]:
+        """{(category, property_id): {date: (rooms_available,)}} from ``dates`` or the start/end period."""
+        rooms = payload.get('rooms_available')
+        days: Dict[str, Any] = {}
+        for entry in payload.get('dates') or []:
+            if isinstance(entry, dict):
+                day_iso = cls._iso_day(entry.get('date'))
+                value = entry.get('rooms_available', rooms)
+            else:
+                day_iso = cls._iso_day(entry)
+                value = rooms
+            if day_iso:
+                days[day_iso] = (value,)
+        if not days and payload.get('start_date'):
+            start = cls._iso_day(payload.get('start_date'))
+            end = cls._iso_day(payload.get('end_date') or payload.get('start_date'))
+            if start and end and start <= end:
+                days = {day_iso: (rooms,) for day_iso in iter_days(start, end)}
+        if not days:
+            return {}
+        return {(payload.get('category'), payload.get('property_id')): days}
 
     @classmethod
     def send_open_close(
@@ -996,15 +1160,12 @@ class OTABookingRMService:
         success: Optional[bool] = None,
         status: Optional[str] = None,
     ) -> List[Dict[str, Any]]:
-        rows = cls._load_json(OTA_BOOKING_DISTRIBUTION_LOGS_FILE, [])
         start_dt = PeriodSelectorService.parse_date(start_date).date() if start_date else None
         end_dt = PeriodSelectorService.parse_date(end_date).date() if end_date else None
         type_norm = str(distribution_type or '').strip().lower()
         status_norm = str(status or '').strip().lower()
         out: List[Dict[str, Any]] = []
-        for row in rows:
-            if not isinstance(row, dict):
-                continue
+        for row in cls._audit_log(OTA_BOOKING_DISTRIBUTION_LOGS_FILE).query(start=start_dt, end=end_dt):
             ts = str(row.get('timestamp') or '')
             try:
                 day = datetime.fromisoformat(ts).date()
@@ -1034,7 +1195,7 @@ class OTABookingRMService:
     ) -> List[Dict[str, Any]]:
         distribution = cls.list_distribution_logs(start_date=start_date, end_date=end_date)
         status_norm = str(status or '').strip().lower()
-        status_rows = cls._load_json(OTA_BOOKING_STATUS_HISTORY_FILE, [])
+        status_rows = cls._audit_log(OTA_BOOKING_STATUS_HISTORY_FILE, time_field='checked_at').query()
         auth_rows: List[Dict[str, Any]] = []
         for item in (status_rows or []):
             if not isinstance(item, dict):
@@ -1114,13 +1275,10 @@ class OTABookingRMService:
         start_date: Optional[str] = None,
         end_date: Optional[str] = None,
     ) -> List[Dict[str, Any]]:
-        rows = cls._load_json(OTA_BOOKING_ERROR_LOGS_FILE, [])
         start_dt = PeriodSelectorService.parse_date(start_date).date() if start_date else None
         end_dt = PeriodSelectorService.parse_date(end_date).date() if end_date else None
         out: List[Dict[str, Any]] = []
-        for row in rows:
-            if not isinstance(row, dict):
-                continue
+        for row in cls._audit_log(OTA_BOOKING_ERROR_LOGS_FILE).query(start=start_dt, end=end_dt):
             ts = str(row.get('timestamp') or '')
             try:
                 day = datetime.fromisoformat(ts).date()
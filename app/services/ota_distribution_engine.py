@@ -0,0 +1,306 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from app.services.cashier_service import file_lock
+from app.services.json_document_cache import stat_token
+
+
+def _env_int(name, default):
+    raw = str(os.environ.get(name) or '').strip()
+    try:
+        return max(1, int(raw)) if raw else default
+    except ValueError:
+        return default
+
+
+def batch_ranges():
+    """Date ranges per call to Booking (ALMAREIA_OTA_BATCH_RANGES)."""
+    return _env_int('ALMAREIA_OTA_BATCH_RANGES', 50)
+
+
+def parallel_calls():
+    """Calls to Booking in flight at once (ALMAREIA_OTA_PARALLEL_CALLS)."""
+    return _env_int('ALMAREIA_OTA_PARALLEL_CALLS', 4)
+
+
+def _state_key(key):
+    return '|'.join(str(part if part is not None else '') for part in key)
+
+
+def iter_days(start_iso, end_iso):
+    day = date.fromisoformat(start_iso)
+    end = date.fromisoformat(end_iso)
+    while day <= end:
+        yield day.isoformat()
+        day += timedelta(days=1)
+
+
+def coalesce_ranges(cells):
+    """
+    ``cells`` is ``{key: {date_iso: values}}``. Returns ``[(key, start_iso,
+    end_iso, values)]`` where consecutive dates of one key with identical
+    values become one range; keys and dates come out sorted.
+    """
+    ranges = []
+    for key in sorted(cells, key=_state_key):
+        current = None
+        for day_iso in sorted(cells[key]):
+            values = tuple(cells[key][day_iso])
+            if current is not None and current[3] == values and \
+                    date.fromisoformat(current[2]) + timedelta(days=1) == date.fromisoformat(day_iso):
+                current[2] = day_iso
+                continue
+            if current is not None:
+                ranges.append(tuple(current))
+            current = [key, day_iso, day_iso, values]
+        if current is not None:
+            ranges.append(tuple(current))
+    return ranges
+
+
+class DistributionStateStore:
+    """
+    Last values Booking acknowledged, per integration, distribution kind
+    (rates, availability), key (room type/rate plan/category) and date:
+    ``{integration_id: {kind: {"key": {date: [values]}}}}``.
+
+    Only a successful call moves the state, so a failed batch is resent on
+    the next run. The file is rewritten (temp file + ``os.replace``) under a
+    file lock after each run, re-read first when another worker changed it;
+    dates already past are dropped on write.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = None
+        self._token = None
+
+    def _read(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        self._data = data if isinstance(data, dict) else {}
+        self._token = stat_token(self.path)
+
+    def _current(self):
+        if self._data is None or stat_token(self.path) != self._token:
+            self._read()
+        return self._data
+
+    def _write(self):
+        today = date.today().isoformat()
+        for kinds in self._data.values():
+            for keys in kinds.values():
+                for name in list(keys):
+                    keys[name] = {day: values for day, values in keys[name].items() if day >= today}
+                    if not keys[name]:
+                        del keys[name]
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._data, f, ensure_ascii=False, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._token = stat_token(self.path)
+
+    def changed(self, integration_id, kind, cells):
+        """(cells whose values differ from the acknowledged ones, count of unchanged dates)."""
+        out = {}
+        unchanged = 0
+        with self._lock:
+            acked = (self._current().get(integration_id) or {}).get(kind) or {}
+            for key, days in cells.items():
+                known = acked.get(_state_key(key)) or {}
+                for day_iso, values in days.items():
+                    if known.get(day_iso) == list(values):
+                        unchanged += 1
+                        continue
+                    out.setdefault(key, {})[day_iso] = values
+        return out, unchanged
+
+    def acknowledge(self, integration_id, kind, cells):
+        if not cells:
+            return
+        with self._lock, file_lock(self.path):
+            self._read()
+            keys = self._data.setdefault(integration_id, {}).setdefault(kind, {})
+            for key, days in cells.items():
+                slot = keys.setdefault(_state_key(key), {})
+                for day_iso, values in days.items():
+                    slot[day_iso] = list(values)
+            self._write()
+
+    def forget(self, integration_id=None, kind=None):
+        """Drops acknowledged values so the next run resends everything."""
+        with self._lock, file_lock(self.path):
+            self._read()
+            if integration_id is None:
+                self._data = {}
+            elif kind is None:
+                self._data.pop(integration_id, None)
+            else:
+                (self._data.get(integration_id) or {}).pop(kind, None)
+            self._write()
+
+
+class DistributionEngine:
+    """
+    Delta-only distribution: drops dates whose values match the last
+    acknowledged ones, coalesces the rest into ranges, and sends them in
+    batches of ``batch_ranges()`` with at most ``parallel_calls()`` calls in
+    flight. Counters (calls, ranges, days, bytes) are kept per kind.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._states = {}
+        self.counters = {}
+
+    def state(self, path):
+        with self._lock:
+            store = self._states.get(path)
+            if store is None:
+                store = self._states[path] = DistributionStateStore(path)
+            return store
+
+    def _count(self, kind, **deltas):
+        with self._lock:
+            slot = self.counters.setdefault(kind, {
+                'runs': 0, 'calls': 0, 'failed_calls': 0, 'ranges_sent': 0,
+                'days_sent': 0, 'days_unchanged': 0, 'payload_bytes': 0,
+            })
+            for name, value in deltas.items():
+                slot[name] += value
+
+    def distribute(self, state, integration_id, kind, cells, build_payload, send, force=False):
+        """
+        ``build_payload(ranges)`` turns a batch of ``(key, start, end,
+        values)`` into the request body; ``send(payload, ranges)`` makes the
+        call and returns a dict with ``success``. Returns ``{'ranges',
+        'days', 'unchanged_days', 'calls', 'payload_bytes', 'batches':
+        [(ranges, result), ...]}``.
+        """
+        if force:
+            changed, unchanged = cells, 0
+        else:
+            changed, unchanged = state.changed(integration_id, kind, cells)
+        ranges = coalesce_ranges(changed)
+        size = batch_ranges()
+        batches = [ranges[i:i + size] for i in range(0, len(ranges), size)]
+        sizes = []
+
+        def _run(batch):
+            payload = build_payload(batch)
+            body = len(json.dumps(payload).encode('utf-8'))
+            sizes.append(body)
+            return batch, send(payload, batch)
+
+        outcomes = []
+        if batches:
+            with ThreadPoolExecutor(max_workers=min(parallel_calls(), len(batches)), thread_name_prefix='ota-dist') as pool:
+                outcomes = list(pool.map(_run, batches))
+        acked = {}
+        failed = 0
+        for batch, result in outcomes:
+            if not result.get('success'):
+                failed += 1
+                continue
+            for key, start, end, values in batch:
+                for day_iso in iter_days(start, end):
+                    acked.setdefault(key, {})[day_iso] = values
+        state.acknowledge(integration_id, kind, acked)
+        days = sum(len(v) for v in changed.values())
+        self._count(
+            kind, runs=1, calls=len(batches), failed_calls=failed, ranges_sent=len(ranges),
+            days_sent=days, days_unchanged=unchanged, payload_bytes=sum(sizes),
+        )
+        return {
+            'ranges': len(ranges),
+            'days': days,
+            'unchanged_days': unchanged,
+            'calls': len(batches),
+            'failed_calls': failed,
+            'payload_bytes': sum(sizes),
+            'batches': outcomes,
+        }
+
+    def stats(self):
+        with self._lock:
+            return {
+                'batch_ranges': batch_ranges(),
+                'parallel_calls': parallel_calls(),
+                'kinds': {kind: dict(slot) for kind, slot in self.counters.items()},
+            }
+
+
+_ENGINE = DistributionEngine()
+
+
+def get_distribution_engine():
+    return _ENGINE
+
+
+def ota_distribution_stats():
+    return _ENGINE.stats()
+
+
+def _benchmark(days=180, room_types=6, changed_every=30):
+    """Queue of one rate per day and room type: per-day calls vs delta + range batches (payload sizes)."""
+    import tempfile
+
+    start = date.today()
+    cells = {}
+    for room in range(room_types):
+        key = (f"RT{room}", 'RP1', 'mar')
+        cells[key] = {
+            (start + timedelta(days=i)).isoformat(): (500.0 + 50 * (i // changed_every), 450.0, 15.0, 425.0)
+            for i in range(days)
+        }
+
+    def per_day_payload(key, day_iso, values):
+        return {'rates': [{'date': day_iso, 'room_type_id_booking': key[0], 'rate_plan_id_booking': key[1], 'values': list(values)}]}
+
+    legacy_calls = 0
+    legacy_bytes = 0
+    started = time.perf_counter()
+    for key, by_day in cells.items():
+        for day_iso, values in by_day.items():
+            legacy_calls += 1
+            legacy_bytes += len(json.dumps(per_day_payload(key, day_iso, values)).encode('utf-8'))
+    legacy_s = time.perf_counter() - started
+
+    def build(batch):
+        return {'rates': [
+            {'start_date': s, 'end_date': e, 'room_type_id_booking': k[0], 'rate_plan_id_booking': k[1], 'values': list(v)}
+            for k, s, e, v in batch
+        ]}
+
+    engine = DistributionEngine()
+    with tempfile.TemporaryDirectory() as tmp:
+        state = DistributionStateStore(os.path.join(tmp, 'state.json'))
+        started = time.perf_counter()
+        first = engine.distribute(state, 'bench', 'rates', cells, build, lambda payload, batch: {'success': True})
+        again = engine.distribute(state, 'bench', 'rates', cells, build, lambda payload, batch: {'success': True})
+        engine_s = time.perf_counter() - started
+    return {
+        'per_day_calls': legacy_calls,
+        'per_day_bytes': legacy_bytes,
+        'per_day_s': round(legacy_s, 4),
+        'engine_calls': first['calls'],
+        'engine_bytes': first['payload_bytes'],
+        'engine_ranges': first['ranges'],
+        'unchanged_rerun_calls': again['calls'],
+        'engine_s': round(engine_s, 4),
+    }
+
+
+if __name__ == '__main__':
+    print(_benchmark())
@@ -0,0 +1,387 @@
+import base64
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from app.services.system_config_manager import get_data_path
+from app.services.request_metrics_service import record_section
+
+logger = logging.getLogger(__name__)
+
+SPOOL_DIR = get_data_path('print_spool')
+RETRY_BACKOFF_SECONDS = (0.5, 1.0, 2.0)
+DEFAULT_MAX_ATTEMPTS = 3
+# Tickets older than this are not reprinted after a restart: a kitchen order
+# surfacing hours later does more harm than good.
+RECOVERY_MAX_AGE_SECONDS = 15 * 60
+FINISHED_RETENTION_SECONDS = 24 * 60 * 60
+
+PENDING_STATUSES = ('queued', 'printing')
+FINAL_STATUSES = ('done', 'failed', 'expired')
+
+
+def device_key(printer):
+    """Queue key for a printer config: one worker per physical device."""
+    if printer.get('type') == 'windows':
+        return f"win:{printer.get('windows_name')}"
+    return f"net:{printer.get('ip')}:{int(printer.get('port', 9100) or 9100)}"
+
+
+def _public_job(job):
+    return {k: v for k, v in job.items() if k != 'payload_b64'}
+
+
+class PrintSpooler:
+    """
+    Per-device print queues with durable job records.
+
+    Every device key (IP:port or Windows printer name) gets its own worker
+    thread, so retries and backoff against an offline printer only delay
+    that printer's tickets. Each job is written to ``spool_dir`` before it is
+    queued and updated on every state change; pending jobs are re-queued on
+    the next start. Finished jobs leave memory once their final record is on
+    disk and the listeners have run; lookups fall back to that record.
+    """
+
+    def __init__(self, transport, spool_dir=None, backoff=RETRY_BACKOFF_SECONDS):
+        self.transport = transport
+        self.spool_dir = spool_dir or SPOOL_DIR
+        self.backoff = tuple(backoff)
+        self._lock = threading.RLock()
+        self._changed = threading.Condition(self._lock)
+        self._queues = {}
+        self._workers = {}
+        self._jobs = {}
+        self._listeners = []
+        self._device_stats = {}
+        self._recovered = False
+
+    # --- persistence ---
+    def _job_path(self, job_id):
+        return os.path.join(self.spool_dir, f"{job_id}.json")
+
+    def _persist(self, job):
+        try:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            path = self._job_path(job['id'])
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(job, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.error(f"print_spool_persist_failed job={job.get('id')} error={e}")
+
+    def recover(self):
+        """Re-queues pending jobs left on disk and prunes old finished records."""
+        with self._lock:
+            if self._recovered:
+                return 0
+            self._recovered = True
+        if not os.path.isdir(self.spool_dir):
+            return 0
+        now = time.time()
+        requeued = 0
+        for name in sorted(os.listdir(self.spool_dir)):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.spool_dir, name)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    job = json.load(f)
+            except Exception:
+                continue
+            age = now - float(job.get('created_ts') or 0)
+            if job.get('status') in PENDING_STATUSES:
+                if age > RECOVERY_MAX_AGE_SECONDS:
+                    job['status'] = 'expired'
+                    job['payload_b64'] = None
+                    job['finished_at'] = datetime.now().isoformat()
+                    self._persist(job)
+                    continue
+                job['status'] = 'queued'
+                job['recovered'] = True
+                self._enqueue(job)
+                requeued += 1
+            elif age > FINISHED_RETENTION_SECONDS:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        if requeued:
+            logger.warning(f"print_spool_recovered jobs={requeued}")
+        return requeued
+
+    # --- submission ---
+    def submit(self, printer, data, context=None, item_ids=None, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.recover()
+        now = datetime.now()
+        job = {
+            'id': uuid.uuid4().hex,
+            'device_key': device_key(printer),
+            'device': {
+                'type': printer.get('type', 'network'),
+                'ip': printer.get('ip'),
+                'port': printer.get('port', 9100),
+                'windows_name': printer.get('windows_name'),
+            },
+            'printer_id': printer.get('id'),
+            'printer_name': printer.get('name'),
+            'status': 'queued',
+            'attempts': 0,
+            'max_attempts': max(1, int(max_attempts)),
+            'last_error': None,
+            'context': dict(context or {}),
+            'item_ids': list(item_ids or []),
+            'created_at': now.isoformat(),
+            'created_ts': time.time(),
+            'finished_at': None,
+            'payload_b64': base64.b64encode(bytes(data)).decode('ascii'),
+        }
+        self._persist(job)
+        self._enqueue(job)
+        return job['id']
+
+    def _enqueue(self, job):
+        key = job['device_key']
+        with self._lock:
+            self._jobs[job['id']] = job
+            q = self._queues.get(key)
+            if q is None:
+                q = queue.Queue()
+                self._queues[key] = q
+                self._device_stats[key] = {'done': 0, 'failed': 0, 'retries': 0, 'last_latency_ms': None}
+                worker = threading.Thread(target=self._worker_loop, args=(key, q), name=f"print-spool-{key}", daemon=True)
+                self._workers[key] = worker
+                worker.start()
+        q.put(job['id'])
+
+    # --- worker ---
+    def _set_status(self, job, **fields):
+        # Only the device worker changes a job, so writing its snapshot
+        # outside the lock cannot reorder records of the same job.
+        with self._changed:
+            job.update(fields)
+            job['updated_at'] = datetime.now().isoformat()
+            if job['status'] in FINAL_STATUSES:
+                job['payload_b64'] = None
+            snapshot = dict(job)
+            self._changed.notify_all()
+        self._persist(snapshot)
+
+    def _evict(self, job):
+        with self._lock:
+            if job.get('status') in FINAL_STATUSES:
+                self._jobs.pop(job['id'], None)
+
+    def _worker_loop(self, key, q):
+        while True:
+            job_id = q.get()
+            with self._lock:
+                job = self._jobs.get(job_id)
+            if job is None or job.get('status') not in PENDING_STATUSES:
+                continue
+            try:
+                self._run_job(key, job)
+            except Exception as e:
+                logger.error(f"print_spool_worker_error device={key} job={job_id} error={e}")
+                self._set_status(job, status='failed', last_error=str(e), finished_at=datetime.now().isoformat())
+            self._notify_listeners(job)
+            self._evict(job)
+
+    def _run_job(self, key, job):
+        payload = base64.b64decode(job.get('payload_b64') or '')
+        stats = self._device_stats[key]
+        while True:
+            self._set_status(job, status='printing', attempts=int(job.get('attempts') or 0) + 1)
+            started = time.perf_counter()
+            try:
+                ok, error = self.transport(job, payload)
+            except Exception as e:
+                ok, error = False, str(e)
+            record_section('print_dispatch', (time.perf_counter() - started) * 1000.0)
+            if ok:
+                stats['done'] += 1
+                stats['last_latency_ms'] = round((time.perf_counter() - started) * 1000, 2)
+                self._set_status(job, status='done', last_error=None, finished_at=datetime.now().isoformat())
+                return
+            attempt = job['attempts']
+            if attempt >= job['max_attempts']:
+                stats['failed'] += 1
+                logger.error(f"print_spool_job_failed device={key} job={job['id']} attempts={attempt} error={error}")
+                self._set_status(job, status='failed', last_error=error, finished_at=datetime.now().isoformat())
+                return
+            stats['retries'] += 1
+            wait_time = self.backoff[min(attempt - 1, len(self.backoff) - 1)] if self.backoff else 0
+            logger.warning(f"print_spool_retry device={key} job={job['id']} attempt={attempt} error={error} wait={wait_time}s")
+            self._set_status(job, status='queued', last_error=error)
+            if wait_time:
+                time.sleep(wait_time)
+
+    # --- listeners / queries ---
+    def add_listener(self, callback):
+        with self._lock:
+            if callback not in self._listeners:
+                self._listeners.append(callback)
+
+    def _notify_listeners(self, job):
+        with self._lock:
+            listeners = list(self._listeners)
+        snapshot = _public_job(job)
+        for callback in listeners:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                logger.error(f"print_spool_listener_error job={job.get('id')} error={e}")
+
+    def get_job(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return _public_job(job)
+        path = self._job_path(str(job_id))
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return _public_job(json.load(f))
+        except Exception:
+            return None
+
+    def wait_for(self, job_ids, timeout):
+        """Blocks until every job is final or ``timeout`` expires; returns their snapshots."""
+        deadline = time.monotonic() + max(0.0, float(timeout or 0))
+        with self._changed:
+            while True:
+                pending = [
+                    job_id for job_id in job_ids
+                    if self._jobs.get(job_id, {}).get('status') in PENDING_STATUSES
+                ]
+                remaining = deadline - time.monotonic()
+                if not pending or remaining <= 0:
+                    break
+                self._changed.wait(remaining)
+            result = {job_id: _public_job(self._jobs[job_id]) for job_id in job_ids if job_id in self._jobs}
+        for job_id in job_ids:
+            if job_id not in result:
+                job = self.get_job(job_id)
+                if job is not None:
+                    result[job_id] = job
+        return result
+
+    def status(self):
+        with self._lock:
+            devices = {}
+            for key, q in self._queues.items():
+                stats = dict(self._device_stats.get(key) or {})
+                stats['queue_depth'] = q.qsize()
+                stats['pending'] = sum(
+                    1 for job in self._jobs.values()
+                    if job['device_key'] == key and job.get('status') in PENDING_STATUSES
+                )
+                devices[key] = stats
+            return {'spool_dir': self.spool_dir, 'devices': devices, 'jobs_in_memory': len(self._jobs)}
+
+
+class StandInPrinter:
+    """
+    Local TCP stand-in for a raw 9100 printer, used by tests and the spooler
+    benchmark. ``delay`` simulates print time per connection and
+    ``online=False`` refuses connections like a powered-off device.
+    """
+
+    def __init__(self, delay=0.0, host='127.0.0.1', port=0):
+        self.delay = float(delay)
+        self.received = []
+        self._lock = threading.Lock()
+        stand_in = self
+
+        class _Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                chunks = []
+                while True:
+                    chunk = self.request.recv(65536)
+                    if not chunk:
+                        break
+                    chunks.append(chunk)
+                if stand_in.delay:
+                    time.sleep(stand_in.delay)
+                with stand_in._lock:
+                    stand_in.received.append(b''.join(chunks))
+
+        class _Server(socketserver.ThreadingTCPServer):
+            allow_reuse_address = True
+            daemon_threads = True
+
+        self._server = _Server((host, port), _Handler)
+        self.host, self.port = self._server.server_address[:2]
+        self._thread = threading.Thread(target=self._server.serve_forever, name='standin-printer', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    @property
+    def config(self):
+        return {'id': f"standin_{self.port}", 'name': f"StandIn {self.port}", 'type': 'network', 'ip': self.host, 'port': self.port}
+
+    def jobs_received(self):
+        with self._lock:
+            return len(self.received)
+
+    @staticmethod
+    def unused_port(host='127.0.0.1'):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.bind((host, 0))
+            return s.getsockname()[1]
+
+
+def _benchmark(devices=3, jobs_per_device=50, delay=0.01):
+    """Throughput of the spooler against local stand-in printers (one of them offline)."""
+    import tempfile
+
+    def transport(job, payload):
+        device = job['device']
+        try:
+            with socket.create_connection((device['ip'], int(device['port'])), timeout=2) as s:
+                s.sendall(payload)
+            return True, None
+        except OSError as e:
+            return False, str(e)
+
+    printers = [StandInPrinter(delay=delay).start() for _ in range(devices)]
+    offline = {'type': 'network', 'ip': '127.0.0.1', 'port': StandInPrinter.unused_port()}
+    with tempfile.TemporaryDirectory() as spool_dir:
+        spooler = PrintSpooler(transport, spool_dir=spool_dir, backoff=(0.5,))
+        spooler.submit(offline, b'offline ticket', max_attempts=10)
+        started = time.perf_counter()
+        job_ids = [
+            spooler.submit(printer.config, b'x' * 512)
+            for _ in range(jobs_per_device)
+            for printer in printers
+        ]
+        spooler.wait_for(job_ids, timeout=120)
+        elapsed = time.perf_counter() - started
+    for printer in printers:
+        printer.stop()
+    done = sum(printer.jobs_received() for printer in printers)
+    return {
+        'jobs': len(job_ids),
+        'delivered': done,
+        'seconds': round(elapsed, 3),
+        'jobs_per_second': round(done / elapsed, 1) if elapsed else None,
+    }
+
+
+if __name__ == '__main__':
+    print(json.dumps(_benchmark(), indent=2))
@@ -9,16 +9,34 @@ from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime
 from app.services.printer_manager import load_printer_settings, load_printers
+from app.services.print_spooler_service import PrintSpooler
+from app.services.menu_catalog_service import build_print_routes
 from app.services.system_config_manager import BASE_DIR
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Global lock for printing synchronization
-print_lock = threading.RLock()
+# Printing is serialized per device (IP:port / Windows queue), never globally,
+# so a slow or offline printer does not hold up the others.
+_device_locks = {}
+_device_locks_guard = threading.Lock()
 _print_context = threading.local()
 
+# How long print_order_items waits for its spooled jobs before answering with
+# the job ids; jobs still pending keep printing in the background.
+ORDER_PRINT_WAIT_SECONDS = 2.0
+_spooler = None
+_spooler_guard = threading.Lock()
+
+def _device_lock(key):
+    with _device_locks_guard:
+        lock = _device_locks.get(key)
+        if lock is None:
+            lock = threading.RLock()
+            _device_locks[key] = lock
+        return lock
+
 try:
     import win32print
 except ImportError:
@@ -225,7 +243,7 @@ def send_to_windows_printer(printer_name, data):
         return False, "win32print module not installed"
     
     try:
-        with print_lock:
+        with _device_lock(f"win:{printer_name}"):
             hPrinter = win32print.OpenPrinter(printer_name)
             try:
                 hJob = win32print.StartDocPrinter(hPrinter, 1, ("Print Job", None, "RAW"))
@@ -259,7 +277,7 @@ def send_to_printer(ip, port, data, retries=3):
     
     for attempt in range(1, retries + 1):
         try:
-            with print_lock:
+            with _device_lock(f"net:{ip}:{int(port)}"):
                 with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
                     s.settimeout(5) # 5 seconds timeout for connection
                     s.connect((ip, int(port)))
@@ -275,6 +293,24 @@ def send_to_printer(ip, port, data, retries=3):
     logger.error(f"Failed to print to {ip}:{port} after {retries} attempts. Last error: {last_error}")
     return False, last_error
 
+def _spool_transport(job, payload):
+    device = job.get('device') or {}
+    with _with_print_context(**(job.get('context') or {})):
+        if device.get('type') == 'windows':
+            return send_to_windows_printer(device.get('windows_name'), payload)
+        # Retries and backoff are handled by the spooler worker of this device.
+        return send_to_printer(device.get('ip'), device.get('port', 9100), payload, retries=1)
+
+def get_print_spooler():
+    global _spooler
+    with _spooler_guard:
+        if _spooler is None:
+            _spooler = PrintSpooler(transport=_spool_transport)
+        return _spooler
+
+def get_print_job(job_id):
+    return get_print_spooler().get_job(job_id)
+
 def get_printer_by_id(printer_id):
     """Retrieves printer configuration by ID."""
     if not printer_id:
@@ -603,39 +639,32 @@ def format_ticket(table_id, waiter_name, items, printer_name):
     
     return cmd
 
-def print_order_items(table_id, waiter_name, new_items, printers_config, products_db):
+def print_order_items(table_id, waiter_name, new_items, printers_config, products_db, wait_timeout=None):
     """
     Groups items by printer and sends print jobs.
     new_items: list of dicts {name, qty, ...}
     printers_config: list of dicts {id, name, ip, port}
     products_db: list of dicts (to look up printer_id for product name)
+
+    Each printer gets its own spooled job (see print_spooler_service). The call
+    waits up to ``wait_timeout`` seconds (ORDER_PRINT_WAIT_SECONDS by default)
+    for the jobs; items of jobs still pending are returned in ``pending_ids``
+    and ``jobs`` maps printer name -> job id for status polling.
     """
-    # Acquire lock to ensure sequential printing (prevents race conditions from concurrent requests)
-    if not print_lock.acquire(timeout=10):
-        logger.error(f"Could not acquire print lock for table {table_id}")
-        return {"results": {"error": "System busy, try again"}, "printed_ids": []}
-        
+    if wait_timeout is None:
+        wait_timeout = ORDER_PRINT_WAIT_SECONDS
     try:
         if not new_items:
             logger.warning(f"Print request for Table {table_id} ignored: No items provided.")
-            return {"results": {"error": "No items"}, "printed_ids": []}
+            return {"results": {"error": "No items"}, "printed_ids": [], "pending_ids": [], "jobs": {}}
 
         logger.info(f"Processing print order for Table {table_id} (Items: {len(new_items)})")
         
-        # Create maps of product flags and printer routing
-        product_printer_map = {}
-        product_flags = {}
-        for p in products_db:
-            name = p.get('name')
-            if not name:
-                continue
-            printer_id = p.get('printer_id')
-            product_printer_map[name] = printer_id
-            product_flags[name] = {
-                'should_print': p.get('should_print', True),
-                'printer_id': printer_id
-            }
-                
+        # Printer routing per product name (precomputed when given a MenuCatalog)
+        product_flags = getattr(products_db, 'print_routes', None)
+        if product_flags is None:
+            product_flags = build_print_routes(products_db)
+
         jobs = {}
         
         for item in new_items:
@@ -649,7 +678,7 @@ def print_order_items(table_id, waiter_name, new_items, printers_config, product
 
             flags = product_flags.get(p_name, {})
             should_print_flag = flags.get('should_print', True)
-            printer_id = product_printer_map.get(p_name)
+            printer_id = flags.get('printer_id')
             
             if not should_print_flag or printer_id == 'no_print':
                 continue
@@ -669,50 +698,50 @@ def print_order_items(table_id, waiter_name, new_items, printers_config, product
                 
         results = {}
         printed_item_ids = []
+        pending_item_ids = []
+        spooled = {}
+        spooler = get_print_spooler()
         
-        # Process each job (printer)
+        # Queue one job per printer; each device prints on its own worker
         for printer_id, items in jobs.items():
             printer = next((p for p in printers_config if str(p['id']) == str(printer_id)), None)
             
             if printer:
-                # Construct ticket data
                 ticket_data = format_ticket(table_id, waiter_name, items, f"{printer['name']}")
-                
-                # Send to printer
-                success = False
-                error = None
-                
-                if printer.get('type') == 'windows':
-                    with _with_print_context(
-                        print_type='kitchen_order',
-                        table_id=table_id,
-                        waiter_name=waiter_name,
-                    ):
-                        success, error = send_to_windows_printer(printer.get('windows_name'), ticket_data)
-                else:
-                    with _with_print_context(
-                        print_type='kitchen_order',
-                        table_id=table_id,
-                        waiter_name=waiter_name,
-                    ):
-                        success, error = send_to_printer(printer.get('ip'), printer.get('port', 9100), ticket_data)
-                
-                results[f"{printer['name']}"] = "OK" if success else f"Error: {error}"
-                
-                if success:
-                    for item in items:
-                        if 'id' in item:
-                            printed_item_ids.append(item['id'])
-                else:
-                    logger.error(f"Failed to print to {printer['name']}: {error}")
+                job_id = spooler.submit(
+                    printer,
+                    ticket_data,
+                    context={'print_type': 'kitchen_order', 'table_id': table_id, 'waiter_name': waiter_name},
+                    item_ids=[item['id'] for item in items if 'id' in item],
+                )
+                spooled[job_id] = (printer, items)
+
+        finished = spooler.wait_for(list(spooled.keys()), wait_timeout)
+        for job_id, (printer, items) in spooled.items():
+            job = finished.get(job_id) or {}
+            status = job.get('status')
+            item_ids = [item['id'] for item in items if 'id' in item]
+            if status == 'done':
+                results[f"{printer['name']}"] = "OK"
+                printed_item_ids.extend(item_ids)
+            elif status in ('queued', 'printing'):
+                results[f"{printer['name']}"] = f"Queued: {job_id}"
+                pending_item_ids.extend(item_ids)
+            else:
+                error = job.get('last_error')
+                results[f"{printer['name']}"] = f"Error: {error}"
+                logger.error(f"Failed to print to {printer['name']}: {error}")
         
-        return {"results": results, "printed_ids": printed_item_ids}
+        return {
+            "results": results,
+            "printed_ids": printed_item_ids,
+            "pending_ids": pending_item_ids,
+            "jobs": {spooled[job_id][0]['name']: job_id for job_id in spooled},
+        }
         
     except Exception as e:
         logger.error(f"Unexpected error in print_order_items: {e}")
-        return {"results": {"error": str(e)}, "printed_ids": []}
-    finally:
-        print_lock.release()
+        return {"results": {"error": str(e)}, "printed_ids": [], "pending_ids": [], "jobs": {}}
 
 def print_transfer_ticket(from_table, to_table, waiter_name, printers_config):
     """
@@ -1151,12 +1180,18 @@ def format_cancellation_ticket(table_id, waiter_name, items, printer_name, justi
     cmd += SEPARATOR + b'\n\n\n\n' + GS + b'V' + b'\x41' + b'\x03'
     return cmd
 
+def _menu_item_by_name(products_db, name):
+    by_name = getattr(products_db, 'by_name', None)
+    if by_name is not None:
+        return by_name.get(name)
+    return next((p for p in products_db if p['name'] == name), None)
+
 def print_cancellation_items(table_id, waiter_name, cancelled_items, printers_config, products_db, justification=None):
     settings = load_printer_settings()
     if settings.get('frigobar_filter_enabled', True):
         filtered_items = []
         for item in cancelled_items:
-            product = next((p for p in products_db if p['name'] == item['name']), None)
+            product = _menu_item_by_name(products_db, item['name'])
             category = product.get('category') if product else item.get('category')
             if category != 'Frigobar':
                 filtered_items.append(item)
@@ -1166,7 +1201,7 @@ def print_cancellation_items(table_id, waiter_name, cancelled_items, printers_co
     # Use same logic as print_order_items for routing
     printer_groups = {}
     for item in cancelled_items:
-        product = next((p for p in products_db if p['name'] == item['name']), None)
+        product = _menu_item_by_name(products_db, item['name'])
         printer_id = product.get('printer_id') if product else None
         
         if not printer_id:
@@ -3,6 +3,7 @@ import uuid
 from datetime import datetime, timedelta
 from typing import Any, Dict, List, Optional
 
+from app.services.audit_log_service import get_audit_log
 from app.services.cashier_service import file_lock
 from app.services.logger_service import LoggerService
 from app.services.period_selector_service import PeriodSelectorService
@@ -62,14 +63,8 @@ class PromotionalPackageService:
             cls._save_json(PROMOTIONAL_PACKAGES_FILE, rows)
 
     @classmethod
-    def _load_logs(cls) -> List[Dict[str, Any]]:
-        data = cls._load_json(PROMOTIONAL_PACKAGES_LOGS_FILE, [])
-        return data if isinstance(data, list) else []
-
-    @classmethod
-    def _save_logs(cls, rows: List[Dict[str, Any]]) -> None:
-        with file_lock(PROMOTIONAL_PACKAGES_LOGS_FILE):
-            cls._save_json(PROMOTIONAL_PACKAGES_LOGS_FILE, rows)
+    def _audit_log(cls):
+        return get_audit_log(PROMOTIONAL_PACKAGES_LOGS_FILE, entity_field='package_id')
 
     @classmethod
     def _validate_payload(cls, payload: Dict[str, Any]) -> Dict[str, Any]:
@@ -128,9 +123,7 @@ class PromotionalPackageService:
             'before': before,
             'after': after,
         }
-        logs = cls._load_logs()
-        logs.append(log_row)
-        cls._save_logs(logs)
+        cls._audit_log().append([log_row])
         LoggerService.log_acao(
             acao='Pacote promocional atualizado',
             entidade='Revenue Management',
@@ -209,12 +202,11 @@ class PromotionalPackageService:
 
     @classmethod
     def list_logs(cls, start_date: Optional[str] = None, end_date: Optional[str] = None, user: Optional[str] = None) -> List[Dict[str, Any]]:
-        rows = cls._load_logs()
         start = PeriodSelectorService.parse_date(start_date).date() if start_date else None
         end = PeriodSelectorService.parse_date(end_date).date() if end_date else None
         user_norm = cls._normalize_text(user)
         out = []
-        for row in rows:
+        for row in cls._audit_log().query(start=start, end=end, user=user_norm, user_contains=True):
             ts = str(row.get('timestamp') or '')
             row_user = cls._normalize_text(row.get('user'))
             try:
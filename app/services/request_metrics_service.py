@@ -0,0 +1,341 @@
+import functools
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime
+
+
+# Latency buckets (ms): geometric from 0.25 ms to ~2 min, 25% apart, so a
+# percentile read from the histogram is within 25% of the true value.
+BUCKET_BOUNDS_MS = tuple(round(0.25 * 1.25 ** i, 3) for i in range(60))
+SECTIONS = ('json_load', 'json_save', 'file_lock_wait', 'print_dispatch')
+DEFAULT_PROFILE_INTERVAL_MS = 5
+PROFILE_MAX_FRAMES = 64
+
+
+def metrics_enabled():
+    raw = str(os.environ.get('ALMAREIA_METRICS', '1') or '1').strip().lower()
+    return raw not in ('0', 'false', 'no', 'off')
+
+
+def _env_int(name, default):
+    raw = str(os.environ.get(name) or '').strip()
+    if not raw:
+        return default
+    try:
+        return max(0, int(raw))
+    except ValueError:
+        return default
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram; cheap to update, percentiles on read."""
+
+    __slots__ = ('counts', 'count', 'total_ms', 'max_ms')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms):
+        self.counts[bisect_left(BUCKET_BOUNDS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def percentile(self, q):
+        if not self.count:
+            return None
+        target = q * self.count
+        running = 0
+        for idx, n in enumerate(self.counts):
+            running += n
+            if running >= target:
+                bound = BUCKET_BOUNDS_MS[idx] if idx < len(BUCKET_BOUNDS_MS) else self.max_ms
+                return round(min(bound, self.max_ms), 3)
+        return round(self.max_ms, 3)
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total_ms / self.count, 3) if self.count else None,
+            'p50_ms': self.percentile(0.50),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'max_ms': round(self.max_ms, 3),
+            'total_ms': round(self.total_ms, 3),
+        }
+
+
+class RequestMetrics:
+    """
+    In-process request instrumentation.
+
+    Per endpoint: a latency histogram plus the time its requests spent in
+    each named section (JSON load/save, file_lock wait, print dispatch).
+    Sections are also tracked globally, so work done outside a request
+    (print spool workers, scheduler jobs) is still visible.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.started_at = datetime.now().isoformat()
+        self._endpoints = {}
+        self._sections = {name: LatencyHistogram() for name in SECTIONS}
+
+    # --- per-request accumulation ---
+    def begin_request(self):
+        self._local.sections = {}
+        self._local.depth = {}
+
+    def end_request(self, endpoint, elapsed_ms, status_code=None):
+        sections = getattr(self._local, 'sections', None) or {}
+        self._local.sections = None
+        with self._lock:
+            entry = self._endpoints.get(endpoint)
+            if entry is None:
+                entry = self._endpoints[endpoint] = {
+                    'latency': LatencyHistogram(),
+                    'sections_ms': {},
+                    'errors': 0,
+                }
+            entry['latency'].add(elapsed_ms)
+            if status_code is not None and int(status_code) >= 500:
+                entry['errors'] += 1
+            for name, ms in sections.items():
+                entry['sections_ms'][name] = entry['sections_ms'].get(name, 0.0) + ms
+        return sections
+
+    # --- sections ---
+    def record(self, section, ms):
+        with self._lock:
+            hist = self._sections.get(section)
+            if hist is None:
+                hist = self._sections[section] = LatencyHistogram()
+            hist.add(ms)
+        sections = getattr(self._local, 'sections', None)
+        if sections is not None:
+            sections[section] = sections.get(section, 0.0) + ms
+
+    def _enter(self, section):
+        depth = getattr(self._local, 'depth', None)
+        if depth is None:
+            depth = self._local.depth = {}
+        depth[section] = depth.get(section, 0) + 1
+        return depth[section] == 1
+
+    def _exit(self, section):
+        self._local.depth[section] -= 1
+
+    def section(self, name):
+        return _SectionTimer(self, name)
+
+    # --- reporting ---
+    def snapshot(self, top=None):
+        with self._lock:
+            endpoints = []
+            for endpoint, entry in self._endpoints.items():
+                summary = entry['latency'].summary()
+                count = summary['count'] or 1
+                endpoints.append({
+                    'endpoint': endpoint,
+                    'errors': entry['errors'],
+                    **summary,
+                    'sections_avg_ms': {k: round(v / count, 3) for k, v in sorted(entry['sections_ms'].items())},
+                })
+            sections = {name: hist.summary() for name, hist in self._sections.items()}
+        endpoints.sort(key=lambda e: e['total_ms'], reverse=True)
+        if top:
+            endpoints = endpoints[:top]
+        return {
+            'enabled': metrics_enabled(),
+            'started_at': self.started_at,
+            'endpoints': endpoints,
+            'sections': sections,
+        }
+
+    def reset(self):
+        with self._lock:
+            self.started_at = datetime.now().isoformat()
+            self._endpoints = {}
+            self._sections = {name: LatencyHistogram() for name in SECTIONS}
+
+
+class _SectionTimer:
+    __slots__ = ('metrics', 'name', 'started', 'outer')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        # Only the outermost timer of a section counts (e.g. _save_json
+        # delegating to _save_json_atomic is one save, not two).
+        self.outer = self.metrics._enter(self.name)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed_ms = (time.perf_counter() - self.started) * 1000.0
+        self.metrics._exit(self.name)
+        if self.outer and metrics_enabled():
+            self.metrics.record(self.name, elapsed_ms)
+        return False
+
+
+_METRICS = RequestMetrics()
+
+
+def get_request_metrics():
+    return _METRICS
+
+
+def record_section(section, ms):
+    if metrics_enabled():
+        _METRICS.record(section, ms)
+
+
+def timed_section(section):
+    """Decorator form of get_request_metrics().section(name)."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _METRICS.section(section):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class StackSampler:
+    """
+    Samples one thread's Python stack every ``interval_ms`` and keeps the
+    counts as collapsed stacks ("root;caller;callee count"), the input
+    format of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, thread_id, interval_ms=DEFAULT_PROFILE_INTERVAL_MS):
+        self.thread_id = thread_id
+        self.interval = max(1, int(interval_ms)) / 1000.0
+        self.stacks = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None and len(names) < PROFILE_MAX_FRAMES:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            key = ';'.join(reversed(names))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        return self
+
+    def write_folded(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+class RequestProfiler:
+    """Opt-in: profiles every Nth request (ALMAREIA_PROFILE_EVERY_N, 0 = off)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seen = 0
+        self.written = []
+
+    @staticmethod
+    def every_n():
+        return _env_int('ALMAREIA_PROFILE_EVERY_N', 0)
+
+    def maybe_start(self):
+        every = self.every_n()
+        if not every:
+            return None
+        with self._lock:
+            self._seen += 1
+            if self._seen % every:
+                return None
+        interval = _env_int('ALMAREIA_PROFILE_INTERVAL_MS', DEFAULT_PROFILE_INTERVAL_MS)
+        return StackSampler(threading.get_ident(), interval).start()
+
+    def finish(self, sampler, endpoint, elapsed_ms, out_dir):
+        sampler.stop()
+        if not sampler.samples:
+            return None
+        safe = ''.join(ch if ch.isalnum() else '_' for ch in endpoint).strip('_')[:80] or 'request'
+        name = f"{datetime.now().strftime('%H%M%S_%f')}_{int(elapsed_ms)}ms_{safe}.folded"
+        path = sampler.write_folded(os.path.join(out_dir, datetime.now().strftime('%Y-%m-%d'), name))
+        with self._lock:
+            self.written = (self.written + [path])[-20:]
+        return path
+
+
+_PROFILER = RequestProfiler()
+
+
+def get_request_profiler():
+    return _PROFILER
+
+
+def init_app(app, profile_dir=None):
+    """Installs the timing hooks on ``app``; profiles go to ``profile_dir``."""
+    from flask import g, request
+
+    if profile_dir is None:
+        from app.services.system_config_manager import get_log_path
+        profile_dir = get_log_path('profiles')
+    app.config.setdefault('ALMAREIA_PROFILE_DIR', profile_dir)
+
+    @app.before_request
+    def _metrics_begin():
+        g.metrics_started = time.perf_counter()
+        _METRICS.begin_request()
+        g.metrics_sampler = _PROFILER.maybe_start()
+
+    @app.teardown_request
+    def _metrics_end(exc=None):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        rule = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+        endpoint = f"{request.method} {rule}"
+        status = getattr(g, 'metrics_status', None) or (500 if exc is not None else None)
+        if metrics_enabled() and not request.path.startswith('/static'):
+            _METRICS.end_request(endpoint, elapsed_ms, status)
+        sampler = g.pop('metrics_sampler', None)
+        if sampler is not None:
+            try:
+                _PROFILER.finish(sampler, endpoint, elapsed_ms, app.config['ALMAREIA_PROFILE_DIR'])
+            except OSError as e:
+                app.logger.warning(f"request_profile_write_failed endpoint={endpoint} error={e}")
+
+    @app.after_request
+    def _metrics_status(response):
+        g.metrics_status = response.status_code
+        return response
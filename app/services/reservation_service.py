@@ -9,6 +9,9 @@ from app.services.system_config_manager import (
     MANUAL_RESERVATIONS_FILE, RESERVATIONS_DIR
 )
 from app.services.cashier_service import file_lock
+from app.services.reservation_source_store import (
+    IntervalUnion, ReservationIndex, get_reservation_source_store, input_signature
+)
 
 class ReservationService:
     RESERVATIONS_DIR = RESERVATIONS_DIR
@@ -228,23 +231,11 @@ class ReservationService:
                 res['source_type'] = 'manual'
                 return res
         
-        # Check Main Excel
-        if os.path.exists(self.RESERVATIONS_FILE):
-            items = self._parse_excel_file(self.RESERVATIONS_FILE)
-            for item in items:
-                if str(item.get('id')) == str(reservation_id):
-                    item['source_type'] = 'excel'
-                    return item
-                    
-        # Check other Excel files in directory
-        if os.path.exists(self.RESERVATIONS_DIR):
-            for f in os.listdir(self.RESERVATIONS_DIR):
-                if (f.endswith('.xlsx') or f.endswith('.xls')) and f != os.path.basename(self.RESERVATIONS_FILE):
-                    items = self._parse_excel_file(os.path.join(self.RESERVATIONS_DIR, f))
-                    for item in items:
-                        if str(item.get('id')) == str(reservation_id):
-                            item['source_type'] = 'excel'
-                            return item
+        # Check Excel (main file first, then the others in the directory)
+        item = self._source_store().find_by_id(reservation_id, self._parse_excel_file)
+        if item:
+            item['source_type'] = 'excel'
+            return item
         return None
 
     def get_reservation_by_id(self, reservation_id):
@@ -949,21 +940,19 @@ class ReservationService:
                 guest = room_occ.get('guest_name', 'Hóspede')
                 raise ValueError(f'Quarto {room_number} ocupado por {guest} no período selecionado.')
 
-        for res in self.get_february_reservations() or []:
-            rid = str(res.get('id'))
+        index = self._reservation_index()
+        for pos, rid in index.overlapping(room_number, checkin_date, checkout_date):
             if str(reservation_id) != 'new' and rid == str(reservation_id):
                 continue
-            room = self.get_manual_room(rid) if hasattr(self, 'get_manual_room') else None
-            room = room or res.get('allocated_room') or res.get('room') or res.get('room_number')
-            if str(room) != room_number:
-                continue
-            r_in = self._parse_date(res.get('checkin'))
-            r_out = self._parse_date(res.get('checkout'))
-            if r_in and r_out and checkin_date < r_out and checkout_date > r_in:
-                guest = res.get('guest_name', 'Outro hóspede')
-                raise ValueError(f'Conflito com reserva de {guest} no quarto {room_number}.')
+            res = index.row(pos)
+            guest = res.get('guest_name', 'Outro hóspede')
+            raise ValueError(f'Conflito com reserva de {guest} no quarto {room_number}.')
         return True
 
+    def _collision_room(self, res):
+        room = self.get_manual_room(str(res.get('id'))) if hasattr(self, 'get_manual_room') else None
+        return room or res.get('allocated_room') or res.get('room') or res.get('room_number')
+
     def validate_stay_restrictions(self, category, checkin, checkout, package_id=None):
         from app.services.stay_restriction_service import StayRestrictionService
         return StayRestrictionService.validate_stay(
@@ -987,14 +976,7 @@ class ReservationService:
             return False
         if not InventoryRestrictionService.is_open_for_period(category, checkin, checkout):
             return False
-        rooms = self.get_room_mapping().get(category, [])
-        for room in rooms:
-            try:
-                self.check_collision('new', room, checkin, checkout)
-                return True
-            except ValueError:
-                continue
-        return False
+        return bool(self.free_rooms_for_category(category, checkin, checkout))
 
     def available_categories_for_period(self, checkin, checkout, exclude_category=None, channel='Recepção'):
         from app.services.inventory_restriction_service import InventoryRestrictionService
@@ -1014,15 +996,40 @@ class ReservationService:
                 continue
             if not InventoryRestrictionService.is_open_for_period(category, checkin, checkout):
                 continue
-            for room in rooms:
-                try:
-                    self.check_collision('new', room, checkin, checkout)
-                    available.append(category)
-                    break
-                except ValueError:
-                    continue
+            if self.free_rooms_for_category(category, checkin, checkout, rooms=rooms):
+                available.append(category)
         return available
 
+    def free_rooms_for_category(self, category, checkin, checkout, rooms=None):
+        """Rooms of ``category`` with no reservation overlapping [checkin, checkout)."""
+        checkin_date = self._parse_date(checkin)
+        checkout_date = self._parse_date(checkout)
+        if not checkin_date or not checkout_date or checkout_date <= checkin_date:
+            return []
+        if rooms is None:
+            rooms = self.get_room_mapping().get(category, [])
+        return self._reservation_index().free_rooms(rooms, checkin_date, checkout_date)
+
+    def category_availability_calendar(self, start_date, num_days, categories=None):
+        """
+        Free rooms per category for each night of [start_date, start_date + num_days).
+        Returns {category: {'YYYY-MM-DD': free_rooms}}.
+        """
+        from datetime import timedelta
+        start = self._parse_date(start_date)
+        if not start:
+            return {}
+        num_days = max(0, int(num_days or 0))
+        index = self._reservation_index()
+        days = [(start + timedelta(days=offset)).isoformat() for offset in range(num_days)]
+        calendar = {}
+        for category, rooms in self.get_room_mapping().items():
+            if categories and category not in categories:
+                continue
+            counts = index.nightly_free_counts(rooms, start, num_days)
+            calendar[category] = dict(zip(days, counts))
+        return calendar
+
     def add_payment(self, reservation_id, amount, payment_details):
         # print(f"DEBUG: add_payment id={reservation_id} amount={amount}")
         res = self.get_reservation_by_id(reservation_id)
@@ -1359,8 +1366,11 @@ class ReservationService:
 
             allocations[rid] = current
 
+            index_key_before = self._reservation_index_key()[0]
             with open(manual_alloc_file, 'w') as f:
                 json.dump(allocations, f, indent=2)
+            index_key_after = self._reservation_index_key()[0]
+        self._reindex_reservation(rid, index_key_before, index_key_after)
         self._append_sync_log(
             event='manual_allocation_saved',
             reservation_id=rid,
@@ -1549,8 +1559,11 @@ class ReservationService:
             
             reservations.append(new_res)
             
+            index_key_before = self._reservation_index_key()[0]
             with open(self.MANUAL_RESERVATIONS_FILE, 'w') as f:
                 json.dump(reservations, f, indent=2)
+            index_key_after = self._reservation_index_key()[0]
+        self._reindex_reservation(new_res['id'], index_key_before, index_key_after)
             
         try:
             from app.services.reservation_rateio_service import ReservationRateioService
@@ -1659,53 +1672,79 @@ class ReservationService:
         )
         return {'action': action, 'reservation_id': reservation_id}
 
+    def _source_store(self):
+        return get_reservation_source_store(self.RESERVATIONS_DIR, self.RESERVATIONS_FILE)
+
+    def _reservation_index_key(self):
+        """(key, racy) describing every input of the merged reservation list."""
+        store = self._source_store()
+        generation = store.refresh(self._parse_excel_file)
+        side_files = (
+            self.MANUAL_RESERVATIONS_FILE,
+            self.MANUAL_ALLOCATIONS_FILE,
+            self.RESERVATION_STATUS_OVERRIDES_FILE,
+            self.RESERVATION_PAYMENTS_FILE,
+        )
+        side_signature, racy = input_signature(side_files)
+        key = (generation, tuple(zip(side_files, side_signature)), datetime.now().date().isoformat())
+        return key, racy
+
+    def _reservation_index(self):
+        """
+        Merged reservations indexed by id and room/date interval. Rebuilt only
+        when a spreadsheet or one of the JSON side files changes (or the day
+        turns, since status normalization depends on today's date).
+        """
+        store = self._source_store()
+        key, racy = self._reservation_index_key()
+        return store.merged_index(
+            key,
+            racy,
+            lambda: ReservationIndex(
+                self._merge_reservation_sources(store.rows(self._parse_excel_file)),
+                self._parse_date,
+                self._collision_room,
+            ),
+        )
+
+    def _reindex_reservation(self, reservation_id, key_before, key_after):
+        """
+        Folds one reservation written by this service into the cached index
+        instead of rebuilding it. ``key_before``/``key_after`` are the input
+        keys taken under the file lock around the write. New reservations are
+        appended at the end of the list.
+        """
+        rid = str(reservation_id)
+
+        def _mutate(index):
+            base = next((r for r in self.get_manual_reservations_data() if str(r.get('id')) == rid), None)
+            source_type = 'manual'
+            if base is None:
+                base = self._source_store().find_by_id(rid, self._parse_excel_file)
+                source_type = 'excel'
+            if base is None:
+                return
+            index.upsert(self._merge_reservation_item(
+                base, source_type, self.get_reservation_status_overrides(), self.get_reservation_payments()
+            ))
+
+        return self._source_store().apply_incremental(key_before, key_after, _mutate)
+
     def get_february_reservations(self):
         """
         Retrieves all active reservations from Manual and Excel sources.
         Originally named for a specific month, now returns all relevant reservations.
         """
-        # Load Manual
-        manual = self.get_manual_reservations_data()
-        
-        # Load Excel
-        excel_items = []
-        if os.path.exists(self.RESERVATIONS_FILE):
-             excel_items.extend(self._parse_excel_file(self.RESERVATIONS_FILE))
-        
-        if os.path.exists(self.RESERVATIONS_DIR):
-             for f in os.listdir(self.RESERVATIONS_DIR):
-                 if (f.endswith('.xlsx') or f.endswith('.xls')) and f != os.path.basename(self.RESERVATIONS_FILE):
-                     try:
-                        excel_items.extend(self._parse_excel_file(os.path.join(self.RESERVATIONS_DIR, f)))
-                     except: pass
-        
-        overrides = self.get_reservation_status_overrides()
-        sidecar = self.get_reservation_payments()
-        merged_manual = []
-        for item in manual:
-            rid = str(item.get('id') or '')
-            base_item = dict(item)
-            base_item['source_type'] = 'manual'
-            if rid in overrides:
-                base_item['status'] = overrides[rid]
-            merged_item = self.merge_overrides_into_reservation(rid, base_item)
-            status_info = self.normalize_reservation_status(
-                merged_item.get('status'),
-                merged_item.get('checkin'),
-                merged_item.get('checkout')
-            )
-            merged_item['reservation_status_code'] = status_info.get('code')
-            merged_item['reservation_status_label'] = status_info.get('label')
-            merged_manual.append(merged_item)
-
-        merged_excel = []
-        for item in excel_items:
-            rid = str(item.get('id') or '')
-            base_item = dict(item)
-            base_item['source_type'] = 'excel'
-            if rid in overrides:
-                base_item['status'] = overrides[rid]
-            merged_item = self.merge_overrides_into_reservation(rid, base_item)
+        return self._reservation_index().reservations()
+
+    def _merge_reservation_item(self, item, source_type, overrides, sidecar):
+        rid = str(item.get('id') or '')
+        base_item = dict(item)
+        base_item['source_type'] = source_type
+        if rid in overrides:
+            base_item['status'] = overrides[rid]
+        merged_item = self.merge_overrides_into_reservation(rid, base_item)
+        if source_type == 'excel':
             payments = sidecar.get(rid, []) if isinstance(sidecar, dict) else []
             sidecar_total = 0.0
             if isinstance(payments, list):
@@ -1719,16 +1758,22 @@ class ReservationService:
                 merged_item['to_receive'] = f"{to_receive_num:.2f}"
                 merged_item['paid_amount_val'] = round(paid_num, 2)
                 merged_item['to_receive_val'] = round(to_receive_num, 2)
-            status_info = self.normalize_reservation_status(
-                merged_item.get('status'),
-                merged_item.get('checkin'),
-                merged_item.get('checkout')
-            )
-            merged_item['reservation_status_code'] = status_info.get('code')
-            merged_item['reservation_status_label'] = status_info.get('label')
-            merged_excel.append(merged_item)
+        status_info = self.normalize_reservation_status(
+            merged_item.get('status'),
+            merged_item.get('checkin'),
+            merged_item.get('checkout')
+        )
+        merged_item['reservation_status_code'] = status_info.get('code')
+        merged_item['reservation_status_label'] = status_info.get('label')
+        return merged_item
 
-        return merged_manual + merged_excel
+    def _merge_reservation_sources(self, excel_items):
+        manual = self.get_manual_reservations_data()
+        overrides = self.get_reservation_status_overrides()
+        sidecar = self.get_reservation_payments()
+        merged = [self._merge_reservation_item(item, 'manual', overrides, sidecar) for item in manual]
+        merged.extend(self._merge_reservation_item(item, 'excel', overrides, sidecar) for item in excel_items)
+        return merged
 
     def get_room_mapping(self):
         """
@@ -1769,17 +1814,18 @@ class ReservationService:
         Places reservations into the grid.
         Resolves room allocation based on manual allocations or category matching.
         """
-        import json
-        from datetime import timedelta
-        
         # Load Manual Allocations
-        manual_allocs = {}
-        manual_alloc_file = self.MANUAL_ALLOCATIONS_FILE
-        if os.path.exists(manual_alloc_file):
-            try:
-                with open(manual_alloc_file, 'r') as f:
-                    manual_allocs = json.load(f)
-            except: pass
+        manual_allocs = self._load_manual_allocations()
+
+        # Occupied slot ranges per room, so the free-room test is a bisect
+        # instead of a walk over every slot of the stay.
+        occupied = {}
+        for room, slots in grid.items():
+            taken = IntervalUnion()
+            for idx, cell in enumerate(slots):
+                if cell is not None:
+                    taken.add(idx, idx)
+            occupied[room] = taken
 
         # Sort reservations to prioritize fixed allocations?
         # Or just process all.
@@ -1879,13 +1925,8 @@ class ReservationService:
                     
                     # Find first free room
                     for room in candidates:
-                        is_free = True
                         if room not in grid: continue
-                        for s in range(eff_start, eff_end + 1):
-                            if grid[room][s] is not None:
-                                is_free = False
-                                break
-                        if is_free:
+                        if not occupied[room].intersects(eff_start, eff_end):
                             allocated_room = room
                             break
                             
@@ -1944,6 +1985,7 @@ class ReservationService:
                             # Maybe we shouldn't have placed it if occupied.
                             # But if it was manually allocated, we force it.
                             pass
+                    occupied[allocated_room].add(eff_start, eff_end)
                             
             except Exception as e:
                 print(f"Error allocating reservation {res.get('id')}: {e}")
@@ -0,0 +1,461 @@
+import copy
+import hashlib
+import json
+import logging
+import marshal
+import os
+import threading
+from bisect import bisect_left, bisect_right
+
+from app.services.json_document_cache import is_racy, stat_token
+
+
+CACHE_VERSION = 1
+CACHE_FILENAME = 'reservation_source_cache.json'
+SPREADSHEET_EXTENSIONS = ('.xlsx', '.xls')
+
+logger = logging.getLogger(__name__)
+
+
+def _stat_signature(path):
+    # As a list: signatures are persisted in the JSON cache file.
+    token = stat_token(path)
+    return list(token) if token is not None else None
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _freeze(value):
+    try:
+        return marshal.dumps(value)
+    except ValueError:
+        return copy.deepcopy(value)
+
+
+def _thaw(frozen):
+    if isinstance(frozen, bytes):
+        return marshal.loads(frozen)
+    return copy.deepcopy(frozen)
+
+
+class RoomStays:
+    """
+    Stays of one room as (checkin, checkout, position, reservation_id)
+    ordinals, sorted by check-in with a running maximum of check-out: an
+    overlap query is a bisect plus a walk over the stays that can still
+    intersect the requested period.
+    """
+
+    def __init__(self):
+        self.stays = []
+        self.starts = []
+        self.max_end = []
+
+    def _reindex_from(self, idx):
+        highest = self.max_end[idx - 1] if idx > 0 else None
+        del self.max_end[idx:]
+        for stay in self.stays[idx:]:
+            highest = stay[1] if highest is None else max(highest, stay[1])
+            self.max_end.append(highest)
+
+    def add(self, stay):
+        idx = bisect_left(self.stays, stay)
+        self.stays.insert(idx, stay)
+        self.starts.insert(idx, stay[0])
+        self._reindex_from(idx)
+
+    def remove(self, stay):
+        idx = bisect_left(self.stays, stay)
+        if idx < len(self.stays) and self.stays[idx] == stay:
+            del self.stays[idx]
+            del self.starts[idx]
+            self._reindex_from(idx)
+
+    def overlapping(self, start, end):
+        idx = bisect_left(self.starts, end) - 1
+        hits = []
+        while idx >= 0 and self.max_end[idx] > start:
+            stay = self.stays[idx]
+            if stay[1] > start:
+                hits.append(stay)
+            idx -= 1
+        return hits
+
+
+class IntervalUnion:
+    """Disjoint sorted [start, end] integer ranges (inclusive) with O(log n) intersection tests."""
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+
+    def intersects(self, start, end):
+        idx = bisect_right(self.starts, end) - 1
+        return idx >= 0 and self.ends[idx] >= start
+
+    def add(self, start, end):
+        lo = bisect_left(self.ends, start - 1)
+        hi = bisect_right(self.starts, end + 1)
+        if lo < hi:
+            start = min(start, self.starts[lo])
+            end = max(end, self.ends[hi - 1])
+        self.starts[lo:hi] = [start]
+        self.ends[lo:hi] = [end]
+
+
+class ReservationIndex:
+    """
+    Merged reservation snapshot with lookups by id and by room/date interval.
+
+    Rows are stored frozen (marshal) so every reader gets a private copy.
+    ``upsert`` replaces or appends one reservation in place, which lets
+    writers in ReservationService keep the index current without a rebuild;
+    each upsert bumps ``revision`` and logs the position it touched, so
+    derived views (the RM occupancy cube) can follow the same changes.
+    ``upsert`` edits the per-room bisect arrays in place, so it and every
+    read hold the index lock.
+    """
+
+    def __init__(self, reservations, parse_date, room_of):
+        self._lock = threading.RLock()
+        self._parse_date = parse_date
+        self._room_of = room_of
+        self._rows = []
+        self._stay_of = {}
+        self.by_id = {}
+        self.by_room = {}
+        self.revision = 0
+        self._changes = []
+        for res in reservations:
+            self._place(len(self._rows), res)
+            self._rows.append(_freeze(res))
+
+    @property
+    def count(self):
+        return len(self._rows)
+
+    def _place(self, pos, res):
+        rid = str(res.get('id'))
+        self.by_id.setdefault(rid, pos)
+        room = self._room_of(res)
+        r_in = self._parse_date(res.get('checkin'))
+        r_out = self._parse_date(res.get('checkout'))
+        if room in (None, '') or not r_in or not r_out:
+            return
+        room = str(room)
+        stay = (r_in.toordinal(), r_out.toordinal(), pos, rid)
+        self.by_room.setdefault(room, RoomStays()).add(stay)
+        self._stay_of[pos] = (room, stay)
+
+    def upsert(self, res):
+        rid = str(res.get('id'))
+        frozen = _freeze(res)
+        with self._lock:
+            pos = self.by_id.get(rid)
+            if pos is None:
+                pos = len(self._rows)
+                self._rows.append(frozen)
+            else:
+                previous = self._stay_of.pop(pos, None)
+                if previous:
+                    self.by_room[previous[0]].remove(previous[1])
+                self._rows[pos] = frozen
+            self._place(pos, res)
+            self._changes.append(pos)
+            self.revision += 1
+            return pos
+
+    def changed_since(self, revision):
+        """Positions upserted after ``revision`` (each once, ascending)."""
+        with self._lock:
+            return sorted(set(self._changes[revision:]))
+
+    def reservations(self):
+        """Private copy of the merged list, in the original source order."""
+        with self._lock:
+            rows = list(self._rows)
+        return [_thaw(frozen) for frozen in rows]
+
+    def get(self, reservation_id):
+        with self._lock:
+            pos = self.by_id.get(str(reservation_id))
+            return None if pos is None else self.row(pos)
+
+    def row(self, pos):
+        with self._lock:
+            frozen = self._rows[pos]
+        return _thaw(frozen)
+
+    def overlapping(self, room_number, checkin_date, checkout_date):
+        """(position, reservation_id) of stays in ``room_number`` intersecting [checkin, checkout)."""
+        with self._lock:
+            bucket = self.by_room.get(str(room_number))
+            if not bucket:
+                return []
+            hits = bucket.overlapping(checkin_date.toordinal(), checkout_date.toordinal())
+        return sorted((stay[2], stay[3]) for stay in hits)
+
+    def is_room_free(self, room_number, checkin_date, checkout_date, exclude_id=None):
+        for _pos, rid in self.overlapping(room_number, checkin_date, checkout_date):
+            if exclude_id is None or rid != str(exclude_id):
+                return False
+        return True
+
+    def free_rooms(self, rooms, checkin_date, checkout_date):
+        return [room for room in rooms if self.is_room_free(room, checkin_date, checkout_date)]
+
+    def nightly_free_counts(self, rooms, start_date, num_days):
+        """Free rooms per night for ``num_days`` nights starting at ``start_date``."""
+        first = start_date.toordinal()
+        last = first + int(num_days)
+        occupied = [0] * int(num_days)
+        for room in rooms:
+            with self._lock:
+                bucket = self.by_room.get(str(room))
+                stays = bucket.overlapping(first, last) if bucket else []
+            nights = IntervalUnion()
+            for stay in stays:
+                nights.add(max(stay[0], first) - first, min(stay[1], last) - first - 1)
+            for night_start, night_end in zip(nights.starts, nights.ends):
+                for night in range(night_start, night_end + 1):
+                    occupied[night] += 1
+        return [len(rooms) - taken for taken in occupied]
+
+
+class ReservationSourceStore:
+    """
+    Parse-once cache of the reservation spreadsheets in one directory.
+
+    Each workbook is parsed only when its (mtime_ns, size, inode) changes and the
+    content hash differs from the last parse; the normalized rows are kept
+    in memory and persisted to ``reservation_source_cache.json`` so a fresh
+    process does not reopen unchanged workbooks. The store also holds the
+    merged ``ReservationIndex`` built by ReservationService, keyed by the
+    signature of every file the merge reads.
+    """
+
+    def __init__(self, reservations_dir, main_file):
+        self.reservations_dir = reservations_dir
+        self.main_file = main_file
+        self._lock = threading.RLock()
+        self._files = None
+        self._generation = 0
+        self._rows = []
+        self._rows_by_id = {}
+        self._listing = None
+        self._index = None
+        self._index_key = None
+        self._index_reusable = False
+        self.counters = {
+            'parses': 0, 'hash_reuses': 0, 'cache_hits': 0,
+            'index_builds': 0, 'index_hits': 0, 'incremental_updates': 0,
+        }
+
+    @property
+    def cache_path(self):
+        return os.path.join(self.reservations_dir, CACHE_FILENAME)
+
+    def spreadsheet_paths(self):
+        """Main workbook first, then the others in directory order (same as the legacy scan)."""
+        paths = []
+        if os.path.exists(self.main_file):
+            paths.append(self.main_file)
+        if os.path.exists(self.reservations_dir):
+            main_name = os.path.basename(self.main_file)
+            for name in os.listdir(self.reservations_dir):
+                if name.endswith(SPREADSHEET_EXTENSIONS) and name != main_name:
+                    paths.append(os.path.join(self.reservations_dir, name))
+        return paths
+
+    def _load_cache_file(self):
+        self._files = {}
+        path = self.cache_path
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                payload = json.load(f)
+        except Exception as e:
+            logger.warning(f"reservation_source_cache_unreadable path={path} error={e}")
+            return
+        if isinstance(payload, dict) and payload.get('version') == CACHE_VERSION:
+            files = payload.get('files')
+            if isinstance(files, dict):
+                self._files = {k: v for k, v in files.items() if isinstance(v, dict) and isinstance(v.get('rows'), list)}
+
+    def _save_cache_file(self):
+        path = self.cache_path
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        payload = {
+            'version': CACHE_VERSION,
+            'files': {k: v for k, v in self._files.items() if v.get('signature') is not None},
+        }
+        try:
+            os.makedirs(self.reservations_dir, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(payload, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.error(f"reservation_source_cache_write_failed path={path} error={e}")
+
+    def _refresh_file(self, path, parser):
+        """Returns (rows_changed, record_changed) for one workbook."""
+        name = os.path.basename(path)
+        signature = _stat_signature(path)
+        cached = self._files.get(name)
+        if cached and signature is not None and cached.get('signature') == signature:
+            self.counters['cache_hits'] += 1
+            return False, False
+        digest = None
+        try:
+            digest = _file_sha256(path)
+        except OSError:
+            pass
+        if cached and digest and cached.get('sha256') == digest:
+            self.counters['hash_reuses'] += 1
+            cached['signature'] = None if is_racy(signature) else signature
+            return False, True
+        rows = parser(path)
+        self.counters['parses'] += 1
+        if _signature_changed_during_read(path, signature):
+            signature = None
+        self._files[name] = {
+            'signature': None if is_racy(signature) else signature,
+            'sha256': digest,
+            'rows': rows if isinstance(rows, list) else [],
+        }
+        return True, True
+
+    def refresh(self, parser):
+        """Brings the spreadsheet rows up to date; returns the current generation."""
+        with self._lock:
+            if self._files is None:
+                self._load_cache_file()
+            paths = self.spreadsheet_paths()
+            listing = [os.path.basename(p) for p in paths]
+            changed = listing != self._listing
+            dirty = False
+            for path in paths:
+                rows_changed, record_changed = self._refresh_file(path, parser)
+                changed = changed or rows_changed
+                dirty = dirty or record_changed
+            stale = set(self._files) - set(listing)
+            for name in stale:
+                self._files.pop(name, None)
+            if changed or stale:
+                self._listing = listing
+                rows = []
+                by_id = {}
+                for name in listing:
+                    for row in self._files[name]['rows']:
+                        by_id.setdefault(str(row.get('id')), len(rows))
+                        rows.append(row)
+                self._rows = rows
+                self._rows_by_id = by_id
+                self._generation += 1
+            if changed or stale or dirty:
+                self._save_cache_file()
+            return self._generation
+
+    def rows(self, parser):
+        with self._lock:
+            self.refresh(parser)
+            return [dict(row) for row in self._rows]
+
+    def find_by_id(self, reservation_id, parser):
+        with self._lock:
+            self.refresh(parser)
+            pos = self._rows_by_id.get(str(reservation_id))
+            return dict(self._rows[pos]) if pos is not None else None
+
+    def merged_index(self, key, racy, builder):
+        """
+        Returns the cached ReservationIndex for ``key`` or builds a new one.
+        An index built while an input was racy is never reused, because a
+        same-tick rewrite would keep the same key; one kept current by
+        ``apply_incremental`` is trusted, since the writer itself produced
+        the change.
+        """
+        with self._lock:
+            if self._index is not None and self._index_key == key and self._index_reusable:
+                self.counters['index_hits'] += 1
+                return self._index
+        index = builder()
+        with self._lock:
+            self.counters['index_builds'] += 1
+            self._index = index
+            self._index_key = key
+            self._index_reusable = not racy
+        return index
+
+    def apply_incremental(self, expected_key, new_key, mutate):
+        """
+        Applies ``mutate(index)`` to the cached index if it still reflects
+        ``expected_key`` (the inputs before the write) and re-keys it to
+        ``new_key``; otherwise drops it so the next read rebuilds.
+        """
+        with self._lock:
+            if self._index is None or self._index_key != expected_key or not self._index_reusable:
+                self._index = None
+                self._index_key = None
+                return False
+            try:
+                mutate(self._index)
+            except Exception as e:
+                logger.error(f"reservation_index_incremental_failed error={e}")
+                self._index = None
+                self._index_key = None
+                return False
+            self._index_key = new_key
+            self.counters['incremental_updates'] += 1
+            return True
+
+    def invalidate(self):
+        with self._lock:
+            self._index = None
+            self._index_key = None
+
+    def status(self):
+        with self._lock:
+            return {
+                'cache_path': self.cache_path,
+                'generation': self._generation,
+                'files': {name: len(entry.get('rows') or []) for name, entry in (self._files or {}).items()},
+                'indexed_reservations': self._index.count if self._index is not None else 0,
+                'counters': dict(self.counters),
+            }
+
+
+def _signature_changed_during_read(path, signature):
+    return signature is None or _stat_signature(path) != signature
+
+
+_STORES = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_reservation_source_store(reservations_dir, main_file):
+    key = (os.path.abspath(reservations_dir), os.path.abspath(main_file))
+    with _STORES_LOCK:
+        store = _STORES.get(key)
+        if store is None:
+            store = ReservationSourceStore(*key)
+            _STORES[key] = store
+        return store
+
+
+def input_signature(paths):
+    """(stat signatures, racy) for the JSON side files a merge reads."""
+    signature = []
+    racy = False
+    for path in paths:
+        sig = _stat_signature(path)
+        racy = racy or is_racy(sig)
+        signature.append(tuple(sig) if sig else None)
+    return tuple(signature), racy
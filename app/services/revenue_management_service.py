@@ -2,9 +2,11 @@ import json
 from datetime import datetime, timedelta
 from typing import Any, Dict, List, Optional
 
+from app.services.audit_log_service import get_audit_log
 from app.services.cashier_service import file_lock
 from app.services.finance_dashboard_service import FinanceDashboardService
 from app.services.logger_service import LoggerService
+from app.services.occupancy_cube_service import CURVE_THRESHOLDS, PICKUP_WINDOWS, OccupancyCube, get_occupancy_cube
 from app.services.reservation_service import ReservationService
 from app.services.weekday_base_rate_service import WeekdayBaseRateService
 from app.services.system_config_manager import (
@@ -562,8 +564,12 @@ class RevenueManagementService:
 
     @classmethod
     def _channel_weight(cls, reservation: Dict[str, Any], advanced: Dict[str, Any]) -> float:
-        channel_weights = advanced.get('channel_weights', {})
         channel = cls._normalize_channel(reservation.get('channel') or reservation.get('origin'))
+        return cls._channel_key_weight(channel, advanced)
+
+    @classmethod
+    def _channel_key_weight(cls, channel: str, advanced: Dict[str, Any]) -> float:
+        channel_weights = advanced.get('channel_weights', {})
         return float(channel_weights.get(channel, channel_weights.get('default', 1.0)))
 
     @staticmethod
@@ -913,14 +919,8 @@ class RevenueManagementService:
         }
 
     @classmethod
-    def _load_booking_commission_logs(cls) -> List[Dict[str, Any]]:
-        loaded = cls._load_json(REVENUE_BOOKING_COMMISSION_LOGS_FILE, [])
-        return loaded if isinstance(loaded, list) else []
-
-    @classmethod
-    def _save_booking_commission_logs(cls, payload: List[Dict[str, Any]]) -> None:
-        with file_lock(REVENUE_BOOKING_COMMISSION_LOGS_FILE):
-            cls._save_json(REVENUE_BOOKING_COMMISSION_LOGS_FILE, payload)
+    def _booking_commission_log(cls):
+        return get_audit_log(REVENUE_BOOKING_COMMISSION_LOGS_FILE, time_field='changed_at')
 
     @classmethod
     def save_booking_commercial_config(cls, payload: Dict[str, Any], user: str, reason: str) -> Dict[str, Any]:
@@ -991,9 +991,7 @@ class RevenueManagementService:
             'current': merged,
             'motivo': reason_text,
         }
-        logs = cls._load_booking_commission_logs()
-        logs.append(log_item)
-        cls._save_booking_commission_logs(logs)
+        cls._booking_commission_log().append([log_item])
         LoggerService.log_acao(
             acao='Alterou comissão Booking no Revenue',
             entidade='Revenue Management',
@@ -1011,14 +1009,11 @@ class RevenueManagementService:
         end_date: Optional[str] = None,
         user: Optional[str] = None,
     ) -> List[Dict[str, Any]]:
-        rows = cls._load_booking_commission_logs()
         start_dt = cls._parse_date(start_date).date() if start_date else None
         end_dt = cls._parse_date(end_date).date() if end_date else None
         user_norm = str(user or '').strip().lower()
         out: List[Dict[str, Any]] = []
-        for item in rows:
-            if not isinstance(item, dict):
-                continue
+        for item in cls._booking_commission_log().query(start=start_dt, end=end_dt, user=user_norm):
             changed_at = str(item.get('changed_at') or '').strip()
             if not changed_at:
                 continue
@@ -1139,6 +1134,55 @@ class RevenueManagementService:
             'booking_category': booking_category,
         }
 
+    @classmethod
+    def _booking_category_label(cls, booking_category: str) -> str:
+        return booking_category.replace('_', ' ').title().replace('Familia', 'Família').replace('Banheira', 'com Banheira').replace('Diamante', 'Diamante')
+
+    @classmethod
+    def _simulation_index(cls, simulated: Dict[str, Any]) -> Dict[tuple, Dict[str, Any]]:
+        return {
+            (str(row.get('date') or ''), cls._normalize_category(row.get('category'))): row
+            for row in (simulated.get('rows') or [])
+            if isinstance(row, dict)
+        }
+
+    @staticmethod
+    def _simulated_direct_tariff(sim_row: Dict[str, Any], fallback_bar: float) -> float:
+        return float(sim_row.get('current_bar') or sim_row.get('base_bar') or fallback_bar)
+
+    @classmethod
+    def direct_tariff_rows(
+        cls,
+        *,
+        categories: List[str],
+        days: List[str],
+        simulation: Dict[str, Any],
+    ) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """
+        The ``date``/``category``/``category_label``/``tarifa_direta`` columns of
+        ``calendar_direct_vs_ota`` by category and day, from a projection
+        (``simulate_projection``) that covers ``days``.
+        """
+        simulated_index = cls._simulation_index(simulation)
+        rules = cls._load_rules()
+        out: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for category in categories:
+            booking_category = cls._normalize_booking_category(category)
+            bucket = cls._booking_category_bucket(booking_category)
+            category_label = cls._booking_category_label(booking_category)
+            fallback_bar = float((rules.get(bucket) or {}).get('base_bar') or 0.0)
+            out[category] = {
+                day: {
+                    'date': day,
+                    'category': booking_category,
+                    'category_bucket': bucket,
+                    'category_label': category_label,
+                    'tarifa_direta': round(cls._simulated_direct_tariff(simulated_index.get((day, bucket), {}), fallback_bar), 2),
+                }
+                for day in days
+            }
+        return out
+
     @classmethod
     def calendar_direct_vs_ota(
         cls,
@@ -1176,7 +1220,7 @@ class RevenueManagementService:
             }
         booking_category = cls._normalize_booking_category(category)
         bucket = cls._booking_category_bucket(booking_category)
-        category_label = booking_category.replace('_', ' ').title().replace('Familia', 'Família').replace('Banheira', 'com Banheira').replace('Diamante', 'Diamante')
+        category_label = cls._booking_category_label(booking_category)
         start_dt = cls._parse_date(start_date).date()
         end_dt = cls._parse_date(end_date).date()
         if end_dt < start_dt:
@@ -1184,11 +1228,7 @@ class RevenueManagementService:
         normalized_weekdays = PeriodSelectorService.normalize_weekdays(weekdays or [])
         total_days = max(1, (end_dt - start_dt).days + 1)
         simulated = cls.simulate_projection(start_date=start_dt.isoformat(), days=total_days, advanced_mode=True)
-        simulated_index = {
-            (str(row.get('date') or ''), cls._normalize_category(row.get('category'))): row
-            for row in (simulated.get('rows') or [])
-            if isinstance(row, dict)
-        }
+        simulated_index = cls._simulation_index(simulated)
         channel_rows = ChannelInventoryControlService.list_channel_restrictions(
             start_date=start_dt.isoformat(),
             end_date=end_dt.isoformat(),
@@ -1229,7 +1269,7 @@ class RevenueManagementService:
                 current = current.fromordinal(current.toordinal() + 1)
                 continue
             sim_row = simulated_index.get((day_iso, bucket), {})
-            direct_tariff = float(sim_row.get('current_bar') or sim_row.get('base_bar') or fallback_bar)
+            direct_tariff = cls._simulated_direct_tariff(sim_row, fallback_bar)
             booking = cls.calculate_booking_ota_pricing(
                 tarifa_direta=direct_tariff,
                 category=booking_category,
@@ -1465,76 +1505,51 @@ class RevenueManagementService:
         return float(sum(values) / max(len(values), 1))
 
     @classmethod
-    def _build_reservation_curve_models(
-        cls,
-        reservations: List[Dict[str, Any]],
-        advanced: Dict[str, Any],
-        capacity_by_bucket: Dict[str, int],
-        category_bucket: str = '',
-    ) -> Dict[str, Any]:
-        thresholds = (30, 15, 7, 3)
-        today = datetime.now().date()
-        daily_samples: Dict[str, Dict[str, Any]] = {}
-        for reservation in reservations:
-            if not isinstance(reservation, dict):
-                continue
-            if not cls._is_active_reservation(reservation):
-                continue
-            bucket = cls._normalize_category(reservation.get('category'))
-            if category_bucket and bucket != category_bucket:
-                continue
-            created_dt = cls._reservation_created_datetime(reservation)
-            stay_days = cls._iter_stay_days(reservation.get('checkin'), reservation.get('checkout'))
-            if not stay_days:
-                continue
-            for day_iso in stay_days:
-                try:
-                    day_dt = cls._parse_date(day_iso).date()
-                except Exception:
-                    continue
-                if day_dt >= today:
-                    continue
-                key = f"{day_iso}|{bucket}"
-                sample = daily_samples.setdefault(key, {
-                    'day_iso': day_iso,
-                    'bucket': bucket,
-                    'occupancy': 0,
-                    'lead_days': [],
-                    'weekday': day_dt.weekday(),
-                    'season': cls._season_for_day(datetime.combine(day_dt, datetime.min.time()), advanced),
-                })
-                sample['occupancy'] = int(sample.get('occupancy') or 0) + 1
-                if created_dt:
-                    lead = (day_dt - created_dt.date()).days
-                    if lead >= 0:
-                        sample['lead_days'].append(float(lead))
-        by_signature: Dict[str, Dict[int, List[float]]] = {}
-        by_bucket: Dict[str, Dict[int, List[float]]] = {}
-        for sample in daily_samples.values():
-            bucket = str(sample.get('bucket') or '')
-            if not bucket:
-                continue
-            occupancy = max(1, int(sample.get('occupancy') or 0))
-            lead_days = sample.get('lead_days') or []
-            signature_key = f"{bucket}|{sample.get('weekday')}|{sample.get('season')}"
-            signature_slot = by_signature.setdefault(signature_key, {30: [], 15: [], 7: [], 3: []})
-            bucket_slot = by_bucket.setdefault(bucket, {30: [], 15: [], 7: [], 3: []})
-            for threshold in thresholds:
-                share = (sum(1 for item in lead_days if float(item) >= float(threshold)) / occupancy) if occupancy > 0 else 0.0
-                signature_slot[threshold].append(share)
-                bucket_slot[threshold].append(share)
-        signature_avg: Dict[str, Dict[int, float]] = {}
-        for key, items in by_signature.items():
-            signature_avg[key] = {threshold: cls._safe_mean(values, fallback=0.0) for threshold, values in items.items()}
-        bucket_avg: Dict[str, Dict[int, float]] = {}
-        for key, items in by_bucket.items():
-            bucket_avg[key] = {threshold: cls._safe_mean(values, fallback=0.0) for threshold, values in items.items()}
+    def _occupancy_contribution(cls, reservation: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """One reservation's share of the occupancy cube (see OccupancyCube.sync)."""
+        if not isinstance(reservation, dict):
+            return None
+        bucket = cls._normalize_category(reservation.get('category'))
+        is_active = cls._is_active_reservation(reservation)
+        created_dt = cls._reservation_created_datetime(reservation)
+        created_day = created_dt.date() if created_dt else None
+        stay_days = cls._iter_stay_days(reservation.get('checkin'), reservation.get('checkout'))
+        lead = None
+        if stay_days and created_day:
+            lead_days = (cls._parse_date(reservation.get('checkin')).date() - created_day).days
+            if lead_days >= 0:
+                lead = float(lead_days)
+        nights = []
+        for day_iso in stay_days:
+            curve = pickup = ()
+            if is_active and created_day:
+                night_lead = (cls._parse_date(day_iso).date() - created_day).days
+                curve = tuple(int(night_lead >= threshold) for threshold in CURVE_THRESHOLDS)
+                if night_lead >= 0:
+                    pickup = tuple(int(night_lead <= window) for window in PICKUP_WINDOWS)
+            nights.append((day_iso, int(is_active), curve, pickup))
+        revenue = []
+        checkin = FinanceDashboardService._parse_date(reservation.get('checkin'))
+        checkout = FinanceDashboardService._parse_date(reservation.get('checkout'))
+        if is_active and checkin and checkout:
+            daily_value = FinanceDashboardService._reservation_total(reservation) / max((checkout.date() - checkin.date()).days, 1)
+            channel = cls._normalize_channel(reservation.get('channel') or reservation.get('origin'))
+            day = checkin.date()
+            while day < checkout.date():
+                revenue.append((day.isoformat(), channel, daily_value))
+                day += timedelta(days=1)
         return {
-            'thresholds': thresholds,
-            'by_signature': signature_avg,
-            'by_bucket': bucket_avg,
+            'bucket': bucket,
+            'nights': nights,
+            'lead': lead,
+            'cancelled': not is_active,
+            'revenue': revenue,
         }
 
+    @classmethod
+    def _occupancy_cube(cls) -> OccupancyCube:
+        return get_occupancy_cube().sync(ReservationService()._reservation_index(), cls._occupancy_contribution)
+
     @classmethod
     def _reservation_curve_threshold_for_days(cls, days_to_arrival: int) -> int:
         if days_to_arrival >= 30:
@@ -1570,49 +1585,18 @@ class RevenueManagementService:
     def occupancy_forecast(cls, start_date: str, days: int = 30, category: Optional[str] = None) -> Dict[str, Any]:
         advanced = cls._load_advanced_config()
         events = cls._events_index()
-        reservations = ReservationService().get_february_reservations()
+        cube = cls._occupancy_cube()
         capacity_by_bucket = cls._category_capacity_by_bucket()
         start_dt = cls._parse_date(start_date).date()
         days_count = max(1, int(days))
         category_bucket = cls._normalize_category(category) if category else ''
-
-        historical_occupancy_by_day: Dict[str, Dict[str, float]] = {}
-        lead_times: List[float] = []
-        cancel_flags: List[float] = []
         today = datetime.now().date()
 
-        for res in reservations:
-            if not isinstance(res, dict):
-                continue
-            bucket = cls._normalize_category(res.get('category'))
-            if category_bucket and bucket != category_bucket:
-                continue
-            stay_days = cls._iter_stay_days(res.get('checkin'), res.get('checkout'))
-            if not stay_days:
-                continue
-            created_dt = cls._reservation_created_datetime(res)
-            if created_dt:
-                try:
-                    lead_days = (cls._parse_date(res.get('checkin')).date() - created_dt.date()).days
-                    if lead_days >= 0:
-                        lead_times.append(float(lead_days))
-                except Exception:
-                    pass
-            is_active = cls._is_active_reservation(res)
-            cancel_flags.append(0.0 if is_active else 1.0)
-            for day_iso in stay_days:
-                slot = historical_occupancy_by_day.setdefault(day_iso, {'alma': 0.0, 'mar': 0.0, 'areia': 0.0})
-                if is_active:
-                    slot[bucket] = float(slot.get(bucket, 0.0)) + 1.0
-
-        avg_lead_time = cls._safe_mean(lead_times, fallback=7.0)
-        avg_cancel_rate = cls._safe_mean(cancel_flags, fallback=0.08)
-        curve_models = cls._build_reservation_curve_models(
-            reservations=reservations,
-            advanced=advanced,
-            capacity_by_bucket=capacity_by_bucket,
-            category_bucket=category_bucket,
-        )
+        lead_sum, lead_count, cancelled, reservations_count = cube.reservation_totals(category_bucket)
+        avg_lead_time = (lead_sum / lead_count) if lead_count else 7.0
+        avg_cancel_rate = (cancelled / reservations_count) if reservations_count else 0.08
+        history = cube.history(today, advanced.get('season_by_month', {}))
+        curve_models = history['curve']
 
         rows: List[Dict[str, Any]] = []
         for i in range(days_count):
@@ -1626,22 +1610,12 @@ class RevenueManagementService:
                 if category_bucket and bucket != category_bucket:
                     continue
                 capacity = max(1, int(capacity_by_bucket.get(bucket, 1)))
-                historical_candidates: List[float] = []
-                for hist_day_iso, by_cat in historical_occupancy_by_day.items():
-                    try:
-                        hist_dt = cls._parse_date(hist_day_iso)
-                    except Exception:
-                        continue
-                    if hist_dt.date() >= today:
-                        continue
-                    if hist_dt.weekday() != day_weekday:
-                        continue
-                    if cls._season_for_day(hist_dt, advanced) != season:
-                        continue
-                    occ = float(by_cat.get(bucket, 0.0))
-                    historical_candidates.append((occ / capacity) * 100.0)
-                historical_avg = cls._safe_mean(historical_candidates, fallback=0.0)
-                confirmed_occ_rooms = float((historical_occupancy_by_day.get(day_iso) or {}).get(bucket, 0.0))
+                # Past nights of the same weekday and season; with a category
+                # filter only the nights that had a reservation of it count.
+                occupied_sum, nights, bucket_nights = history['occupancy'].get((bucket, day_weekday, season), (0, 0, 0))
+                samples = bucket_nights if category_bucket else nights
+                historical_avg = ((occupied_sum / capacity) * 100.0 / samples) if samples else 0.0
+                confirmed_occ_rooms = float(cube.occupied(day_iso, bucket))
                 confirmed_occ_pct = (confirmed_occ_rooms / capacity) * 100.0
                 days_to_arrival = max((day_dt.date() - today).days, 0)
                 curve_ratio = cls._reservation_curve_ratio_for_day(
@@ -1691,14 +1665,7 @@ class RevenueManagementService:
         days_count = max(1, int(days))
         category_bucket = cls._normalize_category(category) if category else ''
         advanced = cls._load_advanced_config()
-        reservations = ReservationService().get_february_reservations()
-        capacity_by_bucket = cls._category_capacity_by_bucket()
-        curve_models = cls._build_reservation_curve_models(
-            reservations=reservations,
-            advanced=advanced,
-            capacity_by_bucket=capacity_by_bucket,
-            category_bucket=category_bucket,
-        )
+        curve_models = cls._occupancy_cube().history(datetime.now().date(), advanced.get('season_by_month', {}))['curve']
         forecast = cls.occupancy_forecast(start_date=start_dt.isoformat(), days=days_count, category=category)
         forecast_rows = [row for row in (forecast.get('rows') or []) if isinstance(row, dict)]
         forecast_index = {f"{str(row.get('date') or '')}|{str(row.get('category') or '')}": row for row in forecast_rows}
@@ -1768,59 +1735,21 @@ class RevenueManagementService:
 
     @classmethod
     def pickup_analysis(cls, start_date: str, days: int = 30, category: Optional[str] = None) -> Dict[str, Any]:
-        reservations = ReservationService().get_february_reservations()
+        cube = cls._occupancy_cube()
         start_dt = cls._parse_date(start_date).date()
         days_count = max(1, int(days))
         category_bucket = cls._normalize_category(category) if category else ''
-        windows = (1, 3, 7, 14)
-        pickup_by_day: Dict[str, Dict[int, int]] = {}
+        windows = PICKUP_WINDOWS
         historical_samples: Dict[int, List[float]] = {1: [], 3: [], 7: [], 14: []}
-        today = datetime.now().date()
-
-        def add_pickup(day_iso: str, window: int, value: int) -> None:
-            slot = pickup_by_day.setdefault(day_iso, {1: 0, 3: 0, 7: 0, 14: 0})
-            slot[window] = slot.get(window, 0) + int(value)
-
-        for res in reservations:
-            if not isinstance(res, dict):
-                continue
-            if not cls._is_active_reservation(res):
-                continue
-            bucket = cls._normalize_category(res.get('category'))
-            if category_bucket and bucket != category_bucket:
-                continue
-            created_dt = cls._reservation_created_datetime(res)
-            if not created_dt:
-                continue
-            stay_days = cls._iter_stay_days(res.get('checkin'), res.get('checkout'))
-            if not stay_days:
-                continue
-            for day_iso in stay_days:
-                try:
-                    target_day = cls._parse_date(day_iso).date()
-                except Exception:
-                    continue
-                lead = (target_day - created_dt.date()).days
-                if lead < 0:
-                    continue
-                for w in windows:
-                    if lead <= w:
-                        add_pickup(day_iso, w, 1)
 
         rows: List[Dict[str, Any]] = []
         for i in range(days_count):
             day = start_dt + timedelta(days=i)
             day_iso = day.isoformat()
-            current = pickup_by_day.get(day_iso, {1: 0, 3: 0, 7: 0, 14: 0})
-            historical_start = day - timedelta(days=56)
+            current = cube.pickup(day_iso, category_bucket)
+            references = [cube.pickup((day - timedelta(days=7 * weeks)).isoformat(), category_bucket) for weeks in range(8, 0, -1)]
             for w in windows:
-                sample = []
-                cursor = historical_start
-                while cursor < day:
-                    ref = pickup_by_day.get(cursor.isoformat(), {})
-                    sample.append(float(ref.get(w, 0)))
-                    cursor += timedelta(days=7)
-                historical_samples[w].extend(sample)
+                historical_samples[w].extend(float(ref[w]) for ref in references)
             baseline_7 = cls._safe_mean([float(v) for v in historical_samples[7]], fallback=0.0)
             pickup_7 = float(current.get(7, 0))
             if pickup_7 >= baseline_7 * 1.9 and pickup_7 >= 2:
@@ -2157,7 +2086,7 @@ class RevenueManagementService:
 
     @classmethod
     def simulate_projection(cls, start_date: str, days: int = 30, advanced_mode: bool = False) -> Dict[str, Any]:
-        reservations = ReservationService().get_february_reservations()
+        cube = cls._occupancy_cube()
         room_mapping = ReservationService().get_room_mapping()
         rules = cls._load_rules()
         advanced = cls._load_advanced_config()
@@ -2179,27 +2108,12 @@ class RevenueManagementService:
                 'mar': {'occupied': 0, 'projected_revenue': 0.0, 'weighted_revenue': 0.0, 'reservations': 0},
                 'areia': {'occupied': 0, 'projected_revenue': 0.0, 'weighted_revenue': 0.0, 'reservations': 0},
             }
-            for reservation in reservations:
-                if not isinstance(reservation, dict):
-                    continue
-                status = str(reservation.get('status') or '').lower()
-                if 'cancel' in status:
-                    continue
-                checkin = FinanceDashboardService._parse_date(reservation.get('checkin'))
-                checkout = FinanceDashboardService._parse_date(reservation.get('checkout'))
-                if not checkin or not checkout:
-                    continue
-                if not (checkin.date() <= day < checkout.date()):
-                    continue
-                category = cls._normalize_category(reservation.get('category'))
-                total_value = FinanceDashboardService._reservation_total(reservation)
-                nights = max((checkout.date() - checkin.date()).days, 1)
-                daily_value = total_value / nights
-                channel_w = cls._channel_weight(reservation, advanced)
-                by_cat[category]['occupied'] += 1
-                by_cat[category]['projected_revenue'] += daily_value
-                by_cat[category]['weighted_revenue'] += (daily_value * channel_w)
-                by_cat[category]['reservations'] += 1
+            for category, channels in cube.projection(day_key).items():
+                for channel, occupied, daily_value in channels:
+                    by_cat[category]['occupied'] += occupied
+                    by_cat[category]['projected_revenue'] += daily_value
+                    by_cat[category]['weighted_revenue'] += (daily_value * cls._channel_key_weight(channel, advanced))
+                    by_cat[category]['reservations'] += occupied
             day_event = events.get(day_key, {})
             target_revpar_day = cls._target_revpar_for_day(day_dt, advanced)
             for category in ('alma', 'mar', 'areia'):
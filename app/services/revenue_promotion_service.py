@@ -3,6 +3,7 @@ import uuid
 from datetime import datetime
 from typing import Any, Dict, List, Optional
 
+from app.services.audit_log_service import get_audit_log
 from app.services.cashier_service import file_lock
 from app.services.logger_service import LoggerService
 from app.services.period_selector_service import PeriodSelectorService
@@ -47,14 +48,8 @@ class RevenuePromotionService:
             cls._save_json(REVENUE_PROMOTIONS_FILE, rows)
 
     @classmethod
-    def _load_logs(cls) -> List[Dict[str, Any]]:
-        data = cls._load_json(REVENUE_PROMOTIONS_LOGS_FILE, [])
-        return data if isinstance(data, list) else []
-
-    @classmethod
-    def _save_logs(cls, rows: List[Dict[str, Any]]) -> None:
-        with file_lock(REVENUE_PROMOTIONS_LOGS_FILE):
-            cls._save_json(REVENUE_PROMOTIONS_LOGS_FILE, rows)
+    def _audit_log(cls):
+        return get_audit_log(REVENUE_PROMOTIONS_LOGS_FILE, entity_field='promotion_id')
 
     @classmethod
     def _normalize_categories(cls, categories: List[Any]) -> List[str]:
@@ -81,9 +76,7 @@ class RevenuePromotionService:
             'before': before,
             'after': after,
         }
-        logs = cls._load_logs()
-        logs.append(row)
-        cls._save_logs(logs)
+        cls._audit_log().append([row])
         LoggerService.log_acao(
             acao='Atualizou promoção de revenue',
             entidade='Revenue Management',
@@ -202,12 +195,11 @@ class RevenuePromotionService:
 
     @classmethod
     def list_logs(cls, start_date: Optional[str] = None, end_date: Optional[str] = None, user: Optional[str] = None) -> List[Dict[str, Any]]:
-        rows = cls._load_logs()
         start = PeriodSelectorService.parse_date(start_date).date() if start_date else None
         end = PeriodSelectorService.parse_date(end_date).date() if end_date else None
         user_norm = cls._normalize_text(user)
         out = []
-        for row in rows:
+        for row in cls._audit_log().query(start=start, end=end, user=user_norm, user_contains=True):
             ts = str(row.get('timestamp') or '')
             row_user = cls._normalize_text(row.get('user'))
             try:
@@ -0,0 +1,432 @@
+import json
+import logging
+import marshal
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
+
+from app.services import data_service
+from app.services.ledger_journal_service import ledger_signature
+
+
+CUBE_VERSION = 1
+CUBE_FILENAME = 'sales_cube.json'
+CHECKPOINT_INTERVAL_SECONDS = 30.0
+# Cell key dimensions, after the day. The sector (Cozinha/Bar) is not
+# stored: it is resolved at read time from product + category, so moving a
+# product to another menu category needs no rebuild.
+DIMENSIONS = ('hour', 'product', 'category', 'waiter', 'customer_type')
+_KEY_SEP = '\x1f'
+
+logger = logging.getLogger(__name__)
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+@lru_cache(maxsize=8192)
+def _bucket(stamp):
+    """('YYYY-MM-DD', hour) of a 'dd/mm/YYYY HH:MM' stamp; launches repeat per minute, hence the cache."""
+    try:
+        dt = datetime.strptime(stamp, '%d/%m/%Y %H:%M')
+    except (TypeError, ValueError):
+        return None
+    return dt.strftime('%Y-%m-%d'), dt.hour
+
+
+def _empty_day():
+    # cells: {"hour<SEP>product<SEP>category<SEP>waiter<SEP>customer_type": [qty, revenue]}
+    # visits: {hour: {customer_type: [order keys]}} for distinct attendances.
+    return {'cells': {}, 'visits': {}}
+
+
+def fold_order(days, order, order_key):
+    """Adds the launched items of ``order`` to ``days`` ({date: day}), bucketed by item launch time."""
+    if not isinstance(order, dict):
+        return
+    customer_type = str(order.get('customer_type') or '')
+    default_waiter = order.get('waiter') or 'N/A'
+    fallback_stamp = order.get('opened_at') or ''
+    for item in order.get('items') or []:
+        if not isinstance(item, dict):
+            continue
+        bucket = _bucket(str(item.get('created_at') or fallback_stamp))
+        if bucket is None:
+            continue
+        qty = _to_float(item.get('qty'))
+        if not qty or qty <= 0:
+            continue
+        price = _to_float(item.get('price')) or 0.0
+        complements = sum(
+            (_to_float(c.get('price')) or 0.0) for c in item.get('complements') or [] if isinstance(c, dict)
+        )
+        date_key, hour = bucket
+        day = days.get(date_key)
+        if day is None:
+            day = days[date_key] = _empty_day()
+        key = _KEY_SEP.join([
+            str(hour),
+            str(item.get('name') or ''),
+            str(item.get('category') or ''),
+            str(item.get('waiter') or default_waiter),
+            customer_type,
+        ])
+        cell = day['cells'].get(key)
+        if cell is None:
+            cell = day['cells'][key] = [0.0, 0.0]
+        cell[0] += qty
+        cell[1] += qty * (price + complements)
+        keys = day['visits'].setdefault(str(hour), {}).setdefault(customer_type, [])
+        if order_key not in keys:
+            keys.append(order_key)
+
+
+def _closed_key(row, position):
+    close_id = row.get('close_id') if isinstance(row, dict) else None
+    return f"conta:{close_id}" if close_id else f"conta:#{position}"
+
+
+def aggregate_sales(rows, start=0):
+    days = {}
+    for offset, row in enumerate(rows or []):
+        fold_order(days, row, _closed_key(row, start + offset))
+    return days
+
+
+def _history_path():
+    # Mirrors the read fallback in data_service._load_json, like the stock index.
+    path = data_service.SALES_HISTORY_FILE
+    if not os.path.exists(path):
+        legacy = data_service._legacy_read_candidate(path)
+        if legacy and os.path.exists(legacy):
+            path = legacy
+    return os.path.abspath(path)
+
+
+def _merge_day(target, day):
+    for key, (qty, revenue) in day['cells'].items():
+        cell = target['cells'].get(key)
+        if cell is None:
+            target['cells'][key] = [qty, revenue]
+        else:
+            cell[0] += qty
+            cell[1] += revenue
+    for hour, by_type in day['visits'].items():
+        slot = target['visits'].setdefault(hour, {})
+        for customer_type, keys in by_type.items():
+            slot.setdefault(customer_type, set()).update(keys)
+
+
+class SalesCube:
+    """
+    Per-day sales cube: date x hour x product x category x waiter x
+    customer type, measuring qty and revenue, plus the orders seen per
+    hour for attendance counts.
+
+    Closed accounts (sales_history) are folded in as they are appended and
+    checkpointed to ``sales_cube.json`` next to the ledger; a ledger
+    signature mismatch (rewritten elsewhere) rebuilds them. Open tables
+    are folded per table segment and re-folded only when that table's
+    version changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._closed = None
+        self._open = {}
+        self._loaded = False
+        self._dirty = False
+        self._last_checkpoint = 0.0
+        self.counters = {'incremental_updates': 0, 'rebuilds': 0, 'open_refolds': 0, 'checkpoints': 0}
+
+    def cube_path(self):
+        return os.path.join(os.path.dirname(os.path.abspath(data_service.SALES_HISTORY_FILE)), CUBE_FILENAME)
+
+    def _load_checkpoint(self):
+        self._loaded = True
+        path = self.cube_path()
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                payload = json.load(f)
+        except Exception as e:
+            logger.warning(f"sales_cube_checkpoint_unreadable path={path} error={e}")
+            return
+        if isinstance(payload, dict) and payload.get('version') == CUBE_VERSION and isinstance(payload.get('days'), dict):
+            self._closed = {
+                'path': payload.get('path'),
+                'signature': payload.get('signature'),
+                'count': int(payload.get('count') or 0),
+                'days': payload['days'],
+            }
+
+    def _closed_is_current(self):
+        state = self._closed
+        path = _history_path()
+        return (
+            isinstance(state, dict)
+            and state.get('path') == path
+            and state.get('signature') is not None
+            and state.get('signature') == ledger_signature(path)
+        )
+
+    def _rebuild_closed(self):
+        path = _history_path()
+        signature = ledger_signature(path)
+        rows = data_service.load_sales_history()
+        if isinstance(rows, dict):
+            rows = list(rows.values())
+        rows = rows if isinstance(rows, list) else []
+        # Only trust the signature if the ledger did not move while reading.
+        if ledger_signature(path) != signature:
+            signature = None
+        self._closed = {'path': path, 'signature': signature, 'count': len(rows), 'days': aggregate_sales(rows)}
+        self._dirty = True
+        self.counters['rebuilds'] += 1
+
+    def _closed_days(self):
+        if not self._loaded:
+            self._load_checkpoint()
+        if not self._closed_is_current():
+            self._rebuild_closed()
+        self._maybe_checkpoint()
+        return self._closed['days']
+
+    def _open_days(self):
+        segments = data_service.table_orders_segments()
+        for table_id in [t for t in self._open if t not in segments]:
+            self._open.pop(table_id, None)
+        for table_id, (version, blob) in segments.items():
+            cached = self._open.get(table_id)
+            if cached is not None and cached[0] == version:
+                continue
+            days = {}
+            fold_order(days, marshal.loads(blob), f"mesa:{table_id}")
+            self._open[table_id] = (version, days)
+            self.counters['open_refolds'] += 1
+        return [days for _version, days in self._open.values()]
+
+    def day(self, date_key, include_open=True):
+        """Merged cube of one day ('YYYY-MM-DD'); visit lists become sets."""
+        merged = {'cells': {}, 'visits': {}}
+        with self._lock:
+            closed = self._closed_days().get(date_key)
+            if closed:
+                _merge_day(merged, closed)
+            if include_open:
+                for days in self._open_days():
+                    if date_key in days:
+                        _merge_day(merged, days[date_key])
+        return merged
+
+    def rollup(self, start_date, end_date, by=('product',), include_open=True):
+        """
+        {group tuple: [qty, revenue]} over the days in [start_date, end_date]
+        ('YYYY-MM-DD', inclusive), grouped by ``by`` (names from DIMENSIONS
+        plus 'date').
+        """
+        positions = [None if name == 'date' else DIMENSIONS.index(name) for name in by]
+        totals = {}
+        with self._lock:
+            sources = [self._closed_days()] + (self._open_days() if include_open else [])
+            for days in sources:
+                for date_key, day in days.items():
+                    if date_key < start_date or date_key > end_date:
+                        continue
+                    for key, (qty, revenue) in day['cells'].items():
+                        parts = key.split(_KEY_SEP)
+                        group = tuple(date_key if pos is None else parts[pos] for pos in positions)
+                        cell = totals.get(group)
+                        if cell is None:
+                            totals[group] = [qty, revenue]
+                        else:
+                            cell[0] += qty
+                            cell[1] += revenue
+        return totals
+
+    def apply_appended(self, rows):
+        """Folds closed accounts that were just appended to sales_history."""
+        with self._lock:
+            if not self._loaded:
+                self._load_checkpoint()
+            state = self._closed
+            path = _history_path()
+            if not isinstance(state, dict) or state.get('path') != path or state.get('signature') is None:
+                # Nothing trustworthy to build on; the next read rebuilds.
+                self._closed = None
+                return
+            start = int(state.get('count') or 0)
+            for offset, row in enumerate(rows or []):
+                fold_order(state['days'], row, _closed_key(row, start + offset))
+            state['count'] = start + len(rows or [])
+            state['signature'] = ledger_signature(path)
+            self._dirty = True
+            self.counters['incremental_updates'] += 1
+            self._maybe_checkpoint()
+
+    def replace_history(self, rows):
+        """Re-derives the closed part from rows that were just written as the whole ledger."""
+        with self._lock:
+            rows = rows if isinstance(rows, list) else []
+            self._closed = {
+                'path': _history_path(),
+                'signature': ledger_signature(_history_path()),
+                'count': len(rows),
+                'days': aggregate_sales(rows),
+            }
+            self._loaded = True
+            self._dirty = True
+            self.counters['rebuilds'] += 1
+            self._maybe_checkpoint()
+
+    def invalidate(self):
+        with self._lock:
+            self._closed = None
+            self._open = {}
+
+    def _maybe_checkpoint(self, force=False):
+        if not self._dirty:
+            return
+        if not force and (time.time() - self._last_checkpoint) < CHECKPOINT_INTERVAL_SECONDS:
+            return
+        self.checkpoint()
+
+    def checkpoint(self):
+        with self._lock:
+            state = self._closed
+            if not isinstance(state, dict) or state.get('signature') is None:
+                return False
+            payload = {
+                'version': CUBE_VERSION,
+                'updated_at': datetime.now().isoformat(),
+                'path': state['path'],
+                'signature': state['signature'],
+                'count': state['count'],
+                'days': state['days'],
+            }
+            path = self.cube_path()
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(payload, f, ensure_ascii=False, separators=(',', ':'))
+                os.replace(tmp_path, path)
+                self._dirty = False
+                self._last_checkpoint = time.time()
+                self.counters['checkpoints'] += 1
+                return True
+            except Exception as e:
+                logger.error(f"sales_cube_checkpoint_failed path={path} error={e}")
+                return False
+
+    def rebuild(self):
+        with self._lock:
+            self._loaded = True
+            self._open = {}
+            self._rebuild_closed()
+            self.checkpoint()
+            return self.status()
+
+    def status(self):
+        with self._lock:
+            state = self._closed if isinstance(self._closed, dict) else {}
+            days = state.get('days') or {}
+            return {
+                'cube_path': self.cube_path(),
+                'closed_accounts': state.get('count'),
+                'days': len(days),
+                'first_day': min(days) if days else None,
+                'last_day': max(days) if days else None,
+                'current': self._closed_is_current(),
+                'open_tables': len(self._open),
+                'counters': dict(self.counters),
+            }
+
+
+def iter_cells(day):
+    """(hour, product, category, waiter, customer_type, qty, revenue) of a ``SalesCube.day`` result."""
+    for key, (qty, revenue) in day['cells'].items():
+        hour, product, category, waiter, customer_type = key.split(_KEY_SEP)
+        yield int(hour), product, category, waiter, customer_type, qty, revenue
+
+
+_CUBE = SalesCube()
+
+
+def get_sales_cube():
+    return _CUBE
+
+
+def notify_sales_appended(rows):
+    try:
+        _CUBE.apply_appended(rows)
+    except Exception as e:
+        logger.error(f"sales_cube_append_failed error={e}")
+        _CUBE.invalidate()
+
+
+def notify_sales_replaced(rows):
+    try:
+        _CUBE.replace_history(rows)
+    except Exception as e:
+        logger.error(f"sales_cube_replace_failed error={e}")
+        _CUBE.invalidate()
+
+
+def rebuild_sales_cube():
+    return _CUBE.rebuild()
+
+
+def _benchmark(orders=3000, items_per_order=8, days=30):
+    """Per-request walk with strptime per item vs reading one day of the cube."""
+    from datetime import timedelta
+
+    base = datetime(2026, 1, 1, 11, 0)
+    rows = []
+    for n in range(orders):
+        opened = base + timedelta(days=n % days, minutes=(n * 7) % 600)
+        rows.append({
+            'close_id': f'C{n}',
+            'customer_type': 'hospede' if n % 3 else 'passante',
+            'waiter': f'garcom{n % 5}',
+            'items': [
+                {'name': f'Produto {i}', 'category': 'Drinks' if i % 2 else 'Pratos', 'qty': 1, 'price': 10.0,
+                 'created_at': (opened + timedelta(minutes=i)).strftime('%d/%m/%Y %H:%M')}
+                for i in range(items_per_order)
+            ],
+        })
+    target = base.strftime('%d/%m/%Y')
+
+    started = time.perf_counter()
+    total = 0.0
+    for row in rows:
+        for item in row['items']:
+            ts = datetime.strptime(item['created_at'], '%d/%m/%Y %H:%M')
+            if ts.strftime('%d/%m/%Y') == target:
+                total += float(item['qty'])
+    walk = time.perf_counter() - started
+
+    _bucket.cache_clear()
+    days_agg = aggregate_sales(rows)
+    started = time.perf_counter()
+    merged = {'cells': {}, 'visits': {}}
+    _merge_day(merged, days_agg[base.strftime('%Y-%m-%d')])
+    cube_total = sum(qty for _h, _p, _c, _w, _t, qty, _r in iter_cells(merged))
+    cube = time.perf_counter() - started
+    assert cube_total == total
+    return {'walk_s': round(walk, 4), 'cube_s': round(cube, 4)}
+
+
+if __name__ == '__main__':
+    if '--benchmark' in sys.argv:
+        print(_benchmark())
+    else:
+        print(json.dumps(rebuild_sales_cube(), indent=2, ensure_ascii=False))
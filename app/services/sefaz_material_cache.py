@@ -0,0 +1,266 @@
+import atexit
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.serialization import pkcs12
+
+from app.services.json_document_cache import stat_token
+
+
+class SchemaCache:
+    """
+    Compiled ``lxml.etree.XMLSchema`` objects by schema version (e.g.
+    ``nfe_v4_00/envEvento_v1.00``), recompiled only when the root XSD file
+    changes on disk.
+
+    A compiled schema keeps its ``error_log`` on the object, so validations
+    against the same schema are serialized by a per-schema lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._schemas = {}
+        self.counters = {'compiles': 0, 'hits': 0}
+
+    def _entry(self, version, xsd_path):
+        token = stat_token(xsd_path)
+        with self._lock:
+            cached = self._schemas.get(version)
+            if cached is not None and cached[0] == token and cached[1] == xsd_path:
+                self.counters['hits'] += 1
+                return cached
+        from lxml import etree
+
+        schema = etree.XMLSchema(etree.parse(xsd_path))
+        entry = (token, xsd_path, schema, threading.Lock())
+        with self._lock:
+            self.counters['compiles'] += 1
+            self._schemas[version] = entry
+        return entry
+
+    def validate(self, version, xsd_path, doc):
+        """``(ok, last_error)`` of ``doc`` (an lxml element) against the schema."""
+        _, _, schema, lock = self._entry(version, xsd_path)
+        with lock:
+            ok = bool(schema.validate(doc))
+            return ok, (None if ok else schema.error_log.last_error)
+
+    def clear(self):
+        with self._lock:
+            self._schemas = {}
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, cached=sorted(self._schemas))
+
+
+class SigningMaterial:
+    """
+    PEM form of one A1 certificate (PFX), shared by every ``SefazService``
+    using the same file: in-memory key/certificate for XML signing, and
+    ``cert.pem``/``key.pem`` for the TLS client certificate, written once to
+    a private temp directory (0700, files 0600) that is removed by
+    ``CertificateCache.clear()`` (also run at process exit).
+    """
+
+    def __init__(self, pfx_path, cert_bytes, key_bytes, metadata):
+        self.pfx_path = pfx_path
+        self.cert_bytes = cert_bytes
+        self.key_bytes = key_bytes
+        self.metadata = metadata
+        self.directory = tempfile.mkdtemp(prefix='almareia-sefaz-')
+        self.cert_pem = os.path.join(self.directory, 'cert.pem')
+        self.key_pem = os.path.join(self.directory, 'key.pem')
+        self._write_private(self.cert_pem, cert_bytes)
+        self._write_private(self.key_pem, key_bytes)
+        self._lock = threading.Lock()
+        self._signers = {}
+
+    @staticmethod
+    def _write_private(path, data):
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+
+    def signer(self, profile, build):
+        """Signer for ``profile`` (hashable), created by ``build()`` on first use."""
+        with self._lock:
+            signer = self._signers.get(profile)
+            if signer is None:
+                signer = self._signers[profile] = build()
+            return signer
+
+    def sign(self, profile, build, *args, **kwargs):
+        signer = self.signer(profile, build)
+        with self._lock:
+            return signer.sign(*args, key=self.key_bytes, cert=self.cert_bytes, **kwargs)
+
+    def close(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def load_signing_material(pfx_path, password):
+    with open(pfx_path, 'rb') as f:
+        pfx_data = f.read()
+    private_key, certificate, additional_certificates = pkcs12.load_key_and_certificates(
+        pfx_data,
+        password.encode('utf-8') if password else None,
+    )
+    if private_key is None or certificate is None:
+        raise Exception("Certificado A1 inválido: chave privada ou certificado ausente no PFX.")
+    cert_bytes = certificate.public_bytes(serialization.Encoding.PEM)
+    for extra in additional_certificates or []:
+        cert_bytes += extra.public_bytes(serialization.Encoding.PEM)
+    key_bytes = private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.TraditionalOpenSSL,
+        encryption_algorithm=serialization.NoEncryption(),
+    )
+    metadata = {
+        "serial_number": str(getattr(certificate, "serial_number", "")),
+        "fingerprint_sha256": certificate.fingerprint(hashes.SHA256()).hex().upper(),
+        "subject": str(certificate.subject.rfc4514_string() or ""),
+        "issuer": str(certificate.issuer.rfc4514_string() or ""),
+        "not_valid_before": certificate.not_valid_before_utc.isoformat() if hasattr(certificate, "not_valid_before_utc") else "",
+        "not_valid_after": certificate.not_valid_after_utc.isoformat() if hasattr(certificate, "not_valid_after_utc") else "",
+    }
+    return SigningMaterial(pfx_path, cert_bytes, key_bytes, metadata)
+
+
+class CertificateCache:
+    """
+    ``SigningMaterial`` by PFX path, reused while the file (mtime, size,
+    inode) and the password stay the same; otherwise new material is loaded.
+
+    Misses on the same path load under a per-path lock, so concurrent first
+    calls share one load. Replaced material (new PFX or another password)
+    stays on disk, since a caller may be mid-request with its PEM paths,
+    until ``clear()``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._path_locks = {}
+        self._retired = []
+        self.counters = {'loads': 0, 'hits': 0}
+
+    def _cached(self, path, token):
+        with self._lock:
+            cached = self._entries.get(path)
+            if cached is not None and cached[0] == token:
+                self.counters['hits'] += 1
+                return cached[1]
+        return None
+
+    def get(self, pfx_path, password):
+        """``(material, cached)``; errors reading/decrypting the PFX propagate."""
+        path = os.path.realpath(pfx_path)
+        token = (stat_token(path), hashlib.sha256(str(password or '').encode('utf-8')).hexdigest())
+        material = self._cached(path, token)
+        if material is not None:
+            return material, True
+        with self._lock:
+            path_lock = self._path_locks.setdefault(path, threading.Lock())
+        with path_lock:
+            material = self._cached(path, token)
+            if material is not None:
+                return material, True
+            material = load_signing_material(path, password)
+            with self._lock:
+                self.counters['loads'] += 1
+                previous = self._entries.get(path)
+                self._entries[path] = (token, material)
+                if previous is not None:
+                    self._retired.append(previous[1])
+        return material, False
+
+    def clear(self):
+        with self._lock:
+            entries = [material for _, material in self._entries.values()] + self._retired
+            self._entries = {}
+            self._retired = []
+        for material in entries:
+            material.close()
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, cached=len(self._entries))
+
+
+_SCHEMAS = SchemaCache()
+_CERTIFICATES = CertificateCache()
+atexit.register(_CERTIFICATES.clear)
+
+
+def get_schema_cache():
+    return _SCHEMAS
+
+
+def get_certificate_cache():
+    return _CERTIFICATES
+
+
+def sefaz_cache_stats():
+    return {'schemas': _SCHEMAS.stats(), 'certificates': _CERTIFICATES.stats()}
+
+
+def _benchmark(rounds=50):
+    """Per-note PFX→PEM conversion and XSD compilation vs the shared caches."""
+    import datetime
+    import time
+
+    from cryptography import x509
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.x509.oid import NameOID
+    from lxml import etree
+
+    workdir = tempfile.mkdtemp(prefix='almareia-sefaz-bench-')
+    try:
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'BENCH:28952732000109')])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        cert = (
+            x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+            .serial_number(1).not_valid_before(now).not_valid_after(now + datetime.timedelta(days=1))
+            .sign(key, hashes.SHA256())
+        )
+        pfx_path = os.path.join(workdir, 'bench.pfx')
+        with open(pfx_path, 'wb') as f:
+            f.write(pkcs12.serialize_key_and_certificates(
+                b'bench', key, cert, None, serialization.BestAvailableEncryption(b'secret')
+            ))
+        xsd_path = os.path.join(workdir, 'bench.xsd')
+        with open(xsd_path, 'w', encoding='utf-8') as f:
+            f.write(
+                '<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">'
+                '<xs:element name="evento"><xs:complexType><xs:sequence>'
+                + ''.join(f'<xs:element name="c{i}" type="xs:string"/>' for i in range(40))
+                + '</xs:sequence></xs:complexType></xs:element></xs:schema>'
+            )
+        doc = etree.fromstring('<evento>' + ''.join(f'<c{i}>x</c{i}>' for i in range(40)) + '</evento>')
+
+        started = time.perf_counter()
+        for _ in range(rounds):
+            load_signing_material(pfx_path, 'secret').close()
+            etree.XMLSchema(etree.parse(xsd_path)).validate(doc)
+        uncached = time.perf_counter() - started
+
+        certificates, schemas = CertificateCache(), SchemaCache()
+        started = time.perf_counter()
+        for _ in range(rounds):
+            certificates.get(pfx_path, 'secret')
+            schemas.validate('bench', xsd_path, doc)
+        cached = time.perf_counter() - started
+        certificates.clear()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {'per_note_s': round(uncached, 4), 'cached_s': round(cached, 4)}
+
+
+if __name__ == '__main__':
+    print(_benchmark())
@@ -1,11 +1,7 @@
 import os
 import logging
 import requests
-import tempfile
 import uuid
-from cryptography.hazmat.primitives.serialization import pkcs12
-from cryptography.hazmat.primitives import serialization
-from cryptography.hazmat.primitives import hashes
 import xml.etree.ElementTree as ET
 import gzip
 import base64
@@ -13,8 +9,18 @@ from datetime import datetime
 from xml.sax.saxutils import escape
 import re
 
+from app.services.integration_http_client import get_integration_client
+from app.services.sefaz_material_cache import get_certificate_cache, get_schema_cache
+
 logger = logging.getLogger(__name__)
 
+# Keep-alive pools (per host and client certificate), timeouts and circuit breaker for the SEFAZ web services.
+SEFAZ_HTTP = get_integration_client("sefaz")
+
+# Compiled event schema (process-wide, see sefaz_material_cache) and the XSD trees already checked on disk.
+EVENT_SCHEMA_VERSION = "nfe_v4_00/envEvento_v1.00"
+_EVENT_XSD_READY = {}
+
 # URL do serviço de Distribuição de DFe (Ambiente Nacional)
 URL_DISTRIBUICAO = "https://www1.nfe.fazenda.gov.br/NFeDistribuicaoDFe/NFeDistribuicaoDFe.asmx"
 URL_RECEPCAO_EVENTO = "https://www.nfe.fazenda.gov.br/NFeRecepcaoEvento4/NFeRecepcaoEvento4.asmx" # Exemplo, varia por UF para NFe, mas Manifestação é AN
@@ -26,7 +32,7 @@ class SefazService:
         self.pfx_password = pfx_password
         self._cert_pem = None
         self._key_pem = None
-        self._temp_dir = None
+        self._material = None
         self._certificate_metadata = {}
         self._xml_signature_profile = {
             "signature_algorithm": "rsa-sha1",
@@ -51,6 +57,9 @@ class SefazService:
     def _ensure_event_xsd_tree(self):
         base_url = "https://raw.githubusercontent.com/akretion/nfelib/master_gen_v4_00/schemas/nfe/v4_00/"
         cache_dir = os.path.join(os.getcwd(), "data", "fiscal", "xsd_cache", "nfe_v4_00")
+        root_path = os.path.join(cache_dir, "envEvento_v1.00.xsd")
+        if _EVENT_XSD_READY.get(cache_dir) and os.path.exists(root_path):
+            return root_path
         os.makedirs(cache_dir, exist_ok=True)
         visited = set()
 
@@ -73,19 +82,17 @@ class SefazService:
                 download_file(ref)
 
         download_file("envEvento_v1.00.xsd")
-        return os.path.join(cache_dir, "envEvento_v1.00.xsd")
+        _EVENT_XSD_READY[cache_dir] = True
+        return root_path
 
     def _validate_event_xml_schema(self, xml_text):
         try:
             from lxml import etree
             xsd_path = self._ensure_event_xsd_tree()
-            schema_doc = etree.parse(xsd_path)
-            schema = etree.XMLSchema(schema_doc)
             doc = etree.fromstring(str(xml_text or "").encode("utf-8"))
-            ok = bool(schema.validate(doc))
+            ok, err = get_schema_cache().validate(EVENT_SCHEMA_VERSION, xsd_path, doc)
             if ok:
                 return {"ok": True, "line": 0, "message": ""}
-            err = schema.error_log.last_error
             return {
                 "ok": False,
                 "line": int(getattr(err, "line", 0) or 0),
@@ -102,58 +109,20 @@ class SefazService:
         self._cleanup()
 
     def _load_cert(self):
-        """Carrega o certificado PFX e converte para PEM temporário para uso no requests."""
+        """Obtém o certificado PFX (em PEM) do cache do processo, carregando-o na primeira vez."""
         try:
-            with open(self.pfx_path, "rb") as f:
-                pfx_data = f.read()
-
-            password = self.pfx_password.encode('utf-8') if self.pfx_password else None
-            
-            # Carregar PFX
-            private_key, certificate, additional_certificates = pkcs12.load_key_and_certificates(
-                pfx_data, 
-                password
-            )
-            if private_key is None or certificate is None:
-                raise Exception("Certificado A1 inválido: chave privada ou certificado ausente no PFX.")
-
-            # Criar diretório temporário
-            self._temp_dir = tempfile.TemporaryDirectory()
-            
-            cert_path = os.path.join(self._temp_dir.name, "cert.pem")
-            key_path = os.path.join(self._temp_dir.name, "key.pem")
-
-            # Salvar Certificado
-            with open(cert_path, "wb") as f:
-                f.write(certificate.public_bytes(serialization.Encoding.PEM))
-                if additional_certificates:
-                    for cert in additional_certificates:
-                        f.write(cert.public_bytes(serialization.Encoding.PEM))
-
-            # Salvar Chave Privada
-            with open(key_path, "wb") as f:
-                f.write(private_key.private_bytes(
-                    encoding=serialization.Encoding.PEM,
-                    format=serialization.PrivateFormat.TraditionalOpenSSL,
-                    encryption_algorithm=serialization.NoEncryption()
-                ))
-
-            self._cert_pem = cert_path
-            self._key_pem = key_path
-            self._certificate_metadata = {
-                "serial_number": str(getattr(certificate, "serial_number", "")),
-                "fingerprint_sha256": certificate.fingerprint(hashes.SHA256()).hex().upper(),
-                "subject": str(certificate.subject.rfc4514_string() or ""),
-                "issuer": str(certificate.issuer.rfc4514_string() or ""),
-                "not_valid_before": certificate.not_valid_before_utc.isoformat() if hasattr(certificate, "not_valid_before_utc") else "",
-                "not_valid_after": certificate.not_valid_after_utc.isoformat() if hasattr(certificate, "not_valid_after_utc") else "",
-            }
+            material, cached = get_certificate_cache().get(self.pfx_path, self.pfx_password)
+            self._material = material
+            self._cert_pem = material.cert_pem
+            self._key_pem = material.key_pem
+            self._certificate_metadata = dict(material.metadata)
             logger.info(
-                "sefaz_certificate_loaded path=%s subject=%s serial=%s valid_to=%s",
+                "sefaz_certificate_loaded path=%s subject=%s serial=%s valid_to=%s cached=%s",
                 str(self.pfx_path),
                 str(self._certificate_metadata.get("subject") or ""),
                 str(self._certificate_metadata.get("serial_number") or ""),
                 str(self._certificate_metadata.get("not_valid_after") or ""),
+                str(bool(cached)).lower(),
             )
             
         except Exception as e:
@@ -171,8 +140,10 @@ class SefazService:
         }
 
     def _cleanup(self):
-        if self._temp_dir:
-            self._temp_dir.cleanup()
+        # Os PEM pertencem ao cache do processo (removidos na troca do PFX ou na saída).
+        self._material = None
+        self._cert_pem = None
+        self._key_pem = None
 
     def _build_soap_envelope(self, body_content, method_name=None, namespace=None):
         return (
@@ -324,6 +295,29 @@ class SefazService:
             logger.error(f"Erro ao manifestar ciência da operação: {e}")
             return {"success": False, "message": str(e)}
 
+    def manifestar_ciencia_operacao_lote(self, chaves_acesso, cnpj, ambiente=1, sequencia_evento=1, correlation_id=None, binding_profile=None):
+        """
+        Manifesta Ciência da Operação para várias chaves com o mesmo certificado,
+        signer e conexão HTTPS (keep-alive do SEFAZ_HTTP). Retorna uma lista
+        ``[(chave, resultado)]`` na ordem recebida.
+        """
+        if self._material is None:
+            self._load_cert()
+        results = []
+        for chave in chaves_acesso or []:
+            results.append((
+                chave,
+                self.manifestar_ciencia_operacao(
+                    chave,
+                    cnpj,
+                    ambiente=ambiente,
+                    sequencia_evento=sequencia_evento,
+                    correlation_id=correlation_id,
+                    binding_profile=binding_profile,
+                ),
+            ))
+        return results
+
     def _gerar_xml_evento(self, chave, cnpj, tp_evento, desc_evento, ambiente, sequencia_evento=1, correlation_id=None):
         now = datetime.now().strftime('%Y-%m-%dT%H:%M:%S-03:00')
         seq = int(sequencia_evento or 1)
@@ -367,7 +361,7 @@ class SefazService:
             from signxml import XMLSigner, methods
         except Exception:
             raise Exception("Assinatura fiscal indisponível: bibliotecas XML não instaladas no servidor.")
-        if not self._cert_pem or not self._key_pem:
+        if self._material is None:
             self._load_cert()
         parser = etree.XMLParser(remove_blank_text=True)
         root = etree.fromstring(event_xml.encode("utf-8"), parser=parser)
@@ -376,21 +370,24 @@ class SefazService:
         if inf_evento is None or evento_node is None:
             raise Exception("Estrutura do evento inválida para assinatura.")
         ref_uri = "#" + str(inf_evento.get("Id") or "")
-        with open(self._key_pem, "rb") as f:
-            key_data = f.read()
-        with open(self._cert_pem, "rb") as f:
-            cert_data = f.read()
-        class LegacyXMLSigner(XMLSigner):
-            def check_deprecated_methods(self):
-                return None
+        signature_algorithm = str(self._xml_signature_profile.get("signature_algorithm") or "rsa-sha256")
+        digest_algorithm = str(self._xml_signature_profile.get("digest_algorithm") or "sha256")
+        c14n_algorithm = str(self._xml_signature_profile.get("c14n_algorithm") or "http://www.w3.org/TR/2001/REC-xml-c14n-20010315")
+
+        def build_signer():
+            class LegacyXMLSigner(XMLSigner):
+                def check_deprecated_methods(self):
+                    return None
+
+            signer = LegacyXMLSigner(
+                method=methods.enveloped,
+                signature_algorithm=signature_algorithm,
+                digest_algorithm=digest_algorithm,
+                c14n_algorithm=c14n_algorithm,
+            )
+            signer.namespaces = {None: "http://www.w3.org/2000/09/xmldsig#"}
+            return signer
 
-        signer = LegacyXMLSigner(
-            method=methods.enveloped,
-            signature_algorithm=str(self._xml_signature_profile.get("signature_algorithm") or "rsa-sha256"),
-            digest_algorithm=str(self._xml_signature_profile.get("digest_algorithm") or "sha256"),
-            c14n_algorithm=str(self._xml_signature_profile.get("c14n_algorithm") or "http://www.w3.org/TR/2001/REC-xml-c14n-20010315"),
-        )
-        signer.namespaces = {None: "http://www.w3.org/2000/09/xmldsig#"}
         logger.info(
             "sefaz_manifest_xml_sign_start correlation_id=%s signature_algorithm=%s digest_algorithm=%s c14n=%s signed_node=infEvento ref_uri=%s",
             str(correlation_id or ""),
@@ -399,10 +396,11 @@ class SefazService:
             str(self._xml_signature_profile.get("c14n_algorithm") or ""),
             str(ref_uri),
         )
-        signed_inf = signer.sign(
+        # Um signer por certificado e perfil de assinatura, reaproveitado entre eventos.
+        signed_inf = self._material.sign(
+            (signature_algorithm, digest_algorithm, c14n_algorithm),
+            build_signer,
             evento_node,
-            key=key_data,
-            cert=cert_data,
             reference_uri=ref_uri,
             id_attribute="Id",
         )
@@ -537,7 +535,7 @@ class SefazService:
                 str(self._certificate_metadata.get("serial_number") or ""),
                 str(self._certificate_metadata.get("fingerprint_sha256") or "")[:16],
             )
-            response = requests.post(
+            response = SEFAZ_HTTP.post(
                 url,
                 data=envelope.encode("utf-8"),
                 headers=headers,
@@ -848,7 +846,7 @@ class SefazService:
         }
         try:
             logger.info(f"SEFAZ SOAP Request Envelope: {envelope}")
-            response = requests.post(
+            response = SEFAZ_HTTP.post(
                 url,
                 data=envelope,
                 headers=headers,
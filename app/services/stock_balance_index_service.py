@@ -0,0 +1,393 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+from app.services import data_service
+from app.services.ledger_journal_service import ledger_signature
+
+
+INDEX_VERSION = 1
+INDEX_FILENAME = 'stock_balance_index.json'
+CHECKPOINT_INTERVAL_SECONDS = 30.0
+ACTIVE_REQUEST_STATUSES = ('Pendente', 'Concluído')
+SOURCES = ('entries', 'requests', 'transfers')
+_KEY_SEP = '\x1f'
+
+logger = logging.getLogger(__name__)
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _bump(bucket, key, qty):
+    bucket[key] = bucket.get(key, 0.0) + qty
+
+
+def _empty_aggregates(source):
+    if source == 'entries':
+        # by_id/by_name feed get_product_balances_by_id (product_id wins,
+        # legacy rows fall back to name); flow feeds calculate_inventory.
+        return {'by_id': {}, 'by_name': {}, 'flow_in': {}, 'flow_out': {}}
+    if source == 'requests':
+        # out_pairs keeps "product_id<SEP>name" because the balance resolver
+        # falls back to the name when the id is unknown to the catalog.
+        return {'out_pairs': {}, 'flow_out': {}}
+    return {'routes': {}}
+
+
+def _request_items(req):
+    if 'items_structured' in req:
+        return req.get('items_structured') or []
+    raw = req.get('items')
+    items = []
+    if isinstance(raw, str):
+        for part in raw.split(', '):
+            if 'x ' in part:
+                qty_str, name = part.split('x ', 1)
+                items.append({'name': name, 'qty': qty_str})
+    return items
+
+
+def _fold_entry(agg, entry):
+    if not isinstance(entry, dict):
+        return
+    qty = _to_float(entry.get('qty'))
+    if qty is None:
+        return
+    if entry.get('product_id'):
+        _bump(agg['by_id'], str(entry['product_id']), qty)
+    elif entry.get('product'):
+        _bump(agg['by_name'], entry['product'], qty)
+    product = entry.get('product')
+    if isinstance(product, str):
+        name = product.strip()
+        if qty >= 0:
+            _bump(agg['flow_in'], name, qty)
+        else:
+            _bump(agg['flow_out'], name, abs(qty))
+
+
+def _fold_request(agg, req):
+    if not isinstance(req, dict):
+        return
+    if req.get('status') in ACTIVE_REQUEST_STATUSES:
+        for item in _request_items(req):
+            if not isinstance(item, dict):
+                continue
+            qty = _to_float(item.get('delivered_qty', item.get('qty', 0)))
+            pid = item.get('product_id')
+            key = f"{str(pid) if pid else ''}{_KEY_SEP}{item.get('name') or ''}"
+            _bump(agg['out_pairs'], key, qty or 0.0)
+    for item in req.get('items_structured') or []:
+        if not isinstance(item, dict) or not isinstance(item.get('name'), str):
+            continue
+        qty = (_to_float(item.get('delivered_qty', 0)) or 0.0) or (_to_float(item.get('qty', 0)) or 0.0)
+        _bump(agg['flow_out'], item['name'].strip(), qty)
+
+
+def _fold_transfer(agg, transfer):
+    if not isinstance(transfer, dict) or not isinstance(transfer.get('product'), str):
+        return
+    qty = _to_float(transfer.get('qty'))
+    if qty is None:
+        return
+    key = _KEY_SEP.join([transfer['product'].strip(), str(transfer.get('from') or ''), str(transfer.get('to') or '')])
+    _bump(agg['routes'], key, qty)
+
+
+_FOLDERS = {
+    'entries': _fold_entry,
+    'requests': _fold_request,
+    'transfers': _fold_transfer,
+}
+
+
+def aggregate_rows(source, rows):
+    agg = _empty_aggregates(source)
+    fold = _FOLDERS[source]
+    for row in rows or []:
+        fold(agg, row)
+    return agg
+
+
+def _source_path(source):
+    if source == 'entries':
+        return data_service.STOCK_ENTRIES_FILE
+    if source == 'requests':
+        return data_service.STOCK_FILE
+    return data_service.STOCK_TRANSFERS_FILE
+
+
+def _resolved_source_path(source):
+    # Mirrors the read fallback in data_service._load_json so the signature
+    # tracks the file that was actually parsed.
+    path = _source_path(source)
+    if not os.path.exists(path):
+        legacy = data_service._legacy_read_candidate(path)
+        if legacy and os.path.exists(legacy):
+            path = legacy
+    return os.path.abspath(path)
+
+
+def _source_loader(source):
+    if source == 'entries':
+        return data_service.load_stock_entries
+    if source == 'requests':
+        return data_service.load_stock_requests
+    return data_service.load_stock_transfers
+
+
+def _signature(path):
+    # Covers the append journal too: stock_entries takes appends there.
+    return ledger_signature(path)
+
+
+class StockBalanceIndex:
+    """
+    Materialized ledger aggregates for stock_entries, stock_requests and
+    stock_transfers. Each source remembers the file signature it reflects;
+    writers in data_service fold new rows in place, and a signature
+    mismatch (file changed by someone else) rebuilds only that source.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._sources = {}
+        self._loaded = False
+        self._dirty = False
+        self._last_checkpoint = 0.0
+        self.counters = {'incremental_updates': 0, 'source_rebuilds': 0, 'checkpoints': 0}
+
+    def index_path(self):
+        return os.path.join(os.path.dirname(os.path.abspath(_source_path('entries'))), INDEX_FILENAME)
+
+    def _load_checkpoint(self):
+        self._loaded = True
+        path = self.index_path()
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                payload = json.load(f)
+        except Exception as e:
+            logger.warning(f"stock_balance_index_checkpoint_unreadable path={path} error={e}")
+            return
+        if not isinstance(payload, dict) or payload.get('version') != INDEX_VERSION:
+            return
+        for source in SOURCES:
+            state = (payload.get('sources') or {}).get(source)
+            if isinstance(state, dict) and isinstance(state.get('aggregates'), dict):
+                self._sources[source] = state
+
+    def _state_is_current(self, source, state):
+        path = _resolved_source_path(source)
+        return (
+            isinstance(state, dict)
+            and state.get('path') == path
+            and state.get('signature') is not None
+            and state.get('signature') == _signature(path)
+        )
+
+    def _rebuild_source(self, source):
+        path = _resolved_source_path(source)
+        signature = _signature(path)
+        rows = _source_loader(source)()
+        # Only trust the signature if the file did not move while reading.
+        if _signature(path) != signature:
+            signature = None
+        state = {
+            'path': path,
+            'signature': signature,
+            'count': len(rows) if isinstance(rows, list) else 0,
+            'aggregates': aggregate_rows(source, rows if isinstance(rows, list) else []),
+        }
+        self._sources[source] = state
+        self._dirty = True
+        self.counters['source_rebuilds'] += 1
+        return state
+
+    def aggregates(self, source):
+        """Copy of ``source``'s aggregates; the live buckets keep folding appended rows."""
+        with self._lock:
+            if not self._loaded:
+                self._load_checkpoint()
+            state = self._sources.get(source)
+            if not self._state_is_current(source, state):
+                state = self._rebuild_source(source)
+            self._maybe_checkpoint()
+            return {name: dict(bucket) for name, bucket in state['aggregates'].items()}
+
+    def apply_appended(self, source, rows):
+        """Folds rows that were just appended to ``source`` and adopts the new file signature."""
+        with self._lock:
+            if not self._loaded:
+                self._load_checkpoint()
+            state = self._sources.get(source)
+            path = _resolved_source_path(source)
+            if not isinstance(state, dict) or state.get('path') != path or state.get('signature') is None:
+                # Nothing trustworthy to build on; the next read rebuilds.
+                self._sources.pop(source, None)
+                return
+            fold = _FOLDERS[source]
+            for row in rows or []:
+                fold(state['aggregates'], row)
+            state['count'] = int(state.get('count') or 0) + len(rows or [])
+            state['signature'] = _signature(path)
+            self._dirty = True
+            self.counters['incremental_updates'] += 1
+            self._maybe_checkpoint()
+
+    def replace_source(self, source, rows):
+        """Re-derives ``source`` from rows that were just written as the whole file."""
+        with self._lock:
+            path = _resolved_source_path(source)
+            self._sources[source] = {
+                'path': path,
+                'signature': _signature(path),
+                'count': len(rows) if isinstance(rows, list) else 0,
+                'aggregates': aggregate_rows(source, rows if isinstance(rows, list) else []),
+            }
+            self._loaded = True
+            self._dirty = True
+            self.counters['incremental_updates'] += 1
+            self._maybe_checkpoint()
+
+    def invalidate(self, source=None):
+        with self._lock:
+            if source is None:
+                self._sources.clear()
+            else:
+                self._sources.pop(source, None)
+
+    def _maybe_checkpoint(self, force=False):
+        if not self._dirty:
+            return
+        if not force and (time.time() - self._last_checkpoint) < CHECKPOINT_INTERVAL_SECONDS:
+            return
+        self.checkpoint()
+
+    def checkpoint(self):
+        with self._lock:
+            payload = {
+                'version': INDEX_VERSION,
+                'updated_at': datetime.now().isoformat(),
+                'sources': {k: v for k, v in self._sources.items() if v.get('signature') is not None},
+            }
+            path = self.index_path()
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(payload, f, ensure_ascii=False, separators=(',', ':'))
+                os.replace(tmp_path, path)
+                self._dirty = False
+                self._last_checkpoint = time.time()
+                self.counters['checkpoints'] += 1
+                return True
+            except Exception as e:
+                logger.error(f"stock_balance_index_checkpoint_failed path={path} error={e}")
+                return False
+
+    def rebuild(self):
+        with self._lock:
+            self._loaded = True
+            self._sources.clear()
+            for source in SOURCES:
+                self._rebuild_source(source)
+            self.checkpoint()
+            return self.status()
+
+    def status(self):
+        with self._lock:
+            return {
+                'index_path': self.index_path(),
+                'sources': {
+                    source: {
+                        'count': state.get('count'),
+                        'current': self._state_is_current(source, state),
+                    }
+                    for source, state in self._sources.items()
+                },
+                'counters': dict(self.counters),
+            }
+
+
+_INDEX = StockBalanceIndex()
+
+
+def get_stock_balance_index():
+    return _INDEX
+
+
+def notify_rows_appended(source, rows):
+    try:
+        _INDEX.apply_appended(source, rows)
+    except Exception as e:
+        logger.error(f"stock_balance_index_append_failed source={source} error={e}")
+        _INDEX.invalidate(source)
+
+
+def notify_source_replaced(source, rows):
+    try:
+        _INDEX.replace_source(source, rows)
+    except Exception as e:
+        logger.error(f"stock_balance_index_replace_failed source={source} error={e}")
+        _INDEX.invalidate(source)
+
+
+def rebuild_stock_balance_index():
+    return _INDEX.rebuild()
+
+
+def resolve_balances_by_id(products, entries_agg, requests_agg):
+    name_to_ids = {}
+    for p in products:
+        name_to_ids.setdefault(p['name'], []).append(str(p['id']))
+    balances = {str(p['id']): 0.0 for p in products}
+
+    for pid, qty in entries_agg['by_id'].items():
+        if pid in balances:
+            balances[pid] += qty
+    for name, qty in entries_agg['by_name'].items():
+        if name in name_to_ids:
+            balances[name_to_ids[name][0]] += qty
+
+    for key, qty in requests_agg['out_pairs'].items():
+        pid, name = key.split(_KEY_SEP, 1)
+        if pid and pid in balances:
+            balances[pid] -= qty
+        elif name and name in name_to_ids:
+            balances[name_to_ids[name][0]] -= qty
+    return balances
+
+
+def transfer_totals(transfers_agg, target_dept, valid_depts):
+    """Returns (incoming, outgoing) qty per product name for a department view."""
+    incoming = {}
+    outgoing = {}
+    if target_dept == 'Geral':
+        return incoming, outgoing
+    for key, qty in transfers_agg['routes'].items():
+        product, t_from, t_to = key.split(_KEY_SEP, 2)
+        if target_dept == 'Principal':
+            is_incoming = t_to == 'Principal'
+            is_outgoing = t_from == 'Principal'
+        else:
+            is_incoming = t_to in valid_depts
+            is_outgoing = t_from in valid_depts
+        if is_incoming:
+            _bump(incoming, product, qty)
+        if is_outgoing:
+            _bump(outgoing, product, qty)
+    return incoming, outgoing
+
+
+if __name__ == '__main__':
+    print(json.dumps(rebuild_stock_balance_index(), indent=2, ensure_ascii=False))
@@ -1,15 +1,23 @@
 import json
 import os
+import threading
 import uuid
 import xml.etree.ElementTree as ET
 from datetime import datetime, timedelta
 from typing import Any, Dict, List, Optional, Tuple
 
+from app.services.json_document_cache import is_racy, stat_token
+from app.services.nfe_repository_index import NfeRepositoryIndex, NoteKeyIndex, digits_only, normalize_text
 from app.services.system_config_manager import get_data_path
 from app.utils.lock import file_lock
 
 NFE_REPOSITORY_FILE = get_data_path(os.path.join("fiscal", "nfe_received_repository.json"))
 
+# Lookup tables for the current repository file, keyed by (path, stat token).
+_REPOSITORY_INDEX = None
+_REPOSITORY_INDEX_LOCK = threading.Lock()
+_REPOSITORY_INDEX_STATS = {"builds": 0, "hits": 0}
+
 
 def _now_iso() -> str:
     return datetime.now().isoformat()
@@ -98,6 +106,31 @@ def _load_data() -> Dict[str, Any]:
     }
 
 
+def _repository_index() -> NfeRepositoryIndex:
+    """Indexes over the repository file, rebuilt only when it changes on disk."""
+    global _REPOSITORY_INDEX
+    path = NFE_REPOSITORY_FILE
+    with _REPOSITORY_INDEX_LOCK:
+        cached = _REPOSITORY_INDEX
+        if cached is not None and cached[0] == (path, stat_token(path)):
+            _REPOSITORY_INDEX_STATS["hits"] += 1
+            return cached[1]
+    with file_lock(path):
+        token = stat_token(path)
+        index = NfeRepositoryIndex(_load_data())
+    # A build from a racy file is used once, not cached.
+    with _REPOSITORY_INDEX_LOCK:
+        _REPOSITORY_INDEX_STATS["builds"] += 1
+        if not is_racy(token):
+            _REPOSITORY_INDEX = ((path, token), index)
+    return index
+
+
+def repository_index_stats() -> Dict[str, Any]:
+    with _REPOSITORY_INDEX_LOCK:
+        return dict(_REPOSITORY_INDEX_STATS, cached=_REPOSITORY_INDEX is not None)
+
+
 def _save_data(data: Dict[str, Any]) -> None:
     os.makedirs(os.path.dirname(NFE_REPOSITORY_FILE), exist_ok=True)
     with open(NFE_REPOSITORY_FILE, "w", encoding="utf-8") as f:
@@ -512,14 +545,7 @@ def _build_note_from_document(
 
 
 def _find_note(notes: List[Dict[str, Any]], nsu: str, chave_nfe: str) -> Optional[Dict[str, Any]]:
-    nsu_value = str(nsu or "")
-    chave_value = str(chave_nfe or "")
-    for note in notes:
-        if str(note.get("chave_nfe") or "") and chave_value and str(note.get("chave_nfe") or "") == chave_value:
-            return note
-        if str(note.get("nsu") or "") and nsu_value and str(note.get("nsu") or "") == nsu_value:
-            return note
-    return None
+    return NoteKeyIndex(notes).find(nsu, chave_nfe)
 
 
 def _upgrade_existing_note_snapshot(existing_note: Dict[str, Any], incoming_note: Dict[str, Any]) -> bool:
@@ -763,27 +789,22 @@ def get_note_by_access_key(access_key: str) -> Optional[Dict[str, Any]]:
     key_value = str(access_key or "").strip()
     if not key_value:
         return None
-    with file_lock(NFE_REPOSITORY_FILE):
-        data = _load_data()
-        notes = data.get("notes") if isinstance(data.get("notes"), list) else []
-        for note in notes:
-            if not isinstance(note, dict):
-                continue
-            if str(note.get("chave_nfe") or "") == key_value:
-                item = _normalize_status(dict(note))
-                if not item.get("document_type"):
-                    classified = _classify_document_payload(
-                        str(item.get("xml_raw") or ""),
-                        item.get("items_fiscais") if isinstance(item.get("items_fiscais"), list) else [],
-                    )
-                    item["document_type"] = classified.get("document_type")
-                    item["has_full_items"] = bool(classified.get("has_full_items"))
-                    item["items_loaded"] = bool(classified.get("items_loaded"))
-                    item["items_reason"] = str(classified.get("items_reason") or "")
-                    item["xml_root"] = str(classified.get("xml_root") or "")
-                item["status"] = _note_status(item)
-                return item
-    return None
+    note = _repository_index().note_by_key(key_value)
+    if note is None:
+        return None
+    item = _normalize_status(note)
+    if not item.get("document_type"):
+        classified = _classify_document_payload(
+            str(item.get("xml_raw") or ""),
+            item.get("items_fiscais") if isinstance(item.get("items_fiscais"), list) else [],
+        )
+        item["document_type"] = classified.get("document_type")
+        item["has_full_items"] = bool(classified.get("has_full_items"))
+        item["items_loaded"] = bool(classified.get("items_loaded"))
+        item["items_reason"] = str(classified.get("items_reason") or "")
+        item["xml_root"] = str(classified.get("xml_root") or "")
+    item["status"] = _note_status(item)
+    return item
 
 
 def suggest_supplier_for_note(
@@ -792,8 +813,8 @@ def suggest_supplier_for_note(
     nome_emitente: str,
     suppliers: List[Dict[str, Any]],
 ) -> Dict[str, Any]:
-    cnpj_value = "".join(ch for ch in str(cnpj_emitente or "") if ch.isdigit())
-    nome_value = str(nome_emitente or "").strip().lower()
+    cnpj_value = digits_only(cnpj_emitente)
+    nome_value = normalize_text(nome_emitente)
     supplier_rows = suppliers if isinstance(suppliers, list) else []
     by_cnpj = []
     by_name = []
@@ -818,22 +839,7 @@ def suggest_supplier_for_note(
             "reason": "Fornecedor identificado pelo CNPJ",
             "source": "cnpj_exact",
         }
-    historical_match = None
-    with file_lock(NFE_REPOSITORY_FILE):
-        data = _load_data()
-        notes = data.get("notes") if isinstance(data.get("notes"), list) else []
-    for note in notes:
-        if not isinstance(note, dict):
-            continue
-        if not str(note.get("supplier_id") or "").strip():
-            continue
-        note_cnpj = "".join(ch for ch in str(note.get("cnpj_emitente") or "") if ch.isdigit())
-        note_name = str(note.get("nome_emitente") or "").strip().lower()
-        if cnpj_value and note_cnpj and cnpj_value == note_cnpj:
-            historical_match = str(note.get("supplier_id") or "")
-            break
-        if nome_value and note_name and nome_value == note_name:
-            historical_match = str(note.get("supplier_id") or "")
+    historical_match = _repository_index().history_supplier(cnpj_value, nome_value)
     if historical_match:
         suggested = next((s for s in supplier_rows if str(s.get("id") or "") == historical_match), None)
         if isinstance(suggested, dict):
@@ -952,20 +958,7 @@ def bind_note_supplier(
 def list_item_bindings(*, supplier_id: str = "", product_id: str = "", limit: int = 1000) -> List[Dict[str, Any]]:
     supplier_filter = str(supplier_id or "").strip()
     product_filter = str(product_id or "").strip()
-    with file_lock(NFE_REPOSITORY_FILE):
-        data = _load_data()
-        rows = data.get("item_bindings") if isinstance(data.get("item_bindings"), list) else []
-    out: List[Dict[str, Any]] = []
-    for row in rows:
-        if not isinstance(row, dict):
-            continue
-        if supplier_filter and str(row.get("supplier_id") or "") != supplier_filter:
-            continue
-        if product_filter and str(row.get("product_id") or "") != product_filter:
-            continue
-        out.append(dict(row))
-    out.sort(key=lambda r: str(r.get("last_used_at") or ""), reverse=True)
-    return out[: max(1, int(limit))]
+    return _repository_index().bindings(supplier_filter, product_filter, max(1, int(limit)))
 
 
 def suggest_item_binding(
@@ -973,40 +966,33 @@ def suggest_item_binding(
     supplier_id: str,
     supplier_product_code: str,
     supplier_product_name: str,
+    index: Optional[NfeRepositoryIndex] = None,
 ) -> Optional[Dict[str, Any]]:
     supplier_value = str(supplier_id or "").strip()
-    code_value = str(supplier_product_code or "").strip().lower()
-    name_value = str(supplier_product_name or "").strip().lower()
+    code_value = normalize_text(supplier_product_code)
+    name_value = normalize_text(supplier_product_name)
     if not supplier_value:
         return None
-    rows = list_item_bindings(supplier_id=supplier_value, limit=500)
-    exact_code = next((row for row in rows if code_value and str(row.get("supplier_product_code") or "").strip().lower() == code_value), None)
+    index = index or _repository_index()
+    exact_code = index.binding_by_code(supplier_value, code_value)
     if isinstance(exact_code, dict):
-        out = dict(exact_code)
+        out = exact_code
         out["confidence"] = "high"
         out["confidence_score"] = 0.92
         out["reason"] = "Código do fornecedor coincide com vínculo anterior"
         out["source"] = "supplier_product_code"
         return out
-    by_name = next((row for row in rows if name_value and name_value == str(row.get("supplier_product_name") or "").strip().lower()), None)
+    by_name = index.binding_by_name(supplier_value, name_value)
     if isinstance(by_name, dict):
-        out = dict(by_name)
+        out = by_name
         out["confidence"] = "medium"
         out["confidence_score"] = 0.75
         out["reason"] = "Descrição fiscal coincide com histórico do fornecedor"
         out["source"] = "supplier_product_name"
         return out
-    similar = next(
-        (
-            row
-            for row in rows
-            if name_value
-            and name_value in str(row.get("supplier_product_name") or "").strip().lower()
-        ),
-        None,
-    )
+    similar = index.binding_containing_name(supplier_value, name_value)
     if isinstance(similar, dict):
-        out = dict(similar)
+        out = similar
         out["confidence"] = "low"
         out["confidence_score"] = 0.45
         out["reason"] = "Descrição semelhante com histórico compatível"
@@ -1179,6 +1165,7 @@ def analyze_note_conference_assist(*, note: Dict[str, Any], parsed_items: List[D
     linked_count = 0
     divergence_count = 0
     pending_count = 0
+    index = _repository_index() if supplier_value else None
     for idx, item in enumerate(items):
         code = str(item.get("code") or "")
         name = str(item.get("name") or "")
@@ -1187,6 +1174,7 @@ def analyze_note_conference_assist(*, note: Dict[str, Any], parsed_items: List[D
             supplier_id=supplier_value,
             supplier_product_code=code,
             supplier_product_name=name,
+            index=index,
         ) if supplier_value else None
         unidade_estoque = str((suggestion or {}).get("unidade_estoque") or "")
         confidence = _classify_item_confidence(suggestion, unit, unidade_estoque)
@@ -1600,8 +1588,9 @@ def _ingest_documents_in_data(
     docs = documents if isinstance(documents, list) else []
     notes_original = data.get("notes") if isinstance(data.get("notes"), list) else []
     notes_staged: List[Dict[str, Any]] = [dict(row) for row in notes_original if isinstance(row, dict)]
-    seen_by_key = {str(note.get("chave_nfe") or "") for note in notes_staged if str(note.get("chave_nfe") or "")}
-    seen_by_nsu = {str(note.get("nsu") or "") for note in notes_staged if str(note.get("nsu") or "")}
+    staged = NoteKeyIndex(notes_staged)
+    seen_by_key = set(staged.by_key)
+    seen_by_nsu = set(staged.by_nsu)
     staged_nsu_values = [_safe_nsu_to_int(row.get("nsu")) for row in notes_staged]
     staged_nsu_values = [v for v in staged_nsu_values if isinstance(v, int)]
     per_doc: List[Dict[str, Any]] = []
@@ -1634,7 +1623,7 @@ def _ingest_documents_in_data(
             continue
         if nsu_value in seen_by_nsu:
             duplicate_count += 1
-            existing = _find_note(notes_staged, nsu_value, chave_value)
+            existing = staged.find(nsu_value, chave_value)
             if isinstance(existing, dict):
                 _upgrade_existing_note_snapshot(existing, item)
             per_doc.append({"nsu": nsu_value, "chave_nfe": chave_value, "status": "duplicado", "reason": "nsu já existe"})
@@ -1644,7 +1633,7 @@ def _ingest_documents_in_data(
             continue
         if chave_value in seen_by_key:
             duplicate_count += 1
-            existing = _find_note(notes_staged, nsu_value, chave_value)
+            existing = staged.find(nsu_value, chave_value)
             if isinstance(existing, dict):
                 _upgrade_existing_note_snapshot(existing, item)
             per_doc.append({"nsu": nsu_value, "chave_nfe": chave_value, "status": "duplicado", "reason": "chave já existe"})
@@ -1652,7 +1641,7 @@ def _ingest_documents_in_data(
             if nsu_int > highest_nsu:
                 highest_nsu = nsu_int
             continue
-        notes_staged.append(item)
+        staged.add(item)
         seen_by_nsu.add(nsu_value)
         seen_by_key.add(chave_value)
         nsu_int = int(nsu_value)
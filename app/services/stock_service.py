@@ -1,7 +1,12 @@
 from datetime import datetime, timedelta
 from app.services.data_service import (
-    load_stock_requests, load_products, load_stock_entries, 
-    load_stock_transfers, load_stock_logs
+    load_products, load_stock_transfers, load_stock_logs, iter_stock_requests, iter_stock_entries
+)
+from app.services.demand_stats_service import (
+    ANALYSIS_DAYS, LEAD_TIME_LOOKBACK_DAYS, smart_stock_suggestions
+)
+from app.services.stock_balance_index_service import (
+    get_stock_balance_index, aggregate_rows, resolve_balances_by_id, transfer_totals
 )
 
 def calculate_suggested_min_stock():
@@ -10,15 +15,16 @@ def calculate_suggested_min_stock():
     Returns a list of dicts:
     [{'product': name, 'current_min': val, 'avg_monthly': val, 'suggested_min': val, 'diff': val}, ...]
     """
-    requests = load_stock_requests()
-    products = load_products()
-    
     # Calculate total consumption per product (last 3 months ideally, but using all history for simplicity if limited data)
     # Let's filter for last 90 days to be more accurate
     
     today = datetime.now()
     start_date = today - timedelta(days=90)
     
+    # Only requests inside the window are read from disk (date sidecar index).
+    requests = iter_stock_requests(start_date)
+    products = load_products()
+    
     consumption_totals = {}
     
     for req in requests:
@@ -73,244 +79,37 @@ def calculate_smart_stock_suggestions():
     Advanced algorithm for calculating Minimum Stock based on:
     - 60 days sales history
     - Standard Deviation of demand
-    - Supplier Lead Time (inferred from frequency)
+    - Supplier Lead Time (median interval between purchases in stock
+      entries, falling back to the product's frequency)
     - Service Level (95% -> Z=1.645)
     
     Formula: Min Stock = (Avg Daily Demand * Lead Time) + Safety Stock
     Safety Stock = Z * StdDev_Day * sqrt(Lead Time)
-    """
-    import math
-    import statistics
-    
-    requests = load_stock_requests()
-    products = load_products()
-    entries = load_stock_entries()
     
+    The statistics are computed for all products at once over a
+    products x days NumPy matrix (demand_stats_service).
+    """
     # 1. Define Analysis Period (Last 60 Days)
     today = datetime.now()
-    start_date = today - timedelta(days=60)
+    start_date = today - timedelta(days=ANALYSIS_DAYS)
+    lead_time_since = today - timedelta(days=LEAD_TIME_LOOKBACK_DAYS)
     
-    # 2. Aggregate Daily Demand per Product
-    # daily_demand[product_name][date_str] = qty
-    daily_demand = {}
+    # Only rows inside the windows are read from disk (date sidecar index).
+    requests = iter_stock_requests(start_date)
+    products = load_products()
+    entries = list(iter_stock_entries(lead_time_since))
     
-    # Process Requests (Internal Consumption)
-    for req in requests:
-        try:
-            req_date = datetime.strptime(req['date'], '%d/%m/%Y')
-            if req_date >= start_date:
-                d_str = req['date']
-                if 'items_structured' in req:
-                    for item in req['items_structured']:
-                        name = item['name']
-                        qty = float(item.get('delivered_qty', item.get('qty', 0)))
-                        if name not in daily_demand: daily_demand[name] = {}
-                        daily_demand[name][d_str] = daily_demand[name].get(d_str, 0) + qty
-                elif 'items' in req and isinstance(req['items'], str):
-                     parts = req['items'].split(', ')
-                     for part in parts:
-                         if 'x ' in part:
-                             try:
-                                 qty_str, name = part.split('x ', 1)
-                                 if name not in daily_demand: daily_demand[name] = {}
-                                 daily_demand[name][d_str] = daily_demand[name].get(d_str, 0) + float(qty_str)
-                             except: pass
-        except: pass
-
-    # Process Entries (Sales registered as negative entries)
-    for entry in entries:
-        try:
-            entry_date = datetime.strptime(entry.get('date', ''), '%d/%m/%Y')
-            if entry_date >= start_date:
-                qty = float(entry.get('qty', 0))
-                if qty < 0: # It's an outflow/sale
-                    name = entry.get('product')
-                    d_str = entry.get('date')
-                    if name not in daily_demand: daily_demand[name] = {}
-                    daily_demand[name][d_str] = daily_demand[name].get(d_str, 0) + abs(qty)
-        except: pass
-
-    suggestions = []
-    
-    # 3. Calculate Metrics per Product
-    for p in products:
-        name = p['name']
-        history = daily_demand.get(name, {})
-        current_min = p.get('min_stock', 0) or 0
-        
-        # If no history, mark as no data
-        if not history:
-            suggestions.append({
-                'id': p['id'],
-                'product': name,
-                'current_min': current_min,
-                'avg_monthly': 0,
-                'std_dev': 0,
-                'lead_time': 0,
-                'suggested_min': 0,
-                'raw_calculated': 0,
-                'justification': "Sem histórico de movimentação recente.",
-                'has_history': False
-            })
-            continue
-            
-        # Fill zero days? 
-        # For accurate StdDev, we should consider days with 0 sales if the product was available.
-        # Simplification: Use the 60 days period as denominator for average.
-        # For StdDev, use the actual data points + zeros? 
-        # Let's create a list of 60 daily values.
-        
-        daily_values = []
-        total_qty = 0
-        for i in range(60):
-            d = start_date + timedelta(days=i)
-            d_str = d.strftime('%d/%m/%Y')
-            val = history.get(d_str, 0)
-            daily_values.append(val)
-            total_qty += val
-            
-        avg_daily = total_qty / 60
-        avg_monthly = avg_daily * 30
-        
-        if total_qty == 0:
-            continue
-            
-        # Standard Deviation of Daily Demand
-        if len(daily_values) > 1:
-            std_dev_day = statistics.stdev(daily_values)
-        else:
-            std_dev_day = 0
-            
-        # Lead Time Estimation based on Frequency
-        freq = p.get('frequency', 'Semanal')
-        if freq == 'Diário': lead_time = 1
-        elif freq == 'Semanal': lead_time = 7
-        elif freq == 'Quinzenal': lead_time = 15
-        elif freq == 'Mensal': lead_time = 30
-        else: lead_time = 7 # Default
-        
-        # Service Level 95% -> Z = 1.645
-        z_score = 1.645
-        
-        # Safety Stock Calculation
-        # Safety Stock = Z * StdDev * sqrt(Lead Time)
-        safety_stock = z_score * std_dev_day * math.sqrt(lead_time)
-        
-        # Cycle Stock (Demand during Lead Time)
-        cycle_stock = avg_daily * lead_time
-        
-        # Min Stock (Reorder Point)
-        calculated_min = cycle_stock + safety_stock
-        
-        # Constraints Check (1% to 50% of Monthly Demand)
-        # Note: User requested validation. 
-        # "Avoid min stocks below 1% or above 50% of average monthly demand"
-        # 50% of monthly demand is 15 days of stock. 
-        # If lead_time is 30 days, calculated_min WILL be > 50% of monthly demand (it will be ~100% + safety).
-        # So this constraint contradicts the math for long lead times.
-        # I will apply the constraint but flag it in the "justification".
-        
-        lower_bound = avg_monthly * 0.01
-        upper_bound = avg_monthly * 0.50
-        
-        final_suggestion = calculated_min
-        notes = []
-        
-        if final_suggestion < lower_bound:
-            final_suggestion = lower_bound
-            notes.append("Ajustado p/ 1% da demanda mensal")
-        elif final_suggestion > upper_bound:
-            # Only cap if lead_time allows it? 
-            # If lead_time > 15 days, capping at 15 days usage guarantees stockout.
-            # But "User is King". I will cap and warn.
-            final_suggestion = upper_bound
-            notes.append("Limitado a 50% da demanda mensal (Regra de Negócio)")
-            
-        current_min = p.get('min_stock', 0) or 0
-        
-        suggestions.append({
-            'id': p['id'],
-            'product': name,
-            'current_min': current_min,
-            'avg_monthly': round(avg_monthly, 2),
-            'std_dev': round(std_dev_day, 2),
-            'lead_time': lead_time,
-            'suggested_min': round(final_suggestion, 2),
-            'raw_calculated': round(calculated_min, 2),
-            'justification': f"Lead Time: {lead_time}d, Var: {round(std_dev_day, 2)}. " + "; ".join(notes),
-            'has_history': True
-        })
-        
-    return suggestions
+    return smart_stock_suggestions(requests, entries, products, start_date, lead_time_since=lead_time_since)
 
 def get_product_balances_by_id(products=None):
+    """
+    Balance per product id, resolved from the materialized ledger index
+    (see stock_balance_index_service) instead of rescanning the ledgers.
+    """
     if products is None:
         products = load_products()
-    entries = load_stock_entries()
-    requests = load_stock_requests()
-    
-    # Map Name to List of IDs to handle legacy name-based entries
-    name_to_ids = {}
-    for p in products:
-        name = p['name']
-        if name not in name_to_ids:
-            name_to_ids[name] = []
-        name_to_ids[name].append(str(p['id']))
-        
-    balances = {str(p['id']): 0.0 for p in products}
-    
-    for entry in entries:
-        # If entry has product_id, use it
-        if entry.get('product_id'):
-            pid = str(entry['product_id'])
-            if pid in balances:
-                try:
-                    balances[pid] += float(entry['qty'])
-                except (ValueError, TypeError): pass
-        elif entry.get('product'):
-            # Legacy: use name
-            name = entry['product']
-            if name in name_to_ids:
-                # Assign to the first ID found for this name
-                target_id = name_to_ids[name][0]
-                if target_id in balances:
-                    try:
-                        balances[target_id] += float(entry['qty'])
-                    except (ValueError, TypeError): pass
-            
-    for req in requests:
-        if req.get('status') not in ['Pendente', 'Concluído']:
-            continue
-
-        items = []
-        if 'items_structured' in req:
-            items = req['items_structured']
-        elif 'items' in req and isinstance(req['items'], str):
-             parts = req['items'].split(', ')
-             for part in parts:
-                 try:
-                     if 'x ' in part:
-                         qty_str, name = part.split('x ', 1)
-                         items.append({'name': name, 'qty': qty_str})
-                 except ValueError: pass
-        
-        for item in items:
-            name = item.get('name')
-            pid = item.get('product_id')
-            
-            try:
-                qty = float(item.get('delivered_qty', item.get('qty', 0)))
-            except (ValueError, TypeError):
-                qty = 0.0
-            
-            if pid and str(pid) in balances:
-                balances[str(pid)] -= qty
-            elif name and name in name_to_ids:
-                target_id = name_to_ids[name][0]
-                if target_id in balances:
-                    balances[target_id] -= qty
-
-    return balances
+    index = get_stock_balance_index()
+    return resolve_balances_by_id(products, index.aggregates('entries'), index.aggregates('requests'))
 
 def get_product_balances():
     products = load_products()
@@ -326,9 +125,18 @@ def get_product_balances():
         
     return balances_by_name
 
-def calculate_inventory(products, entries, requests, transfers, target_dept='Geral'):
+def calculate_inventory(products, entries=None, requests=None, transfers=None, target_dept='Geral'):
+    """
+    Inventory flow per product name for a department view.
+    Ledgers passed explicitly are aggregated in a single pass; ledgers left
+    as None are read from the materialized balance index.
+    """
     print(f"DEBUG: Calculating for {target_dept}")
     inventory = {}
+    index = get_stock_balance_index()
+    entries_agg = aggregate_rows('entries', entries) if entries is not None else index.aggregates('entries')
+    requests_agg = aggregate_rows('requests', requests) if requests is not None else index.aggregates('requests')
+    transfers_agg = aggregate_rows('transfers', transfers) if transfers is not None else index.aggregates('transfers')
     
     # 1. Helper to normalize product names for matching
     #    "Heineken long neck (BAR)" -> base: "Heineken long neck"
@@ -389,92 +197,29 @@ def calculate_inventory(products, entries, requests, transfers, target_dept='Ger
         }
 
     # 4. Calculate Flow
-    for p_name in inventory:
+    # Internal transfers don't change the global ('Geral') stock; for other
+    # views they are pre-summed per product for the department's aliases.
+    transfers_in, transfers_out = transfer_totals(transfers_agg, target_dept, valid_depts)
+    is_dept_view = target_dept not in ['Geral', 'Principal']
+
+    for p_name, data in inventory.items():
         base_name = get_base_name(p_name)
-        
+
         # --- ENTRIES (Purchases / Reset) ---
-        for entry in entries:
-            entry_prod = entry['product'].strip()
-            # Strict match for Purchases (usually bought with specific name)
-            if entry_prod == p_name:
-                try:
-                    qty = float(entry['qty'])
-                    if qty >= 0:
-                        inventory[p_name]['qty_in'] += qty
-                    else:
-                        # Negative entry (Sale/Consumption/Adjustment)
-                        inventory[p_name]['qty_out'] += abs(qty)
-                except ValueError:
-                    pass
-            # Note: We don't use base_name here because if you buy "Heineken", 
-            # it goes to "Heineken" (Main), not "Heineken (BAR)".
+        # Strict match: buying "Heineken" goes to "Heineken" (Main), not "Heineken (BAR)".
+        data['qty_in'] += entries_agg['flow_in'].get(p_name, 0.0)
+        data['qty_out'] += entries_agg['flow_out'].get(p_name, 0.0)
 
         # --- TRANSFERS ---
-        for t in transfers:
-            t_prod = t['product'].strip()
-            t_qty = float(t['qty'])
-            t_from = t['from']
-            t_to = t['to']
-            
-            # INCOMING (To this context)
-            # Only relevant if we are not in 'Geral' (Geral shows global sum, transfers cancel out or just move?)
-            # Actually, for 'Geral', Balance = Total In - Total Out. Internal transfers shouldn't change Total Balance?
-            # User said "Inventário Geral... procurar produtos".
-            # If 'Geral', we might just sum everything. 
-            # But let's follow the standard logic:
-            
-            # Check if Transfer Destination matches our Target Dept
-            is_incoming = False
-            if target_dept == 'Geral':
-                pass # Internal transfers don't increase Global Stock (unless from external?)
-            elif target_dept == 'Principal':
-                if t_to == 'Principal': is_incoming = True
-            else:
-                if t_to in valid_depts: is_incoming = True
-            
-            if is_incoming:
-                # Match Product
-                # 1. Exact Match
-                if t_prod == p_name:
-                    inventory[p_name]['qty_in'] += t_qty
-                # 2. Base Name Match (Main -> Dept)
-                #    Only if we are in a Dept View (not Principal/Geral usually)
-                elif target_dept not in ['Geral', 'Principal'] and t_prod == base_name:
-                     inventory[p_name]['qty_in'] += t_qty
-
-            # OUTGOING (From this context)
-            is_outgoing = False
-            if target_dept == 'Geral':
-                pass # Internal transfers don't decrease Global Stock
-            elif target_dept == 'Principal':
-                if t_from == 'Principal': is_outgoing = True
-            else:
-                if t_from in valid_depts: is_outgoing = True
-                
-            if is_outgoing:
-                # For Outgoing, usually the product name matches exactly what we have
-                if t_prod == p_name:
-                    inventory[p_name]['qty_out'] += t_qty
-                # (Rare case: Transfer out "Base Name" but we hold "Variant"? Unlikely logic.)
+        data['qty_in'] += transfers_in.get(p_name, 0.0)
+        # Base Name Match (Main -> Dept) only in a Dept View
+        if is_dept_view and base_name != p_name:
+            data['qty_in'] += transfers_in.get(base_name, 0.0)
+        data['qty_out'] += transfers_out.get(p_name, 0.0)
 
         # --- CONSUMPTION / REQUESTS (Sales) ---
-        # Logic: Requests are usually for "USO INTERNO" or Sales
-        for req in requests:
-            if 'items_structured' in req:
-                for item in req['items_structured']:
-                    # Filter by "Destination Stock" (e.g., USO INTERNO)
-                    # And ensure it CAME FROM our department
-                    
-                    # Note: stock_requests.json doesn't always have 'source_dept'.
-                    # But if we are in 'Bar', and we sell 'Heineken (BAR)', it's an Out.
-                    
-                    req_prod = item['name'].strip()
-                    req_qty = float(item.get('delivered_qty', 0)) or float(item.get('qty', 0))
-                    
-                    if req_prod == p_name:
-                        # If the product name matches EXACTLY, it belongs to this inventory item.
-                        # So it's an OUT.
-                        inventory[p_name]['qty_out'] += req_qty
+        # A request item whose name matches EXACTLY belongs to this inventory item.
+        data['qty_out'] += requests_agg['flow_out'].get(p_name, 0.0)
 
     # Calculate Balance
     for name, data in inventory.items():
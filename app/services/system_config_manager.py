@@ -274,6 +274,7 @@ OTA_BOOKING_DISTRIBUTION_LOGS_FILE = get_data_path('ota_booking_distribution_log
 OTA_BOOKING_ERROR_LOGS_FILE = get_data_path('ota_booking_error_logs.json')
 OTA_BOOKING_STATUS_HISTORY_FILE = get_data_path('ota_booking_status_history.json')
 OTA_BOOKING_PENDING_RATES_FILE = get_data_path('ota_booking_pending_rates.json')
+OTA_BOOKING_DISTRIBUTION_STATE_FILE = get_data_path('ota_booking_distribution_state.json')
 OTA_BOOKING_CHANNEL_CTA_CTD_FILE = get_data_path('ota_booking_channel_cta_ctd.json')
 OTA_BOOKING_COMMERCIAL_RESTRICTIONS_FILE = get_data_path('ota_booking_commercial_restrictions.json')
 OTA_BOOKING_COMMERCIAL_AUDIT_FILE = get_data_path('ota_booking_commercial_audit.json')
@@ -0,0 +1,438 @@
+import json
+import logging
+import marshal
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from urllib.parse import quote, unquote
+
+from app.services.json_document_cache import is_racy, stat_token
+from app.utils.lock import file_lock
+
+
+SEGMENT_DIR_SUFFIX = '.d'
+SEGMENT_PREFIX = 't_'
+SEGMENT_SUFFIX = '.json'
+VIEW_MANIFEST = '_view.json'
+VIEW_LOCK = '_view'
+CHANGE_JOURNAL_MAX_BYTES = 512 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def segment_dir_for(view_path):
+    root, _ext = os.path.splitext(os.path.abspath(view_path))
+    return root + SEGMENT_DIR_SUFFIX
+
+
+def segment_name(table_id):
+    return SEGMENT_PREFIX + quote(str(table_id), safe='') + SEGMENT_SUFFIX
+
+
+def table_id_from_segment(name):
+    if not (name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)):
+        return None
+    return unquote(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+
+def _encode(value):
+    # Version 0 has no back-references or interned-string markers, so equal
+    # orders always encode to equal bytes and can be compared as blobs.
+    return marshal.dumps(value, 0)
+
+
+def _table_sort_key(table_id):
+    return (0, int(table_id), '') if table_id.isdigit() else (1, 0, table_id)
+
+
+class TableOrdersStore:
+    """
+    table_orders partitioned per table.
+
+    Every open table lives in its own segment ``<name>.d/t_<id>.json``
+    carrying a version counter; a save only rewrites the segments whose
+    order the caller actually changed, each under that table's lock, so
+    waiters on different tables never wait for each other. Closed tables
+    leave a tombstone so the counter keeps growing if the table reopens.
+
+    ``table_orders.json`` is kept as a materialized view for everything
+    that still reads the file directly (backups, transfers, restores).
+    Concurrent view refreshes coalesce: whoever holds the view lock keeps
+    rewriting it until no commit is left behind. A view rewritten by
+    someone else is detected by its stat token and folded back into the
+    segments before the next read.
+
+    Every segment commit also appends a line to a per-table change
+    journal under ``backups/table_orders/``, replacing the old full-file
+    copy per save.
+    """
+
+    def __init__(self, view_path, read_view, write_file, journal_dir):
+        self.view_path = view_path
+        self.dir = segment_dir_for(view_path)
+        self.journal_dir = journal_dir
+        self._read_view = read_view
+        self._write_file = write_file
+        self._lock = threading.Lock()
+        self._view_lock = threading.Lock()
+        self._table_locks = {}
+        self._local = threading.local()
+        self._segments = {}
+        self._view_tables = None
+        self._view_state = None
+        self._known_view_token = None
+        self._generation = 0
+        self._flushed_generation = 0
+        self.counters = {
+            'loads': 0,
+            'saves': 0,
+            'segment_reads': 0,
+            'segments_written': 0,
+            'segments_unchanged': 0,
+            'conflicts': 0,
+            'view_writes': 0,
+            'view_coalesced': 0,
+            'imports': 0,
+        }
+
+    # --- paths and locks ---
+    def segment_path(self, table_id):
+        return os.path.join(self.dir, segment_name(table_id))
+
+    def mutex_path(self, table_id):
+        """Lock base for callers that need a table held across load and save."""
+        os.makedirs(self.dir, exist_ok=True)
+        return os.path.join(self.dir, segment_name(table_id)[:-len(SEGMENT_SUFFIX)] + '.order')
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def _held(self):
+        held = getattr(self._local, 'held', None)
+        if held is None:
+            held = self._local.held = {}
+        return held
+
+    @contextmanager
+    def table_lock(self, table_id):
+        """Per-table lock (thread + process); re-entrant within a thread."""
+        table_id = str(table_id)
+        held = self._held()
+        if held.get(table_id):
+            held[table_id] += 1
+            try:
+                yield
+            finally:
+                held[table_id] -= 1
+        else:
+            with self._lock:
+                lock = self._table_locks.setdefault(table_id, threading.Lock())
+            os.makedirs(self.dir, exist_ok=True)
+            with lock, file_lock(self.segment_path(table_id)):
+                held[table_id] = 1
+                try:
+                    yield
+                finally:
+                    held.pop(table_id, None)
+
+    # --- segments ---
+    def _read_segment(self, name, token):
+        path = os.path.join(self.dir, name)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                payload = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"table_orders_segment_unreadable file={name} error={e}")
+            return None
+        self._count('segment_reads')
+        if not isinstance(payload, dict):
+            return None
+        version = int(payload.get('version') or 0)
+        blob = None if payload.get('deleted') else _encode(payload.get('order'))
+        entry = (token, version, blob)
+        with self._lock:
+            self._segments[name] = entry
+        return entry
+
+    def _segment(self, name):
+        token = stat_token(os.path.join(self.dir, name))
+        if token is None:
+            with self._lock:
+                self._segments.pop(name, None)
+            return None
+        with self._lock:
+            cached = self._segments.get(name)
+        if cached is not None and cached[0] == token and not is_racy(token):
+            return cached
+        return self._read_segment(name, token)
+
+    def _scan(self):
+        """{table_id: (version, blob)} of open tables, plus the stat tokens read."""
+        try:
+            names = os.listdir(self.dir)
+        except FileNotFoundError:
+            return {}, ()
+        tables = {}
+        tokens = []
+        for name in names:
+            table_id = table_id_from_segment(name)
+            if table_id is None:
+                continue
+            entry = self._segment(name)
+            if entry is None:
+                continue
+            tokens.append((name, entry[0]))
+            if entry[2] is not None:
+                tables[table_id] = (entry[1], entry[2])
+        with self._lock:
+            live = {name for name, _token in tokens}
+            for name in [n for n in self._segments if n not in live]:
+                self._segments.pop(name, None)
+        return tables, tuple(sorted(tokens))
+
+    def _commit(self, table_id, blob, expected_version, user):
+        """Writes one table's segment. Returns (ok, changed)."""
+        with self.table_lock(table_id):
+            name = segment_name(table_id)
+            token = stat_token(os.path.join(self.dir, name))
+            current = self._read_segment(name, token) if token is not None else None
+            version, current_blob = (current[1], current[2]) if current else (0, None)
+            if expected_version is not None and version != expected_version:
+                self._count('conflicts')
+                if blob is None:
+                    logger.warning(f"table_orders concurrent update on table {table_id}: keeping it open (user={user}).")
+                    return True, False
+                logger.warning(f"table_orders concurrent update on table {table_id}: last write wins (user={user}).")
+            if blob == current_blob:
+                self._count('segments_unchanged')
+                return True, False
+            payload = {
+                'table_id': table_id,
+                'version': version + 1,
+                'updated_at': datetime.now().isoformat(),
+                'updated_by': user,
+            }
+            if blob is None:
+                payload['deleted'] = True
+            else:
+                payload['order'] = marshal.loads(blob)
+            if not self._write_file(self.segment_path(table_id), payload):
+                return False, False
+            self._count('segments_written')
+            with self._lock:
+                self._segments.pop(name, None)
+                self._generation += 1
+            self._journal(table_id, payload)
+            return True, True
+
+    # --- change journal ---
+    def _journal(self, table_id, payload):
+        try:
+            os.makedirs(self.journal_dir, exist_ok=True)
+            path = os.path.join(self.journal_dir, segment_name(table_id)[:-len(SEGMENT_SUFFIX)] + '.jsonl')
+            try:
+                if os.path.getsize(path) > CHANGE_JOURNAL_MAX_BYTES:
+                    os.replace(path, path[:-len('.jsonl')] + '.1.jsonl')
+            except OSError:
+                pass
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(payload, ensure_ascii=False) + '\n')
+        except Exception as e:
+            logger.error(f"Failed to journal table_orders change for table {table_id}: {e}")
+
+    def history(self, table_id, limit=20):
+        """Latest journaled versions of one table, newest first."""
+        base = os.path.join(self.journal_dir, segment_name(table_id)[:-len(SEGMENT_SUFFIX)])
+        rows = []
+        for path in (base + '.jsonl', base + '.1.jsonl'):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    lines = f.read().splitlines()
+            except OSError:
+                continue
+            for line in reversed(lines):
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    continue
+                if len(rows) >= limit:
+                    return rows
+        return rows
+
+    # --- materialized view ---
+    def _manifest_path(self):
+        return os.path.join(self.dir, VIEW_MANIFEST)
+
+    def _stored_view_token(self):
+        try:
+            with open(self._manifest_path(), 'r', encoding='utf-8') as f:
+                raw = json.load(f).get('view_token')
+        except (OSError, ValueError, AttributeError):
+            return None
+        return tuple(raw) if raw else None
+
+    def _write_view(self):
+        tables, tokens = self._scan()
+        ordered = sorted(tables, key=_table_sort_key)
+        if tokens == self._view_state and stat_token(self.view_path) == self._known_view_token:
+            return True
+        view = {table_id: marshal.loads(tables[table_id][1]) for table_id in ordered}
+        if not self._write_file(self.view_path, view):
+            return False
+        token = stat_token(self.view_path)
+        if not self._write_file(self._manifest_path(), {'view_token': list(token) if token else None}):
+            return False
+        self._count('view_writes')
+        self._view_tables = {table_id: blob for table_id, (_v, blob) in tables.items()}
+        self._view_state = tokens
+        self._known_view_token = token
+        return True
+
+    def _flush_view(self):
+        ok = True
+        while True:
+            if not self._view_lock.acquire(blocking=False):
+                # The holder re-checks the generation after releasing.
+                self._count('view_coalesced')
+                return ok
+            try:
+                os.makedirs(self.dir, exist_ok=True)
+                with file_lock(os.path.join(self.dir, VIEW_LOCK)):
+                    while True:
+                        with self._lock:
+                            generation = self._generation
+                        ok = self._write_view() and ok
+                        if self._generation == generation:
+                            break
+                with self._lock:
+                    self._flushed_generation = max(self._flushed_generation, generation)
+            finally:
+                self._view_lock.release()
+            with self._lock:
+                if self._generation == self._flushed_generation:
+                    return ok
+
+    def _sync_view(self):
+        """Folds a table_orders.json written outside the store into the segments."""
+        token = stat_token(self.view_path)
+        if token is not None and token == self._known_view_token:
+            return
+        stored = self._stored_view_token()
+        first_run = stored is None and not os.path.exists(self._manifest_path())
+        if not first_run and (token is None or token == stored):
+            self._known_view_token = stored
+            return
+        with self._view_lock:
+            os.makedirs(self.dir, exist_ok=True)
+            with file_lock(os.path.join(self.dir, VIEW_LOCK)):
+                stored = self._stored_view_token()
+                token = stat_token(self.view_path)
+                if os.path.exists(self._manifest_path()) and (token is None or token == stored):
+                    self._known_view_token = stored
+                    return
+                self._import_view()
+                self._write_view()
+
+    def _import_view(self):
+        try:
+            external = self._read_view()
+        except Exception as e:
+            logger.error(f"table_orders view unreadable, keeping per-table segments: {e}")
+            return
+        if not isinstance(external, dict):
+            external = {}
+        self._count('imports')
+        previous = self._view_tables
+        current, _tokens = self._scan()
+        external_blobs = {str(k): _encode(v) for k, v in external.items() if v is not None}
+        for table_id, blob in external_blobs.items():
+            if previous is not None and previous.get(table_id) == blob:
+                continue
+            if current.get(table_id, (None, None))[1] == blob:
+                continue
+            self._commit(table_id, blob, None, 'import')
+        for table_id in list(previous if previous is not None else current):
+            if table_id in external_blobs or table_id not in current:
+                continue
+            if previous is not None and current[table_id][1] != previous.get(table_id):
+                continue
+            self._commit(table_id, None, current[table_id][0], 'import')
+        logger.info(f"table_orders.json changed outside the store; folded into {self.dir}.")
+
+    # --- public API ---
+    def load(self):
+        self._sync_view()
+        tables, _tokens = self._scan()
+        self._local.baseline = dict(tables)
+        self._count('loads')
+        return {table_id: marshal.loads(tables[table_id][1]) for table_id in sorted(tables, key=_table_sort_key)}
+
+    def open_segments(self):
+        """{table_id: (version, blob)} of the open tables, ``blob`` being the marshal-encoded order."""
+        self._sync_view()
+        tables, _tokens = self._scan()
+        return tables
+
+    def save(self, data, user='system'):
+        incoming = data if isinstance(data, dict) else {}
+        self._sync_view()
+        self._count('saves')
+        current, _tokens = self._scan()
+        baseline = getattr(self._local, 'baseline', None)
+        if baseline is None:
+            # Saved without a load: the payload is the whole document.
+            baseline = current
+        if current and not incoming:
+            logger.warning(f"CRITICAL: Wipe detected on table_orders.json! User: {user}. Previous versions kept in {self.journal_dir}.")
+
+        changes = []
+        seen = set()
+        for key, value in incoming.items():
+            table_id = str(key)
+            seen.add(table_id)
+            loaded = baseline.get(table_id)
+            if value is None:
+                if table_id in current:
+                    changes.append((table_id, None, loaded[0] if loaded else None))
+                continue
+            try:
+                blob = _encode(value)
+            except ValueError as e:
+                logger.error(f"table_orders: table {table_id} is not serializable: {e}")
+                return False
+            if loaded is not None and loaded[1] == blob:
+                continue
+            changes.append((table_id, blob, loaded[0] if loaded else None))
+        for table_id, (version, _blob) in baseline.items():
+            if table_id not in seen:
+                changes.append((table_id, None, version))
+
+        ok = True
+        for table_id, blob, expected in changes:
+            committed, _changed = self._commit(table_id, blob, expected, user)
+            ok = ok and committed
+        if changes:
+            ok = self._flush_view() and ok
+        tables, _tokens = self._scan()
+        self._local.baseline = dict(tables)
+        return ok
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        return {'path': self.view_path, 'segment_dir': self.dir, **counters}
+
+
+_STORES = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_table_orders_store(view_path, read_view, write_file, journal_dir):
+    key = os.path.abspath(view_path)
+    with _STORES_LOCK:
+        store = _STORES.get(key)
+        if store is None:
+            store = _STORES[key] = TableOrdersStore(key, read_view, write_file, journal_dir)
+        return store
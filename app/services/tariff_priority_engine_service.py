@@ -28,10 +28,13 @@ class TariffPriorityEngineService:
         return out
 
     @classmethod
-    def _dynamic_factor(cls, category: str, day: str) -> Dict[str, Any]:
-        simulation = RevenueManagementService.simulate_projection(start_date=day, days=1, advanced_mode=True)
+    def _dynamic_factor(cls, category: str, day: str, simulation: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        # ``simulation`` may be a projection over a longer period that covers ``day``.
+        if simulation is None:
+            simulation = RevenueManagementService.simulate_projection(start_date=day, days=1, advanced_mode=True)
         bucket = RevenueManagementService._normalize_category(category)
-        row = next((item for item in (simulation.get('rows') or []) if str(item.get('category')) == bucket), None)
+        day_key = PeriodSelectorService.parse_date(day).date().isoformat()
+        row = next((item for item in (simulation.get('rows') or []) if str(item.get('category')) == bucket and str(item.get('date')) == day_key), None)
         if not row:
             return {'factor': 1.0, 'details': {'mode': 'advanced', 'reason': 'sem linha de simulação'}}
         current = float(row.get('current_bar') or 0)
@@ -11,6 +11,7 @@ from app.services.data_service import (
     load_products, load_menu_items, save_stock_entry, log_stock_action
 )
 from app.services.cashier_service import CashierService
+from app.services.menu_catalog_service import MenuCatalog, get_menu_catalog
 
 # Helper for file locking (simple version)
 import time
@@ -103,6 +104,9 @@ def normalize_room_key(raw_input, valid_keys):
     return None
 
 def resolve_stock_product_for_order_item(order_item, menu_items_db, products_db):
+    if isinstance(menu_items_db, MenuCatalog):
+        return menu_items_db.stock_product_for(order_item)
+
     menu_item = None
     raw_product_id = order_item.get('product_id')
     if raw_product_id is not None:
@@ -490,11 +494,7 @@ def transfer_table_to_room(table_id, raw_room_number, user_name, mode='restauran
                 secure_save_sales_history(sales_history, user_id='Sistema')
                 
                 # Deduct Stock
-                products_db = load_products()
-                menu_items_db = load_menu_items()
-                menu_items_by_id = {str(m.get('id')): m for m in menu_items_db if m.get('id') is not None}
-                menu_items_by_name = {m.get('name'): m for m in menu_items_db if m.get('name')}
-                insumo_map = {str(p.get('id')): p for p in products_db if p.get('id') is not None}
+                catalog = get_menu_catalog(load_menu_items, load_products)
                 for item in order['items']:
                     item_uuid = item.get('id') or str(uuid.uuid4())
                     deducted_acc_ids = set(str(x) for x in item.get('accompaniments_deducted_ids', []) if x is not None)
@@ -509,27 +509,18 @@ def transfer_table_to_room(table_id, raw_room_number, user_name, mode='restauran
                         if origin == 'acompanhamento' and component_pid is not None and str(component_pid) in deducted_acc_ids:
                             continue
 
-                        menu_item_match = None
-                        if component_pid is not None:
-                            menu_item_match = menu_items_by_id.get(str(component_pid))
-                        if not menu_item_match and component_name:
-                            menu_item_match = menu_items_by_name.get(component_name)
+                        menu_item_match = catalog.menu_item(component_pid, component_name, last_wins=True)
 
                         if menu_item_match and menu_item_match.get('recipe'):
                             if origin == 'produto':
                                 continue
-                            for ingred in menu_item_match.get('recipe', []):
-                                ing_id = ingred.get('ingredient_id')
+                            for line in catalog.recipe_lines(menu_item_match):
+                                ing_id = line.ingredient_id
                                 if ing_id is None:
                                     continue
-                                insumo_data = insumo_map.get(str(ing_id))
-                                if not insumo_data:
-                                    continue
-                                try:
-                                    ing_qty = float(ingred.get('qty', 0) or 0)
-                                except Exception:
-                                    continue
-                                if ing_qty <= 0:
+                                insumo_data = line.insumo
+                                ing_qty = line.qty
+                                if ing_qty is None or ing_qty <= 0:
                                     continue
                                 total_needed = ing_qty * qty
                                 save_stock_entry({
@@ -548,8 +539,8 @@ def transfer_table_to_room(table_id, raw_room_number, user_name, mode='restauran
 
                         product_obj = resolve_stock_product_for_order_item(
                             {'product_id': component_pid, 'name': component_name},
-                            menu_items_db,
-                            products_db
+                            catalog,
+                            catalog.products
                         )
                         if not product_obj:
                             continue
@@ -4,6 +4,8 @@ import time
 import logging
 from contextlib import contextmanager
 
+from app.services.request_metrics_service import record_section
+
 logger = logging.getLogger(__name__)
 
 def _process_is_alive(pid):
@@ -21,6 +23,7 @@ def file_lock(lock_path_base, timeout=20, stale_timeout=600):
     """
     lock_path = lock_path_base + '.lock'
     start_time = time.time()
+    wait_started = time.perf_counter()
     while True:
         try:
             # Exclusive creation
@@ -54,6 +57,7 @@ def file_lock(lock_path_base, timeout=20, stale_timeout=600):
         except OSError as e:
             logger.error(f"Error acquiring lock: {e}")
             raise
+    record_section('file_lock_wait', (time.perf_counter() - wait_started) * 1000.0)
     
     try:
         yield
@@ -0,0 +1,83 @@
+import json
+from datetime import date, timedelta
+
+import pytest
+
+from app.services import audit_log_service, promotional_package_service
+from app.services.audit_log_service import AuditLog
+from app.services.logger_service import LoggerService
+from app.services.promotional_package_service import PromotionalPackageService
+
+START = date(2026, 3, 1)
+
+
+def _day(offset):
+    return (START + timedelta(days=offset)).isoformat()
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    monkeypatch.setattr(audit_log_service, "_LOGS", {})
+
+
+def test_rotacao_por_tamanho_e_consulta_le_so_segmentos_do_periodo(monkeypatch, tmp_path):
+    monkeypatch.setenv("ALMAREIA_AUDIT_SEGMENT_BYTES", "1")
+    log = AuditLog(str(tmp_path / "logs.json"), time_field="day_affected", entity_field="channel")
+    for offset in range(10):
+        log.append([
+            {"day_affected": _day(offset), "channel": "Booking", "user": "Ana"},
+            {"day_affected": _day(offset), "channel": "Expedia", "user": "Rui"},
+        ])
+    # cada append sela o segmento anterior: 9 selados + o ativo
+    assert log.stats()["sealed_segments"] == 9
+    assert (tmp_path / "logs.audit" / "000009.jsonl").exists()
+
+    rows = log.query(start=_day(3), end=_day(4), entity="booking")
+    assert [(r["day_affected"], r["channel"]) for r in rows] == [(_day(3), "Booking"), (_day(4), "Booking")]
+    stats = log.stats()
+    # os dois selados do período e o ativo, sempre lido
+    assert (stats["segments_read"], stats["segments_skipped"]) == (3, 7)
+
+    assert [r["user"] for r in log.query(user=" rui ")] == ["Rui"] * 10
+    assert log.query(entity="decolar") == []
+
+
+def test_importa_json_legado_uma_vez_e_pagina(tmp_path):
+    legacy = tmp_path / "logs.json"
+    legacy.write_text(json.dumps([{"timestamp": f"{_day(i)}T10:00:00", "n": i} for i in range(5)] + ["lixo"]))
+    log = AuditLog(str(legacy))
+    log.append([{"timestamp": f"{_day(5)}T10:00:00", "n": 5}, {"timestamp": f"{_day(6)}T10:00:00", "n": 6}])
+    assert log.stats()["imported_rows"] == 5
+    assert [r["n"] for r in log.query(newest_first=True, limit=3, offset=1)] == [5, 4, 3]
+    assert [r["n"] for r in log.query(start=_day(2), end=_day(5))] == [2, 3, 4, 5]
+
+    # legado intacto e não reimportado por outro processo
+    assert len(json.loads(legacy.read_text())) == 6
+    again = AuditLog(str(legacy))
+    assert [r["n"] for r in again.query()] == list(range(7))
+    assert again.stats()["imported_rows"] == 0
+
+
+def test_linha_cortada_no_fim_e_descartada(tmp_path):
+    log = AuditLog(str(tmp_path / "logs.json"))
+    log.append([{"timestamp": _day(0), "n": 0}])
+    with open(tmp_path / "logs.audit" / "active.jsonl", "a") as f:
+        f.write('{"timestamp": "2026-03-0')
+    assert [r["n"] for r in log.query()] == [0]
+    log.append([{"timestamp": _day(1), "n": 1}])
+    assert [r["n"] for r in log.query()] == [0, 1]
+
+
+def test_pacotes_promocionais_gravam_e_filtram_pelo_log(monkeypatch, tmp_path):
+    legacy = tmp_path / "promotional_packages_logs.json"
+    legacy.write_text(json.dumps([{"timestamp": "2026-01-10T09:00:00", "user": "Maria Souza", "action": "create",
+                                   "package_id": "P0", "before": None, "after": {}}]))
+    monkeypatch.setattr(promotional_package_service, "PROMOTIONAL_PACKAGES_LOGS_FILE", str(legacy))
+    monkeypatch.setattr(LoggerService, "log_acao", staticmethod(lambda **kwargs: None))
+    PromotionalPackageService._append_log("update", "maria", "P0", {}, {"name": "Verão"})
+    PromotionalPackageService._append_log("create", "joão", "P1", None, {"name": "Páscoa"})
+
+    rows = PromotionalPackageService.list_logs(user="MARIA")
+    assert [row["action"] for row in rows] == ["update", "create"]
+    assert [row["action"] for row in PromotionalPackageService.list_logs(start_date="2026-01-01", end_date="2026-01-31")] == ["create"]
+    assert len(json.loads(legacy.read_text())) == 1
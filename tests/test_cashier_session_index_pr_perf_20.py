@@ -0,0 +1,126 @@
+import json
+import os
+
+import pytest
+
+from app.services import cashier_service
+from app.services import json_document_cache
+from app.services.cashier_service import CashierService
+from app.services.ledger_service import LedgerService
+
+
+def _tx(tx_id, tx_type, amount, method, description="Venda", group=None):
+    details = {"payment_group_id": group} if group else {}
+    return {"id": tx_id, "type": tx_type, "amount": amount, "payment_method": method,
+            "description": description, "timestamp": "10/03/2026 12:00", "details": details}
+
+
+SESSIONS = [
+    {"id": "R0", "status": "closed", "type": "restaurant", "opened_at": "09/03/2026 08:00", "opening_balance": 50.0,
+     "closing_balance": 80.0, "difference": 0, "transactions": [_tx("T0", "sale", 30.0, "Dinheiro")]},
+    {"id": "G0", "status": "closed", "type": "reception_room_billing", "opened_at": "10/03/2026 07:00",
+     "opening_balance": 0.0, "transactions": []},
+    {"id": "R1", "user": "ana", "status": "open", "type": "restaurant", "opened_at": "10/03/2026 08:00", "opening_balance": 100.0,
+     "transactions": [
+         _tx("T1", "sale", 40.0, "Dinheiro"),
+         _tx("T2", "sale", 60.0, "Pix", "Venda Mesa 3 - Pix", group="PG1"),
+         _tx("T3", "sale", 20.0, "Cartão de Crédito", "Venda Mesa 3 - Crédito", group="PG1"),
+         _tx("T4", "out", 15.0, "Dinheiro"),
+     ]},
+    {"id": "G1", "status": "open", "type": "guest_consumption", "opened_at": "10/03/2026 09:00", "opening_balance": 10.0,
+     "transactions": []},
+]
+
+
+@pytest.fixture
+def sessions_file(monkeypatch, tmp_path):
+    path = tmp_path / "cashier_sessions.json"
+    path.write_text(json.dumps(SESSIONS, ensure_ascii=False), encoding="utf-8")
+    monkeypatch.setattr(cashier_service, "CASHIER_SESSIONS_FILE", str(path))
+    monkeypatch.setattr(json_document_cache, "RACY_WINDOW_SECONDS", 0)
+    monkeypatch.setattr(cashier_service, "_SESSION_INDEX", None)
+    monkeypatch.setattr(cashier_service, "_SESSION_INDEX_STATS", {"builds": 0, "hits": 0, "adopted": 0, "appends": 0})
+    monkeypatch.setattr(CashierService, "_perform_backup", staticmethod(lambda sessions: None))
+    monkeypatch.setattr(LedgerService, "record_transaction", staticmethod(lambda **kwargs: None))
+    loads = {"count": 0}
+    original = CashierService._load_sessions
+
+    def _counting_load():
+        loads["count"] += 1
+        return original()
+
+    monkeypatch.setattr(CashierService, "_load_sessions", staticmethod(_counting_load))
+    return path, loads
+
+
+def _legacy_totals(session):
+    # sem id a sessão não casa com o índice e os laços completos são usados
+    detached = dict(session, id=None)
+    return CashierService._calculate_balance(detached), CashierService._calculate_cash_balance(detached)
+
+
+def test_indice_de_sessoes_responde_consultas_sem_recarregar(sessions_file):
+    path, loads = sessions_file
+    active = CashierService.get_active_session("restaurant")
+    assert active["id"] == "R1"
+    assert CashierService.get_active_session("reception_room_billing")["id"] == "G1"
+    assert CashierService.get_session_by_id("R0")["closing_balance"] == 80.0
+    assert CashierService._calculate_balance(active) == 205.0
+    assert CashierService._calculate_cash_balance(active) == 125.0
+    summary = CashierService.get_session_summary(active)
+    assert summary["total_in"] == 120.0 and summary["total_out"] == 15.0
+    assert summary["balance_by_method"] == {"Dinheiro": 25.0, "Pix": 60.0, "Cartão de Crédito": 20.0}
+
+    assert [s["id"] for s in CashierService.get_history()] == ["G1", "R1", "G0", "R0"]
+    assert [s["id"] for s in CashierService.get_history(cashier_type="guest_consumption")] == ["G1", "G0"]
+    assert [s["id"] for s in CashierService.get_history(start_date="10/03/2026", cashier_type="restaurant")] == ["R1"]
+    assert CashierService.get_current_status("restaurant")["current_balance"] == 205.0
+    assert CashierService.get_current_status("daily_rates") == {"status": "never_opened"}
+
+    rows, has_more = CashierService.get_paginated_transactions("R1", page=1, per_page=2)
+    assert [r["id"] for r in rows] == ["T4", "T3"] and has_more is True
+    assert rows[1]["is_group"] is True and rows[1]["amount"] == 80.0
+    rows, has_more = CashierService.get_paginated_transactions("R1", page=2, per_page=2)
+    assert [r["id"] for r in rows] == ["T1"] and has_more is False
+    # cópias independentes: alterar o retorno não altera o índice
+    rows[0]["amount"] = 999
+    assert CashierService.get_paginated_transactions("R1", page=2, per_page=2)[0][0]["amount"] == 40.0
+    assert loads["count"] == 1
+
+    # sessão alterada em memória não usa os totais materializados
+    active["transactions"].append(_tx("T5", "sale", 5.0, "Dinheiro"))
+    assert CashierService._calculate_cash_balance(active) == 130.0
+
+
+def test_lancamentos_e_transferencias_atualizam_saldos_incrementalmente(sessions_file):
+    path, loads = sessions_file
+    CashierService.get_active_session("restaurant")
+    CashierService.get_paginated_transactions("R1")
+
+    CashierService.add_transaction("restaurant", 10.0, "Venda balcão", "Dinheiro", "ana", transaction_type="sale")
+    with pytest.raises(ValueError):
+        CashierService.add_transaction("guest_consumption", 50.0, "Sangria", "Dinheiro", "ana", transaction_type="sangria")
+    CashierService.transfer_funds("restaurant", "guest_consumption", 35.0, "Troco", "ana")
+
+    assert cashier_service._SESSION_INDEX_STATS["appends"] == 2
+    restaurant = CashierService.get_active_session("restaurant")
+    guest = CashierService.get_active_session("guest_consumption")
+    assert CashierService._calculate_cash_balance(restaurant) == 100.0
+    assert CashierService._calculate_cash_balance(guest) == 45.0
+    assert CashierService.get_session_summary(restaurant)["total_out"] == 50.0
+    assert CashierService.get_paginated_transactions("R1", page=1, per_page=1)[0][0]["category"] == "Transferência Enviada"
+
+    # totais materializados == laço completo sobre o arquivo gravado
+    on_disk = {s["id"]: s for s in json.loads(path.read_text(encoding="utf-8"))}
+    for session_id in ("R1", "G1"):
+        indexed = CashierService.get_session_by_id(session_id)
+        materialized = (CashierService._calculate_balance(indexed), CashierService._calculate_cash_balance(indexed))
+        assert materialized == _legacy_totals(on_disk[session_id])
+    # add_transaction/transfer_funds leem o arquivo sob o lock; as consultas não
+    assert loads["count"] == 5
+
+    # arquivo reescrito por fora: o token muda e o índice é reconstruído
+    path.write_text(json.dumps(SESSIONS[:2], ensure_ascii=False), encoding="utf-8")
+    os.utime(path, ns=(0, 0))
+    assert CashierService.get_active_session("restaurant") is None
+    assert loads["count"] == 6
@@ -0,0 +1,163 @@
+import json
+
+import pytest
+from flask import Flask, session
+
+from app.blueprints.reception import routes as reception_routes
+from app.services import (
+    channel_commission_service,
+    channel_inventory_control_service,
+    channel_inventory_planner_service,
+    channel_manager_service,
+    channel_restriction_service,
+    channel_tariff_service,
+    inventory_protection_service,
+    inventory_restriction_service,
+)
+from app.services.channel_inventory_planner_service import ChannelInventoryPlannerService
+from app.services.channel_restriction_service import ChannelRestrictionService
+from app.services.channel_rule_priority_engine_service import ChannelRulePriorityEngineService
+from app.services.channel_tariff_service import ChannelTariffService
+from app.services.reservation_service import ReservationService
+from app.services.revenue_management_service import RevenueManagementService
+
+CATEGORIES = ['areia', 'mar_familia', 'mar', 'alma_banheira', 'alma', 'alma_diamante']
+
+RESERVATIONS = [
+    {"id": "r1", "status": "Confirmada", "category": "Suíte Mar", "channel": "Booking.com",
+     "checkin": "2026-03-10", "checkout": "2026-03-13", "amount": 900.0},
+    {"id": "r2", "status": "Cancelada", "category": "Suíte Mar", "channel": "Booking.com",
+     "checkin": "2026-03-10", "checkout": "2026-03-12", "amount": 600.0},
+    {"id": "r3", "status": "Confirmada", "category": "Suíte Areia", "origin": "Recepção",
+     "checkin": "11/03/2026", "checkout": "12/03/2026", "amount": 300.0},
+]
+
+FILES = {
+    (channel_tariff_service, "CHANNEL_MANAGER_TARIFFS_FILE"): {"channels": [{
+        "channel_name": "Booking.com", "tariff_mode": "usar_tarifa_direta_grossup_comissao",
+        "global_commission_pct": 0.15, "min_tariff": 200,
+        "commission_periods": [{"id": "c1", "start_date": "2026-03-12", "end_date": "2026-03-13", "commission_pct": 20}],
+    }]},
+    (channel_restriction_service, "CHANNEL_MANAGER_RESTRICTIONS_FILE"): [
+        {"category": "Suíte Mar", "channel": "Booking.com", "restriction_type": "stop_sell", "date": "2026-03-11", "status": "active", "value": True},
+        {"category": "mar_familia", "channel": "Booking.com", "restriction_type": "min_stay", "date": "2026-03-12", "status": "active", "value": 2},
+        {"category": "Suíte Alma", "channel": "Booking.com", "restriction_type": "promocao_especifica", "date": "2026-03-10", "status": "active", "value": "10%"},
+        {"category": "Suíte Alma", "channel": "Booking.com", "restriction_type": "ctd", "date": "2026-03-14", "status": "active", "value": True},
+        {"category": "Suíte Areia", "channel": "Expedia", "restriction_type": "stop_sell", "date": "2026-03-10", "status": "active", "value": True},
+    ],
+    (channel_inventory_control_service, "BLACKOUT_DATES_FILE"): [
+        {"category": "Suíte Areia", "date": "2026-03-12", "status": "active"},
+    ],
+    (channel_inventory_control_service, "CHANNEL_ALLOTMENTS_FILE"): [
+        {"category": "Suíte Mar", "channel": "Booking.com", "date": "2026-03-10", "rooms": 2},
+    ],
+    (channel_inventory_control_service, "CHANNEL_SALES_RESTRICTIONS_FILE"): [
+        {"category": "Suíte Areia", "channel": "Booking.com", "date": "2026-03-13", "status": "active"},
+    ],
+    (inventory_restriction_service, "INVENTORY_RESTRICTIONS_FILE"): [
+        {"category": "Suíte Alma", "date": "2026-03-11", "status": "closed"},
+    ],
+    (inventory_protection_service, "INVENTORY_PROTECTION_RULES_FILE"): [
+        {"category": "Suíte Areia", "date": "2026-03-10", "status": "active", "protected_rooms": 1},
+    ],
+    (channel_commission_service, "CHANNEL_MANAGER_COMMISSIONS_FILE"): [
+        {"channel_name": "Booking.com", "commercial_model": "gross_up_automatico", "global_commission_pct": 0.18},
+    ],
+    (channel_inventory_planner_service, "CHANNEL_MANAGER_INVENTORY_SHARED_FILE"): [
+        {"category": "Suíte Mar", "date": "2026-03-11", "shared_global_enabled": False},
+    ],
+    (channel_inventory_planner_service, "CHANNEL_MANAGER_INVENTORY_PARTIAL_CLOSURES_FILE"): [
+        {"category": "Suíte Areia", "channel": "Booking.com", "date": "2026-03-11", "closed_rooms": 1},
+    ],
+    (channel_manager_service, "CHANNEL_MANAGER_CHANNELS_FILE"): None,
+    (channel_manager_service, "CHANNEL_MANAGER_CHANNELS_LOGS_FILE"): None,
+    (channel_tariff_service, "CHANNEL_MANAGER_TARIFFS_LOGS_FILE"): None,
+}
+
+
+@pytest.fixture
+def channel_data(monkeypatch, tmp_path):
+    for index, ((module, name), payload) in enumerate(FILES.items()):
+        path = tmp_path / f"{index}_{name.lower()}.json"
+        if payload is not None:
+            path.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+        monkeypatch.setattr(module, name, str(path))
+    monkeypatch.setattr(ReservationService, "get_february_reservations", lambda self: [dict(r) for r in RESERVATIONS])
+    projections = {"count": 0}
+    original = RevenueManagementService.simulate_projection.__func__
+
+    def _counting_projection(cls, *args, **kwargs):
+        projections["count"] += 1
+        return original(cls, *args, **kwargs)
+
+    monkeypatch.setattr(RevenueManagementService, "simulate_projection", classmethod(_counting_projection))
+    return projections
+
+
+def _per_cell_rows(channel, start, end):
+    # o caminho anterior: cada serviço chamado com um único dia por célula
+    sim = RevenueManagementService.simulate_projection(start_date=start, days=4, advanced_mode=True)
+    sim_map = {(str(row.get('date')), str(row.get('category'))): float(row.get('current_bar') or row.get('base_bar') or 0.0)
+               for row in sim.get('rows') or []}
+    rows = []
+    for day_iso in ['2026-03-10', '2026-03-11', '2026-03-12', '2026-03-13']:
+        next_day = '2026-03-%02d' % (int(day_iso[-2:]) + 1)
+        for category in CATEGORIES:
+            direct = sim_map.get((day_iso, RevenueManagementService._booking_category_bucket(category)), 0.0)
+            tariff_row = (ChannelTariffService.calculate_tariffs(channel_name=channel, category=category, start_date=day_iso, end_date=day_iso, weekdays=[]).get('rows') or [{}])[0]
+            inv_day = (ChannelInventoryPlannerService.build_snapshot(category=category, start_date=day_iso, end_date=day_iso, weekdays=[]).get('rows') or [{}])[0]
+            channel_row = next((item for item in inv_day.get('channels') or [] if str(item.get('channel')) == channel), {})
+            day_rules = ChannelRestrictionService.resolve_day_rules(category=category, channel=channel, day=day_iso)
+            engine = ChannelRulePriorityEngineService.evaluate(category=category, channel=channel, checkin=day_iso, checkout=next_day,
+                                                               sale_date=day_iso, package_selected=None, apply_dynamic=True)
+            rows.append({
+                'date': day_iso,
+                'category': category,
+                'channel': channel,
+                'tarifa_direta': round(float(tariff_row.get('tarifa_direta') or direct), 2),
+                'tarifa_canal': round(float((engine.get('pricing') or {}).get('tarifa_final_calculada') or tariff_row.get('tarifa_canal') or 0.0), 2),
+                'disponibilidade': int(channel_row.get('available_for_sale') or 0),
+                'status_aberto': bool(engine.get('sellable')),
+                'restricoes_ativas': day_rules.get('labels') or [],
+                'promocao_ativa': day_rules.get('promocao_especifica') or '',
+                'pacote_ativo': day_rules.get('pacote_obrigatorio') or '',
+                'motivo_indisponibilidade': engine.get('message') or '',
+                'rules_applied': engine.get('rules_applied') or [],
+            })
+    return rows
+
+
+def _calendar(query):
+    app = Flask(__name__)
+    app.secret_key = "test-secret"
+    with app.test_request_context("/api/reception/revenue-management/channel-manager/calendar?" + query):
+        session["user"] = "recepcao"
+        session["role"] = "admin"
+        return reception_routes.api_reception_channel_manager_calendar.__wrapped__().get_json()
+
+
+def test_calendario_em_lote_igual_ao_calculo_por_celula(channel_data):
+    expected = _per_cell_rows("Booking.com", "2026-03-10", "2026-03-13")
+    per_cell_projections = channel_data["count"]
+    assert per_cell_projections > 24
+
+    channel_data["count"] = 0
+    payload = _calendar("channel=Booking.com&start_date=2026-03-10&end_date=2026-03-13")
+    assert payload["count"] == 24
+    assert payload["rows"] == json.loads(json.dumps(expected))
+    # uma única projeção de RM para a grade inteira
+    assert channel_data["count"] == 1
+
+    # o cenário exercita bloqueios diferentes
+    reasons = {row["motivo_indisponibilidade"] for row in payload["rows"]}
+    assert "Canal Booking.com com stop sell ativo." in reasons
+    assert "Blackout total ativo no período." in reasons
+    assert "Categoria fechada para venda no período." in reasons
+    assert any(row["promocao_ativa"] == "10%" for row in payload["rows"])
+
+
+def test_calendario_filtra_dias_da_semana_e_tipo_de_regra(channel_data):
+    # 2026-03-11 é quarta-feira
+    payload = _calendar("channel=Booking.com&category=mar&start_date=2026-03-10&end_date=2026-03-13&weekdays=wed&rule_type=stop_sell")
+    assert [(row["date"], row["category"]) for row in payload["rows"]] == [("2026-03-11", "mar")]
+    assert _calendar("channel=Booking.com&start_date=2026-03-10&end_date=2026-03-13&weekdays=qualquer")["rows"] == []
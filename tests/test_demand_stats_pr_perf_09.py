@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.services import demand_stats_service as demand
+from app.services.demand_stats_reference import reference_suggestions
+
+
+def _d(today, days_ago):
+    return (today - timedelta(days=days_ago)).strftime("%d/%m/%Y")
+
+
+def test_matriz_vetorizada_reproduz_calculo_original():
+    today = datetime(2026, 3, 31, 15, 0)
+    start_date = today - timedelta(days=demand.ANALYSIS_DAYS)
+    products, requests, entries = demand.synthetic_ledger(num_products=80, years=1, seed=3, today=today)
+    products.append({"id": "x1", "name": "Só hoje", "frequency": "Diário"})
+    products.append({"id": "x2", "name": "Data torta", "frequency": None, "min_stock": None})
+    requests += [
+        {"date": _d(today, 0), "items_structured": [{"name": "Só hoje", "qty": 3}]},
+        {"date": "5/3/2026", "items": "2x Data torta, lixo, abcx 4"},
+        {"date": _d(today, 10), "items_structured": [{"name": "Produto 00001", "qty": 2}, {"qty": 1}, {"name": "Produto 00002", "qty": 9}]},
+        {"date": None, "items": "1x Produto 00003"},
+    ]
+    entries.append({"product": "Produto 00004", "qty": "inválido", "date": _d(today, 3)})
+
+    expected = reference_suggestions(requests, entries, products, start_date)
+    got = demand.smart_stock_suggestions(requests, entries, products, start_date)
+
+    assert [{k: v for k, v in row.items() if k != "lead_time_source"} for row in got] == expected
+    names = [row["product"] for row in got]
+    # histórico só no dia de hoje (fora da janela de 60 dias) some da lista, como antes
+    assert "Só hoje" not in names
+    # data fora do formato canônico conta como histórico, mas com total zero
+    assert "Data torta" not in names
+
+
+def test_prazo_de_entrega_inferido_pelas_compras():
+    today = datetime(2026, 3, 31, 9, 0)
+    since = today - timedelta(days=demand.LEAD_TIME_LOOKBACK_DAYS)
+    entries = [
+        {"product": "Limão", "qty": 20, "date": _d(today, days)} for days in (40, 30, 20, 10, 10)
+    ] + [
+        {"product": "Sal", "qty": 5, "date": _d(today, 50)},
+        {"product": "Sal", "qty": 5, "date": _d(today, 5)},
+        {"product": "Limão", "qty": -2, "date": _d(today, 2)},
+        {"product": "Limão", "qty": 100, "date": _d(today, 400)},
+    ]
+    assert demand.infer_lead_times(entries, since) == {"Limão": 10}
+
+    products = [
+        {"id": "1", "name": "Limão", "frequency": "Mensal"},
+        {"id": "2", "name": "Sal", "frequency": "Quinzenal"},
+    ]
+    requests = [{"date": _d(today, 2), "items_structured": [{"name": "Sal", "qty": 4}]}]
+    rows = demand.smart_stock_suggestions(requests, entries, products, today - timedelta(days=60), lead_time_since=since)
+
+    by_name = {row["product"]: row for row in rows}
+    assert by_name["Limão"]["lead_time"] == 10
+    assert by_name["Limão"]["lead_time_source"] == "entries"
+    assert by_name["Sal"]["lead_time"] == 15
+    assert by_name["Sal"]["lead_time_source"] == "frequency"
+    assert by_name["Limão"]["raw_calculated"] == pytest.approx(
+        2 / 60 * 10 + demand.Z_SCORE_95 * by_name["Limão"]["std_dev"] * 10 ** 0.5, abs=0.02
+    )
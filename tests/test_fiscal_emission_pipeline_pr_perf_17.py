@@ -0,0 +1,202 @@
+import json
+import threading
+import time
+
+from app.services import fiscal_pool_service, fiscal_service
+from app.services.fiscal_emission_pipeline import EmissionRateLimiter
+
+
+SETTINGS = {
+    "integrations": [
+        {
+            "provider": "nuvem_fiscal",
+            "cnpj_emitente": "28952732000109",
+            "client_id": "cid",
+            "client_secret": "sec",
+            "environment": "homologation",
+            "serie": "1",
+            "next_number": "10",
+        }
+    ]
+}
+
+
+def _configure(monkeypatch, tmp_path):
+    pool_file = tmp_path / "fiscal_pool.json"
+    pool_file.write_text("[]", encoding="utf-8")
+    pending_file = tmp_path / "pending_fiscal_emissions.json"
+    pending_file.write_text("[]", encoding="utf-8")
+    monkeypatch.setattr(fiscal_pool_service, "FISCAL_POOL_FILE", str(pool_file))
+    monkeypatch.setattr(fiscal_service, "PENDING_EMISSIONS_FILE", str(pending_file))
+    monkeypatch.setattr(fiscal_pool_service, "load_menu_items", lambda: [])
+    monkeypatch.setattr(fiscal_pool_service.FiscalPoolService, "sync_entry_to_remote", staticmethod(lambda entry: True))
+    monkeypatch.setattr(fiscal_service, "load_fiscal_settings", lambda: json.loads(json.dumps(SETTINGS)))
+    saved = []
+    monkeypatch.setattr(fiscal_service, "save_fiscal_settings", lambda settings: saved.append(json.loads(json.dumps(settings))) or True)
+    monkeypatch.setattr(fiscal_service, "_EMISSION_RATE", EmissionRateLimiter())
+    return tmp_path / "fiscal_emission_state.json", saved
+
+
+def _add_entry(original_id, amount=100.0):
+    return fiscal_pool_service.FiscalPoolService.add_to_pool(
+        origin="restaurant",
+        original_id=original_id,
+        total_amount=amount,
+        items=[{"id": "1", "name": "Prato", "qty": 1, "price": amount, "ncm": "21069090", "cfop": "5102"}],
+        payment_methods=[{"method": "Cartão", "amount": amount, "is_fiscal": True}],
+        user="tester",
+        customer_info={"cpf_cnpj": "12345678901"},
+    )
+
+
+def test_downloads_sobrepoem_emissoes_sem_quebrar_o_intervalo(monkeypatch, tmp_path):
+    state_file, saved = _configure(monkeypatch, tmp_path)
+    ids = [_add_entry(f"MESA_{n}") for n in range(4)]
+    monkeypatch.setattr(fiscal_service, "EMISSION_MIN_INTERVAL_SECONDS", 0.05)
+    emitted_at = []
+    numbers = []
+    lock = threading.Lock()
+
+    def _emit_invoice(transaction, settings, *args, **kwargs):
+        with lock:
+            emitted_at.append(time.monotonic())
+            numbers.append(settings["next_number"])
+            idx = len(emitted_at)
+        return {"success": True, "data": {"id": f"NF{idx}", "serie": "1", "numero": settings["next_number"]}}
+
+    def _slow_xml(nfe_id, settings):
+        time.sleep(0.2)
+        return f"{nfe_id}.xml"
+
+    monkeypatch.setattr(fiscal_service, "emit_invoice", _emit_invoice)
+    monkeypatch.setattr(fiscal_service, "download_xml", _slow_xml)
+    monkeypatch.setattr(fiscal_service, "download_pdf", lambda *args, **kwargs: "ok.pdf")
+
+    started = time.monotonic()
+    result = fiscal_service.process_pending_emissions()
+    elapsed = time.monotonic() - started
+
+    assert result == {"processed": 4, "success": 4, "failed": 0}
+    assert all(b - a >= 0.045 for a, b in zip(emitted_at, emitted_at[1:]))
+    # quatro downloads de 0,2 s em série levariam pelo menos 0,8 s
+    assert elapsed < 0.6
+    assert numbers == ["10", "11", "12", "13"]
+    assert saved[-1]["integrations"][0]["next_number"] == "14"
+    for entry_id in ids:
+        entry = fiscal_pool_service.FiscalPoolService.get_entry(entry_id)
+        assert entry["status"] == "emitted" and entry["xml_ready"] is True
+    assert json.loads(state_file.read_text(encoding="utf-8")) == {}
+
+
+def test_execucao_interrompida_e_retomada_sem_reemitir(monkeypatch, tmp_path):
+    state_file, _ = _configure(monkeypatch, tmp_path)
+    authorized = _add_entry("MESA_A")
+    unknown = _add_entry("MESA_B")
+    for entry_id in (authorized, unknown):
+        fiscal_pool_service.FiscalPoolService.update_status(entry_id, "issuing", user="Sistema")
+    state_file.write_text(
+        json.dumps(
+            {
+                authorized: {"stage": "emitted", "source": "pool", "cnpj": "28952732000109", "nfe_id": "NF-A", "serie": "1", "number": "10", "access_key": ""},
+                unknown: {"stage": "emitting", "source": "pool", "cnpj": "28952732000109"},
+            }
+        ),
+        encoding="utf-8",
+    )
+
+    def _must_not_emit(*args, **kwargs):
+        raise AssertionError("nota já autorizada não pode ser reemitida")
+
+    monkeypatch.setattr(fiscal_service, "emit_invoice", _must_not_emit)
+    monkeypatch.setattr(fiscal_service, "download_xml", lambda nfe_id, settings: f"{nfe_id}.xml")
+    monkeypatch.setattr(fiscal_service, "download_pdf", lambda nfe_id, settings: f"{nfe_id}.pdf")
+
+    result = fiscal_service.process_pending_emissions()
+    assert result == {"processed": 2, "success": 1, "failed": 1}
+    done = fiscal_pool_service.FiscalPoolService.get_entry(authorized)
+    assert done["status"] == "emitted" and done["fiscal_doc_uuid"] == "NF-A"
+    interrupted = fiscal_pool_service.FiscalPoolService.get_entry(unknown)
+    assert interrupted["status"] == "manual_retry_required"
+    assert "interrompida" in interrupted["last_error"]
+    assert json.loads(state_file.read_text(encoding="utf-8")) == {}
+
+
+def test_gravacoes_concorrentes_do_pool_nao_se_perdem(monkeypatch, tmp_path):
+    _configure(monkeypatch, tmp_path)
+    ids = [_add_entry(f"MESA_{n}") for n in range(8)]
+    service = fiscal_pool_service.FiscalPoolService
+    real_load = service._load_pool
+
+    def _slow_load():
+        pool = real_load()
+        time.sleep(0.005)
+        return pool
+
+    monkeypatch.setattr(service, "_load_pool", staticmethod(_slow_load))
+
+    def _work(entry_id):
+        service.update_status(entry_id, "emitted", fiscal_doc_uuid=f"NF-{entry_id}")
+        service.set_xml_ready(entry_id, True, f"{entry_id}.xml")
+        service.set_pdf_ready(entry_id, True, f"{entry_id}.pdf")
+
+    threads = [threading.Thread(target=_work, args=(entry_id,)) for entry_id in ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for entry_id in ids:
+        entry = service.get_entry(entry_id)
+        assert entry["status"] == "emitted" and entry["fiscal_doc_uuid"] == f"NF-{entry_id}"
+        assert entry["xml_ready"] is True and entry["pdf_ready"] is True
+
+
+def _queue_item(emission_id):
+    return {
+        "id": emission_id,
+        "status": "pending",
+        "cnpj_emitente": "28952732000109",
+        "amount": 50.0,
+        "items": [{"id": "1", "name": "Prato", "qty": 1, "price": 50.0, "ncm": "21069090", "cfop": "5102"}],
+        "payments": [{"method": "Cartão", "amount": 50.0, "is_fiscal": True}],
+        "attempts": 0,
+    }
+
+
+def test_fila_grava_situacao_antes_de_descartar_o_estado(monkeypatch, tmp_path):
+    state_file, _ = _configure(monkeypatch, tmp_path)
+    pending_file = tmp_path / "pending_fiscal_emissions.json"
+    pending_file.write_text(json.dumps([_queue_item("Q1"), _queue_item("Q2")]), encoding="utf-8")
+    monkeypatch.setattr(fiscal_service, "EMISSION_MIN_INTERVAL_SECONDS", 0)
+    emitted = []
+
+    def _emit_invoice(transaction, settings, *args, **kwargs):
+        emitted.append(transaction["id"])
+        if transaction["id"] == "Q2":
+            raise RuntimeError("queda da conexão")
+        return {"success": True, "data": {"id": "NF-Q1", "serie": "1", "numero": "10"}}
+
+    monkeypatch.setattr(fiscal_service, "emit_invoice", _emit_invoice)
+    monkeypatch.setattr(fiscal_service, "download_xml", lambda nfe_id, settings: None)
+    monkeypatch.setattr(fiscal_service, "download_pdf", lambda nfe_id, settings: None)
+
+    try:
+        fiscal_service.process_pending_emissions()
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("erro da emissão deveria ser propagado")
+
+    # a fila foi gravada mesmo com o erro; Q1 autorizada aguarda o XML
+    queue = {item["id"]: item for item in json.loads(pending_file.read_text(encoding="utf-8"))}
+    assert queue["Q1"]["status"] == "pending" and queue["Q1"]["attempts"] == 1
+    state = json.loads(state_file.read_text(encoding="utf-8"))
+    assert list(state) == ["Q1"] and state["Q1"]["stage"] == "emitted"
+
+    emitted.clear()
+    monkeypatch.setattr(fiscal_service, "emit_invoice", lambda *args, **kwargs: {"success": False, "message": "fora do ar"})
+    monkeypatch.setattr(fiscal_service, "download_xml", lambda nfe_id, settings: f"{nfe_id}.xml")
+    fiscal_service.process_pending_emissions(specific_id="Q1")
+    queue = {item["id"]: item for item in json.loads(pending_file.read_text(encoding="utf-8"))}
+    assert queue["Q1"]["status"] == "emitted" and queue["Q1"]["nfe_id"] == "NF-Q1"
+    assert json.loads(state_file.read_text(encoding="utf-8")) == {}
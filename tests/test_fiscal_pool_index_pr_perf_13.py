@@ -0,0 +1,104 @@
+import json
+
+import pytest
+
+from app.services import fiscal_pool_service
+from app.services import json_document_cache
+from app.services.fiscal_pool_index import FiscalPoolIndex
+from app.services.fiscal_pool_service import FiscalPoolService
+
+
+LEGACY_POOL = [
+    {"id": "A", "origin": "restaurant", "fiscal_type": "nfce", "status": "pending", "closed_at": "2026-03-02 10:00:00", "total_amount": 50.0, "payment_methods": [], "history": []},
+    {"id": "B", "origin": "reception", "fiscal_type": "nfse", "status": "emitted", "closed_at": "2026-03-05 09:00:00", "total_amount": 80.0, "fiscal_amount": 80.0, "history": []},
+    {"id": "C", "origin": "restaurant", "fiscal_type": "nfce", "status": "pending", "closed_at": "2026-03-05 09:00:00", "total_amount": 20.0, "fiscal_amount": 20.0, "cnpj_emitente": "28952732000109", "history": []},
+    {"id": "D", "origin": "restaurant", "fiscal_type": "nfce", "status": "emitted", "closed_at": "2026-02-27 18:30:00", "total_amount": 12.0, "fiscal_amount": 12.0, "cnpj_emitente": "28952732000109", "history": []},
+    {"id": "E", "origin": "restaurant", "fiscal_type": "nfse", "status": "pending", "closed_at": "2026-03-04 12:00:00", "total_amount": 30.0, "fiscal_amount": 30.0, "history": []},
+]
+
+
+def _linear_get_pool(pool, filters):
+    filtered = []
+    for entry in pool:
+        if filters.get("status") and filters["status"] != "all" and entry["status"] != filters["status"]:
+            continue
+        if filters.get("origin") and filters["origin"] != "all" and entry["origin"] != filters["origin"]:
+            continue
+        if filters.get("fiscal_type") and entry["fiscal_type"] != filters["fiscal_type"]:
+            continue
+        if filters.get("date_start") and entry["closed_at"] < filters["date_start"]:
+            continue
+        if filters.get("date_end") and entry["closed_at"] > filters["date_end"]:
+            continue
+        filtered.append(entry)
+    return sorted(filtered, key=lambda x: x["closed_at"], reverse=True)
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [
+        {},
+        {"status": "pending"},
+        {"status": "all", "origin": "restaurant"},
+        {"status": "pending", "fiscal_type": "nfce"},
+        {"date_start": "2026-03-01", "date_end": "2026-03-05"},
+        {"date_start": "2026-03-05 09:00:00", "status": "pending"},
+        {"date_end": "2026-03-04 12:00:00", "origin": "restaurant", "status": "emitted"},
+        {"status": "inexistente"},
+    ],
+)
+def test_consulta_indexada_equivale_ao_filtro_linear(filters):
+    index = FiscalPoolIndex(LEGACY_POOL)
+    page, total = index.query(
+        status=None if filters.get("status") in (None, "all") else filters["status"],
+        origin=filters.get("origin"),
+        fiscal_type=filters.get("fiscal_type"),
+        date_start=filters.get("date_start"),
+        date_end=filters.get("date_end"),
+    )
+    expected = _linear_get_pool(LEGACY_POOL, filters)
+    assert [e["id"] for e in page] == [e["id"] for e in expected]
+    assert total == len(expected)
+
+    second_page, _ = index.query(offset=1, limit=2)
+    assert [e["id"] for e in second_page] == [e["id"] for e in _linear_get_pool(LEGACY_POOL, {})][1:3]
+    # cada chamada devolve cópias independentes
+    index.entry("A")["status"] = "emitted"
+    assert index.entry("A")["status"] == "pending"
+
+
+@pytest.fixture
+def pool_file(monkeypatch, tmp_path):
+    path = tmp_path / "fiscal_pool.json"
+    path.write_text(json.dumps(LEGACY_POOL), encoding="utf-8")
+    monkeypatch.setattr(fiscal_pool_service, "FISCAL_POOL_FILE", str(path))
+    monkeypatch.setattr(json_document_cache, "RACY_WINDOW_SECONDS", 0)
+    monkeypatch.setattr(fiscal_pool_service, "_POOL_INDEX", None)
+    monkeypatch.setattr(fiscal_pool_service, "_POOL_INDEX_STATS", {"builds": 0, "hits": 0, "migrations": 0})
+    return path
+
+
+def test_migracao_roda_uma_vez_e_indice_reaproveitado(pool_file):
+    entry = FiscalPoolService.get_entry("A")
+    assert entry["fiscal_amount"] == 50.0
+    assert entry["cnpj_emitente"] == FiscalPoolService.MIRAPRAIA_CNPJ
+    meta = json.loads((pool_file.parent / "fiscal_pool.meta.json").read_text(encoding="utf-8"))
+    assert meta["schema_version"] == fiscal_pool_service.POOL_SCHEMA_VERSION
+
+    assert [e["id"] for e in FiscalPoolService.get_pending_nfce()] == ["C", "A"]
+    assert FiscalPoolService.query_pool({"status": "all"}, offset=0, limit=2)["total"] == 5
+    stats = FiscalPoolService.pool_index_stats()
+    assert stats["migrations"] == 1 and stats["builds"] == 1 and stats["hits"] == 2
+
+    assert FiscalPoolService.update_status("A", "emitted", user="tester")
+    assert FiscalPoolService.update_status("nao-existe", "emitted") is False
+    assert [e["id"] for e in FiscalPoolService.get_pending_nfce()] == ["C"]
+    assert FiscalPoolService.get_entry("A")["history"][-1]["to"] == "emitted"
+    stats = FiscalPoolService.pool_index_stats()
+    # gravação própria carimba o arquivo: o recarregamento não migra de novo
+    assert stats["migrations"] == 1 and stats["builds"] == 2
+
+    # restauração externa volta a passar pela migração
+    pool_file.write_text(json.dumps(LEGACY_POOL), encoding="utf-8")
+    assert FiscalPoolService.get_entry("A")["status"] == "pending"
+    assert FiscalPoolService.pool_index_stats()["migrations"] == 2
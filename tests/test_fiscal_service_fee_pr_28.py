@@ -19,7 +19,7 @@ def test_emit_invoice_adds_service_fee_item_when_amount_is_higher(monkeypatch):
         return _FakeResp({"status": "autorizada", "id": "NF-1", "serie": "1", "numero": "123"})
 
     monkeypatch.setattr(fiscal_service, "get_access_token", lambda *args, **kwargs: "TOKEN")
-    monkeypatch.setattr(fiscal_service.requests, "post", _fake_post)
+    monkeypatch.setattr(fiscal_service.NUVEM_FISCAL_HTTP, "post", _fake_post)
 
     tx = {"id": "TX-1", "payment_method": "Dinheiro", "amount": 11.0}
     settings = {
@@ -50,7 +50,7 @@ def test_emit_invoice_does_not_add_service_fee_item_when_amount_matches(monkeypa
         return _FakeResp({"status": "autorizada", "id": "NF-2", "serie": "1", "numero": "124"})
 
     monkeypatch.setattr(fiscal_service, "get_access_token", lambda *args, **kwargs: "TOKEN")
-    monkeypatch.setattr(fiscal_service.requests, "post", _fake_post)
+    monkeypatch.setattr(fiscal_service.NUVEM_FISCAL_HTTP, "post", _fake_post)
 
     tx = {"id": "TX-2", "payment_method": "Dinheiro", "amount": 10.0}
     settings = {
@@ -0,0 +1,128 @@
+import http.server
+import json
+import threading
+
+import pytest
+
+from app.services import fiscal_service, integration_http_client
+from app.services.integration_http_client import CircuitOpenError, IntegrationHttpClient, TokenCache
+
+
+class _StubHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        state = self.server.state
+        state["connections"].add(self.client_address)
+        state["calls"].append(self.path)
+        state["auth"].append(self.headers.get("Authorization"))
+        statuses = state["statuses"]
+        status = statuses.pop(0) if statuses else 200
+        self._reply(status, {"status": "autorizada", "path": self.path})
+
+    def do_POST(self):
+        state = self.server.state
+        state["connections"].add(self.client_address)
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        state["calls"].append(self.path)
+        state["tokens_issued"] += 1
+        self._reply(200, {"access_token": f"TOKEN-{state['tokens_issued']}", "expires_in": 3600})
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    server.state = {"connections": set(), "calls": [], "statuses": [], "tokens_issued": 0, "auth": []}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_cliente_reaproveita_conexao_e_repete_get_em_503(stub_server):
+    server, base = stub_server
+    client = IntegrationHttpClient("teste", backoff_seconds=0)
+    for nfe_id in ("101", "102", "103"):
+        assert client.get(f"{base}/nfce/{nfe_id}").status_code == 200
+    assert len(server.state["connections"]) == 1
+
+    server.state["statuses"] = [503]
+    assert client.get(f"{base}/nfce/104").status_code == 200
+    stats = client.stats()
+    endpoint = next(e for e in stats["endpoints"] if e["endpoint"].endswith("/nfce/{id}"))
+    assert endpoint["count"] == 5 and endpoint["retries"] == 1 and endpoint["errors"] == 1
+    assert stats["circuits"][base.split("//")[1]]["state"] == "closed"
+    client.close()
+
+
+def test_circuito_abre_apos_falhas_e_fecha_apos_teste(stub_server, monkeypatch):
+    server, base = stub_server
+    client = IntegrationHttpClient("teste", max_retries=0, breaker_threshold=2, breaker_cooldown_seconds=30)
+    clock = {"now": 1000.0}
+    monkeypatch.setattr(integration_http_client.time, "monotonic", lambda: clock["now"])
+    server.state["statuses"] = [500, 500]
+    assert client.get(f"{base}/nfce/1").status_code == 500
+    assert client.get(f"{base}/nfce/1").status_code == 500
+    with pytest.raises(CircuitOpenError):
+        client.get(f"{base}/nfce/1")
+    assert len(server.state["calls"]) == 2
+
+    clock["now"] += 31
+    assert client.get(f"{base}/nfce/1").status_code == 200
+    assert client.stats()["circuits"][base.split("//")[1]]["state"] == "closed"
+    client.close()
+
+
+def test_token_oauth_reaproveitado_ate_expirar(stub_server, monkeypatch):
+    server, base = stub_server
+    client = IntegrationHttpClient("nuvem_fiscal_teste")
+    tokens = TokenCache()
+    monkeypatch.setattr(fiscal_service, "NUVEM_FISCAL_HTTP", client)
+    monkeypatch.setattr(fiscal_service, "get_token_cache", lambda: tokens)
+    real_post = client.post
+    monkeypatch.setattr(client, "post", lambda url, **kwargs: real_post(f"{base}/oauth/token", **kwargs))
+
+    first = fiscal_service.get_access_token("id", "secret", scope="nfce")
+    second = fiscal_service.get_access_token("id", "secret", scope="nfce")
+    other_scope = fiscal_service.get_access_token("id", "secret", scope="nfe")
+    assert first == second == "TOKEN-1" and other_scope == "TOKEN-2"
+    assert tokens.stats() == {"hits": 1, "fetches": 2, "cached": 2}
+    client.close()
+
+
+def test_token_recusado_com_401_e_renovado_uma_vez(stub_server, monkeypatch):
+    server, base = stub_server
+    client = IntegrationHttpClient("nuvem_fiscal_teste")
+    tokens = TokenCache()
+    monkeypatch.setattr(fiscal_service, "NUVEM_FISCAL_HTTP", client)
+    monkeypatch.setattr(fiscal_service, "get_token_cache", lambda: tokens)
+    real_post = client.post
+    monkeypatch.setattr(client, "post", lambda url, **kwargs: real_post(f"{base}/oauth/token", **kwargs))
+
+    headers = {"Authorization": f"Bearer {fiscal_service.get_access_token('id', 'secret')}"}
+    server.state["statuses"] = [401]
+    response = fiscal_service._nuvem_fiscal_call("get", f"{base}/nfce/1", headers=headers)
+    assert response.status_code == 200
+    assert server.state["auth"] == ["Bearer TOKEN-1", "Bearer TOKEN-2"]
+    assert headers["Authorization"] == "Bearer TOKEN-2"
+    assert fiscal_service.get_access_token("id", "secret") == "TOKEN-2"
+
+    # recusa persistente: só uma nova tentativa
+    server.state["statuses"] = [401, 401]
+    assert fiscal_service._nuvem_fiscal_call("get", f"{base}/nfce/1", headers=headers).status_code == 401
+    assert server.state["tokens_issued"] == 3 and len(server.state["auth"]) == 4
+    client.close()
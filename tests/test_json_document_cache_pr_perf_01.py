@@ -0,0 +1,86 @@
+import json
+import os
+
+import pytest
+
+from app.services import data_service
+from app.services import json_document_cache
+from app.services.json_document_cache import JsonDocumentCache
+
+
+@pytest.fixture
+def fresh_cache(monkeypatch):
+    cache = JsonDocumentCache(max_bytes=1024 * 1024, enabled=True)
+    monkeypatch.setattr(json_document_cache, "_DOCUMENT_CACHE", cache)
+    monkeypatch.setattr(json_document_cache, "RACY_WINDOW_SECONDS", 0)
+    return cache
+
+
+def _write(path, payload, mtime=None):
+    path.write_text(json.dumps(payload), encoding="utf-8")
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def test_load_json_reaproveita_parse_e_entrega_copia_privada(fresh_cache, tmp_path):
+    target = tmp_path / "stock_requests.json"
+    _write(target, [{"id": "R1", "qty": 1}], mtime=1_700_000_000)
+
+    first = data_service._load_json(str(target), [])
+    first[0]["qty"] = 999
+    first.append({"id": "intruso"})
+    second = data_service._load_json(str(target), [])
+
+    assert second == [{"id": "R1", "qty": 1}]
+    stats = data_service.get_json_cache_stats()
+    assert stats["misses"] == 1
+    assert stats["hits"] == 1
+    assert stats["entries"] == 1
+
+
+def test_cache_invalida_por_assinatura_de_stat(fresh_cache, tmp_path):
+    target = tmp_path / "suppliers.json"
+    _write(target, [{"id": "A"}], mtime=1_700_000_000)
+    assert data_service._load_json(str(target), []) == [{"id": "A"}]
+
+    _write(target, [{"id": "B"}], mtime=1_700_000_100)
+    assert data_service._load_json(str(target), []) == [{"id": "B"}]
+    assert fresh_cache.stats()["stale"] == 1
+
+
+def test_save_json_invalida_entrada(fresh_cache, tmp_path):
+    target = tmp_path / "observations.json"
+    _write(target, [{"id": "old"}], mtime=1_700_000_000)
+    assert data_service._load_json(str(target), []) == [{"id": "old"}]
+
+    assert data_service._save_json(str(target), [{"id": "new"}]) is True
+    assert fresh_cache.stats()["entries"] == 0
+    assert data_service._load_json(str(target), []) == [{"id": "new"}]
+
+
+def test_orcamento_lru_em_bytes_expulsa_mais_antigo(monkeypatch, tmp_path):
+    cache = JsonDocumentCache(max_bytes=600, enabled=True)
+    monkeypatch.setattr(json_document_cache, "RACY_WINDOW_SECONDS", 0)
+    paths = []
+    for idx in range(3):
+        path = tmp_path / f"doc_{idx}.json"
+        _write(path, {"rows": ["x" * 40] * 5}, mtime=1_700_000_000)
+        paths.append(path)
+        cache.get(str(path), data_service._read_json_file)
+
+    stats = cache.stats()
+    assert stats["bytes"] <= 600
+    assert stats["evictions"] >= 1
+    cached_paths = {row["path"] for row in stats["files"]}
+    assert json_document_cache.cache_key(paths[-1]) in cached_paths
+    assert json_document_cache.cache_key(paths[0]) not in cached_paths
+
+
+def test_arquivo_recem_modificado_nao_e_confiado(monkeypatch, tmp_path):
+    cache = JsonDocumentCache(max_bytes=1024 * 1024, enabled=True)
+    target = tmp_path / "fresh.json"
+    _write(target, {"v": 1})
+    cache.get(str(target), data_service._read_json_file)
+    stats = cache.stats()
+    assert stats["entries"] == 0
+    assert stats["racy_skips"] == 1
@@ -0,0 +1,132 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask, session
+
+from app.blueprints import kitchen as kitchen_module
+from app.services import kds_event_service
+from app.services.table_orders_store import _encode
+
+NOW = datetime(2026, 3, 15, 12, 0, 10)
+
+
+def _order(item_status="pending", minutes_ago=8):
+    created_at = (NOW - timedelta(minutes=minutes_ago)).strftime('%d/%m/%Y %H:%M')
+    return {
+        "status": "open",
+        "opened_at": (NOW - timedelta(minutes=10)).strftime('%d/%m/%Y %H:%M'),
+        "waiter": "adailton",
+        "items": [
+            {"id": "i1", "name": "Acai", "qty": 1, "category": "Sobremesas", "created_at": created_at,
+             "kds_status": item_status, "observations": [], "accompaniments": [], "questions_answers": []},
+        ],
+    }
+
+
+@pytest.fixture
+def kds(monkeypatch):
+    state = {"orders": {"77": _order(), "78": _order(minutes_ago=3)}, "versions": {"77": 1, "78": 1}}
+    monkeypatch.setattr(kds_event_service, "_FEED", kds_event_service.KdsFeed())
+    monkeypatch.setattr(kds_event_service, "_BUS", kds_event_service.KdsEventBus())
+    monkeypatch.setattr(kitchen_module, "load_table_orders", lambda: state["orders"])
+    monkeypatch.setattr(kitchen_module, "table_orders_segments",
+                        lambda: {t: (state["versions"][t], _encode(o)) for t, o in state["orders"].items()})
+    monkeypatch.setattr(kitchen_module, "load_settings", lambda: {"kds_sla": {"Sobremesas": 20}})
+    monkeypatch.setattr(kitchen_module, "load_printers", lambda: [])
+    return state
+
+
+def _poll(since, epoch, wait=0, clock=lambda: NOW):
+    def build_table(table_id, order, now, context):
+        kds_sla, printers_map = context
+        return kitchen_module._build_kds_table(table_id, order, "kitchen", now, kds_sla, printers_map)
+
+    return kds_event_service.wait_for_kds_changes(
+        "kitchen", since, epoch, wait,
+        load_state=lambda: (kitchen_module.table_orders_segments(), kitchen_module._kds_context()),
+        build_table=build_table, clock=clock,
+    )
+
+
+def test_feed_envia_apenas_mesas_alteradas_e_remocoes(kds):
+    full, modified = _poll(None, None)
+    legacy = kitchen_module._build_kds_payload("kitchen", now=NOW)
+    assert modified and full["full"] is True
+    assert full["orders"] == legacy["orders"]
+    assert full["sections_summary"] == legacy["sections_summary"]
+    assert full["avg_prep_seconds"] == legacy["avg_prep_seconds"]
+    assert full["table_order"] == ["77", "78"]
+
+    # nada mudou: só a versão volta
+    payload, modified = _poll(full["version"], full["epoch"])
+    assert not modified and payload == {"version": full["version"], "epoch": full["epoch"], "not_modified": True}
+    built = kds_event_service._FEED.counters["tables_built"]
+    assert built == 2
+
+    # só a mesa 78 mudou: só ela é reconstruída e enviada
+    kds["orders"]["78"] = _order("preparing", minutes_ago=3)
+    kds["versions"]["78"] = 2
+    delta, modified = _poll(full["version"], full["epoch"])
+    assert modified and delta["full"] is False
+    assert [o["table_id"] for o in delta["orders"]] == ["78"]
+    assert delta["removed"] == [] and delta["table_order"] == ["77", "78"]
+    assert kds_event_service._FEED.counters["tables_built"] == built + 1
+
+    # mesa fechada vira remoção
+    del kds["orders"]["77"]
+    closed, _ = _poll(delta["version"], delta["epoch"])
+    assert closed["orders"] == [] and closed["removed"] == ["77"] and closed["table_order"] == ["78"]
+
+    # época diferente (outro worker/reinício): payload completo
+    other, _ = _poll(closed["version"], "outra")
+    assert other["full"] is True and [o["table_id"] for o in other["orders"]] == ["78"]
+
+
+def test_virada_de_minuto_e_publicacao_acordam_a_espera(kds):
+    full, _ = _poll(None, None)
+    # minuto novo: tempos de espera mudam, todos os cartões voltam
+    later, modified = _poll(full["version"], full["epoch"], clock=lambda: NOW + timedelta(minutes=1))
+    assert modified and {o["table_id"] for o in later["orders"]} == {"77", "78"}
+    assert later["orders"][0]["wait_minutes"] == full["orders"][0]["wait_minutes"] + 1
+
+    clock = lambda: NOW + timedelta(minutes=1)
+
+    def _write():
+        time.sleep(0.1)
+        kds["orders"]["77"] = _order("done")
+        kds["versions"]["77"] = 2
+        kds_event_service.notify_kds_orders_changed()
+
+    writer = threading.Thread(target=_write)
+    started = time.monotonic()
+    writer.start()
+    delta, modified = _poll(later["version"], later["epoch"], wait=5, clock=clock)
+    writer.join()
+    assert modified and [o["table_id"] for o in delta["orders"]] == ["77"]
+    assert time.monotonic() - started < 2
+
+
+def test_endpoint_com_since_responde_not_modified(kds, monkeypatch):
+    monkeypatch.setattr(kds_event_service, "RECHECK_SECONDS", 0.05)
+    app = Flask(__name__)
+    app.secret_key = "test-secret"
+
+    def _get(query):
+        with app.test_request_context("/kitchen/kds/data?station=kitchen&" + query):
+            session["user"] = "cicera"
+            session["role"] = "gerente"
+            return kitchen_module.kitchen_kds_data.__wrapped__().get_json()
+
+    first = _get("since=")
+    assert first["success"] is True and first["data"]["full"] is True
+    assert [o["table_id"] for o in first["data"]["orders"]] == ["77", "78"]
+    data = first["data"]
+    again = _get(f"since={data['version']}&epoch={data['epoch']}&wait=0")
+    if not again.get("not_modified"):
+        # o minuto virou entre as duas chamadas
+        data = again["data"]
+        again = _get(f"since={data['version']}&epoch={data['epoch']}&wait=0")
+    assert again == {"success": True, "not_modified": True, "version": data["version"], "epoch": data["epoch"]}
+    assert kds_event_service.kds_event_stats()["not_modified"] == 1
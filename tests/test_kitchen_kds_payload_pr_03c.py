@@ -36,7 +36,6 @@ def test_build_kds_payload_keeps_wait_minutes_contract(monkeypatch):
     monkeypatch.setattr(kitchen_module, "load_menu_items", lambda: [])
     monkeypatch.setattr(kitchen_module, "load_settings", lambda: {"kds_sla": {"Sobremesas": 20}})
     monkeypatch.setattr(kitchen_module, "load_printers", lambda: [])
-    monkeypatch.setattr(kitchen_module, "get_default_printer", lambda _kind: None)
 
     payload = kitchen_module._build_kds_payload("kitchen", now=now)
 
@@ -60,7 +59,6 @@ def test_kitchen_kds_data_endpoint_returns_payload_without_nameerror(monkeypatch
     monkeypatch.setattr(kitchen_module, "load_menu_items", lambda: [])
     monkeypatch.setattr(kitchen_module, "load_settings", lambda: {"kds_sla": {"Sobremesas": 20}})
     monkeypatch.setattr(kitchen_module, "load_printers", lambda: [])
-    monkeypatch.setattr(kitchen_module, "get_default_printer", lambda _kind: None)
 
     with app.test_request_context("/kitchen/kds/data?station=kitchen"):
         session["user"] = "cicera"
@@ -217,7 +217,6 @@ def test_kds_data_and_status_flow(app_client, monkeypatch):
     monkeypatch.setattr(kitchen_module, "load_menu_items", lambda: [])
     monkeypatch.setattr(kitchen_module, "load_settings", lambda: {"kds_sla": {"Pratos": 30}})
     monkeypatch.setattr(kitchen_module, "load_printers", lambda: [])
-    monkeypatch.setattr(kitchen_module, "get_default_printer", lambda _: None)
 
     resp_data = app_client.get("/kitchen/kds/data?station=cozinha")
     assert resp_data.status_code == 200
@@ -652,7 +651,6 @@ def test_kds_visual_lane_by_print_destination(app_client, monkeypatch):
             {"id": "3", "name": "Cozinha Sobremesa"},
         ],
     )
-    monkeypatch.setattr(kitchen_module, "get_default_printer", lambda _: None)
 
     resp = app_client.get("/kitchen/kds/data?station=cozinha")
     assert resp.status_code == 200
@@ -0,0 +1,108 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.services import ledger_segment_store
+from app.services.ledger_service import LedgerService
+
+
+def _legacy_balance(ledger, box_name, date_cutoff=None):
+    cutoff_dt = datetime.fromisoformat(date_cutoff) if date_cutoff else None
+    balance = 0.0
+    for tx in ledger:
+        if cutoff_dt and datetime.fromisoformat(tx["timestamp"]) > cutoff_dt:
+            continue
+        if tx["dest_box"] == box_name:
+            balance += float(tx["value"])
+        elif tx["source_box"] == box_name:
+            balance -= float(tx["value"])
+    return balance
+
+
+def _legacy_chain(count, start):
+    ledger = []
+    previous_hash = "0" * 64
+    boxes = ["Caixa Restaurante", "Caixa Recepção", "EXTERNO"]
+    for idx in range(count):
+        record = {
+            "id": f"T{idx}",
+            "timestamp": (start + timedelta(hours=idx)).isoformat(),
+            "user": "caixa",
+            "source_box": boxes[idx % 3],
+            "dest_box": boxes[(idx + 1) % 3],
+            "operation_type": "VENDA",
+            "value": round(10.1 * (idx + 1), 2),
+            "payment_method": "Dinheiro",
+            "reference": f"Ref {idx}",
+            "previous_hash": previous_hash,
+        }
+        record["current_hash"] = LedgerService._calculate_hash(record, previous_hash)
+        previous_hash = record["current_hash"]
+        ledger.append(record)
+    return ledger
+
+
+@pytest.fixture
+def ledger_file(monkeypatch, tmp_path):
+    path = tmp_path / "financial_ledger.json"
+    monkeypatch.setattr(LedgerService, "FILE_PATH", str(path))
+    monkeypatch.setattr(ledger_segment_store, "_STORES", {})
+    monkeypatch.setenv("ALMAREIA_LEDGER_CHECKPOINT_EVERY", "4")
+    monkeypatch.setenv("ALMAREIA_LEDGER_SEGMENT_RECORDS", "6")
+    monkeypatch.delenv("ALMAREIA_LEDGER_CHECKPOINT_KEY", raising=False)
+    return path
+
+
+def test_migra_legado_e_saldos_por_data_iguais_ao_replay(ledger_file):
+    start = datetime(2026, 3, 1, 8, 0, 0)
+    legacy = _legacy_chain(15, start)
+    ledger_file.write_text(json.dumps(legacy), encoding="utf-8")
+
+    assert LedgerService.get_transactions() == legacy
+    assert not ledger_file.exists()
+    store = LedgerService._store()
+    assert store.stats()["segments"] == 3 and store.stats()["checkpoints"] == 3
+
+    for box in ("Caixa Restaurante", "Caixa Recepção", "EXTERNO"):
+        assert LedgerService.rebuild_balance(box) == _legacy_balance(legacy, box)
+        for hours in (-1, 0, 2, 5, 7, 11, 13, 20):
+            cutoff = (start + timedelta(hours=hours, minutes=30)).isoformat()
+            assert LedgerService.rebuild_balance(box, cutoff) == _legacy_balance(legacy, box, cutoff)
+
+    tx = LedgerService.record_transaction("caixa", "EXTERNO", "Caixa Restaurante", "VENDA", 5, "Pix", "Mesa 3")
+    assert tx["previous_hash"] == legacy[-1]["current_hash"]
+    reversal = LedgerService.reverse_transaction(tx["id"], "gerente", "erro")
+    assert reversal["source_box"] == "Caixa Restaurante"
+    everything = LedgerService.get_transactions()
+    assert len(everything) == 17
+    assert LedgerService.rebuild_balance("Caixa Restaurante") == _legacy_balance(everything, "Caixa Restaurante")
+    assert LedgerService.verify_integrity() == (True, "Ledger integrity verified from checkpoint 16 (1 new records)")
+    assert LedgerService.verify_integrity(full=True) == (True, "Ledger integrity verified")
+
+
+def test_verificacao_incremental_detecta_adulteracao_e_checkpoint_falso(ledger_file):
+    for idx in range(10):
+        LedgerService.record_transaction("caixa", "EXTERNO", "Caixa Recepção", "VENDA", idx + 1, "Pix", f"R{idx}")
+    store = LedgerService._store()
+    assert LedgerService.verify_integrity()[0] is True
+
+    # adulteração depois do último checkpoint é detectada pela verificação incremental
+    segment = store.segment_path(2)
+    lines = open(segment, encoding="utf-8").read().splitlines()
+    tampered = json.loads(lines[-1])
+    tampered["value"] = 999.0
+    lines[-1] = json.dumps(tampered)
+    open(segment, "w", encoding="utf-8").write("\n".join(lines) + "\n")
+    ok, message = LedgerService.verify_integrity()
+    assert ok is False and "index 9" in message
+
+    # checkpoint regravado sem a chave não é aceito
+    checkpoints = open(store.checkpoints_path, encoding="utf-8").read().splitlines()
+    forged = json.loads(checkpoints[-1])
+    forged["balances"]["Caixa Recepção"] = 1_000_000.0
+    checkpoints[-1] = json.dumps(forged)
+    open(store.checkpoints_path, "w", encoding="utf-8").write("\n".join(checkpoints) + "\n")
+    ledger_segment_store._STORES.clear()
+    ok, message = LedgerService.verify_integrity()
+    assert ok is False and "signature" in message
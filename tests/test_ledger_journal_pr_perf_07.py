@@ -0,0 +1,121 @@
+import json
+import os
+from datetime import datetime
+
+import pytest
+
+from app.services import data_service
+from app.services import ledger_journal_service
+from app.services import stock_balance_index_service as index_service
+
+
+@pytest.fixture
+def ledgers(monkeypatch, tmp_path):
+    entries = tmp_path / "ledger_entries.json"
+    sales = tmp_path / "ledger_sales.json"
+    entries.write_text(json.dumps([{"id": "E1", "product": "Limão", "qty": 10, "date": "01/03/2026"}]), encoding="utf-8")
+    sales.write_text(json.dumps([{"id": "S1", "total": 30, "closed_at": "01/03/2026 12:00"}]), encoding="utf-8")
+
+    backups = []
+    monkeypatch.setattr(data_service, "STOCK_ENTRIES_FILE", str(entries))
+    monkeypatch.setattr(data_service, "SALES_HISTORY_FILE", str(sales))
+    monkeypatch.setattr(data_service, "_backup_before_write", lambda path, *_a, **_k: backups.append(os.path.basename(path)))
+    monkeypatch.setattr(ledger_journal_service, "_JOURNALS", {})
+    monkeypatch.setattr(index_service, "_INDEX", index_service.StockBalanceIndex())
+    monkeypatch.delenv("ALMAREIA_LEDGER_COMPACT_ROWS", raising=False)
+    return {"entries": entries, "sales": sales, "backups": backups}
+
+
+def _journal(path):
+    return ledger_journal_service.journal_path_for(str(path))
+
+
+def test_lancamentos_vao_para_o_diario_sem_reescrever_snapshot(ledgers):
+    before = ledgers["entries"].read_bytes()
+
+    data_service.save_stock_entry({"id": "E2", "product": "Limão", "qty": 5, "date": "02/03/2026"})
+    assert data_service.add_stock_entries_batch([
+        {"id": "E2", "product": "Limão", "qty": 5},
+        {"id": "E3", "product": "Limão", "qty": -1, "date": "03/03/2026"},
+    ]) == 1
+
+    assert ledgers["entries"].read_bytes() == before
+    assert ledgers["backups"] == []
+    assert [e["id"] for e in data_service.load_stock_entries()] == ["E1", "E2", "E3"]
+    assert len(open(_journal(ledgers["entries"]), encoding="utf-8").read().splitlines()) == 3
+
+    entries = data_service.load_stock_entries()
+    entries.append({"id": "E4", "product": "Limão", "qty": 2})
+    assert data_service.save_stock_entries(entries) is True
+    assert ledgers["entries"].read_bytes() == before
+
+    # o índice de saldo acompanha o diário sem reconstruir
+    flow_in = index_service.get_stock_balance_index().aggregates("entries")["flow_in"]
+    assert flow_in["Limão"] == pytest.approx(17.0)
+    assert index_service.get_stock_balance_index().counters["source_rebuilds"] == 1
+
+
+def test_compactacao_e_reescrita_completa(ledgers, monkeypatch):
+    monkeypatch.setenv("ALMAREIA_LEDGER_COMPACT_ROWS", "3")
+    for idx in range(2, 5):
+        data_service.save_stock_entry({"id": f"E{idx}", "product": "Limão", "qty": 1})
+
+    assert not os.path.exists(_journal(ledgers["entries"]))
+    assert [e["id"] for e in json.loads(ledgers["entries"].read_text(encoding="utf-8"))] == ["E1", "E2", "E3", "E4"]
+    assert ledgers["backups"] == ["ledger_entries.json"]
+
+    data_service.save_stock_entry({"id": "E5", "product": "Limão", "qty": 1})
+    kept = [e for e in data_service.load_stock_entries() if e["id"] != "E2"]
+    assert data_service.save_stock_entries(kept) is True
+    assert not os.path.exists(_journal(ledgers["entries"]))
+    assert [e["id"] for e in data_service.load_stock_entries()] == ["E1", "E3", "E4", "E5"]
+
+
+def test_cauda_cortada_e_diario_obsoleto_sao_ignorados(ledgers):
+    data_service.save_stock_entry({"id": "E2", "product": "Limão", "qty": 1})
+    with open(_journal(ledgers["entries"]), "ab") as f:
+        f.write(b'{"at":"x","rows":[{"id":"meia')
+    ledger_journal_service._JOURNALS.clear()
+
+    assert [e["id"] for e in data_service.load_stock_entries()] == ["E1", "E2"]
+    data_service.save_stock_entry({"id": "E3", "product": "Limão", "qty": 1})
+    assert [e["id"] for e in data_service.load_stock_entries()] == ["E1", "E2", "E3"]
+    assert open(_journal(ledgers["entries"]), "rb").read().endswith(b"\n")
+
+    # snapshot regravado por fora: o diário antigo não se aplica mais
+    ledgers["entries"].write_text(json.dumps([{"id": "N1", "product": "Sal", "qty": 1}]), encoding="utf-8")
+    assert [e["id"] for e in data_service.load_stock_entries()] == ["N1"]
+    data_service.save_stock_entry({"id": "N2", "product": "Sal", "qty": 1})
+    assert [e["id"] for e in data_service.load_stock_entries()] == ["N1", "N2"]
+
+
+def test_historico_de_vendas_anexa_e_filtra_por_periodo(ledgers):
+    history = data_service.load_sales_history()
+    history.append({"id": "S2", "total": 10, "closed_at": "05/03/2026 20:15"})
+    assert data_service.secure_save_sales_history(history) is True
+    assert data_service.append_sales_history([{"id": "S3", "total": 5, "closed_at": "09/03/2026 10:00"}]) is True
+    assert [s["id"] for s in json.loads(ledgers["sales"].read_text(encoding="utf-8"))] == ["S1"]
+
+    window = data_service.iter_sales_history(datetime(2026, 3, 2), datetime(2026, 3, 9))
+    assert [s["id"] for s in window] == ["S2"]
+    assert [s["id"] for s in data_service.iter_sales_history(start=datetime(2026, 3, 5))] == ["S2", "S3"]
+
+    assert data_service.compact_ledgers()["ledger_sales.json"] is True
+    assert [s["id"] for s in json.loads(ledgers["sales"].read_text(encoding="utf-8"))] == ["S1", "S2", "S3"]
+
+
+def test_lista_sem_o_diario_nao_apaga_lancamentos_pendentes(ledgers):
+    # leitor que só enxerga o snapshot (como o antigo import_sales)
+    stale = json.loads(ledgers["entries"].read_text(encoding="utf-8"))
+    data_service.save_stock_entry({"id": "E2", "product": "Limão", "qty": 1})
+    stale.append({"id": "E3", "product": "Limão", "qty": 2})
+    assert data_service.save_stock_entries(stale) is True
+    assert [e["id"] for e in data_service.load_stock_entries()] == ["E1", "E3", "E2"]
+    assert ledger_journal_service._JOURNALS[os.path.abspath(str(ledgers["entries"]))].counters["carried_rows"] == 1
+
+    # estorno: o que foi lido pode ser removido; o que entrou depois da leitura fica
+    data_service.save_stock_entry({"id": "E4", "product": "Limão", "qty": 1})
+    kept = [e for e in data_service.load_stock_entries() if e["id"] != "E4"]
+    data_service.save_stock_entry({"id": "E5", "product": "Limão", "qty": 1})
+    assert data_service.save_stock_entries(kept) is True
+    assert [e["id"] for e in data_service.load_stock_entries()] == ["E1", "E3", "E2", "E5"]
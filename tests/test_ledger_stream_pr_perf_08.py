@@ -0,0 +1,102 @@
+import io
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.services import data_service
+from app.services import json_document_cache
+from app.services import ledger_journal_service
+from app.services import ledger_stream_service as stream
+from app.services import stock_service
+
+
+def _d(days_ago):
+    return (datetime.now() - timedelta(days=days_ago)).strftime("%d/%m/%Y")
+
+
+@pytest.fixture
+def ledgers(monkeypatch, tmp_path):
+    requests_file = tmp_path / "ledger_requests.json"
+    entries_file = tmp_path / "ledger_entries.json"
+    requests_file.write_text(json.dumps([
+        {"id": "R1", "date": _d(200), "items_structured": [{"name": "Limão", "qty": 90}]},
+        {"id": "R2", "date": _d(30), "items_structured": [{"name": "Limão", "qty": 30}]},
+        {"id": "R3", "date": "sem data", "items_structured": [{"name": "Limão", "qty": 500}]},
+        {"id": "R4", "date": _d(2), "items": "15x Limão, 3x Açúcar"},
+    ], ensure_ascii=False), encoding="utf-8")
+    entries_file.write_text(json.dumps([
+        {"id": "E1", "product": "Limão", "qty": -4, "date": _d(100)},
+        {"id": "E2", "product": "Limão", "qty": -6, "date": _d(10)},
+    ]), encoding="utf-8")
+
+    monkeypatch.setattr(data_service, "STOCK_FILE", str(requests_file))
+    monkeypatch.setattr(data_service, "STOCK_ENTRIES_FILE", str(entries_file))
+    monkeypatch.setattr(data_service, "_backup_before_write", lambda *_a, **_k: None)
+    monkeypatch.setattr(ledger_journal_service, "_JOURNALS", {})
+    monkeypatch.setattr(stream, "_INDEX", stream.LedgerStreamIndex())
+    monkeypatch.setattr(json_document_cache, "RACY_WINDOW_SECONDS", 0)
+    return {"requests": requests_file, "entries": entries_file}
+
+
+def test_parser_incremental_devolve_offsets_exatos():
+    rows = [{"id": 1, "nome": "Açaí ☕"}, 12345678901234, "texto", [1, 2], {"v": None}]
+    raw = ("\ufeff[ " + ",\n  ".join(json.dumps(r, ensure_ascii=False) for r in rows) + " ]").encode("utf-8")
+
+    parsed = list(stream.iter_json_array(io.BytesIO(raw), chunk_size=5))
+
+    assert [value for _o, _l, value in parsed] == rows
+    for offset, length, value in parsed:
+        assert json.loads(raw[offset:offset + length].decode("utf-8")) == value
+    with pytest.raises(stream.NotAJsonArray):
+        list(stream.iter_json_array(io.BytesIO(b'{"a": 1}')))
+
+
+def test_janela_de_datas_le_somente_linhas_relevantes(ledgers):
+    index = stream.get_ledger_stream_index()
+    window = list(data_service.iter_stock_requests(datetime.now() - timedelta(days=60)))
+
+    assert [r["id"] for r in window] == ["R2", "R4"]
+    assert index.counters["rows_read"] == 2
+    assert index.counters["sidecar_builds"] == 1
+    assert os.path.exists(stream.sidecar_path_for(str(ledgers["requests"])))
+
+    list(data_service.iter_stock_requests(datetime.now() - timedelta(days=7)))
+    assert index.counters["sidecar_hits"] == 1
+
+    # novo processo: o índice vem do arquivo lateral, sem reprocessar o JSON
+    fresh = stream.LedgerStreamIndex()
+    stream._INDEX = fresh
+    assert [r["id"] for r in data_service.iter_stock_requests(end=datetime.now() - timedelta(days=100))] == ["R1"]
+    assert fresh.counters["sidecar_loads"] == 1
+    assert fresh.counters["sidecar_builds"] == 0
+
+
+def test_arquivo_regravado_reconstroi_indice_e_inclui_diario(ledgers):
+    list(data_service.iter_stock_entries(datetime.now() - timedelta(days=60)))
+    data_service.save_stock_entry({"id": "E3", "product": "Limão", "qty": -1, "date": _d(1)})
+    data_service.save_stock_entry({"id": "E4", "product": "Limão", "qty": -1, "date": _d(300)})
+
+    assert [e["id"] for e in data_service.iter_stock_entries(datetime.now() - timedelta(days=60))] == ["E2", "E3"]
+    assert [e["id"] for e in data_service.iter_stock_entries()] == ["E1", "E2", "E3", "E4"]
+
+    data_service.load_stock_entries()  # regravação deliberada: quem grava leu o diário
+    data_service.save_stock_entries([{"id": "N1", "product": "Sal", "qty": -1, "date": _d(5)}])
+    assert [e["id"] for e in data_service.iter_stock_entries(datetime.now() - timedelta(days=60))] == ["N1"]
+    assert stream.get_ledger_stream_index().counters["sidecar_builds"] == 2
+
+
+def test_relatorios_de_estoque_minimo_usam_janela(ledgers, monkeypatch):
+    monkeypatch.setattr(stock_service, "load_products", lambda: [
+        {"id": "1", "name": "Limão", "min_stock": 0, "frequency": "Semanal"},
+    ])
+
+    suggested = stock_service.calculate_suggested_min_stock()
+    # 30 + 15 nos últimos 90 dias; R1 (200 dias) e R3 (sem data) ficam de fora
+    assert suggested[0]["avg_monthly"] == pytest.approx(15.0)
+
+    smart = stock_service.calculate_smart_stock_suggestions()
+    assert smart[0]["product"] == "Limão"
+    # 30 + 15 (requisições) + 6 (saída) em 60 dias
+    assert smart[0]["avg_monthly"] == pytest.approx(round(51 / 60 * 30, 2), abs=0.01)
@@ -0,0 +1,105 @@
+import threading
+
+import pytest
+from flask import Flask
+
+from app.models.database import db
+from app.models.models import LogAcaoDepartamento
+from app.services import log_writer_service
+from app.services.log_writer_service import BatchedLogWriter, enable_sqlite_wal
+from app.services.logger_service import LoggerService
+
+
+def test_writer_agrupa_linhas_em_lotes():
+    batches = []
+    writer = BatchedLogWriter(lambda app, rows: batches.append(len(rows)), batch_size=20, flush_interval_ms=50)
+
+    for idx in range(50):
+        assert writer.submit(None, {"acao": f"a{idx}"}) is True
+    assert writer.flush(timeout=5) is True
+
+    assert sum(batches) == 50
+    assert max(batches) <= 20
+    assert len(batches) < 50
+    stats = writer.stats()
+    assert stats["written"] == 50
+    assert stats["queue_depth"] == 0
+    assert stats["avg_flush_ms"] is not None
+
+
+def test_fila_cheia_descarta_info_e_grava_critico_na_hora():
+    release = threading.Event()
+    written = []
+
+    def slow_write(app, rows):
+        release.wait(5)
+        written.extend(row["acao"] for row in rows)
+
+    writer = BatchedLogWriter(slow_write, queue_max=1, batch_size=1, flush_interval_ms=10)
+    writer.submit(None, {"acao": "primeiro", "nivel_severidade": "INFO"})
+    # aguarda a thread pegar o primeiro item e travar na escrita
+    for _ in range(200):
+        if writer.stats()["queue_depth"] == 0:
+            break
+        threading.Event().wait(0.01)
+    writer.submit(None, {"acao": "na_fila", "nivel_severidade": "INFO"})
+
+    assert writer.submit(None, {"acao": "descartado", "nivel_severidade": "INFO"}) is False
+    release.set()
+    assert writer.submit(None, {"acao": "critico", "nivel_severidade": "CRITICAL"}) is True
+    assert writer.flush(timeout=5) is True
+
+    stats = writer.stats()
+    assert stats["dropped"] == 1
+    assert stats["inline_writes"] == 1
+    assert "descartado" not in written
+    assert sorted(written) == ["critico", "na_fila", "primeiro"]
+
+
+def test_falha_na_gravacao_em_lote_registra_traceback(capsys):
+    def broken_write(app, rows):
+        raise RuntimeError("banco travado")
+
+    writer = BatchedLogWriter(broken_write, batch_size=5, flush_interval_ms=10)
+    assert writer.submit(None, {"acao": "a"}) is True
+    assert writer.flush(timeout=5) is True
+
+    assert writer.stats()["failed"] == 1
+    err = capsys.readouterr()
+    assert "RuntimeError: banco travado" in err.out
+    assert "Traceback" in err.err
+
+
+@pytest.fixture
+def log_app(monkeypatch, tmp_path):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path / 'logs.db'}"
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+    with app.app_context():
+        LogAcaoDepartamento.__table__.create(db.engine)
+    monkeypatch.setattr(LoggerService, "_app", None)
+    monkeypatch.setattr(log_writer_service, "_WRITER", None)
+    monkeypatch.setenv("ALMAREIA_LOG_ASYNC", "1")
+    monkeypatch.setenv("ALMAREIA_LOG_FLUSH_INTERVAL_MS", "20")
+    LoggerService.init_app(app)
+    yield app
+    LoggerService.shutdown(timeout=5)
+
+
+def test_logger_service_grava_em_lote_com_wal(log_app):
+    with log_app.app_context():
+        assert enable_sqlite_wal(db.engine) is True
+
+    for idx in range(30):
+        assert LoggerService.log_acao(f"Order {idx}", "Order", {"idx": idx}, departamento_id="Restaurante", colaborador_id="ana")
+
+    with log_app.app_context():
+        page = LoggerService.get_logs(departamento_id="Restaurante", per_page=100)
+    assert page["total"] == 30
+    assert page["items"][0]["colaborador_id"] == "ana"
+
+    stats = LoggerService.pipeline_stats()
+    assert stats["async"] is True
+    assert stats["written"] == 30
+    assert stats["flushes"] < 30
@@ -0,0 +1,102 @@
+import json
+import os
+
+import pytest
+
+from app.blueprints.restaurant import routes as restaurant_routes
+from app.services import data_service
+from app.services import json_document_cache
+from app.services import menu_catalog_service as catalog_module
+from app.services.menu_catalog_service import MenuCatalog
+
+
+PRODUCTS = [
+    {"id": "1", "name": "Camarão", "unit": "kg", "price": 80.0},
+    {"id": "2", "name": "Arroz", "unit": "kg", "price": 6.0},
+    {"id": "3", "name": "Cerveja Lata", "unit": "un", "price": 4.0},
+    {"id": "4", "name": "Arroz", "unit": "kg", "price": 9.0},
+]
+MENU = [
+    {
+        "id": "10", "name": "Moqueca", "category": "Pratos", "printer_id": "cozinha",
+        "recipe": [
+            {"ingredient_id": "1", "qty": 0.3},
+            {"ingredient": "Arroz", "qty": "0.2"},
+            {"ingredient_id": "99", "qty": 1},
+            {"ingredient": "Inexistente", "qty": 1},
+            {"ingredient_id": "2", "qty": None},
+        ],
+    },
+    {"id": "11", "name": "Cerveja Lata", "category": "Bebidas", "printer_id": "no_print"},
+    {"id": "12", "name": "Arroz Extra", "category": "Acompanhamentos", "stock_product_id": "2", "should_print": False},
+    {"id": "13", "name": "Moqueca", "category": "Pratos"},
+]
+
+
+def test_indices_e_receita_expandida_equivalem_as_buscas_lineares():
+    catalog = MenuCatalog(MENU, PRODUCTS)
+
+    assert catalog.menu_item("11")["name"] == "Cerveja Lata"
+    # nome repetido: vale o primeiro, como nos next(...) antigos
+    assert catalog.menu_item(None, "Moqueca")["id"] == "10"
+    # fechamento, consumo interno e transferência usavam {nome: item}: vale o último
+    assert catalog.menu_item(None, "Moqueca", last_wins=True)["id"] == "13"
+    assert catalog.menu_item("10", "Moqueca", last_wins=True)["id"] == "10"
+    assert catalog.menu_item("404", "Cerveja Lata")["id"] == "11"
+    assert [m["id"] for m in catalog.by_category["Pratos"]] == ["10", "13"]
+
+    lines = catalog.recipe_lines(catalog.by_id["10"])
+    assert [(line.key, line.qty, line.insumo["price"]) for line in lines] == [
+        ("1", 0.3, 80.0),
+        ("2", 0.2, 6.0),
+        ("2", None, 6.0),
+    ]
+    assert catalog.recipe_lines(catalog.by_id["10"]) is lines
+    assert catalog.print_routes["Cerveja Lata"] == {"should_print": True, "printer_id": "no_print"}
+
+    for order_item in (
+        {"product_id": "12", "name": "Arroz Extra"},
+        {"product_id": "11", "name": "Cerveja Lata"},
+        {"product_id": "10", "name": "Moqueca"},
+        {"name": "Arroz"},
+        {"product_id": "999", "name": "Nada"},
+    ):
+        legacy = restaurant_routes.resolve_stock_product_for_order_item(order_item, MENU, PRODUCTS)
+        assert restaurant_routes.resolve_stock_product_for_order_item(order_item, catalog, catalog.products) is legacy
+
+
+@pytest.fixture
+def catalog_files(monkeypatch, tmp_path):
+    menu_file = tmp_path / "menu_items.json"
+    products_file = tmp_path / "products.json"
+    menu_file.write_text(json.dumps(MENU, ensure_ascii=False), encoding="utf-8")
+    products_file.write_text(json.dumps(PRODUCTS, ensure_ascii=False), encoding="utf-8")
+    monkeypatch.setattr(data_service, "get_data_path", lambda name: str(tmp_path / name))
+    monkeypatch.setattr(data_service, "MENU_ITEMS_FILE", str(menu_file))
+    monkeypatch.setattr(data_service, "PRODUCTS_FILE", str(products_file))
+    monkeypatch.setattr(catalog_module, "MENU_ITEMS_FILE", str(menu_file))
+    monkeypatch.setattr(catalog_module, "PRODUCTS_FILE", str(products_file))
+    monkeypatch.setattr(json_document_cache, "RACY_WINDOW_SECONDS", 0)
+    monkeypatch.setattr(catalog_module, "_CACHE", catalog_module._CatalogCache())
+    return menu_file
+
+
+def test_catalogo_reconstruido_somente_quando_arquivo_muda(catalog_files):
+    first = catalog_module.get_menu_catalog()
+    assert catalog_module.get_menu_catalog() is first
+    assert catalog_module.menu_catalog_stats()["builds"] == 1
+
+    menu = json.loads(catalog_files.read_text(encoding="utf-8"))
+    menu.append({"id": "20", "name": "Caipirinha", "category": "Bebidas"})
+    catalog_files.write_text(json.dumps(menu, ensure_ascii=False), encoding="utf-8")
+    os.utime(catalog_files, ns=(1, 1))
+
+    second = catalog_module.get_menu_catalog()
+    assert second is not first
+    assert second.menu_item("20")["name"] == "Caipirinha"
+    assert catalog_module.menu_catalog_stats()["builds"] == 2
+
+    # carregadores substituídos (ex.: testes, prévias) não usam o cache
+    custom = catalog_module.get_menu_catalog(lambda: [{"id": "1", "name": "X"}], lambda: [])
+    assert custom.menu_item("1")["name"] == "X"
+    assert catalog_module.get_menu_catalog() is second
@@ -0,0 +1,108 @@
+import json
+import os
+
+import pytest
+
+from app.services import json_document_cache
+from app.services import stock_nfe_repository_service as repo
+from app.services.nfe_repository_index import NfeRepositoryIndex, NoteKeyIndex
+
+
+def _linear_find(notes, nsu, chave):
+    for note in notes:
+        if str(note.get("chave_nfe") or "") and chave and str(note.get("chave_nfe") or "") == chave:
+            return note
+        if str(note.get("nsu") or "") and nsu and str(note.get("nsu") or "") == nsu:
+            return note
+    return None
+
+
+def test_indice_de_notas_equivale_a_busca_linear():
+    notes = [
+        {"nsu": "1", "chave_nfe": "K1"},
+        {"nsu": "2", "chave_nfe": ""},
+        {"nsu": "", "chave_nfe": "K3"},
+        {"nsu": "2", "chave_nfe": "K4"},
+        {"nsu": "5", "chave_nfe": "K1"},
+    ]
+    index = NoteKeyIndex(list(notes))
+    for nsu in ("", "1", "2", "5", "9"):
+        for chave in ("", "K1", "K3", "K4", "K9"):
+            assert index.find(nsu, chave) is _linear_find(notes, nsu, chave)
+    index.add({"nsu": "9", "chave_nfe": "K9"})
+    assert index.find("9", "") is index.notes[-1]
+
+
+def test_historico_de_fornecedor_e_vinculos_de_itens():
+    data = {
+        "notes": [
+            {"chave_nfe": "A", "supplier_id": "s-nome-1", "cnpj_emitente": "", "nome_emitente": "Padaria Sol"},
+            {"chave_nfe": "B", "supplier_id": "s-cnpj", "cnpj_emitente": "12.345.678/0001-99", "nome_emitente": "Outro"},
+            {"chave_nfe": "C", "supplier_id": "s-cnpj-2", "cnpj_emitente": "12345678000199", "nome_emitente": ""},
+            {"chave_nfe": "D", "supplier_id": "s-nome-2", "cnpj_emitente": "", "nome_emitente": " padaria sol "},
+            {"chave_nfe": "E", "supplier_id": "  ", "cnpj_emitente": "99", "nome_emitente": "Sem vinculo"},
+        ],
+        "item_bindings": [
+            {"supplier_id": "s1", "product_id": "p1", "supplier_product_code": "A1", "supplier_product_name": "ARROZ TIPO 1", "last_used_at": "2026-01-01"},
+            {"supplier_id": "s1", "product_id": "p2", "supplier_product_code": "a1", "supplier_product_name": "Arroz", "last_used_at": "2026-02-01"},
+            {"supplier_id": "s2", "product_id": "p3", "supplier_product_code": "A1", "supplier_product_name": "FEIJAO", "last_used_at": "2026-03-01"},
+        ],
+    }
+    index = NfeRepositoryIndex(data)
+    assert index.history_supplier("12345678000199", "padaria sol") == "s-cnpj"
+    assert index.history_supplier("", "padaria sol") == "s-nome-2"
+    assert index.history_supplier("99", "sem vinculo") is None
+    # mais recente primeiro, como o antigo sort por last_used_at
+    assert index.binding_by_code("s1", "a1")["product_id"] == "p2"
+    assert index.binding_by_name("s1", "arroz tipo 1")["product_id"] == "p1"
+    assert index.binding_containing_name("s1", "tipo")["product_id"] == "p1"
+    assert [row["product_id"] for row in index.bindings(limit=10)] == ["p3", "p2", "p1"]
+    copy = index.binding_by_code("s2", "a1")
+    copy["product_id"] = "alterado"
+    assert index.binding_by_code("s2", "a1")["product_id"] == "p3"
+
+
+@pytest.fixture
+def repo_file(monkeypatch, tmp_path):
+    path = tmp_path / "nfe_repo.json"
+    monkeypatch.setattr(repo, "NFE_REPOSITORY_FILE", str(path))
+    monkeypatch.setattr(json_document_cache, "RACY_WINDOW_SECONDS", 0)
+    monkeypatch.setattr(repo, "_REPOSITORY_INDEX", None)
+    monkeypatch.setattr(repo, "_REPOSITORY_INDEX_STATS", {"builds": 0, "hits": 0})
+    return path
+
+
+def _doc(nsu, key):
+    return {
+        "nsu": nsu,
+        "access_key": key,
+        "issued_at": "2026-01-15T09:00:00",
+        "emitente": {"nome": "Fornecedor Teste", "cpf_cnpj": "12345678000199"},
+        "xml_content": "<NFe></NFe>",
+    }
+
+
+def test_conferencia_de_nota_grande_carrega_o_repositorio_uma_vez(repo_file):
+    result = repo.ingest_documents(
+        documents=[_doc("1", "K1"), _doc("2", "K2"), _doc("2", "K9"), _doc("3", "K1")],
+        source_method="lastNSU",
+        correlation_id="c1",
+    )
+    assert (result["new"], result["duplicates"]) == (2, 2)
+    data = json.loads(repo_file.read_text(encoding="utf-8"))
+    data["item_bindings"] = [
+        {"supplier_id": "s1", "product_id": f"p{i}", "supplier_product_code": f"C{i}", "supplier_product_name": f"Item {i}", "unidade_estoque": "UN", "fator_conversao": 1.0, "last_used_at": "2026-01-01"}
+        for i in range(60)
+    ]
+    repo_file.write_text(json.dumps(data), encoding="utf-8")
+    # sai da janela de escrita para que o índice possa ser reaproveitado
+    os.utime(repo_file, ns=(0, 0))
+
+    parsed_items = [{"code": f"c{i}", "name": f"Item {i}", "unit": "UN"} for i in range(60)]
+    assist = repo.analyze_note_conference_assist(note={"supplier_id": "s1"}, parsed_items=parsed_items, supplier_id="s1")
+    assert assist["summary"]["items_linked"] == 60
+    assert all(row["suggestion"]["source"] == "supplier_product_code" for row in assist["items"])
+    assert repo.get_note_by_access_key("K2")["nsu"] == "2"
+    assert repo.get_note_by_access_key("K9") is None
+    stats = repo.repository_index_stats()
+    assert stats["builds"] == 1 and stats["hits"] == 2
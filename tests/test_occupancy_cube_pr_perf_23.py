@@ -0,0 +1,108 @@
+from datetime import date, timedelta
+
+import pytest
+
+from app.services import occupancy_cube_service
+from app.services.reservation_service import ReservationService
+from app.services.reservation_source_store import ReservationIndex
+from app.services.revenue_management_service import RevenueManagementService
+
+TODAY = date.today()
+
+
+def _day(offset):
+    return (TODAY + timedelta(days=offset)).isoformat()
+
+
+def _reservations():
+    return [
+        {"id": "A", "category": "Suíte Mar", "status": "Confirmada", "checkin": _day(-14), "checkout": _day(-12),
+         "created_at": _day(-20), "channel": "Direto", "amount": 600.0},
+        {"id": "B", "category": "Suíte Mar", "status": "Cancelada", "checkin": _day(-14), "checkout": _day(-13),
+         "created_at": _day(-15), "amount": 300.0},
+        {"id": "C", "category": "Suíte Areia", "status": "Confirmada", "checkin": _day(-7), "checkout": _day(-6),
+         "created_at": _day(-8), "channel": "Booking.com", "amount": 300.0},
+        {"id": "D", "category": "Suíte Mar", "status": "Confirmada", "checkin": _day(7), "checkout": _day(9),
+         "created_at": _day(0), "channel": "Booking.com", "amount": 800.0},
+    ]
+
+
+def _index():
+    svc = ReservationService()
+    return ReservationIndex(_reservations(), svc._parse_date, svc._collision_room)
+
+
+@pytest.fixture
+def cube(monkeypatch):
+    state = {"index": _index(), "seasons": {str(m): "alta" for m in range(1, 13)}}
+    monkeypatch.setattr(occupancy_cube_service, "_CUBE", occupancy_cube_service.OccupancyCube())
+    monkeypatch.setattr(ReservationService, "_reservation_index", lambda self: state["index"])
+    monkeypatch.setattr(ReservationService, "get_room_mapping", lambda self: {"Suíte Mar": ["11", "12"], "Suíte Areia": ["01", "02"]})
+    advanced = RevenueManagementService._load_advanced_config()
+    monkeypatch.setattr(RevenueManagementService, "_load_advanced_config",
+                        classmethod(lambda cls: dict(advanced, season_by_month=state["seasons"])))
+    monkeypatch.setattr(RevenueManagementService, "_events_index", classmethod(lambda cls: {}))
+    monkeypatch.setattr(RevenueManagementService, "_current_tariff_index", classmethod(lambda cls: {}))
+    return state
+
+
+def _row(payload, day_iso, category="mar"):
+    return next(row for row in payload["rows"] if row["date"] == day_iso and row.get("category", category) == category)
+
+
+def test_previsao_e_pickup_leem_o_cubo(cube):
+    forecast = RevenueManagementService.occupancy_forecast(_day(7), days=3)
+    assert forecast["lead_time_avg_days"] == 3.75
+    assert forecast["cancel_rate_avg"] == 0.25
+    row = _row(forecast, _day(7))
+    # noites passadas do mesmo dia da semana: D-14 (Mar) e D-7 (Areia)
+    assert row["historical_avg_pct"] == 25.0
+    assert row["occupancy_current_pct"] == 50.0
+
+    only_mar = RevenueManagementService.occupancy_forecast(_day(7), days=1, category="mar")
+    assert _row(only_mar, _day(7))["historical_avg_pct"] == 50.0
+    assert only_mar["lead_time_avg_days"] == pytest.approx(14 / 3, abs=0.01)
+
+    curve = RevenueManagementService.reservation_curve(_day(7), days=1, category="mar")
+    assert _row(curve, _day(7))["curve_3d_pct"] == 100.0
+
+    pickup = RevenueManagementService.pickup_analysis(_day(7), days=2)
+    assert (_row(pickup, _day(7))["pickup_3d"], _row(pickup, _day(7))["pickup_7d"]) == (0, 1)
+    assert (_row(pickup, _day(8))["pickup_7d"], _row(pickup, _day(8))["pickup_14d"]) == (0, 1)
+
+    projection = RevenueManagementService.simulate_projection(_day(7), days=1)
+    assert _row(projection, _day(7))["occupied_rooms"] == 1
+    assert _row(projection, _day(7))["projected_adr"] == 400.0
+
+    stats = occupancy_cube_service.occupancy_cube_stats()
+    assert stats["builds"] == 1 and stats["reservations"] == 4
+
+    # estação alterada nas configurações avançadas: agregados refeitos
+    builds = stats["aggregate_builds"]
+    cube["seasons"] = dict(cube["seasons"], **{str((TODAY + timedelta(days=7)).month): "baixa"})
+    RevenueManagementService.occupancy_forecast(_day(7), days=1)
+    assert occupancy_cube_service.occupancy_cube_stats()["aggregate_builds"] == builds + 1
+
+
+def test_upsert_no_indice_atualiza_cubo_sem_reconstruir(cube):
+    RevenueManagementService.occupancy_forecast(_day(7), days=3)
+    cube["index"].upsert(dict(_reservations()[3], status="Cancelada"))
+    cube["index"].upsert({"id": "E", "category": "Suíte Areia", "status": "Confirmada", "checkin": _day(8),
+                          "checkout": _day(9), "created_at": _day(6), "amount": 200.0})
+
+    incremental = RevenueManagementService.occupancy_forecast(_day(7), days=3)
+    pickup = RevenueManagementService.pickup_analysis(_day(7), days=3)
+    projection = RevenueManagementService.simulate_projection(_day(7), days=3)
+    stats = occupancy_cube_service.occupancy_cube_stats()
+    assert (stats["builds"], stats["incremental_updates"]) == (1, 1)
+    assert _row(incremental, _day(7))["occupancy_current_pct"] == 0.0
+    assert _row(incremental, _day(8), "areia")["occupancy_current_pct"] == 50.0
+    assert incremental["cancel_rate_avg"] == 0.4
+
+    # mesmo resultado de um cubo montado do zero sobre o índice alterado
+    rebuilt_index = ReservationIndex(cube["index"].reservations(), ReservationService()._parse_date, ReservationService()._collision_room)
+    cube["index"] = rebuilt_index
+    assert RevenueManagementService.occupancy_forecast(_day(7), days=3) == incremental
+    assert RevenueManagementService.pickup_analysis(_day(7), days=3) == pickup
+    assert RevenueManagementService.simulate_projection(_day(7), days=3) == projection
+    assert occupancy_cube_service.occupancy_cube_stats()["builds"] == 2
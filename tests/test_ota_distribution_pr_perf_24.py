@@ -0,0 +1,125 @@
+import http.server
+import json
+import threading
+from datetime import date, timedelta
+
+import pytest
+
+from app.services import ota_booking_rm_service, ota_distribution_engine
+from app.services.booking_connectivity_auth_service import BookingConnectivityAuthService
+from app.services.logger_service import LoggerService
+from app.services.ota_booking_rm_service import OTABookingRMService
+from app.services.ota_distribution_engine import coalesce_ranges
+
+
+@pytest.fixture
+def booking(monkeypatch, tmp_path):
+    stub = {"calls": [], "status": 200}
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            stub["calls"].append((self.path, len(body), json.loads(body)))
+            self.send_response(stub["status"])
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    for name in ("OTA_BOOKING_PENDING_RATES_FILE", "OTA_BOOKING_DISTRIBUTION_LOGS_FILE",
+                 "OTA_BOOKING_ERROR_LOGS_FILE", "OTA_BOOKING_DISTRIBUTION_STATE_FILE"):
+        monkeypatch.setattr(ota_booking_rm_service, name, str(tmp_path / f"{name.lower()}.json"))
+    monkeypatch.setattr(ota_distribution_engine, "_ENGINE", ota_distribution_engine.DistributionEngine())
+    monkeypatch.setenv("ALMAREIA_OTA_BATCH_RANGES", "3")
+    monkeypatch.setattr(OTABookingRMService, "_integration_base_url",
+                        classmethod(lambda cls, integration_id: f"http://127.0.0.1:{server.server_address[1]}"))
+    monkeypatch.setattr(BookingConnectivityAuthService, "get_access_token",
+                        classmethod(lambda cls, **kwargs: {"success": True, "access_token": "token"}))
+    monkeypatch.setattr(LoggerService, "log_acao", staticmethod(lambda **kwargs: None))
+    yield stub
+    server.shutdown()
+
+
+def _queue(rates):
+    """rates: {(room type, day offset): tarifa}; uma pendência por dia, como queue_rate_distribution."""
+    pending = []
+    for (room_type, offset), tariff in sorted(rates.items()):
+        pending.append({
+            "id": f"{room_type}-{offset}-{tariff}", "integration_id": "bk", "status": "pendente", "attempts": 0,
+            "payload": {"category": "mar", "room_type_id_booking": room_type, "rate_plan_id_booking": "RP",
+                        "date": (date.today() + timedelta(days=offset)).strftime("%d/%m/%Y"),
+                        "tarifa_ota_final": tariff, "tarifa_direta": 400.0, "comissao_percentual": 15.0,
+                        "liquido_estimado_hotel": tariff * 0.85},
+        })
+    with open(ota_booking_rm_service.OTA_BOOKING_PENDING_RATES_FILE, "w") as f:
+        json.dump(pending, f)
+
+
+def _statuses():
+    return [item["status"] for item in OTABookingRMService.list_pending_rate_distributions()]
+
+
+def test_coalesce_junta_dias_consecutivos_com_mesmo_valor():
+    cells = {("RT", "RP"): {"2026-03-01": (1,), "2026-03-02": (1,), "2026-03-03": (2,), "2026-03-05": (2,)}}
+    assert coalesce_ranges(cells) == [
+        (("RT", "RP"), "2026-03-01", "2026-03-02", (1,)),
+        (("RT", "RP"), "2026-03-03", "2026-03-03", (2,)),
+        (("RT", "RP"), "2026-03-05", "2026-03-05", (2,)),
+    ]
+
+
+def test_fila_envia_faixas_em_lotes_e_so_o_que_mudou(booking):
+    rates = {(room, offset): (500.0 if offset < 6 else 550.0) for room in ("RT1", "RT2") for offset in range(10)}
+    _queue(rates)
+    result = OTABookingRMService.process_pending_rate_distributions(integration_id="bk", user="ana")
+    # 20 dias viram 4 faixas, em 2 chamadas de até 3 faixas
+    assert (result["processed"], result["sent"], result["calls"], result["ranges"]) == (20, 20, 2, 4)
+    # os lotes saem em paralelo: a ordem de chegada varia
+    assert sorted(len(call[2]["rates"]) for call in booking["calls"]) == [1, 3]
+    first = max(booking["calls"], key=lambda call: len(call[2]["rates"]))[2]["rates"][0]
+    assert (first["room_type_id_booking"], first["end_date"]) == ("RT1", (date.today() + timedelta(days=5)).isoformat())
+    assert result["payload_bytes"] == sum(call[1] for call in booking["calls"])
+    assert set(_statuses()) == {"enviado"}
+
+    # mesmos valores de novo, com um único dia alterado: só ele sai
+    rates[("RT2", 3)] = 610.0
+    _queue(rates)
+    result = OTABookingRMService.process_pending_rate_distributions(integration_id="bk", user="ana")
+    assert (result["sent"], result["unchanged"], result["calls"]) == (1, 19, 1)
+    assert [(r["room_type_id_booking"], r["start_date"], r["tarifa_ota_final"]) for r in booking["calls"][-1][2]["rates"]] == [
+        ("RT2", (date.today() + timedelta(days=3)).isoformat(), 610.0)]
+
+    logs = OTABookingRMService.list_distribution_logs()
+    assert len(logs) == 3 and all(log["success"] for log in logs)
+    # lote 1: RT1 (6 + 4 dias) e RT2 (6); lote 2: RT2 (4); depois o dia alterado
+    assert sorted(len(log["queue_ids"]) for log in logs) == [1, 4, 16]
+
+
+def test_falha_nao_avanca_estado_e_reprocessamento_reenvia(booking):
+    _queue({("RT1", offset): 500.0 for offset in range(3)})
+    booking["status"] = 503
+    result = OTABookingRMService.process_pending_rate_distributions(integration_id="bk", user="ana")
+    assert (result["failed"], result["sent"]) == (3, 0)
+    assert set(_statuses()) == {"erro"}
+    assert len(OTABookingRMService.list_error_logs()) == 1
+
+    booking["status"] = 200
+    OTABookingRMService.reprocess_failed_rate_distributions(queue_ids=None, user="ana")
+    result = OTABookingRMService.process_pending_rate_distributions(integration_id="bk", user="ana")
+    assert (result["sent"], result["calls"]) == (3, 1)
+    assert booking["calls"][-1][2]["rates"][0]["end_date"] == (date.today() + timedelta(days=2)).isoformat()
+
+    # disponibilidade: reenvio idêntico não chama a Booking, a menos que forçado
+    payload = {"category": "mar", "rooms_available": 4, "start_date": date.today().isoformat(),
+               "end_date": (date.today() + timedelta(days=6)).isoformat()}
+    calls = len(booking["calls"])
+    sent = OTABookingRMService.send_availability(integration_id="bk", payload=payload, user="ana")
+    assert sent["success"] and sent["calls"] == 1 and len(booking["calls"][-1][2]["availability"]) == 1
+    again = OTABookingRMService.send_availability(integration_id="bk", payload=payload, user="ana")
+    assert again["status"] == "sem_alteracao" and len(booking["calls"]) == calls + 1
+    forced = OTABookingRMService.send_availability(integration_id="bk", payload=payload, user="ana", force=True)
+    assert forced["calls"] == 1 and len(booking["calls"]) == calls + 2
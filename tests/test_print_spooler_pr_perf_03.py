@@ -0,0 +1,159 @@
+import base64
+import json
+import time
+from contextlib import contextmanager
+
+import pytest
+
+from app.blueprints.restaurant import routes as restaurant_routes
+from app.services import printing_service
+from app.services.print_spooler_service import PrintSpooler, StandInPrinter
+
+
+def _network_transport(job, payload):
+    device = job["device"]
+    return printing_service.send_to_printer(device["ip"], device["port"], payload, retries=1)
+
+
+@pytest.fixture
+def production_print(monkeypatch):
+    monkeypatch.setenv("ALMAREIA_ENV", "production")
+    monkeypatch.setenv("ALMAREIA_DEV_PRINT_MODE", "0")
+
+
+@pytest.fixture
+def stand_in():
+    printer = StandInPrinter().start()
+    yield printer
+    printer.stop()
+
+
+def _wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return predicate()
+
+
+def test_impressora_offline_nao_segura_fila_das_demais(production_print, stand_in, tmp_path):
+    spooler = PrintSpooler(transport=_network_transport, spool_dir=str(tmp_path), backoff=(0.5,))
+    offline = {"id": "bar", "name": "Bar", "type": "network", "ip": "127.0.0.1", "port": StandInPrinter.unused_port()}
+
+    offline_job = spooler.submit(offline, b"bar ticket", max_attempts=5)
+    started = time.monotonic()
+    kitchen_job = spooler.submit(stand_in.config, b"kitchen ticket")
+    result = spooler.wait_for([kitchen_job], timeout=2.0)
+
+    assert result[kitchen_job]["status"] == "done"
+    assert time.monotonic() - started < 1.0
+    assert _wait_until(lambda: stand_in.received == [b"kitchen ticket"])
+    assert spooler.get_job(offline_job)["status"] in ("queued", "printing")
+
+
+def test_job_persistido_e_recuperado_apos_reinicio(production_print, stand_in, tmp_path):
+    record = {
+        "id": "job-restart",
+        "device_key": f"net:{stand_in.host}:{stand_in.port}",
+        "device": {"type": "network", "ip": stand_in.host, "port": stand_in.port, "windows_name": None},
+        "printer_id": "k1",
+        "printer_name": "Cozinha",
+        "status": "printing",
+        "attempts": 1,
+        "max_attempts": 3,
+        "last_error": None,
+        "context": {"print_type": "kitchen_order", "table_id": "12"},
+        "item_ids": ["i1"],
+        "created_at": "2026-01-01T00:00:00",
+        "created_ts": time.time(),
+        "finished_at": None,
+        "payload_b64": base64.b64encode(b"reprint me").decode("ascii"),
+    }
+    stale = dict(record, id="job-stale", created_ts=time.time() - 3600)
+    (tmp_path / "job-restart.json").write_text(json.dumps(record), encoding="utf-8")
+    (tmp_path / "job-stale.json").write_text(json.dumps(stale), encoding="utf-8")
+
+    seen = []
+    spooler = PrintSpooler(transport=_network_transport, spool_dir=str(tmp_path))
+    spooler.add_listener(seen.append)
+    assert spooler.recover() == 1
+
+    assert _wait_until(lambda: spooler.get_job("job-restart")["status"] == "done")
+    assert _wait_until(lambda: stand_in.received == [b"reprint me"])
+    on_disk = json.loads((tmp_path / "job-restart.json").read_text(encoding="utf-8"))
+    assert on_disk["status"] == "done"
+    assert on_disk["payload_b64"] is None
+    assert json.loads((tmp_path / "job-stale.json").read_text(encoding="utf-8"))["status"] == "expired"
+    assert _wait_until(lambda: [job["id"] for job in seen] == ["job-restart"])
+
+
+def test_print_order_items_devolve_job_id_imediato(production_print, stand_in, monkeypatch, tmp_path):
+    spooler = PrintSpooler(transport=printing_service._spool_transport, spool_dir=str(tmp_path))
+    monkeypatch.setattr(printing_service, "_spooler", spooler)
+    stand_in.delay = 0.3
+    printer = dict(stand_in.config, id="2", name="Cozinha")
+    items = [{"id": "it1", "name": "Moqueca", "qty": 1}]
+    products_db = [{"name": "Moqueca", "printer_id": "2"}]
+
+    result = printing_service.print_order_items("7", "ana", items, [printer], products_db, wait_timeout=0)
+
+    job_id = result["jobs"]["Cozinha"]
+    assert result["pending_ids"] == ["it1"]
+    assert result["printed_ids"] == []
+    assert result["results"]["Cozinha"] == f"Queued: {job_id}"
+    assert _wait_until(lambda: printing_service.get_print_job(job_id)["status"] == "done")
+    assert _wait_until(lambda: stand_in.jobs_received() == 1)
+
+
+def test_job_finalizado_sai_da_memoria_e_continua_consultavel(production_print, stand_in, tmp_path):
+    seen = []
+    spooler = PrintSpooler(transport=_network_transport, spool_dir=str(tmp_path))
+    spooler.add_listener(seen.append)
+    job_id = spooler.submit(stand_in.config, b"ticket")
+
+    assert _wait_until(lambda: spooler.status()["jobs_in_memory"] == 0)
+    assert [job["status"] for job in seen] == ["done"]
+    assert spooler.get_job(job_id)["status"] == "done"
+    assert spooler.wait_for([job_id], timeout=0)[job_id]["status"] == "done"
+
+
+def test_itens_de_job_concluido_apos_a_espera_sao_marcados_impressos(monkeypatch):
+    jobs = {
+        "j1": {"status": "done", "item_ids": ["a", "b"]},
+        "j2": {"status": "printing", "item_ids": ["c"]},
+        "j3": {"status": "failed", "item_ids": ["d"]},
+    }
+    monkeypatch.setattr(restaurant_routes, "get_print_job", jobs.get)
+    print_res = {"pending_ids": ["a", "b", "c", "d"], "jobs": {"Cozinha": "j1", "Bar": "j2", "Copa": "j3"}}
+
+    pending, printed = restaurant_routes._pending_print_jobs_by_item(print_res)
+
+    assert pending == {"c": "j2"}
+    assert printed == {"a", "b"}
+
+
+def test_listener_do_spooler_grava_a_mesa_sob_o_lock_dela(monkeypatch):
+    held = []
+    orders = {"7": {"items": [{"id": "a", "print_job_id": "j1", "print_status": "queued"}]}}
+
+    @contextmanager
+    def _lock(path):
+        held.append(path)
+        yield
+        held.remove(path)
+
+    def _save(data):
+        assert held == [restaurant_routes.table_order_lock_path("7")]
+        orders.update(data)
+
+    monkeypatch.setattr(restaurant_routes, "file_lock", _lock)
+    monkeypatch.setattr(restaurant_routes, "load_table_orders", lambda: json.loads(json.dumps(orders)))
+    monkeypatch.setattr(restaurant_routes, "save_table_orders", _save)
+
+    restaurant_routes._settle_spooled_order_print(
+        {"id": "j1", "status": "done", "item_ids": ["a"], "context": {"print_type": "kitchen_order", "table_id": 7}}
+    )
+
+    assert orders["7"]["items"][0]["print_status"] == "printed"
+    assert held == []
@@ -0,0 +1,91 @@
+import json
+import time
+
+import pytest
+from flask import Flask
+
+from app.services import data_service
+from app.services import request_metrics_service as metrics_module
+from app.services.request_metrics_service import LatencyHistogram
+from app.utils.lock import file_lock
+
+
+def test_histograma_estima_percentis():
+    hist = LatencyHistogram()
+    for ms in range(1, 101):
+        hist.add(float(ms))
+
+    summary = hist.summary()
+    assert summary["count"] == 100
+    assert summary["max_ms"] == 100.0
+    assert 50 <= summary["p50_ms"] <= 50 * 1.25
+    assert 95 <= summary["p95_ms"] <= 100
+    assert summary["p99_ms"] <= 100
+    assert LatencyHistogram().percentile(0.5) is None
+
+
+@pytest.fixture
+def metrics_app(monkeypatch, tmp_path):
+    monkeypatch.setattr(metrics_module, "_METRICS", metrics_module.RequestMetrics())
+    monkeypatch.setattr(metrics_module, "_PROFILER", metrics_module.RequestProfiler())
+    doc = tmp_path / "doc.json"
+    doc.write_text(json.dumps({"ok": True}), encoding="utf-8")
+
+    app = Flask(__name__)
+    metrics_module.init_app(app, profile_dir=str(tmp_path / "profiles"))
+
+    @app.route("/reserva/<rid>")
+    def reserva(rid):
+        with file_lock(str(tmp_path / "doc.json")):
+            data = data_service._load_json(str(doc), {})
+        data_service._save_json(str(tmp_path / "out.json"), {"rid": rid})
+        return data
+
+    @app.route("/lento")
+    def lento():
+        time.sleep(0.03)
+        return "ok"
+
+    @app.route("/erro")
+    def erro():
+        return "falhou", 500
+
+    return app
+
+
+def test_latencia_e_secoes_por_endpoint(metrics_app):
+    client = metrics_app.test_client()
+    for rid in ("a", "b", "c"):
+        assert client.get(f"/reserva/{rid}").status_code == 200
+    client.get("/erro")
+    client.get("/inexistente")
+
+    snapshot = metrics_module.get_request_metrics().snapshot()
+    by_endpoint = {e["endpoint"]: e for e in snapshot["endpoints"]}
+
+    reserva = by_endpoint["GET /reserva/<rid>"]
+    assert reserva["count"] == 3
+    assert reserva["p50_ms"] is not None and reserva["p99_ms"] >= reserva["p50_ms"]
+    assert set(reserva["sections_avg_ms"]) == {"json_load", "json_save", "file_lock_wait"}
+    assert by_endpoint["GET /erro"]["errors"] == 1
+    assert by_endpoint["GET <unmatched>"]["count"] == 1
+    assert snapshot["sections"]["json_save"]["count"] == 3
+    assert snapshot["sections"]["json_load"]["count"] == 3
+
+
+def test_profiler_amostral_grava_pilhas_dobradas(metrics_app, monkeypatch, tmp_path):
+    monkeypatch.setenv("ALMAREIA_PROFILE_EVERY_N", "2")
+    monkeypatch.setenv("ALMAREIA_PROFILE_INTERVAL_MS", "1")
+    client = metrics_app.test_client()
+    client.get("/lento")
+    assert metrics_module.get_request_profiler().written == []
+    client.get("/lento")
+
+    written = metrics_module.get_request_profiler().written
+    assert len(written) == 1
+    assert written[0].startswith(str(tmp_path / "profiles"))
+    lines = open(written[0], encoding="utf-8").read().splitlines()
+    assert lines
+    stack, count = lines[0].rsplit(" ", 1)
+    assert int(count) >= 1
+    assert any("lento" in line for line in lines)
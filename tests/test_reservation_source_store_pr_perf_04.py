@@ -0,0 +1,142 @@
+import json
+import os
+import threading
+from datetime import date, datetime
+
+import pytest
+
+from app.services import json_document_cache
+from app.services import reservation_source_store as store_module
+from app.services.reservation_service import ReservationService
+
+
+def _row(rid, guest, checkin, checkout, source_file):
+    return {
+        "id": rid,
+        "guest_name": guest,
+        "checkin": checkin,
+        "checkout": checkout,
+        "category": "Suíte Mar",
+        "status": "Confirmada",
+        "channel": "Booking.com",
+        "amount": "1000,00",
+        "paid_amount": "0,00",
+        "to_receive": "1000,00",
+        "amount_val": 1000.0,
+        "paid_amount_val": 0.0,
+        "to_receive_val": 1000.0,
+        "source_file": source_file,
+    }
+
+
+SHEETS = {
+    "minhas_reservas.xlsx": [
+        _row("X1", "Maria", "10/03/2026", "12/03/2026", "minhas_reservas.xlsx"),
+        _row("X2", "João", "11/03/2026", "15/03/2026", "minhas_reservas.xlsx"),
+    ],
+    "extra.xlsx": [
+        _row("X3", "Ana", "20/03/2026", "22/03/2026", "extra.xlsx"),
+    ],
+}
+
+
+@pytest.fixture
+def service(monkeypatch, tmp_path):
+    monkeypatch.setattr(json_document_cache, "RACY_WINDOW_SECONDS", 0)
+    monkeypatch.setattr(store_module, "_STORES", {})
+    for name in SHEETS:
+        (tmp_path / name).write_bytes(name.encode("utf-8"))
+    (tmp_path / "manual_allocations.json").write_text(json.dumps({"X1": {"room": "12"}, "X2": {"room": "14"}}), encoding="utf-8")
+
+    svc = ReservationService()
+    svc.RESERVATIONS_DIR = str(tmp_path)
+    svc.RESERVATIONS_FILE = str(tmp_path / "minhas_reservas.xlsx")
+    svc.MANUAL_RESERVATIONS_FILE = str(tmp_path / "manual_reservations.json")
+    svc.MANUAL_ALLOCATIONS_FILE = str(tmp_path / "manual_allocations.json")
+    svc.RESERVATION_STATUS_OVERRIDES_FILE = str(tmp_path / "reservation_status_overrides.json")
+    svc.RESERVATION_PAYMENTS_FILE = str(tmp_path / "reservation_payments.json")
+
+    svc.parsed = []
+
+    def fake_parse(file_path):
+        svc.parsed.append(os.path.basename(file_path))
+        return [dict(row) for row in SHEETS[os.path.basename(file_path)]]
+
+    svc._parse_excel_file = fake_parse
+    return svc
+
+
+def test_planilhas_sao_lidas_uma_unica_vez(service):
+    first = service.get_february_reservations()
+    assert [r["id"] for r in first] == ["X1", "X2", "X3"]
+    first[0]["guest_name"] = "alterado"
+
+    assert service.get_reservation_by_id("X3")["guest_name"] == "Ana"
+    assert service.search_reservations("maria")[0]["id"] == "X1"
+    assert service.get_february_reservations()[0]["guest_name"] == "Maria"
+    assert sorted(service.parsed) == ["extra.xlsx", "minhas_reservas.xlsx"]
+
+
+def test_cache_persistido_evita_reabrir_planilhas(service, tmp_path):
+    service.get_february_reservations()
+    assert os.path.exists(tmp_path / store_module.CACHE_FILENAME)
+
+    store_module._STORES.clear()
+    service.parsed.clear()
+    assert service.get_reservation_by_id("X2")["guest_name"] == "João"
+    assert service.parsed == []
+
+
+def test_planilha_alterada_e_reprocessada_sozinha(service, tmp_path, monkeypatch):
+    service.get_february_reservations()
+    service.parsed.clear()
+
+    (tmp_path / "extra.xlsx").write_bytes(b"nova versao")
+    monkeypatch.setitem(SHEETS, "extra.xlsx", [_row("X4", "Pedro", "01/04/2026", "03/04/2026", "extra.xlsx")])
+
+    assert [r["id"] for r in service.get_february_reservations()] == ["X1", "X2", "X4"]
+    assert service.parsed == ["extra.xlsx"]
+
+
+def test_colisao_usa_indice_por_quarto_e_periodo(service, tmp_path):
+    with pytest.raises(ValueError, match="Maria"):
+        service.check_collision("new", "12", "11/03/2026", "13/03/2026")
+    assert service.check_collision("new", "12", "12/03/2026", "14/03/2026") is True
+    assert service.check_collision("X2", "14", "11/03/2026", "15/03/2026") is True
+
+    (tmp_path / "manual_allocations.json").write_text(json.dumps({"X1": {"room": "12"}, "X2": {"room": "12"}}), encoding="utf-8")
+    with pytest.raises(ValueError, match="João"):
+        service.check_collision("X1", "12", "13/03/2026", "14/03/2026")
+
+    store = service._source_store()
+    builds = store.counters["index_builds"]
+    service.check_collision("new", "21", "01/03/2026", "05/03/2026")
+    assert store.counters["index_builds"] == builds
+
+
+def test_consultas_concorrentes_com_upsert_nao_veem_indice_parcial():
+    index = store_module.ReservationIndex(
+        [{"id": "FIXA", "room": "12", "checkin": "2026-03-10", "checkout": "2026-03-20"}],
+        lambda value: datetime.strptime(value, "%Y-%m-%d").date() if value else None,
+        lambda res: res.get("room"),
+    )
+    stop = threading.Event()
+    seen = []
+
+    def _reader():
+        while not stop.is_set():
+            hits = index.overlapping("12", date(2026, 3, 12), date(2026, 3, 13))
+            seen.append(any(rid == "FIXA" for _pos, rid in hits))
+
+    readers = [threading.Thread(target=_reader) for _ in range(3)]
+    for thread in readers:
+        thread.start()
+    for n in range(2000):
+        day = 1 + n % 27
+        index.upsert({"id": f"M{n % 40}", "room": "12", "checkin": f"2026-03-{day:02d}", "checkout": f"2026-03-{day + 1:02d}"})
+    stop.set()
+    for thread in readers:
+        thread.join()
+
+    assert seen and all(seen)
+    assert index.revision == 2000
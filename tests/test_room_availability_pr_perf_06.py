@@ -0,0 +1,117 @@
+import json
+import os
+from datetime import date, datetime
+
+import pytest
+
+from app.services import json_document_cache
+from app.services import reservation_source_store as store_module
+from app.services.reservation_rateio_service import ReservationRateioService
+from app.services.reservation_service import ReservationService
+from app.services.reservation_source_store import IntervalUnion
+
+
+MAIN_SHEET = [
+    {"id": "X1", "guest_name": "Maria", "checkin": "10/03/2026", "checkout": "12/03/2026", "category": "Suíte Mar", "status": "Confirmada", "amount": "800.00", "paid_amount": "0.00"},
+    {"id": "X2", "guest_name": "João", "checkin": "11/03/2026", "checkout": "13/03/2026", "category": "Suíte Areia", "status": "Confirmada", "amount": "600.00", "paid_amount": "0.00"},
+]
+
+
+@pytest.fixture
+def service(monkeypatch, tmp_path):
+    monkeypatch.setattr(json_document_cache, "RACY_WINDOW_SECONDS", 0)
+    monkeypatch.setattr(store_module, "_STORES", {})
+    monkeypatch.setattr(ReservationRateioService, "generate", staticmethod(lambda **kwargs: None))
+    (tmp_path / "minhas_reservas.xlsx").write_bytes(b"planilha")
+    allocations = {"X1": {"room": "12"}, "X2": {"room": "01"}}
+    (tmp_path / "manual_allocations.json").write_text(json.dumps(allocations), encoding="utf-8")
+
+    svc = ReservationService()
+    svc.RESERVATIONS_DIR = str(tmp_path)
+    svc.RESERVATIONS_FILE = str(tmp_path / "minhas_reservas.xlsx")
+    svc.MANUAL_RESERVATIONS_FILE = str(tmp_path / "manual_reservations.json")
+    svc.MANUAL_ALLOCATIONS_FILE = str(tmp_path / "manual_allocations.json")
+    svc.RESERVATION_STATUS_OVERRIDES_FILE = str(tmp_path / "reservation_status_overrides.json")
+    svc.RESERVATION_PAYMENTS_FILE = str(tmp_path / "reservation_payments.json")
+    svc.RESERVATION_SYNC_LOG_FILE = str(tmp_path / "reservation_sync_logs.json")
+    svc._parse_excel_file = lambda file_path: [dict(row, source_file=os.path.basename(file_path)) for row in MAIN_SHEET]
+    return svc
+
+
+def test_interval_union_funde_faixas_adjacentes():
+    taken = IntervalUnion()
+    taken.add(5, 7)
+    taken.add(1, 2)
+    taken.add(3, 4)
+    assert list(zip(taken.starts, taken.ends)) == [(1, 7)]
+    taken.add(10, 12)
+    assert taken.intersects(8, 9) is False
+    assert taken.intersects(9, 10) is True
+    assert taken.intersects(0, 0) is False
+
+
+def test_quartos_livres_e_calendario_por_categoria(service):
+    free = service.free_rooms_for_category("Suíte Areia", "11/03/2026", "12/03/2026")
+    assert free == ["02", "03"]
+    assert service.free_rooms_for_category("Suíte Areia", "12/03/2026", "11/03/2026") == []
+
+    calendar = service.category_availability_calendar(date(2026, 3, 10), 4, categories=["Suíte Areia", "Suíte Mar"])
+    assert calendar["Suíte Areia"] == {"2026-03-10": 3, "2026-03-11": 2, "2026-03-12": 2, "2026-03-13": 3}
+    assert calendar["Suíte Mar"]["2026-03-10"] == 10
+    assert calendar["Suíte Mar"]["2026-03-12"] == 11
+
+
+def test_disponibilidade_por_categoria_usa_indice(service, monkeypatch):
+    from app.services.inventory_restriction_service import InventoryRestrictionService
+    from app.services.tariff_priority_engine_service import TariffPriorityEngineService
+
+    monkeypatch.setattr(TariffPriorityEngineService, "evaluate", staticmethod(lambda **kwargs: {"sellable": True}))
+    monkeypatch.setattr(InventoryRestrictionService, "is_open_for_period", staticmethod(lambda *args, **kwargs: True))
+    monkeypatch.setattr(service, "get_room_mapping", lambda: {"Suíte Areia": ["01"], "Suíte Mar": ["12", "14"]})
+
+    assert service.has_availability_for_category("Suíte Areia", "12/03/2026", "14/03/2026") is False
+    assert service.has_availability_for_category("Suíte Areia", "13/03/2026", "14/03/2026") is True
+    assert service.available_categories_for_period("11/03/2026", "12/03/2026") == ["Suíte Mar"]
+
+
+def test_alocacao_e_nova_reserva_atualizam_indice_sem_reconstruir(service):
+    service.get_february_reservations()
+    store = service._source_store()
+    builds = store.counters["index_builds"]
+
+    service.save_manual_allocation("X1", "14", "10/03/2026", "12/03/2026")
+    assert service.free_rooms_for_category("Suíte Mar", "10/03/2026", "11/03/2026", rooms=["12", "14"]) == ["12"]
+
+    created = service.create_manual_reservation({
+        "guest_name": "Ana", "checkin": "10/03/2026", "checkout": "11/03/2026", "category": "Suíte Mar", "amount": "400.00",
+    })
+    service.save_manual_allocation(created["id"], "12", "10/03/2026", "11/03/2026")
+
+    assert service.free_rooms_for_category("Suíte Mar", "10/03/2026", "11/03/2026", rooms=["12", "14"]) == []
+    assert service.get_reservation_by_id(created["id"])["guest_name"] == "Ana"
+    assert store.counters["index_builds"] == builds
+    assert store.counters["incremental_updates"] == 3
+
+    rebuilt = ReservationService.__new__(ReservationService)
+    rebuilt.__dict__.update(service.__dict__)
+    store.invalidate()
+    by_id = {r["id"]: r for r in rebuilt.get_february_reservations()}
+    assert by_id["X1"]["room"] == "14"
+    assert by_id[created["id"]]["room"] == "12"
+
+
+def test_grade_de_ocupacao_aloca_em_quarto_livre(service):
+    start_dt = datetime(2026, 3, 10)
+    grid = service.get_occupancy_grid({}, start_dt, 4)
+    reservations = [
+        {"id": "A", "guest_name": "A", "checkin": "10/03/2026", "checkout": "12/03/2026", "category": "Suíte Areia", "room": "01"},
+        {"id": "B", "guest_name": "B", "checkin": "11/03/2026", "checkout": "13/03/2026", "category": "Suíte Areia"},
+        {"id": "C", "guest_name": "C", "checkin": "12/03/2026", "checkout": "13/03/2026", "category": "Suíte Areia"},
+    ]
+    grid = service.allocate_reservations(grid, reservations, start_dt, 4)
+
+    assert grid["01"][1]["id"] == "A"
+    # B colide com A no 01 e vai para o 02
+    assert grid["02"][3]["id"] == "B"
+    # C entra no 01 depois da saída de A (checkout AM, check-in PM)
+    assert grid["01"][5]["id"] == "C"
@@ -0,0 +1,126 @@
+import json
+import os
+
+import pytest
+from flask import Flask
+
+import app.blueprints.restaurant.routes as restaurant_module
+from app.blueprints.restaurant import restaurant_bp
+from app.services import data_service, json_document_cache, ledger_journal_service, table_orders_store
+from app.services import sales_cube_service as cube_service
+
+
+def _item(name, category, qty, price, created_at, waiter="ana"):
+    return {"name": name, "category": category, "qty": qty, "price": price, "created_at": created_at, "waiter": waiter, "complements": []}
+
+
+CLOSED = [
+    {
+        "close_id": "C1",
+        "customer_type": "hospede",
+        "waiter": "ana",
+        "opened_at": "10/03/2026 12:00",
+        "closed_at": "10/03/2026 13:30",
+        "items": [
+            _item("Moqueca", "Pratos", 2, 80.0, "10/03/2026 12:10"),
+            _item("Caipirinha", "Drinks", 3, 20.0, "10/03/2026 12:15", waiter="bia"),
+        ],
+    },
+    {
+        "customer_type": "passante",
+        "waiter": "bia",
+        "opened_at": "09/03/2026 20:00",
+        "closed_at": "09/03/2026 21:00",
+        "items": [_item("Moqueca", "Pratos", 1, 80.0, "09/03/2026 20:05", waiter="")],
+    },
+]
+
+
+@pytest.fixture
+def sales(monkeypatch, tmp_path):
+    history = tmp_path / "sales_history.json"
+    history.write_text(json.dumps(CLOSED), encoding="utf-8")
+    orders = tmp_path / "table_orders.json"
+    orders.write_text(json.dumps({
+        "7": {
+            "customer_type": "passante",
+            "waiter": "caio",
+            "opened_at": "10/03/2026 19:00",
+            "items": [
+                _item("Caipirinha", "Drinks", 1, 20.0, "10/03/2026 19:05", waiter=""),
+                _item("Água", "Frigobar", 1, 5.0, "10/03/2026 19:06"),
+                _item("Café", "Cafeteria", 2, 6.0, "10/03/2026 08:30"),
+                _item("Cancelado", "Pratos", 0, 50.0, "10/03/2026 19:10"),
+            ],
+        }
+    }), encoding="utf-8")
+    monkeypatch.setattr(data_service, "SALES_HISTORY_FILE", str(history))
+    monkeypatch.setattr(data_service, "TABLE_ORDERS_FILE", str(orders))
+    monkeypatch.setattr(data_service, "get_data_path", lambda name: str(tmp_path / name))
+    monkeypatch.setattr(data_service, "_backup_before_write", lambda *a, **k: None)
+    monkeypatch.setattr(ledger_journal_service, "_JOURNALS", {})
+    monkeypatch.setattr(table_orders_store, "_STORES", {})
+    monkeypatch.setattr(json_document_cache, "RACY_WINDOW_SECONDS", 0)
+    monkeypatch.setattr(cube_service, "_CUBE", cube_service.SalesCube())
+    monkeypatch.setattr(cube_service, "CHECKPOINT_INTERVAL_SECONDS", 0)
+    return tmp_path
+
+
+def test_cubo_agrega_contas_fechadas_e_mesas_abertas(sales):
+    cube = cube_service.get_sales_cube()
+    by_product = cube.rollup("2026-03-10", "2026-03-10", by=("product",))
+    assert by_product == {
+        ("Moqueca",): [2.0, 160.0],
+        ("Caipirinha",): [4.0, 80.0],
+        ("Água",): [1.0, 5.0],
+        ("Café",): [2.0, 12.0],
+    }
+    by_waiter = cube.rollup("2026-03-09", "2026-03-10", by=("date", "waiter"))
+    assert by_waiter[("2026-03-10", "caio")] == [1.0, 20.0]
+    assert by_waiter[("2026-03-09", "bia")] == [1.0, 80.0]
+
+    # fechamento da mesa: entra no diário e é dobrado sem reconstruir o cubo
+    history = data_service.load_sales_history()
+    history.append({"close_id": "C3", "customer_type": "hospede", "items": [_item("Moqueca", "Pratos", 1, 80.0, "10/03/2026 21:00")]})
+    assert data_service.secure_save_sales_history(history) is True
+    assert cube.rollup("2026-03-10", "2026-03-10", by=("product",))[("Moqueca",)] == [3.0, 240.0]
+    assert cube.counters["rebuilds"] == 1 and cube.counters["incremental_updates"] == 1
+
+    # o checkpoint é reaproveitado por um novo processo
+    assert os.path.exists(cube.cube_path())
+    reopened = cube_service.SalesCube()
+    assert reopened.rollup("2026-03-10", "2026-03-10", by=("product",), include_open=False)[("Moqueca",)] == [3.0, 240.0]
+    assert reopened.counters["rebuilds"] == 0
+
+    # histórico reescrito por fora: assinatura muda e o cubo é reconstruído
+    (sales / "sales_history.json").write_text(json.dumps(CLOSED[:1]), encoding="utf-8")
+    assert reopened.rollup("2026-03-09", "2026-03-09", include_open=False) == {}
+    assert reopened.counters["rebuilds"] == 1
+
+
+def test_estatisticas_do_restaurante_leem_o_cubo(sales, monkeypatch):
+    monkeypatch.setattr(restaurant_module, "load_menu_items", lambda: [{"name": "Caipirinha", "category": "Drinks"}])
+    app = Flask(__name__)
+    app.config["TESTING"] = True
+    app.secret_key = "test-secret"
+    app.register_blueprint(restaurant_bp)
+    with app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess["user"] = "tester"
+            sess["role"] = "admin"
+        payload = client.get("/api/restaurant/stats?date=2026-03-10").get_json()
+
+    assert payload["kpi"] == {"total_pedidos": 9.0, "total_atendimentos": 2}
+    assert payload["breakfast"]["total_pedidos"] == 2.0
+    assert payload["breakfast"]["top_items"] == [{"name": "Café", "qty": 2.0}]
+    lunch = payload["lunch"]
+    assert lunch["attendances"] == {"hospedes": 1, "passantes": 0}
+    assert lunch["top_kitchen"] == [{"name": "Moqueca", "qty": 2.0}]
+    assert lunch["top_bar"] == [{"name": "Caipirinha", "qty": 3.0}]
+    assert {"name": "bia", "count": 3.0} in lunch["attendants"]
+    dinner = payload["dinner"]
+    assert dinner["attendances"] == {"hospedes": 0, "passantes": 1}
+    # Frigobar conta no movimento, mas não em cozinha/bar
+    assert next(h["count"] for h in dinner["movement_hourly"] if h["hour"] == 19) == 2.0
+    assert next(h["count"] for h in dinner["movement_segmented"]["bar"] if h["hour"] == 19) == 1.0
+    assert dinner["attendants"] == [{"name": "caio", "count": 1.0}, {"name": "ana", "count": 1.0}]
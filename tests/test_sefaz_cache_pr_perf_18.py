@@ -0,0 +1,172 @@
+import datetime
+import os
+import stat
+import threading
+import time
+
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.serialization import pkcs12
+from cryptography.x509.oid import NameOID
+
+from app.services import fiscal_service, sefaz_material_cache, sefaz_service
+from app.services.sefaz_material_cache import CertificateCache, SchemaCache
+from app.services.sefaz_service import SefazService
+
+
+def _write_pfx(path, serial, password=b"senha"):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "ALMAREIA TESTE:28952732000109")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+        .serial_number(serial).not_valid_before(now).not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    path.write_bytes(pkcs12.serialize_key_and_certificates(b"a1", key, cert, None, serialization.BestAvailableEncryption(password)))
+
+
+@pytest.fixture
+def caches(monkeypatch):
+    certificates, schemas = CertificateCache(), SchemaCache()
+    monkeypatch.setattr(sefaz_material_cache, "_CERTIFICATES", certificates)
+    monkeypatch.setattr(sefaz_material_cache, "_SCHEMAS", schemas)
+    yield certificates, schemas
+    certificates.clear()
+
+
+def test_certificado_carregado_uma_vez_e_trocado_quando_o_pfx_muda(tmp_path, caches):
+    certificates, _ = caches
+    pfx = tmp_path / "a1.pfx"
+    _write_pfx(pfx, serial=1)
+
+    with SefazService(str(pfx), "senha") as first:
+        cert_pem, key_pem = first._cert_pem, first._key_pem
+        assert first._certificate_metadata["serial_number"] == "1"
+    # sair do contexto não apaga o material compartilhado
+    assert os.path.exists(key_pem)
+    assert stat.S_IMODE(os.stat(key_pem).st_mode) == 0o600
+    assert stat.S_IMODE(os.stat(os.path.dirname(key_pem)).st_mode) == 0o700
+    with SefazService(str(pfx), "senha") as second:
+        assert (second._cert_pem, second._key_pem) == (cert_pem, key_pem)
+    assert certificates.stats() == {"loads": 1, "hits": 1, "cached": 1}
+
+    with pytest.raises(ValueError):
+        SefazService(str(pfx), "errada").load_certificate()
+
+    _write_pfx(pfx, serial=2)
+    with SefazService(str(pfx), "senha") as renewed:
+        assert renewed._certificate_metadata["serial_number"] == "2"
+        assert renewed._key_pem != key_pem
+    # quem ainda usa o certificado anterior não perde os arquivos PEM
+    assert os.path.exists(key_pem)
+
+    certificates.clear()
+    assert certificates.stats()["cached"] == 0
+    assert not os.path.exists(os.path.dirname(key_pem))
+
+
+def test_schema_compilado_uma_vez_por_versao(tmp_path, monkeypatch, caches):
+    _, schemas = caches
+    xsd = tmp_path / "envEvento_v1.00.xsd"
+    xsd.write_text(
+        '<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">'
+        '<xs:element name="envEvento"><xs:complexType><xs:sequence>'
+        '<xs:element name="idLote" type="xs:integer"/>'
+        '</xs:sequence></xs:complexType></xs:element></xs:schema>',
+        encoding="utf-8",
+    )
+    monkeypatch.setattr(SefazService, "_ensure_event_xsd_tree", lambda self: str(xsd))
+    service = SefazService("dummy.pfx", "dummy")
+
+    assert service._validate_event_xml_schema("<envEvento><idLote>1</idLote></envEvento>")["ok"] is True
+    invalid = service._validate_event_xml_schema("<envEvento><idLote>x</idLote></envEvento>")
+    assert invalid["ok"] is False and "idLote" in invalid["message"]
+    assert SefazService("dummy.pfx", "dummy")._validate_event_xml_schema("<envEvento><idLote>2</idLote></envEvento>")["ok"] is True
+    assert schemas.stats()["compiles"] == 1 and schemas.stats()["hits"] == 2
+
+    xsd.write_text(xsd.read_text(encoding="utf-8").replace("xs:integer", "xs:string"), encoding="utf-8")
+    os.utime(xsd, ns=(0, 0))
+    assert service._validate_event_xml_schema("<envEvento><idLote>x</idLote></envEvento>")["ok"] is True
+    assert schemas.stats()["compiles"] == 2
+
+
+class _Response:
+    status_code = 200
+    headers = {"Content-Type": "text/xml"}
+
+    def __init__(self, key):
+        self.text = (
+            '<retEnvEvento xmlns="http://www.portalfiscal.inf.br/nfe" versao="1.00"><cStat>128</cStat>'
+            '<xMotivo>Lote de evento processado</xMotivo><retEvento versao="1.00"><infEvento>'
+            f'<cStat>135</cStat><xMotivo>Evento registrado e vinculado a NF-e</xMotivo><chNFe>{key}</chNFe>'
+            '<tpEvento>210210</tpEvento><nProt>113260000000001</nProt></infEvento></retEvento></retEnvEvento>'
+        )
+        self.content = self.text.encode("utf-8")
+
+
+def test_manifestacao_em_lote_reaproveita_certificado_e_signer(tmp_path, monkeypatch, caches):
+    certificates, _ = caches
+    pfx = tmp_path / "a1.pfx"
+    _write_pfx(pfx, serial=7)
+    keys = [f"2626030542922200014855001001229409158882869{n}" for n in range(3)]
+    posts = []
+
+    def _post(url, data=None, cert=None, **kwargs):
+        posts.append(cert)
+        body = data.decode("utf-8")
+        assert "<Signature" in body
+        return _Response(next(key for key in keys if key in body))
+
+    monkeypatch.setattr(sefaz_service.SEFAZ_HTTP, "post", _post)
+    monkeypatch.setattr(SefazService, "_validate_event_xml_schema", lambda self, xml: {"ok": True, "line": 0, "message": ""})
+    monkeypatch.setattr(fiscal_service, "check_xml_signature_dependencies", lambda: {"ok": True, "missing": []})
+    settings = {"provider": "sefaz_direto", "cnpj_emitente": "28952732000109", "environment": "production"}
+    monkeypatch.setattr(fiscal_service, "_get_sefaz_service_instance", lambda settings: SefazService(str(pfx), "senha"))
+
+    results = fiscal_service.send_manifestation_ciencia_operacao_batch(keys + ["123"], settings, correlation_id="lote-1")
+    assert [results[key]["event_cStat"] for key in keys] == ["135", "135", "135"]
+    assert results["123"]["success"] is False and results["123"]["xMotivo"] == "Chave da NF-e inválida."
+    assert len(set(posts)) == 1 and len(posts) == 3
+    assert certificates.stats()["loads"] == 1
+    material = next(iter(certificates._entries.values()))[1]
+    assert len(material._signers) == 1
+
+
+def test_primeiro_acesso_concorrente_carrega_o_pfx_uma_vez(tmp_path, monkeypatch, caches):
+    certificates, _ = caches
+    pfx = tmp_path / "a1.pfx"
+    _write_pfx(pfx, serial=3)
+    real_load = sefaz_material_cache.load_signing_material
+    barrier = threading.Barrier(4)
+
+    def _slow_load(path, password):
+        time.sleep(0.05)
+        return real_load(path, password)
+
+    monkeypatch.setattr(sefaz_material_cache, "load_signing_material", _slow_load)
+    results = []
+
+    def _get(password):
+        barrier.wait()
+        results.append(certificates.get(str(pfx), password)[0])
+
+    threads = [threading.Thread(target=_get, args=("senha",)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert certificates.stats()["loads"] == 1
+    assert len({id(material) for material in results}) == 1
+    assert os.path.exists(results[0].key_pem)
+
+    # outra senha para o mesmo PFX não apaga o material em uso
+    monkeypatch.setattr(sefaz_material_cache, "load_signing_material", lambda path, password: real_load(path, "senha"))
+    other, cached = certificates.get(str(pfx), "outra")
+    assert cached is False and other is not results[0]
+    assert os.path.exists(results[0].key_pem)
+    certificates.clear()
+    assert not os.path.exists(results[0].directory)
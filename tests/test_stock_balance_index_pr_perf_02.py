@@ -0,0 +1,126 @@
+import json
+
+import pytest
+
+from app.services import data_service
+from app.services import stock_balance_index_service as index_service
+from app.services import stock_service
+
+
+PRODUCTS = [
+    {"id": "1", "name": "Heineken", "category": "Bebidas", "department": "Principal", "price": 5.0},
+    {"id": "2", "name": "Heineken (BAR)", "category": "Bebidas", "department": "Bar", "price": 7.0},
+    {"id": "3", "name": "Limão", "category": "Hortifruti", "department": "Cozinha", "price": 1.0},
+]
+
+
+@pytest.fixture
+def ledgers(monkeypatch, tmp_path):
+    files = {
+        "entries": tmp_path / "ledger_entries.json",
+        "requests": tmp_path / "ledger_requests.json",
+        "transfers": tmp_path / "ledger_transfers.json",
+    }
+    files["entries"].write_text(json.dumps([
+        {"id": "E1", "product_id": "1", "product": "Heineken", "qty": 24},
+        {"id": "E2", "product": "Limão", "qty": "10"},
+        {"id": "E3", "product_id": "2", "product": "Heineken (BAR)", "qty": -2},
+        {"id": "E4", "product_id": "1", "product": "Heineken", "qty": "inválido"},
+    ]), encoding="utf-8")
+    files["requests"].write_text(json.dumps([
+        {"id": "R1", "status": "Concluído", "items_structured": [{"name": "Heineken", "product_id": "1", "qty": 6, "delivered_qty": 4}]},
+        {"id": "R2", "status": "Pendente", "items": "3x Limão"},
+        {"id": "R3", "status": "Cancelado", "items_structured": [{"name": "Limão", "product_id": "3", "qty": 5}]},
+        {"id": "R4", "status": "Pendente", "items_structured": [{"name": "Limão", "product_id": "999", "qty": 1}]},
+    ]), encoding="utf-8")
+    files["transfers"].write_text(json.dumps([
+        {"id": "T1", "product": "Heineken", "qty": 4, "from": "Principal", "to": "Bar"},
+    ]), encoding="utf-8")
+
+    monkeypatch.setattr(data_service, "STOCK_ENTRIES_FILE", str(files["entries"]))
+    monkeypatch.setattr(data_service, "STOCK_FILE", str(files["requests"]))
+    monkeypatch.setattr(data_service, "STOCK_TRANSFERS_FILE", str(files["transfers"]))
+    monkeypatch.setattr(data_service, "_backup_before_write", lambda *_a, **_k: None)
+    monkeypatch.setattr(index_service, "_INDEX", index_service.StockBalanceIndex())
+    return files
+
+
+def test_saldos_por_id_respeitam_regras_legadas(ledgers):
+    balances = stock_service.get_product_balances_by_id(PRODUCTS)
+    # 24 entrada - 4 entregue; "inválido" ignorado
+    assert balances["1"] == pytest.approx(20.0)
+    assert balances["2"] == pytest.approx(-2.0)
+    # 10 entrada por nome - 3 (texto legado) - 1 (id desconhecido cai no nome); cancelado ignorado
+    assert balances["3"] == pytest.approx(6.0)
+
+
+def test_inventario_por_departamento_sem_varredura_por_produto(ledgers):
+    bar = stock_service.calculate_inventory(PRODUCTS, target_dept="Serviço")
+    assert set(bar) == {"Heineken (BAR)"}
+    # transferência pelo nome base entra no item do bar
+    assert bar["Heineken (BAR)"]["qty_in"] == pytest.approx(4.0)
+    assert bar["Heineken (BAR)"]["qty_out"] == pytest.approx(2.0)
+
+    principal = stock_service.calculate_inventory(PRODUCTS, target_dept="Principal")
+    assert principal["Heineken"]["qty_in"] == pytest.approx(24.0)
+    assert principal["Heineken"]["qty_out"] == pytest.approx(8.0)
+    assert principal["Heineken"]["balance"] == pytest.approx(16.0)
+
+    explicit = stock_service.calculate_inventory(
+        PRODUCTS,
+        json.loads(ledgers["entries"].read_text(encoding="utf-8")),
+        json.loads(ledgers["requests"].read_text(encoding="utf-8")),
+        json.loads(ledgers["transfers"].read_text(encoding="utf-8")),
+        target_dept="Principal",
+    )
+    assert explicit == principal
+
+
+def test_writers_atualizam_indice_incrementalmente(ledgers, monkeypatch):
+    index = index_service.get_stock_balance_index()
+    assert stock_service.get_product_balances_by_id(PRODUCTS)["3"] == pytest.approx(6.0)
+    rebuilds = index.counters["source_rebuilds"]
+
+    def _no_full_reload():
+        raise AssertionError("índice não deveria reler o ledger")
+
+    data_service.add_stock_entries_batch([{"id": "E5", "product_id": "3", "product": "Limão", "qty": 5}])
+    data_service.add_stock_entries_batch([{"id": "E5", "product_id": "3", "product": "Limão", "qty": 5}])
+    data_service.save_stock_request({"id": "R5", "status": "Pendente", "items_structured": [{"name": "Limão", "product_id": "3", "qty": 2}]})
+
+    monkeypatch.setattr(index_service, "_source_loader", lambda _source: _no_full_reload)
+    assert stock_service.get_product_balances_by_id(PRODUCTS)["3"] == pytest.approx(9.0)
+    assert index.counters["source_rebuilds"] == rebuilds
+
+
+def test_alteracao_externa_reconstroi_somente_a_fonte(ledgers):
+    index = index_service.get_stock_balance_index()
+    stock_service.get_product_balances_by_id(PRODUCTS)
+    rebuilds = index.counters["source_rebuilds"]
+
+    ledgers["entries"].write_text(json.dumps([
+        {"id": "E1", "product_id": "1", "product": "Heineken", "qty": 100},
+    ]), encoding="utf-8")
+
+    assert stock_service.get_product_balances_by_id(PRODUCTS)["1"] == pytest.approx(96.0)
+    assert index.counters["source_rebuilds"] == rebuilds + 1
+
+
+def test_rebuild_grava_checkpoint_reaproveitado(ledgers):
+    status = index_service.rebuild_stock_balance_index()
+    assert set(status["sources"]) == {"entries", "requests", "transfers"}
+    assert all(row["current"] for row in status["sources"].values())
+
+    fresh = index_service.StockBalanceIndex()
+    aggregates = fresh.aggregates("entries")
+    assert fresh.counters["source_rebuilds"] == 0
+    assert aggregates["by_id"]["1"] == pytest.approx(24.0)
+
+
+def test_agregados_devolvidos_nao_mudam_com_novos_lancamentos(ledgers):
+    index = index_service.get_stock_balance_index()
+    before = index.aggregates("entries")
+    data_service.add_stock_entries_batch([{"id": "E6", "product_id": "1", "product": "Heineken", "qty": 6}])
+
+    assert before["by_id"]["1"] == pytest.approx(24.0)
+    assert index.aggregates("entries")["by_id"]["1"] == pytest.approx(30.0)
@@ -13,30 +13,35 @@ def _configure_table_orders_path(monkeypatch, tmp_path):
     return table_orders_file
 
 
-def test_save_table_orders_serializa_escrita(monkeypatch, tmp_path):
+def test_save_table_orders_serializa_escrita_por_mesa(monkeypatch, tmp_path):
     _configure_table_orders_path(monkeypatch, tmp_path)
-    tracker = {"active": 0, "max_active": 0}
+    tracker = {"active": {}, "max_active": {}}
+    lock = threading.Lock()
     original_save_atomic = data_service._save_json_atomic
 
     def _spy_save_atomic(filepath, payload):
-        tracker["active"] += 1
-        tracker["max_active"] = max(tracker["max_active"], tracker["active"])
+        with lock:
+            tracker["active"][filepath] = tracker["active"].get(filepath, 0) + 1
+            tracker["max_active"][filepath] = max(tracker["max_active"].get(filepath, 0), tracker["active"][filepath])
         time.sleep(0.05)
         try:
             return original_save_atomic(filepath, payload)
         finally:
-            tracker["active"] -= 1
+            with lock:
+                tracker["active"][filepath] -= 1
 
     monkeypatch.setattr(data_service, "_save_json_atomic", _spy_save_atomic)
 
     def _writer(i):
-        return data_service.save_table_orders({str(i): {"items": [f"item-{i}"]}})
+        # duas escritas concorrentes por mesa
+        return data_service.save_table_orders({str(i % 6): {"items": [f"item-{i}"]}})
 
     with ThreadPoolExecutor(max_workers=6) as executor:
         results = list(executor.map(_writer, range(12)))
 
     assert all(results)
-    assert tracker["max_active"] == 1
+    # cada arquivo (segmento da mesa ou table_orders.json) nunca tem duas escritas simultâneas
+    assert set(tracker["max_active"].values()) == {1}
 
 
 def test_save_table_orders_mitiga_lost_update_com_merge(monkeypatch, tmp_path):
@@ -0,0 +1,130 @@
+import json
+import threading
+import time
+
+import pytest
+
+from app.services import data_service
+from app.services import table_orders_store
+
+
+@pytest.fixture
+def orders_file(monkeypatch, tmp_path):
+    path = tmp_path / "table_orders.json"
+    path.write_text(json.dumps({"10": {"items": ["suco"], "total": 8.0}}), encoding="utf-8")
+    monkeypatch.setattr(data_service, "TABLE_ORDERS_FILE", str(path))
+    monkeypatch.setattr(data_service, "get_data_path", lambda name: str(tmp_path / name))
+    monkeypatch.setattr(table_orders_store, "_STORES", {})
+    return path
+
+
+def _store():
+    return data_service._table_orders_store()
+
+
+def test_migra_arquivo_legado_e_grava_somente_mesa_alterada(orders_file):
+    orders = data_service.load_table_orders()
+    assert orders == {"10": {"items": ["suco"], "total": 8.0}}
+    assert (orders_file.parent / "table_orders.d" / "t_10.json").exists()
+
+    orders["11"] = {"items": ["café"], "total": 5.0}
+    assert data_service.save_table_orders(orders)
+    before = _store().stats()["segments_written"]
+
+    orders = data_service.load_table_orders()
+    orders["11"]["items"].append("pão")
+    assert data_service.save_table_orders(orders)
+
+    stats = _store().stats()
+    assert stats["segments_written"] == before + 1
+    segment = json.loads((orders_file.parent / "table_orders.d" / "t_11.json").read_text(encoding="utf-8"))
+    assert segment["version"] == 2
+    assert json.loads(orders_file.read_text(encoding="utf-8")) == {
+        "10": {"items": ["suco"], "total": 8.0},
+        "11": {"items": ["café", "pão"], "total": 5.0},
+    }
+    history = data_service.table_orders_history("11")
+    assert [row["version"] for row in history] == [2, 1]
+
+
+def test_mesas_diferentes_nao_disputam_o_mesmo_lock(orders_file):
+    data_service.load_table_orders()
+    store = _store()
+    holding = threading.Event()
+    release = threading.Event()
+
+    def _garcom_mesa_10():
+        with store.table_lock("10"):
+            holding.set()
+            release.wait(5)
+
+    holder = threading.Thread(target=_garcom_mesa_10)
+    holder.start()
+    assert holding.wait(5)
+    try:
+        started = time.perf_counter()
+        result = []
+        worker = threading.Thread(target=lambda: result.append(data_service.save_table_orders({"10": {"items": ["suco"], "total": 8.0}, "20": {"items": ["água"]}})))
+        worker.start()
+        worker.join(2)
+        assert result == [True]
+        assert time.perf_counter() - started < 1.5
+
+        blocked = threading.Thread(target=lambda: result.append(data_service.save_table_orders({"10": {"items": []}, "20": {"items": ["água"]}})))
+        blocked.start()
+        blocked.join(0.3)
+        assert blocked.is_alive()
+    finally:
+        release.set()
+        holder.join(5)
+    blocked.join(5)
+    assert result == [True, True]
+    assert data_service.load_table_orders()["10"] == {"items": []}
+
+
+def test_exclusao_com_copia_desatualizada_preserva_mesa_alterada(orders_file):
+    loaded = threading.Event()
+    go = threading.Event()
+    result = []
+
+    def _garcom_com_copia_antiga():
+        stale = data_service.load_table_orders()
+        loaded.set()
+        go.wait(5)
+        stale.pop("10")
+        stale["30"] = {"items": ["vinho"]}
+        result.append(data_service.save_table_orders(stale))
+
+    worker = threading.Thread(target=_garcom_com_copia_antiga)
+    worker.start()
+    assert loaded.wait(5)
+    current = data_service.load_table_orders()
+    current["10"]["items"].append("pastel")
+    assert data_service.save_table_orders(current)
+    go.set()
+    worker.join(5)
+
+    assert result == [True]
+    orders = data_service.load_table_orders()
+    assert orders["10"]["items"] == ["suco", "pastel"]
+    assert orders["30"] == {"items": ["vinho"]}
+    assert _store().stats()["conflicts"] == 1
+
+
+def test_gravacao_externa_do_arquivo_e_incorporada(orders_file):
+    orders = data_service.load_table_orders()
+    orders["12"] = {"items": ["cerveja"]}
+    assert data_service.save_table_orders(orders)
+
+    # transfer_service e restaurações ainda regravam table_orders.json diretamente
+    external = json.loads(orders_file.read_text(encoding="utf-8"))
+    external.pop("10")
+    external["40"] = {"items": ["hambúrguer"]}
+    tmp = orders_file.with_suffix(".tmp")
+    tmp.write_text(json.dumps(external, ensure_ascii=False), encoding="utf-8")
+    tmp.replace(orders_file)
+
+    assert data_service.load_table_orders() == {"12": {"items": ["cerveja"]}, "40": {"items": ["hambúrguer"]}}
+    assert _store().stats()["imports"] == 2
+    tombstone = json.loads((orders_file.parent / "table_orders.d" / "t_10.json").read_text(encoding="utf-8"))
+    assert tombstone["deleted"] is True and tombstone["version"] == 2